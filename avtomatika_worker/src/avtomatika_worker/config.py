@@ -54,6 +54,9 @@ class WorkerConfig:
         self.result_retry_initial_delay: float = float(
             os.getenv("RESULT_RETRY_INITIAL_DELAY", "1.0"),
         )
+        # Результаты, готовые в пределах этой задержки, отправляются одним запросом (0 - без пакетирования)
+        self.result_batch_delay: float = float(os.getenv("RESULT_BATCH_DELAY", "0.05"))
+        self.result_batch_size: int = int(os.getenv("RESULT_BATCH_SIZE", "50"))
         self.heartbeat_debounce_delay: float = float(os.getenv("WORKER_HEARTBEAT_DEBOUNCE_DELAY", 0.1))
         self.task_poll_timeout: float = float(os.getenv("TASK_POLL_TIMEOUT", "30"))
         self.task_poll_error_delay: float = float(
@@ -61,6 +64,9 @@ class WorkerConfig:
         )
         self.idle_poll_delay: float = float(os.getenv("IDLE_POLL_DELAY", "0.01"))
         self.enable_websockets: bool = os.getenv("WORKER_ENABLE_WEBSOCKETS", "false").lower() == "true"
+        # Получение задач через WebSocket вместо опроса (требует WORKER_ENABLE_WEBSOCKETS)
+        self.push_enabled: bool = os.getenv("WORKER_PUSH_ENABLED", "false").lower() == "true"
+        self.result_ack_timeout: float = float(os.getenv("RESULT_ACK_TIMEOUT", "10.0"))
         self.multi_orchestrator_mode: str = os.getenv("MULTI_ORCHESTRATOR_MODE", "FAILOVER")
 
     def _get_orchestrators_config(self) -> List[Dict[str, Any]]:
@@ -1,6 +1,8 @@
 import asyncio
 import json
 import logging
+from contextlib import suppress
+from functools import partial
 from typing import Any, Callable, Dict, Set
 
 import aiohttp
@@ -48,11 +50,22 @@ class Worker:
         self._http_session = http_session
         self._session_is_managed_externally = http_session is not None
         self._ws_connection: aiohttp.ClientWebSocketResponse | None = None
+        # Push mode: the orchestrator whose WebSocket connection delivers tasks, the tasks it pushed,
+        # and the results sent over the connection that wait for an acknowledgement
+        self._push_orchestrator_url: str | None = None
+        self._push_ended = asyncio.Event()
+        self._push_ended.set()
+        self._pushed_tasks: Set[str] = set()
+        self._pending_result_acks: Dict[str, asyncio.Future] = {}
         self._headers = {"X-Worker-Token": self._config.worker_token}
         self._shutdown_event = asyncio.Event()
         self._registered_event = asyncio.Event()
         self._round_robin_index = 0
         self._debounce_task: asyncio.Task | None = None
+        # Results waiting to be sent in a batch, per orchestrator URL
+        self._result_buffers: Dict[str, list[tuple[Dict[str, Any], asyncio.Future]]] = {}
+        self._result_flush_tasks: Dict[str, asyncio.Task] = {}
+        self._result_delivery_tasks: Set[asyncio.Task] = set()
 
     def _validate_config(self):
         """Checks for unused task type limits and warns the user."""
@@ -135,28 +148,51 @@ class Worker:
         # Schedule the new debounced call.
         self._debounce_task = asyncio.create_task(self._debounced_heartbeat_sender())
 
+    def _get_free_slots(self) -> int:
+        """Returns how many tasks the worker can take at once.
+        Tasks of a limited type may arrive in any mix, so the tightest type limit also caps the batch.
+        """
+        free_slots = self._config.max_concurrent_tasks - self._current_load
+        for task_type, limit in self._task_type_limits.items():
+            free_slots = min(free_slots, limit - self._current_load_by_type.get(task_type, 0))
+        return max(free_slots, 1)
+
+    def _start_task(self, task_data: Dict[str, Any]):
+        """Accounts for a received task and starts processing it."""
+        self._current_load += 1
+        task_handler_info = self._task_handlers.get(task_data["type"])
+        if task_handler_info:
+            task_type_for_limit = task_handler_info.get("type")
+            if task_type_for_limit:
+                self._current_load_by_type[task_type_for_limit] += 1
+
+        task = asyncio.create_task(self._process_task(task_data))
+        self._active_tasks[task_data["task_id"]] = task
+
     async def _poll_for_tasks(self, orchestrator_url: str):
-        """Polls a specific Orchestrator for new tasks."""
+        """Polls a specific Orchestrator for as many new tasks as the worker has free slots."""
+        if orchestrator_url == self._push_orchestrator_url:
+            # Tasks arrive over the WebSocket connection, poll again once it is gone
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._push_ended.wait(), timeout=self._config.task_poll_timeout)
+            return
+
         url = f"{orchestrator_url}/_worker/workers/{self._config.worker_id}/tasks/next"
         try:
             if not self._http_session:
                 return
             timeout = aiohttp.ClientTimeout(total=self._config.task_poll_timeout + 5)
-            async with self._http_session.get(url, headers=self._headers, timeout=timeout) as resp:
+            params = {"max": self._get_free_slots()}
+            async with self._http_session.get(url, headers=self._headers, params=params, timeout=timeout) as resp:
                 if resp.status == 200:
-                    task_data = await resp.json()
-                    task_data["orchestrator_url"] = orchestrator_url
-
-                    self._current_load += 1
-                    task_handler_info = self._task_handlers.get(task_data["type"])
-                    if task_handler_info:
-                        task_type_for_limit = task_handler_info.get("type")
-                        if task_type_for_limit:
-                            self._current_load_by_type[task_type_for_limit] += 1
+                    tasks = await resp.json()
+                    if isinstance(tasks, dict):
+                        # Orchestrators without batched polling answer with a single task
+                        tasks = [tasks]
+                    for task_data in tasks:
+                        task_data["orchestrator_url"] = orchestrator_url
+                        self._start_task(task_data)
                     self._schedule_heartbeat_debounce()
-
-                    task = asyncio.create_task(self._process_task(task_data))
-                    self._active_tasks[task_data["task_id"]] = task
                 elif resp.status != 204:
                     await asyncio.sleep(self._config.task_poll_error_delay)
         except (asyncio.TimeoutError, aiohttp.ClientError) as e:
@@ -205,6 +241,7 @@ class Worker:
                     send_progress=self.send_progress,
                     add_to_hot_cache=self.add_to_hot_cache,
                     remove_from_hot_cache=self.remove_from_hot_cache,
+                    resolve_blob=partial(self.resolve_blob, orchestrator_url=orchestrator_url),
                 )
             else:
                 result = {"status": "failure", "error_message": f"Unsupported task: {task_name}"}
@@ -220,16 +257,111 @@ class Worker:
             self._current_load -= 1
             if task_type_for_limit:
                 self._current_load_by_type[task_type_for_limit] -= 1
+            if task_id in self._pushed_tasks:
+                # The slot of a pushed task goes back to the orchestrator as a credit
+                self._pushed_tasks.discard(task_id)
+                await self._send_ws_message({"event": "credit", "amount": 1})
             self._schedule_heartbeat_debounce()
 
+    async def resolve_blob(self, value: Any, orchestrator_url: str) -> Any:
+        """
+        Returns the payload behind a blob reference (`{"$blob": key, ...}`) in task params,
+        fetching it from the orchestrator. Other values are returned unchanged.
+        """
+        if not (isinstance(value, dict) and isinstance(value.get("$blob"), str)):
+            return value
+        if not self._http_session:
+            raise RuntimeError("HTTP session is not initialized")
+        url = f"{orchestrator_url}/_worker/workers/{self._config.worker_id}/blobs/{value['$blob']}"
+        async with self._http_session.get(url, headers=self._headers) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
     async def _send_result(self, payload: Dict[str, Any], orchestrator_url: str):
-        """Sends the result to a specific orchestrator."""
-        url = f"{orchestrator_url}/_worker/tasks/result"
+        """Sends the result to a specific orchestrator.
+        Results are coalesced for up to `result_batch_delay` seconds and sent together,
+        returning once the batch holding this result has been delivered (or given up on).
+        """
+        if orchestrator_url == self._push_orchestrator_url and await self._send_result_over_ws(payload):
+            return
+        if self._config.result_batch_delay <= 0:
+            await self._post_results([payload], orchestrator_url)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        buffer = self._result_buffers.setdefault(orchestrator_url, [])
+        buffer.append((payload, future))
+        if len(buffer) >= self._config.result_batch_size:
+            self._flush_results(orchestrator_url)
+        elif orchestrator_url not in self._result_flush_tasks:
+            self._result_flush_tasks[orchestrator_url] = asyncio.create_task(
+                self._flush_results_after_delay(orchestrator_url)
+            )
+        await future
+
+    async def _send_result_over_ws(self, payload: Dict[str, Any]) -> bool:
+        """Sends a result over the push connection and waits for the orchestrator to acknowledge it.
+        Returns False if the result has to be sent over HTTP instead.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending_result_acks[payload["task_id"]] = future
+        try:
+            if not await self._send_ws_message({"event": "task_result", "payload": payload}):
+                return False
+            await asyncio.wait_for(future, timeout=self._config.result_ack_timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"No acknowledgement for the result of task {payload['task_id']}, sending it over HTTP.")
+            return False
+        finally:
+            self._pending_result_acks.pop(payload["task_id"], None)
+
+    async def _send_ws_message(self, message: Dict[str, Any]) -> bool:
+        if not self._ws_connection or self._ws_connection.closed:
+            return False
+        try:
+            await self._ws_connection.send_json(message)
+            return True
+        except Exception as e:
+            logger.warning(f"Could not send WebSocket message: {e}")
+            return False
+
+    async def _flush_results_after_delay(self, orchestrator_url: str):
+        await asyncio.sleep(self._config.result_batch_delay)
+        self._result_flush_tasks.pop(orchestrator_url, None)
+        self._flush_results(orchestrator_url)
+
+    def _flush_results(self, orchestrator_url: str):
+        """Starts sending the buffered results of an orchestrator."""
+        if flush_task := self._result_flush_tasks.pop(orchestrator_url, None):
+            flush_task.cancel()
+        batch = self._result_buffers.pop(orchestrator_url, [])
+        if batch:
+            # Keep a reference until the batch is delivered, the event loop only holds a weak one
+            delivery_task = asyncio.create_task(self._deliver_results(batch, orchestrator_url))
+            self._result_delivery_tasks.add(delivery_task)
+            delivery_task.add_done_callback(self._result_delivery_tasks.discard)
+
+    async def _deliver_results(self, batch: list[tuple[Dict[str, Any], asyncio.Future]], orchestrator_url: str):
+        try:
+            await self._post_results([payload for payload, _ in batch], orchestrator_url)
+        finally:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    async def _post_results(self, payloads: list[Dict[str, Any]], orchestrator_url: str):
+        """Posts results to an orchestrator, a single result to `/tasks/result`, several to `/tasks/results`."""
+        if len(payloads) == 1:
+            url, body = f"{orchestrator_url}/_worker/tasks/result", payloads[0]
+        else:
+            url = f"{orchestrator_url}/_worker/tasks/results"
+            body = {"worker_id": self._config.worker_id, "results": payloads}
         delay = self._config.result_retry_initial_delay
         for i in range(self._config.result_max_retries):
             try:
                 if self._http_session and not self._http_session.closed:
-                    async with self._http_session.post(url, json=payload, headers=self._headers) as resp:
+                    async with self._http_session.post(url, json=body, headers=self._headers) as resp:
                         if resp.status == 200:
                             return
             except aiohttp.ClientError as e:
@@ -292,6 +424,10 @@ class Worker:
                 payload["hot_skills"] = hot_skills
 
         for orchestrator in self._config.orchestrators:
+            if orchestrator["url"] == self._push_orchestrator_url and await self._send_ws_message(
+                {"event": "heartbeat", "data": payload}
+            ):
+                continue
             url = f"{orchestrator['url']}/_worker/workers/{self._config.worker_id}"
             try:
                 if self._http_session and not self._http_session.closed:
@@ -317,6 +453,11 @@ class Worker:
             task.cancel()
         if self._active_tasks:
             await asyncio.gather(*self._active_tasks.values(), return_exceptions=True)
+        # Send the results still waiting for their batch, and wait for the batches in flight
+        for orchestrator_url in list(self._result_buffers):
+            self._flush_results(orchestrator_url)
+        if self._result_delivery_tasks:
+            await asyncio.gather(*self._result_delivery_tasks, return_exceptions=True)
 
         if self._ws_connection and not self._ws_connection.closed:
             await self._ws_connection.close()
@@ -355,23 +496,32 @@ class Worker:
         """Manages the WebSocket connection to the orchestrator."""
         while not self._shutdown_event.is_set():
             for orchestrator in self._config.orchestrators:
-                ws_url = orchestrator["url"].replace("http", "ws", 1) + "/_worker/ws"
+                ws_url = orchestrator["url"].replace("http", "ws", 1) + f"/_worker/ws/{self._config.worker_id}"
                 try:
                     if self._http_session:
                         async with self._http_session.ws_connect(ws_url, headers=self._headers) as ws:
                             self._ws_connection = ws
                             logger.info(f"WebSocket connection established to {ws_url}")
-                            await self._listen_for_commands()
+                            if self._config.push_enabled:
+                                await ws.send_json({"event": "push_start", "credits": self._get_free_slots()})
+                            await self._listen_for_commands(orchestrator["url"])
                 except (aiohttp.ClientError, asyncio.TimeoutError) as e:
                     logger.warning(f"WebSocket connection to {ws_url} failed: {e}")
                 finally:
                     self._ws_connection = None
+                    self._stop_push()
                     logger.info(f"WebSocket connection to {ws_url} closed.")
                     await asyncio.sleep(5)  # Reconnection delay
             if not self._config.orchestrators:
                 await asyncio.sleep(5)
 
-    async def _listen_for_commands(self):
+    def _stop_push(self):
+        """Falls back to polling once the push connection is gone."""
+        self._push_orchestrator_url = None
+        self._pushed_tasks.clear()
+        self._push_ended.set()
+
+    async def _listen_for_commands(self, orchestrator_url: str):
         """Listens for and processes commands from the orchestrator via WebSocket."""
         if not self._ws_connection:
             return
@@ -381,11 +531,28 @@ class Worker:
                 if msg.type == aiohttp.WSMsgType.TEXT:
                     try:
                         command = msg.json()
-                        if command.get("type") == "cancel_task":
+                        command_type = command.get("command", command.get("type"))
+                        if command_type == "cancel_task":
                             task_id = command.get("task_id")
                             if task_id in self._active_tasks:
                                 self._active_tasks[task_id].cancel()
                                 logger.info(f"Cancelled task {task_id} by orchestrator command.")
+                        elif command_type == "run_task":
+                            task_data = command["task"]
+                            task_data["orchestrator_url"] = orchestrator_url
+                            self._pushed_tasks.add(task_data["task_id"])
+                            self._start_task(task_data)
+                            self._schedule_heartbeat_debounce()
+                        elif command_type == "result_ack":
+                            future = self._pending_result_acks.get(command.get("task_id"))
+                            if future and not future.done():
+                                future.set_result(command)
+                        elif command_type == "push_accepted":
+                            logger.info(f"Receiving tasks from {orchestrator_url} over WebSocket.")
+                            self._push_orchestrator_url = orchestrator_url
+                            self._push_ended.clear()
+                        elif command_type == "push_rejected":
+                            logger.info(f"Orchestrator {orchestrator_url} does not push tasks, polling instead.")
                     except json.JSONDecodeError:
                         logger.warning(f"Received invalid JSON over WebSocket: {msg.data}")
                 elif msg.type == aiohttp.WSMsgType.ERROR:
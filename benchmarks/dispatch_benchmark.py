@@ -0,0 +1,97 @@
+"""Measures `Dispatcher.dispatch` latency against the worker registry.
+
+Compares the indexed registry of `RedisStorage` / `MemoryStorage` with the
+legacy SCAN + MGET discovery for 10, 1k and 10k registered workers.
+Requires the test extras (`fakeredis`), no real Redis server is needed.
+
+Usage:
+    python benchmarks/dispatch_benchmark.py
+"""
+
+import asyncio
+import os
+import sys
+from statistics import mean, quantiles
+from time import perf_counter
+from typing import Any
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fakeredis import aioredis  # noqa: E402
+
+from avtomatika.dispatcher import Dispatcher  # noqa: E402
+from avtomatika.storage.base import StorageBackend  # noqa: E402
+from avtomatika.storage.memory import MemoryStorage  # noqa: E402
+from avtomatika.storage.redis import RedisStorage  # noqa: E402
+
+WORKER_COUNTS = (10, 1_000, 10_000)
+TASK_TYPES = [f"task_{i}" for i in range(10)]
+
+
+class LegacyScanRedisStorage(RedisStorage):
+    """RedisStorage with the pre-index worker discovery (SCAN + MGET of every worker)."""
+
+    async def get_available_workers(
+        self,
+        task_type: str | None = None,
+        status: str | None = None,
+    ) -> list[dict[str, Any]]:
+        worker_keys = [key async for key in self._redis.scan_iter("orchestrator:worker:info:*")]
+        if not worker_keys:
+            return []
+        worker_data_list = await self._redis.mget(worker_keys)
+        return [self._unpack(data) for data in worker_data_list if data]
+
+
+async def populate(storage: StorageBackend, worker_count: int) -> None:
+    for i in range(worker_count):
+        worker_id = f"worker-{i}"
+        await storage.register_worker(
+            worker_id,
+            {
+                "worker_id": worker_id,
+                # Every worker supports a single task type, half of each pool is busy.
+                "status": "idle" if (i // len(TASK_TYPES)) % 2 == 0 else "busy",
+                "supported_tasks": [TASK_TYPES[i % len(TASK_TYPES)]],
+                "cost_per_second": 0.01,
+            },
+            600,
+        )
+
+
+async def measure(storage: StorageBackend, iterations: int) -> list[float]:
+    dispatcher = Dispatcher(storage, MagicMock())
+    latencies = []
+    for i in range(iterations):
+        job_state = {"id": f"job-{i}", "tracing_context": {}}
+        task_info = {"type": TASK_TYPES[i % len(TASK_TYPES)], "dispatch_strategy": "round_robin"}
+        start = perf_counter()
+        await dispatcher.dispatch(job_state, task_info)
+        latencies.append((perf_counter() - start) * 1000)
+    return latencies
+
+
+async def run_case(name: str, storage: StorageBackend, worker_count: int) -> None:
+    await populate(storage, worker_count)
+    iterations = 200 if worker_count <= 1_000 else 30
+    latencies = await measure(storage, iterations)
+    p95 = quantiles(latencies, n=20)[-1]
+    print(f"{name:<22} {worker_count:>8} {mean(latencies):>12.3f} {p95:>12.3f}")
+
+
+async def main() -> None:
+    print(f"{'backend':<22} {'workers':>8} {'mean, ms':>12} {'p95, ms':>12}")
+    for worker_count in WORKER_COUNTS:
+        for name, factory in (
+            ("redis (legacy scan)", LegacyScanRedisStorage),
+            ("redis (indexed)", RedisStorage),
+        ):
+            client = aioredis.FakeRedis()
+            await run_case(name, factory(client), worker_count)
+            await client.aclose()
+        await run_case("memory (indexed)", MemoryStorage(), worker_count)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+"""Simulates task response times under the load-balancing dispatch strategies.
+
+Drives the real `Dispatcher` on `MemoryStorage` with a simulated clock: tasks
+arrive as a Poisson process and are served by workers of different speed and
+concurrency with exponentially distributed service times. Workers report their
+`load` in heartbeats every 15 simulated seconds, as the worker SDK does, while
+`expected_finish` reads queue depths and in-flight tasks at dispatch time and
+learns worker latencies from the task results.
+
+Usage:
+    python benchmarks/dispatch_strategy_simulation.py
+"""
+
+import asyncio
+import heapq
+import os
+import sys
+from itertools import count
+from random import Random, seed
+from statistics import mean, quantiles
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from avtomatika.dispatcher import Dispatcher  # noqa: E402
+from avtomatika.storage.memory import MemoryStorage  # noqa: E402
+
+# (mean service time in seconds, concurrency) of each worker
+WORKERS = [(0.5, 1), (0.5, 1), (1.0, 1), (1.0, 2), (2.0, 1), (2.0, 2), (4.0, 1), (8.0, 1)]
+HEARTBEAT_INTERVAL = 15.0
+TASK_COUNT = 5_000
+UTILIZATIONS = (0.5, 0.7, 0.9)
+STRATEGIES = (
+    ("round_robin", "round_robin", 0),
+    ("least_connections", "least_connections", 0),
+    ("expected_finish (2 choices)", "expected_finish", 2),
+    ("expected_finish (all)", "expected_finish", 0),
+)
+
+
+async def simulate(strategy: str, choices: int, utilization: float, rng: Random) -> list[float]:
+    storage = MemoryStorage()
+    config = MagicMock()
+    config.DISPATCH_EXPECTED_FINISH_CHOICES = choices
+    dispatcher = Dispatcher(storage, config)
+    for i, (_, concurrency) in enumerate(WORKERS):
+        await storage.register_worker(
+            f"worker-{i}",
+            {"worker_id": f"worker-{i}", "supported_tasks": ["task"], "max_concurrent_tasks": concurrency},
+            10**9,
+        )
+
+    capacity = sum(concurrency / service_time for service_time, concurrency in WORKERS)
+    arrival_rate = utilization * capacity
+    running = dict.fromkeys(range(len(WORKERS)), 0)
+    arrived_at: dict[str, float] = {}
+    started_at: dict[str, float] = {}
+    response_times: list[float] = []
+    events: list[tuple[float, int, str, int | None, str | None]] = []
+    sequence = count()
+
+    async def start_tasks(worker: int, now: float) -> None:
+        worker_id = f"worker-{worker}"
+        service_time, concurrency = WORKERS[worker]
+        while running[worker] < concurrency and (await storage.get_worker_loads([worker_id]))[worker_id]["queued"]:
+            task = await storage.dequeue_task_for_worker(worker_id, 1)
+            await storage.mark_task_in_flight(worker_id, task["task_id"], 10**9)
+            running[worker] += 1
+            started_at[task["task_id"]] = now
+            finish = now + rng.expovariate(1 / service_time)
+            heapq.heappush(events, (finish, next(sequence), "finish", worker, task["task_id"]))
+
+    heapq.heappush(events, (rng.expovariate(arrival_rate), next(sequence), "arrival", None, None))
+    heapq.heappush(events, (HEARTBEAT_INTERVAL, next(sequence), "heartbeat", None, None))
+    dispatched = 0
+    while len(response_times) < TASK_COUNT:
+        now, _, kind, worker, task_id = heapq.heappop(events)
+        if kind == "arrival":
+            task_id = f"task-{dispatched}"
+            arrived_at[task_id] = now
+            job_state = {"id": f"job-{dispatched}", "tracing_context": {}}
+            await dispatcher.dispatch(job_state, {"type": "task", "task_id": task_id, "dispatch_strategy": strategy})
+            await start_tasks(int(job_state["task_worker_id"].split("-")[1]), now)
+            dispatched += 1
+            if dispatched < TASK_COUNT:
+                heapq.heappush(events, (now + rng.expovariate(arrival_rate), next(sequence), "arrival", None, None))
+        elif kind == "finish":
+            response_times.append(now - arrived_at[task_id])
+            running[worker] -= 1
+            await storage.clear_task_in_flight(f"worker-{worker}", task_id)
+            service_time = now - started_at.pop(task_id)
+            await storage.record_task_stats(f"worker-{worker}", "task", service_time * 1000, success=True)
+            await start_tasks(worker, now)
+        else:
+            for i in running:
+                await storage.update_worker_data(f"worker-{i}", {"load": running[i]})
+            heapq.heappush(events, (now + HEARTBEAT_INTERVAL, next(sequence), "heartbeat", None, None))
+    return response_times
+
+
+async def main() -> None:
+    print(f"{'strategy':<30} {'load':>5} {'mean, s':>9} {'p95, s':>9} {'p99, s':>9}")
+    for utilization in UTILIZATIONS:
+        for name, strategy, choices in STRATEGIES:
+            # Seeded for reproducible runs, including the sampling in the dispatcher
+            seed(42)
+            response_times = await simulate(strategy, choices, utilization, Random(42))
+            percentiles = quantiles(response_times, n=100)
+            print(
+                f"{name:<30} {utilization:>5.1f} {mean(response_times):>9.2f} "
+                f"{percentiles[94]:>9.2f} {percentiles[98]:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
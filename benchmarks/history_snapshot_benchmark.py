@@ -0,0 +1,89 @@
+"""Compares history storage size and read latency with full snapshots and with snapshot diffs.
+
+Logs the events of long-running jobs (4 events per step, as `JobExecutor` and the
+result handler do) into a SQLite history database, once with a full `context_snapshot`
+for every event and once with diffs between full snapshots taken every 10 events.
+Reports the stored snapshot bytes and the latency of `get_job_history`, which serves
+`GET /jobs/{job_id}/history`.
+
+Usage:
+    python benchmarks/history_snapshot_benchmark.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from avtomatika.history.sqlite import SQLiteHistoryStorage  # noqa: E402
+
+JOBS = 20
+STEPS = (10, 50)
+INITIAL_DATA_SIZE = 10_000
+READS = 20
+
+
+async def log_job(storage: SQLiteHistoryStorage, job_id: str, steps: int):
+    job_state = {
+        "id": job_id,
+        "blueprint_name": "benchmark",
+        "current_state": "start",
+        "initial_data": {"document": "x" * INITIAL_DATA_SIZE},
+        "state_history": {},
+        "status": "running",
+        "retry_count": 0,
+    }
+    for step in range(steps):
+        state = f"step_{step}"
+        job_state["current_state"] = state
+        task_info = {"type": "process", "params": {"step": step}}
+        result = {"status": "success", "data": {f"summary_{step}": "y" * 200}}
+        for event_type, snapshot in (
+            ("state_started", job_state),
+            ("task_dispatched", {**job_state, "task_info": task_info}),
+            ("task_finished", {**job_state, "result": result}),
+        ):
+            await storage.log_job_event(
+                {"job_id": job_id, "state": state, "event_type": event_type, "context_snapshot": snapshot}
+            )
+        job_state["state_history"].update(result["data"])
+        await storage.log_job_event(
+            {"job_id": job_id, "state": state, "event_type": "state_finished", "context_snapshot": job_state}
+        )
+
+
+async def measure(full_snapshot_interval: int, steps: int) -> tuple[int, float]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        storage = SQLiteHistoryStorage(
+            os.path.join(tmp_dir, "history.db"),
+            full_snapshot_interval=full_snapshot_interval,
+        )
+        await storage.initialize()
+        for job in range(JOBS):
+            await log_job(storage, f"job-{job}", steps)
+
+        async with storage._conn.execute("SELECT SUM(LENGTH(context_snapshot)) FROM job_history") as cursor:
+            (snapshot_bytes,) = await cursor.fetchone()
+
+        start = perf_counter()
+        for i in range(READS):
+            await storage.get_job_history(f"job-{i % JOBS}")
+        latency_ms = (perf_counter() - start) / READS * 1000
+
+        await storage.close()
+        return snapshot_bytes, latency_ms
+
+
+async def main():
+    print(f"{'steps':>6} {'mode':>16} {'snapshot bytes':>16} {'history read, ms':>18}")
+    for steps in STEPS:
+        for mode, interval in (("full", 1), ("diff, every 10", 10)):
+            snapshot_bytes, latency_ms = await measure(interval, steps)
+            print(f"{steps:>6} {mode:>16} {snapshot_bytes:>16} {latency_ms:>18.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
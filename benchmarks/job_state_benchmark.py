@@ -0,0 +1,113 @@
+"""Measures the bytes written to Redis per job lifecycle for both job state layouts.
+
+Replays the storage writes of a typical job (create, dispatch a task, accept the
+worker result, transition to the final state) with `initial_data` of 1 KB, 100 KB
+and 1 MB, and counts the bytes of the write commands sent to Redis.
+Requires the test extras (`fakeredis`), no real Redis server is needed.
+
+Usage:
+    python benchmarks/job_state_benchmark.py
+"""
+
+import asyncio
+import os
+import sys
+from time import monotonic
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fakeredis import aioredis  # noqa: E402
+from redis.asyncio.connection import AbstractConnection  # noqa: E402
+
+from avtomatika.storage.redis import RedisStorage  # noqa: E402
+from avtomatika.storage.unit_of_work import JobUnitOfWork  # noqa: E402
+
+PAYLOAD_SIZES = (1_000, 100_000, 1_000_000)
+WRITE_COMMANDS = {b"SET", b"HSET", b"HDEL", b"DEL"}
+
+bytes_written = 0
+_pack_command = AbstractConnection.pack_command
+
+
+def _counting_pack_command(self, *args):
+    global bytes_written
+    packed = _pack_command(self, *args)
+    name = args[0].encode() if isinstance(args[0], str) else args[0]
+    if name.upper() in WRITE_COMMANDS:
+        bytes_written += sum(len(chunk) for chunk in packed)
+    return packed
+
+
+AbstractConnection.pack_command = _counting_pack_command
+
+
+async def run_lifecycle(storage: RedisStorage, job_id: str, payload_size: int):
+    # API: job creation
+    job_writes = JobUnitOfWork(storage)
+    await job_writes.save_job_state(
+        job_id,
+        {
+            "id": job_id,
+            "blueprint_name": "benchmark",
+            "current_state": "start",
+            "initial_data": {"document": "x" * payload_size},
+            "state_history": {},
+            "status": "pending",
+            "tracing_context": {"traceparent": "00-" + "0" * 32 + "-" + "0" * 16 + "-01"},
+            "client_config": {"token": "client-token", "plan": "premium", "params": {}},
+        },
+    )
+    await job_writes.enqueue_job(job_id)
+    await job_writes.commit()
+
+    # Executor: the handler dispatches a task
+    job_state = await storage.get_job_state(job_id)
+    job_writes = JobUnitOfWork(storage)
+    job_state["retry_count"] = 0
+    job_state["status"] = "waiting_for_worker"
+    job_state["task_dispatched_at"] = monotonic()
+    job_state["current_task_info"] = {"type": "process", "params": {}}
+    job_state["current_task_transitions"] = {"success": "finished", "failure": "failed"}
+    await job_writes.save_job_state(job_id, job_state)
+    await job_writes.add_job_to_watch(job_id, monotonic() + 60)
+    job_state["current_task_id"] = "task-1"
+    job_state["task_worker_id"] = "worker-1"
+    await job_writes.save_job_state(job_id, job_state)
+    await job_writes.commit()
+
+    # API: the worker result is accepted
+    job_state = await storage.get_job_state(job_id)
+    job_writes = JobUnitOfWork(storage)
+    await job_writes.remove_job_from_watch(job_id)
+    job_state["state_history"].update({"summary": "y" * 200})
+    job_state["current_state"] = "finished"
+    job_state["status"] = "running"
+    await job_writes.save_job_state(job_id, job_state)
+    await job_writes.enqueue_job(job_id)
+    await job_writes.commit()
+
+    # Watcher-style status update
+    await storage.update_job_state(job_id, {"status": "finished"})
+
+
+async def measure(layout: str, payload_size: int) -> int:
+    global bytes_written
+    redis = aioredis.FakeRedis()
+    storage = RedisStorage(redis, job_state_layout=layout)
+    bytes_written = 0
+    await run_lifecycle(storage, "job-1", payload_size)
+    result = bytes_written
+    await redis.aclose()
+    return result
+
+
+async def main():
+    print(f"{'initial_data':>12} {'blob, bytes':>14} {'hash, bytes':>14} {'ratio':>8}")
+    for payload_size in PAYLOAD_SIZES:
+        blob = await measure("blob", payload_size)
+        hashed = await measure("hash", payload_size)
+        print(f"{payload_size:>12} {blob:>14} {hashed:>14} {blob / hashed:>8.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
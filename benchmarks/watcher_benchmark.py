@@ -0,0 +1,102 @@
+"""Measures how late the Watcher fails jobs after their deadline.
+
+Compares the deadline-driven watcher with the previous fixed-interval polling
+(sleep `WATCHER_INTERVAL_SECONDS`, then handle everything overdue) on
+`RedisStorage` and `MemoryStorage`. Deadlines of 500 jobs are spread over a few
+seconds, and are added while the watcher is already running.
+Requires the test extras (`fakeredis`), no real Redis server is needed.
+
+Usage:
+    python benchmarks/watcher_benchmark.py
+"""
+
+import asyncio
+import os
+import sys
+from asyncio import sleep
+from random import uniform
+from statistics import median, quantiles
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fakeredis import aioredis  # noqa: E402
+
+from avtomatika.config import Config  # noqa: E402
+from avtomatika.engine import OrchestratorEngine  # noqa: E402
+from avtomatika.storage.base import StorageBackend  # noqa: E402
+from avtomatika.storage.memory import MemoryStorage  # noqa: E402
+from avtomatika.storage.redis import RedisStorage  # noqa: E402
+from avtomatika.watcher import Watcher  # noqa: E402
+
+JOB_COUNT = 500
+SPREAD_SECONDS = 3.0
+# Kept short so the legacy mode finishes quickly; the default of 20s makes it proportionally worse
+INTERVAL_SECONDS = 1
+
+
+class TimingWatcher(Watcher):
+    """Records how long after its deadline each entry was handled."""
+
+    def __init__(self, engine: OrchestratorEngine, deadlines: dict[str, float]):
+        super().__init__(engine)
+        self.deadlines = deadlines
+        self.lateness_ms: list[float] = []
+
+    async def handle_timeouts(self, entries: list[str]):
+        now = time()
+        self.lateness_ms.extend((now - self.deadlines[entry]) * 1000 for entry in entries)
+        await super().handle_timeouts(entries)
+
+
+class LegacyIntervalWatcher(TimingWatcher):
+    """The previous loop: sleep the whole interval, then handle every overdue entry."""
+
+    async def run(self):
+        self._running = True
+        while self._running:
+            await sleep(self.watch_interval_seconds)
+            if timed_out := await self.storage.get_timed_out_jobs():
+                await self.handle_timeouts(timed_out)
+
+
+async def run_case(name: str, storage: StorageBackend, watcher_class: type[TimingWatcher]) -> None:
+    config = Config()
+    config.WATCHER_INTERVAL_SECONDS = INTERVAL_SECONDS
+    config.LOG_LEVEL = "ERROR"
+    engine = OrchestratorEngine(storage, config)
+    deadlines: dict[str, float] = {}
+    watcher = watcher_class(engine, deadlines)
+    # The only instance, it owns all shards
+    await engine.shard_leases.rebalance()
+    task = asyncio.create_task(watcher.run())
+    await sleep(0.1)
+
+    start = time()
+    for i in range(JOB_COUNT):
+        job_id = f"job-{i}"
+        deadlines[job_id] = start + uniform(0.2, SPREAD_SECONDS)
+        await storage.save_job_state(job_id, {"id": job_id, "status": "waiting_for_worker"})
+        await storage.add_job_to_watch(job_id, deadlines[job_id])
+    while len(watcher.lateness_ms) < JOB_COUNT:
+        await sleep(0.05)
+
+    watcher.stop()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    lateness = watcher.lateness_ms
+    p99 = quantiles(lateness, n=100)[-1]
+    print(f"{name:<28} {median(lateness):>12.1f} {p99:>12.1f} {max(lateness):>12.1f}")
+
+
+async def main() -> None:
+    print(f"{'watcher':<28} {'p50, ms':>12} {'p99, ms':>12} {'max, ms':>12}")
+    for mode, watcher_class in (("interval", LegacyIntervalWatcher), ("deadline", TimingWatcher)):
+        client = aioredis.FakeRedis()
+        await run_case(f"redis ({mode})", RedisStorage(client), watcher_class)
+        await client.aclose()
+        await run_case(f"memory ({mode})", MemoryStorage(), watcher_class)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
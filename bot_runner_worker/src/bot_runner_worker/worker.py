@@ -48,6 +48,13 @@ async def start_bot_handler(params: Dict[str, Any], **kwargs) -> Dict[str, Any]:
     - image: готовый Docker образ
     """
     try:
+        # Большие поля (код, файлы, архив) оркестратор может передать ссылкой на blob store
+        resolve_blob = kwargs.get("resolve_blob")
+        if resolve_blob:
+            for field in ("code", "files", "archive"):
+                if field in params:
+                    params[field] = await resolve_blob(params[field])
+
         user_id = params["user_id"]
         bot_id = params["bot_id"]
         deployment_mode = params["deployment_mode"]
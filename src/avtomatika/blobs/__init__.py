@@ -0,0 +1,11 @@
+from contextlib import suppress
+
+from .base import BlobStore, find_blob_keys, is_blob_ref, make_blob_ref
+from .filesystem import FileSystemBlobStore
+
+__all__ = ["BlobStore", "FileSystemBlobStore", "find_blob_keys", "is_blob_ref", "make_blob_ref"]
+
+with suppress(ImportError):
+    from .redis import RedisBlobStore  # noqa: F401
+
+    __all__.append("RedisBlobStore")
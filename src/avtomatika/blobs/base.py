@@ -0,0 +1,123 @@
+from abc import ABC, abstractmethod
+from collections.abc import Collection
+from hashlib import sha256
+from typing import Any
+
+from orjson import JSONEncodeError, dumps, loads
+
+# Marker key of a reference to a payload kept in a blob store: {"$blob": "sha256:<hex>", "size": <bytes>}
+BLOB_REF_KEY = "$blob"
+
+
+def make_blob_ref(key: str, size: int) -> dict[str, Any]:
+    """Builds the reference stored in place of an offloaded payload."""
+    return {BLOB_REF_KEY: key, "size": size}
+
+
+def is_blob_ref(value: Any) -> bool:
+    """Checks whether a value is a reference to an offloaded payload."""
+    return isinstance(value, dict) and isinstance(value.get(BLOB_REF_KEY), str)
+
+
+def find_blob_keys(value: Any) -> set[str]:
+    """Returns the keys of all references found anywhere in a (nested) value, e.g. a job state."""
+    if is_blob_ref(value):
+        return {value[BLOB_REF_KEY]}
+    keys: set[str] = set()
+    if isinstance(value, dict):
+        for item in value.values():
+            keys |= find_blob_keys(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            keys |= find_blob_keys(item)
+    return keys
+
+
+def blob_key(data: bytes) -> str:
+    """Returns the content address of the encoded payload."""
+    return f"sha256:{sha256(data).hexdigest()}"
+
+
+class BlobStore(ABC):
+    """Abstract base class for a content-addressed store of large payloads.
+
+    Payloads are encoded as JSON and stored once under the hash of their
+    contents. Job state, task payloads and history keep only a small
+    reference, which handlers and workers resolve when they need the data.
+    Storing or reading a payload renews it, so `sweep` only removes payloads
+    that no job has used for the retention period.
+    """
+
+    @abstractmethod
+    async def put(self, data: bytes) -> str:
+        """Stores the encoded payload if it is not stored yet, otherwise renews the stored one.
+
+        :param data: The JSON-encoded payload.
+        :return: The content address (key) of the payload.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None:
+        """Gets the encoded payload by its key.
+
+        :param key: The content address returned by `put`.
+        :return: The JSON-encoded payload or None if it is not found.
+        """
+        raise NotImplementedError
+
+    async def touch(self, keys: Collection[str]) -> None:
+        """Renews stored payloads as if they were read, so that they are not swept or expired.
+        The default implementation reads them; missing payloads are skipped.
+
+        :param keys: Content addresses returned by `put`.
+        """
+        for key in keys:
+            await self.get(key)
+
+    async def sweep(self, older_than: float) -> int:
+        """Deletes the payloads that were neither stored nor read since `older_than`.
+        Stores that expire payloads by themselves (e.g. with a TTL) keep this default.
+
+        :param older_than: Unix timestamp; payloads last used before it are deleted.
+        :return: The number of deleted payloads.
+        """
+        return 0
+
+    async def load(self, key: str) -> Any:
+        """Gets and decodes a payload by its key. Raises KeyError if it is not found."""
+        data = await self.get(key)
+        if data is None:
+            raise KeyError(f"Blob '{key}' not found")
+        return loads(data)
+
+    async def offload(self, data: dict[str, Any], threshold: int) -> dict[str, Any]:
+        """Returns a copy of `data` where top-level values whose encoded size
+        exceeds `threshold` bytes are stored in the blob store and replaced
+        by references. Values that cannot be encoded as JSON are kept inline.
+        """
+        offloaded = {}
+        for name, value in data.items():
+            if is_blob_ref(value):
+                offloaded[name] = value
+                continue
+            try:
+                encoded = dumps(value)
+            except JSONEncodeError:
+                offloaded[name] = value
+                continue
+            if len(encoded) > threshold:
+                offloaded[name] = make_blob_ref(await self.put(encoded), len(encoded))
+            else:
+                offloaded[name] = value
+        return offloaded
+
+    async def resolve(self, value: Any) -> Any:
+        """Returns the payload behind a reference, or the value itself if it is not a reference."""
+        if is_blob_ref(value):
+            return await self.load(value[BLOB_REF_KEY])
+        return value
+
+    async def resolve_all(self, data: dict[str, Any]) -> dict[str, Any]:
+        """Returns a copy of `data` with all top-level references resolved."""
+        return {name: await self.resolve(value) for name, value in data.items()}
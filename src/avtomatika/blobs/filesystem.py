@@ -0,0 +1,105 @@
+from asyncio import to_thread
+from collections.abc import Collection
+from contextlib import suppress
+from mmap import ACCESS_READ, mmap
+from os import makedirs, remove, replace, scandir, utime
+from os.path import exists, join
+from tempfile import NamedTemporaryFile
+from typing import Any
+
+from orjson import loads
+
+from .base import BlobStore, blob_key
+
+
+class FileSystemBlobStore(BlobStore):
+    """Blob store keeping each payload in a file under a local (or shared) directory.
+    Payloads are decoded straight from a memory-mapped file. The modification time of
+    a file is its last use, it is renewed whenever the payload is stored or read.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        digest = key.split(":", 1)[-1]
+        if not digest.isalnum():
+            raise ValueError(f"Invalid blob key '{key}'")
+        return join(self.root, digest[:2], digest)
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        try:
+            utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        if self._touch(path):
+            return
+        directory = path.rsplit("/", 1)[0]
+        makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial payload
+        with NamedTemporaryFile(dir=directory, delete=False) as tmp:
+            tmp.write(data)
+        replace(tmp.name, path)
+
+    def _read(self, key: str) -> bytes | None:
+        path = self._path(key)
+        if not self._touch(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _load(self, key: str) -> Any:
+        path = self._path(key)
+        if not self._touch(path):
+            raise KeyError(f"Blob '{key}' not found")
+        with open(path, "rb") as f, mmap(f.fileno(), 0, access=ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                return loads(view)
+            finally:
+                view.release()
+
+    def _touch_all(self, keys: Collection[str]) -> None:
+        for key in keys:
+            # References are kept as given in job input, a malformed one points at no payload
+            with suppress(ValueError):
+                self._touch(self._path(key))
+
+    def _sweep(self, older_than: float) -> int:
+        if not exists(self.root):
+            return 0
+        deleted = 0
+        with scandir(self.root) as directories:
+            for directory in directories:
+                if not directory.is_dir():
+                    continue
+                with scandir(directory.path) as files:
+                    for file in files:
+                        # Temporary files of interrupted writes are removed as well
+                        if file.is_file() and file.stat().st_mtime < older_than:
+                            with suppress(FileNotFoundError):
+                                remove(file.path)
+                                deleted += 1
+        return deleted
+
+    async def put(self, data: bytes) -> str:
+        key = blob_key(data)
+        await to_thread(self._write, key, data)
+        return key
+
+    async def get(self, key: str) -> bytes | None:
+        return await to_thread(self._read, key)
+
+    async def load(self, key: str) -> Any:
+        return await to_thread(self._load, key)
+
+    async def touch(self, keys: Collection[str]) -> None:
+        await to_thread(self._touch_all, keys)
+
+    async def sweep(self, older_than: float) -> int:
+        return await to_thread(self._sweep, older_than)
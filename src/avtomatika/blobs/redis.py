@@ -0,0 +1,41 @@
+from collections.abc import Collection
+
+from redis import Redis
+
+from .base import BlobStore, blob_key
+
+
+class RedisBlobStore(BlobStore):
+    """Blob store keeping each payload in a Redis string key.
+    With a `ttl` Redis expires the payloads itself; storing or reading a payload renews its TTL.
+    """
+
+    def __init__(self, redis_client: Redis, prefix: str = "orchestrator:blob", ttl: int | None = None):
+        self._redis = redis_client
+        self._prefix = prefix
+        self._ttl = ttl
+
+    def _get_key(self, key: str) -> str:
+        return f"{self._prefix}:{key}"
+
+    async def put(self, data: bytes) -> str:
+        key = blob_key(data)
+        # The key is derived from the content, an existing payload never needs to be rewritten
+        stored = await self._redis.set(self._get_key(key), data, nx=True, ex=self._ttl)
+        if not stored and self._ttl:
+            await self._redis.expire(self._get_key(key), self._ttl)
+        return key
+
+    async def get(self, key: str) -> bytes | None:
+        if self._ttl:
+            return await self._redis.getex(self._get_key(key), ex=self._ttl)
+        return await self._redis.get(self._get_key(key))
+
+    async def touch(self, keys: Collection[str]) -> None:
+        # Without a TTL payloads are kept until they are deleted, there is nothing to renew
+        if not self._ttl or not keys:
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.expire(self._get_key(key), self._ttl)
+            await pipe.execute()
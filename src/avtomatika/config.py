@@ -15,6 +15,20 @@ class Config:
         self.REDIS_HOST: str = getenv("REDIS_HOST", "")
         self.REDIS_PORT: int = int(getenv("REDIS_PORT", 6379))
         self.REDIS_DB: int = int(getenv("REDIS_DB", 0))
+        # Connection pools of the request traffic and of blocking commands (XREADGROUP BLOCK, BZPOPMAX,
+        # subscriptions), and how long a command waits for a free connection
+        self.REDIS_MAX_CONNECTIONS: int = int(getenv("REDIS_MAX_CONNECTIONS", 50))
+        self.REDIS_BLOCKING_MAX_CONNECTIONS: int = int(getenv("REDIS_BLOCKING_MAX_CONNECTIONS", 10))
+        self.REDIS_POOL_TIMEOUT_SECONDS: float = float(getenv("REDIS_POOL_TIMEOUT_SECONDS", 5.0))
+        self.REDIS_HEALTH_CHECK_INTERVAL_SECONDS: int = int(getenv("REDIS_HEALTH_CHECK_INTERVAL_SECONDS", 30))
+        # RESP protocol version of the pooled connections, 2 or 3
+        self.REDIS_PROTOCOL: int = int(getenv("REDIS_PROTOCOL", 2))
+        # Server-assisted client-side caching of client configs and worker tokens
+        self.REDIS_CLIENT_CACHE_ENABLED: bool = getenv("REDIS_CLIENT_CACHE_ENABLED", "false").lower() == "true"
+        self.REDIS_CLIENT_CACHE_SIZE: int = int(getenv("REDIS_CLIENT_CACHE_SIZE", 10000))
+        self.REDIS_CLIENT_CACHE_TTL_SECONDS: float = float(getenv("REDIS_CLIENT_CACHE_TTL_SECONDS", 60.0))
+        # How job states are stored: "blob" (one msgpack value per job) or "hash" (one value per top-level field)
+        self.REDIS_JOB_STATE_LAYOUT: str = getenv("REDIS_JOB_STATE_LAYOUT", "blob")
 
         # Postgres settings
         self.POSTGRES_DSN: str = getenv(
@@ -46,15 +60,95 @@ class Config:
             getenv("WORKER_HEALTH_CHECK_INTERVAL_SECONDS", 60),
         )
         self.JOB_MAX_RETRIES: int = int(getenv("JOB_MAX_RETRIES", 3))
+        # The watcher sleeps until the next job deadline, but at most this long
         self.WATCHER_INTERVAL_SECONDS: int = int(
             getenv("WATCHER_INTERVAL_SECONDS", 20),
         )
+        # Timed out entries the watcher claims and handles in one batch
+        self.WATCHER_BATCH_SIZE: int = int(getenv("WATCHER_BATCH_SIZE", 100))
+        # Shard leases of the watcher and reputation work expire this long after their owner stops renewing them
+        self.SHARD_LEASE_TTL_SECONDS: int = int(getenv("SHARD_LEASE_TTL_SECONDS", 15))
         self.EXECUTOR_MAX_CONCURRENT_JOBS: int = int(
             getenv("EXECUTOR_MAX_CONCURRENT_JOBS", 100),
         )
+        self.EXECUTOR_DEQUEUE_BATCH_SIZE: int = int(
+            getenv("EXECUTOR_DEQUEUE_BATCH_SIZE", 10),
+        )
+        self.EXECUTOR_DEQUEUE_BLOCK_MS: int = int(
+            getenv("EXECUTOR_DEQUEUE_BLOCK_MS", 1000),
+        )
+        # Job queue partitioning: "none", "blueprint", "hash" (JOB_PARTITION_COUNT partitions by job ID) or
+        # "blueprint_hash". Per-blueprint weights and caps are given as "blueprint_a:3,blueprint_b:1".
+        self.JOB_PARTITIONING: str = getenv("JOB_PARTITIONING", "none")
+        self.JOB_PARTITION_COUNT: int = int(getenv("JOB_PARTITION_COUNT", 4))
+        self.JOB_PARTITION_WEIGHTS: str = getenv("JOB_PARTITION_WEIGHTS", "")
+        self.JOB_PARTITION_MAX_CONCURRENT_JOBS: str = getenv("JOB_PARTITION_MAX_CONCURRENT_JOBS", "")
+        # Priority lanes of the job queue as "lane:min_priority", e.g. "urgent:10,high:1", and their weights.
+        # "weighted" drains the lanes by weight, "strict" reads a lane only while all higher ones are empty.
+        self.JOB_PRIORITY_LANES: str = getenv("JOB_PRIORITY_LANES", "")
+        self.JOB_PRIORITY_LANE_WEIGHTS: str = getenv("JOB_PRIORITY_LANE_WEIGHTS", "")
+        self.JOB_PRIORITY_DRAINING: str = getenv("JOB_PRIORITY_DRAINING", "weighted")
+        # Jobs this close to their deadline are queued in the highest priority lane
+        self.JOB_DEADLINE_BOOST_SECONDS: float = float(getenv("JOB_DEADLINE_BOOST_SECONDS", 60))
+        # How often acknowledged jobs are trimmed from the job queue and its metrics are reported
+        self.JOB_QUEUE_MAINTENANCE_INTERVAL_SECONDS: int = int(getenv("JOB_QUEUE_MAINTENANCE_INTERVAL_SECONDS", 60))
+        # Consumers of the job queue idle this long without pending jobs and not of a live instance are removed
+        self.JOB_QUEUE_CONSUMER_IDLE_SECONDS: int = int(getenv("JOB_QUEUE_CONSUMER_IDLE_SECONDS", 3600))
+        self.WORKER_CACHE_ENABLED: bool = getenv("WORKER_CACHE_ENABLED", "false").lower() == "true"
+        self.WORKER_CACHE_MAX_STALENESS_SECONDS: float = float(
+            getenv("WORKER_CACHE_MAX_STALENESS_SECONDS", 5.0),
+        )
+        # Live per-worker task statistics: weight of the newest task in the moving averages,
+        # and the number of recent tasks the latency percentiles cover
+        self.WORKER_STATS_EWMA_ALPHA: float = float(getenv("WORKER_STATS_EWMA_ALPHA", 0.2))
+        self.WORKER_STATS_WINDOW: int = int(getenv("WORKER_STATS_WINDOW", 100))
+        # Number of random workers compared by the `expected_finish` dispatch strategy, 0 compares all
+        self.DISPATCH_EXPECTED_FINISH_CHOICES: int = int(getenv("DISPATCH_EXPECTED_FINISH_CHOICES", 2))
+        # "worker" enqueues each task for one worker, "shared" into per-task-type queues any capable worker claims
+        self.TASK_QUEUE_MODE: str = getenv("TASK_QUEUE_MODE", "worker")
+        # In the shared mode, idle workers take tasks from a peer's queue once it holds this many
+        self.TASK_STEAL_MIN_QUEUE: int = int(getenv("TASK_STEAL_MIN_QUEUE", 2))
+        # Long polls wait on a single task event subscription instead of a blocking pop per worker
+        self.TASK_NOTIFICATIONS_ENABLED: bool = getenv("TASK_NOTIFICATIONS_ENABLED", "true").lower() == "true"
+        # Without task notifications, long polls holding a blocking pop (and a connection of the blocking pool)
+        # at once. The job stream reader and the three pub/sub subscriptions keep 4 connections of that pool.
+        self.WORKER_BLOCKING_POLLS_MAX: int = int(
+            getenv("WORKER_BLOCKING_POLLS_MAX", max(self.REDIS_BLOCKING_MAX_CONNECTIONS - 4, 1)),
+        )
+        # Long polls over WORKER_BLOCKING_POLLS_MAX check the queues without blocking this often
+        self.WORKER_POLL_FALLBACK_INTERVAL_SECONDS: float = float(getenv("WORKER_POLL_FALLBACK_INTERVAL_SECONDS", 1))
+        # Workers that ask for it over their WebSocket connection get tasks pushed instead of polling
+        self.WORKER_PUSH_ENABLED: bool = getenv("WORKER_PUSH_ENABLED", "false").lower() == "true"
+
+        # Large payload offloading, enabled when a blob store is configured
+        self.BLOB_STORE_PATH: str = getenv("BLOB_STORE_PATH", "")
+        self.BLOB_STORE_THRESHOLD_BYTES: int = int(
+            getenv("BLOB_STORE_THRESHOLD_BYTES", 65536),
+        )
+        # Payloads not stored or read for this many days are deleted, 0 keeps them forever.
+        # Expired payloads are swept every HISTORY_RETENTION_INTERVAL_SECONDS.
+        self.BLOB_STORE_RETENTION_DAYS: int = int(getenv("BLOB_STORE_RETENTION_DAYS", 0))
 
         # History storage settings
         self.HISTORY_DATABASE_URI: str = getenv("HISTORY_DATABASE_URI", "")
+        # Events are written in batches by a background task unless buffering is disabled
+        self.HISTORY_BUFFER_ENABLED: bool = getenv("HISTORY_BUFFER_ENABLED", "true").lower() == "true"
+        self.HISTORY_BUFFER_MAX_SIZE: int = int(getenv("HISTORY_BUFFER_MAX_SIZE", 10000))
+        self.HISTORY_BATCH_SIZE: int = int(getenv("HISTORY_BATCH_SIZE", 500))
+        self.HISTORY_FLUSH_INTERVAL_SECONDS: float = float(
+            getenv("HISTORY_FLUSH_INTERVAL_SECONDS", 0.5),
+        )
+        self.HISTORY_OVERFLOW_POLICY: str = getenv("HISTORY_OVERFLOW_POLICY", "block")  # "block", "drop" or "spill"
+        self.HISTORY_SPILL_PATH: str = getenv("HISTORY_SPILL_PATH", "")
+        # Job events store a full context snapshot every N events and diffs in between (1 disables diffs)
+        self.HISTORY_FULL_SNAPSHOT_INTERVAL: int = int(getenv("HISTORY_FULL_SNAPSHOT_INTERVAL", 10))
+        # Events are stored in one partition per "day" or "week", empty disables partitioning
+        self.HISTORY_PARTITION_INTERVAL: str = getenv("HISTORY_PARTITION_INTERVAL", "")
+        # Events older than this are removed in the background, 0 keeps the history forever
+        self.HISTORY_RETENTION_DAYS: int = int(getenv("HISTORY_RETENTION_DAYS", 0))
+        self.HISTORY_RETENTION_INTERVAL_SECONDS: int = int(getenv("HISTORY_RETENTION_INTERVAL_SECONDS", 3600))
+        # Expired partitions are exported to Parquet files in this directory before they are dropped
+        self.HISTORY_ARCHIVE_PATH: str = getenv("HISTORY_ARCHIVE_PATH", "")
 
         # Rate limiting settings
         self.RATE_LIMITING_ENABLED: bool = getenv("RATE_LIMITING_ENABLED", "true").lower() == "true"
@@ -24,6 +24,8 @@ class JobContext(NamedTuple):
     data_stores: Any = None
     tracing_context: dict[str, Any] = {}
     aggregation_results: dict[str, Any] | None = None
+    # Resolves references to offloaded payloads: `await context.blobs.resolve(value)`
+    blobs: Any = None
 
 
 class GPUInfo(NamedTuple):
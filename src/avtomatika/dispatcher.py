@@ -1,9 +1,12 @@
 from collections import defaultdict
+from hashlib import sha1
 from logging import getLogger
-from random import choice
-from typing import Any
+from random import choice, sample
+from typing import Any, NoReturn
 from uuid import uuid4
 
+from orjson import OPT_SORT_KEYS, dumps
+
 try:
     from opentelemetry.propagate import inject  # type: ignore[import]
 except ImportError:
@@ -12,21 +15,54 @@ except ImportError:
         pass
 
 
+from .blobs.base import BlobStore
 from .config import Config
 from .storage.base import StorageBackend
+from .storage.unit_of_work import JobUnitOfWork
+from .worker_cache import WorkerCache
+from .worker_stats import summarize_task_stats
 
 logger = getLogger(__name__)
 
+# Strategies that look at the live task statistics of the workers (see `_with_task_stats`)
+STATS_STRATEGIES = {"best_value"}
+# "worker" binds every task to one worker's queue, "shared" queues tasks per task type (see `claim_task`)
+TASK_QUEUE_MODES = ("worker", "shared")
+# Shared queue names start with this, per-worker queues are named by the worker ID
+SHARED_QUEUE_PREFIX = "type:"
+
+
+def shared_queue_name(task_type: str, class_id: str = "") -> str:
+    """Returns the name of the shared queue of a task type, or of one of its resource classes."""
+    return f"{SHARED_QUEUE_PREFIX}{task_type}:{class_id}" if class_id else f"{SHARED_QUEUE_PREFIX}{task_type}"
+
+
+def resource_class_id(constraints: dict[str, Any]) -> str:
+    """Returns a short stable identifier of the `resource_requirements` and `max_cost` of a task."""
+    return sha1(dumps(constraints, option=OPT_SORT_KEYS)).hexdigest()[:12]
+
 
 class Dispatcher:
     """Responsible for dispatching tasks to specific workers using various strategies.
     In the PULL model, this means enqueuing the task for the worker.
     """
 
-    def __init__(self, storage: StorageBackend, config: Config):
+    def __init__(
+        self,
+        storage: StorageBackend,
+        config: Config,
+        worker_cache: WorkerCache | None = None,
+        blob_store: BlobStore | None = None,
+    ):
         self.storage = storage
         self.config = config
+        # Large task params are offloaded here, workers fetch them by reference
+        self.blob_store = blob_store
+        # When enabled, workers are looked up in the process-local snapshot instead of storage
+        self.workers: StorageBackend | WorkerCache = worker_cache or storage
         self._round_robin_indices: dict[str, int] = defaultdict(int)
+        # (task_type, class_id) pairs of the shared queues this instance has registered
+        self._registered_classes: set[tuple[str, str]] = set()
 
     @staticmethod
     def _is_worker_compliant(
@@ -56,6 +92,16 @@ class Dispatcher:
 
         return True
 
+    @classmethod
+    def _is_in_resource_class(cls, worker: dict[str, Any], constraints: dict[str, Any]) -> bool:
+        """Checks if a worker may run the tasks of a shared queue with these constraints."""
+        if constraints.get("resource_requirements") and not cls._is_worker_compliant(
+            worker, constraints["resource_requirements"]
+        ):
+            return False
+        max_cost = constraints.get("max_cost")
+        return max_cost is None or worker.get("cost_per_second", float("inf")) <= max_cost
+
     @staticmethod
     def _select_default(
         workers: list[dict[str, Any]],
@@ -112,11 +158,13 @@ class Dispatcher:
     @staticmethod
     def _get_best_value_score(worker: dict[str, Any]) -> float:
         """Calculates a "score" for a worker using the formula cost / reputation.
-        The lower the score, the better.
+        The reputation is lowered by the recent error rate of the worker for the task type,
+        so failures count before the next reputation recalculation. The lower the score, the better.
         """
         cost = worker.get("cost_per_second", float("inf"))
         # Default reputation is 1.0 if absent
         reputation = worker.get("reputation", 1.0)
+        reputation *= 1 - worker.get("task_stats", {}).get("error_rate", 0.0)
         # Avoid division by zero
         return float("inf") if reputation == 0 else cost / reputation
 
@@ -128,24 +176,186 @@ class Dispatcher:
         """Selects the worker with the best price-quality (reputation) ratio."""
         return min(workers, key=self._get_best_value_score)
 
-    async def dispatch(self, job_state: dict[str, Any], task_info: dict[str, Any]):
-        job_id = job_state["id"]
-        task_type = task_info.get("type")
-        if not task_type:
-            raise ValueError("Task info must include a 'type'")
+    @staticmethod
+    def _get_concurrency(worker: dict[str, Any]) -> int:
+        """Returns how many tasks a worker runs at the same time, as reported at registration."""
+        concurrency = worker.get("max_concurrent_tasks") or (worker.get("resources") or {}).get("max_concurrent_tasks")
+        return max(int(concurrency or 1), 1)
 
-        dispatch_strategy = task_info.get("dispatch_strategy", "default")
-        resource_requirements = task_info.get("resource_requirements")
+    async def _select_expected_finish(
+        self,
+        workers: list[dict[str, Any]],
+        task_type: str,
+    ) -> dict[str, Any]:
+        """ "Expected Finish" strategy: selects the worker expected to finish the task first.
+
+        The estimate is (queued + in-flight tasks + 1) * observed latency / concurrency, where the
+        queue and in-flight counts are read from storage at dispatch time rather than taken from
+        the last heartbeat. Only `DISPATCH_EXPECTED_FINISH_CHOICES` random workers are compared
+        (power of two choices by default), which keeps the lookups constant and stops orchestrator
+        instances from all piling onto the same worker. Workers without latency statistics for the
+        task type are assumed to be as fast as the average of the compared workers.
+        """
+        choices = self.config.DISPATCH_EXPECTED_FINISH_CHOICES
+        if choices and len(workers) > choices:
+            workers = sample(workers, choices)
+
+        worker_ids = [w["worker_id"] for w in workers]
+        loads = await self.storage.get_worker_loads(worker_ids)
+        stats = await self.storage.get_workers_stats(worker_ids, task_type)
+        latencies = {
+            worker_id: worker_stats[task_type]["lat"]
+            for worker_id, worker_stats in stats.items()
+            if worker_stats[task_type].get("lat") is not None
+        }
+        default_latency = sum(latencies.values()) / len(latencies) if latencies else 1.0
+
+        def expected_finish(worker: dict[str, Any]) -> float:
+            load = loads.get(worker["worker_id"], {})
+            pending = load.get("queued", 0) + load.get("in_flight", 0) + 1
+            latency = latencies.get(worker["worker_id"], default_latency)
+            return pending * latency / self._get_concurrency(worker)
+
+        return min(workers, key=expected_finish)
+
+    async def _with_task_stats(self, workers: list[dict[str, Any]], task_type: str) -> list[dict[str, Any]]:
+        """Returns the workers with their live statistics for the task type under `task_stats`.
+        Workers are copied so the registry entries (possibly shared through the worker cache) stay untouched.
+        """
+        stats = await self.storage.get_workers_stats([w["worker_id"] for w in workers], task_type)
+        return [
+            {**w, "task_stats": summarize_task_stats(stats[w["worker_id"]][task_type])}
+            if w["worker_id"] in stats
+            else w
+            for w in workers
+        ]
+
+    async def _shared_queue_for(
+        self,
+        task_type: str,
+        resource_requirements: dict[str, Any] | None,
+        max_cost: float | None,
+    ) -> str:
+        """Returns the shared queue for a task, registering its resource class on first use."""
+        constraints: dict[str, Any] = {}
+        if resource_requirements:
+            constraints["resource_requirements"] = resource_requirements
+        if max_cost is not None:
+            constraints["max_cost"] = max_cost
+        if not constraints:
+            return shared_queue_name(task_type)
+
+        class_id = resource_class_id(constraints)
+        if (task_type, class_id) not in self._registered_classes:
+            await self.storage.register_resource_class(task_type, class_id, constraints)
+            self._registered_classes.add((task_type, class_id))
+        return shared_queue_name(task_type, class_id)
+
+    async def _claimable_queues(self, worker: dict[str, Any]) -> list[str]:
+        """Returns the queues a worker takes tasks from: its own queue first (tasks routed to it
+        for affinity), then the shared queues of its task types and the resource classes it satisfies.
+        """
+        task_types = worker.get("supported_tasks", [])
+        resource_classes = await self.storage.get_resource_classes(task_types)
+        queues = [worker["worker_id"]]
+        for task_type in task_types:
+            queues.append(shared_queue_name(task_type))
+            queues.extend(
+                shared_queue_name(task_type, class_id)
+                for class_id, constraints in resource_classes.get(task_type, {}).items()
+                if self._is_in_resource_class(worker, constraints)
+            )
+        return queues
+
+    async def claimable_queues(self, worker_id: str) -> list[str]:
+        """Returns the queues `claim_tasks` takes the tasks of a worker from, except stolen ones."""
+        worker = await self.storage.get_worker_info(worker_id)
+        return await self._claimable_queues(worker) if worker else [worker_id]
 
-        all_workers = await self.storage.get_available_workers()
+    async def _steal_task(self, worker: dict[str, Any]) -> tuple[str, dict[str, Any], float] | None:
+        """Takes a task from the queue of the most loaded worker that shares a task type with `worker`,
+        if that queue holds at least `TASK_STEAL_MIN_QUEUE` tasks. In the shared mode per-worker queues
+        only hold tasks without resource constraints, so supporting the task type is enough to run it.
+        """
+        task_types = set(worker.get("supported_tasks", []))
+        peer_ids = set()
+        for task_type in task_types:
+            peer_ids.update(w["worker_id"] for w in await self.workers.get_available_workers(task_type=task_type))
+        peer_ids.discard(worker["worker_id"])
+        if not peer_ids:
+            return None
+
+        loads = await self.storage.get_worker_loads(list(peer_ids))
+        victim_id, load = max(loads.items(), key=lambda item: item[1]["queued"])
+        if load["queued"] < self.config.TASK_STEAL_MIN_QUEUE:
+            return None
+        # The victim may also run other task types, such a task is left where it is
+        stolen = await self.storage.dequeue_task_of_types(victim_id, task_types)
+        if stolen is None:
+            return None
+        logger.info(f"Worker {worker['worker_id']} took task {stolen[1].get('task_id')} from the queue of {victim_id}")
+        return stolen
+
+    async def claim_task(self, worker_id: str, timeout: int) -> dict[str, Any] | None:
+        """Takes the next task for a worker in the "shared" task queue mode (see `claim_tasks`)."""
+        tasks = await self.claim_tasks(worker_id, timeout, 1)
+        return tasks[0] if tasks else None
+
+    async def claim_tasks(self, worker_id: str, timeout: int | None, count: int) -> list[dict[str, Any]]:
+        """Takes up to `count` tasks for a worker in the "shared" task queue mode (see `claim_queued_tasks`)."""
+        return [task for _, task, _ in await self.claim_queued_tasks(worker_id, timeout, count)]
+
+    async def claim_queued_tasks(
+        self,
+        worker_id: str,
+        timeout: int | None,
+        count: int,
+        storage: StorageBackend | JobUnitOfWork | None = None,
+    ) -> list[tuple[str, dict[str, Any], float]]:
+        """Takes up to `count` tasks for a worker in the "shared" task queue mode, each with the
+        queue it was taken from and its priority.
+
+        The worker's own queue and the shared queues it can serve are checked first, then
+        a task is stolen from an overloaded peer, and finally the worker waits up to `timeout`
+        seconds (None does not wait) on all of its queues at once and tops the batch up from them.
+        When a task did not come from the worker's own queue, the worker that took it is recorded
+        per task (needed for cancellation), in `storage` when given (e.g. the caller's unit of work).
+        """
+        storage = storage or self.storage
+        worker = await self.storage.get_worker_info(worker_id)
+        if not worker:
+            if timeout is None:
+                return await self.storage.dequeue_tasks_from_queues([worker_id], count)
+            first = await self.storage.dequeue_task_from_queues([worker_id], timeout)
+            if first is None:
+                return []
+            return [first] + await self.storage.dequeue_tasks_from_queues([worker_id], count - 1)
+
+        queues = await self._claimable_queues(worker)
+        claimed = await self.storage.dequeue_tasks_from_queues(queues, count)
+        if not claimed and (stolen := await self._steal_task(worker)):
+            claimed = [stolen]
+        if not claimed and timeout is not None:
+            first = await self.storage.dequeue_task_from_queues(queues, timeout)
+            if first:
+                claimed = [first] + await self.storage.dequeue_tasks_from_queues(queues, count - 1)
+
+        for queue_name, task, _ in claimed:
+            if queue_name != worker_id:
+                await storage.set_task_worker(task["job_id"], task["task_id"], worker_id)
+        return claimed
+
+    async def _raise_no_capable_workers(self, task_type: str) -> NoReturn:
+        """Loads the full worker list to explain why no idle, capable worker was found.
+        This is only done on the failure path, so dispatch itself never scans all workers.
+        """
+        all_workers = await self.workers.get_available_workers()
         logger.info(f"Found {len(all_workers)} available workers")
         if not all_workers:
             raise RuntimeError("No available workers")
 
         # A worker is considered available if its status is 'idle' or not specified (for backward compatibility)
-        logger.debug(f"All available workers: {[w['worker_id'] for w in all_workers]}")
         idle_workers = [w for w in all_workers if w.get("status", "idle") == "idle"]
-        logger.debug(f"Idle workers: {[w['worker_id'] for w in idle_workers]}")
         if not idle_workers:
             if busy_mo_workers := [
                 w for w in all_workers if w.get("status") == "busy" and "multi_orchestrator_info" in w
@@ -156,11 +366,65 @@ class Dispatcher:
                 )
             raise RuntimeError("No idle workers (all are 'busy')")
 
-        # Filter by task type
-        capable_workers = [w for w in idle_workers if task_type in w.get("supported_tasks", [])]
+        raise RuntimeError(f"No suitable workers for task type '{task_type}'")
+
+    async def _select_worker(
+        self,
+        workers: list[dict[str, Any]],
+        task_type: str,
+        dispatch_strategy: str,
+    ) -> dict[str, Any]:
+        """Selects a worker according to the strategy."""
+        if dispatch_strategy in STATS_STRATEGIES:
+            workers = await self._with_task_stats(workers, task_type)
+
+        if dispatch_strategy == "round_robin":
+            return self._select_round_robin(workers, task_type)
+        if dispatch_strategy == "least_connections":
+            return self._select_least_connections(workers, task_type)
+        if dispatch_strategy == "cheapest":
+            return self._select_cheapest(workers, task_type)
+        if dispatch_strategy == "best_value":
+            return self._select_best_value(workers, task_type)
+        if dispatch_strategy == "expected_finish":
+            return await self._select_expected_finish(workers, task_type)
+        return self._select_default(workers, task_type)
+
+    async def dispatch(
+        self,
+        job_state: dict[str, Any],
+        task_info: dict[str, Any],
+        storage: StorageBackend | JobUnitOfWork | None = None,
+    ):
+        """Selects a worker for the task and enqueues it.
+
+        The task and the updated job state are written to `storage` when given
+        (e.g. the caller's unit of work), otherwise directly to the dispatcher's storage.
+        """
+        storage = storage or self.storage
+        job_id = job_state["id"]
+        task_type = task_info.get("type")
+        if not task_type:
+            raise ValueError("Task info must include a 'type'")
+
+        dispatch_strategy = task_info.get("dispatch_strategy", "default")
+        resource_requirements = task_info.get("resource_requirements")
+
+        # Shared queues are served by whichever capable worker becomes free first, so busy workers count too
+        shared_queues = self.config.TASK_QUEUE_MODE == "shared"
+        status = None if shared_queues else "idle"
+
+        # The registry indexes narrow the candidates down to idle workers for this task type.
+        # The filters are re-applied here for backends that return unfiltered lists.
+        candidate_workers = await self.workers.get_available_workers(task_type=task_type, status=status)
+        capable_workers = [
+            w
+            for w in candidate_workers
+            if (shared_queues or w.get("status", "idle") == "idle") and task_type in w.get("supported_tasks", [])
+        ]
         logger.debug(f"Capable workers for task '{task_type}': {[w['worker_id'] for w in capable_workers]}")
         if not capable_workers:
-            raise RuntimeError(f"No suitable workers for task type '{task_type}'")
+            await self._raise_no_capable_workers(task_type)
 
         # Filter by resource requirements
         if resource_requirements:
@@ -188,48 +452,59 @@ class Dispatcher:
                 )
             capable_workers = cost_compliant_workers
 
-        # Select worker according to strategy
-        if dispatch_strategy == "round_robin":
-            selected_worker = self._select_round_robin(capable_workers, task_type)
-        elif dispatch_strategy == "least_connections":
-            selected_worker = self._select_least_connections(capable_workers, task_type)
-        elif dispatch_strategy == "cheapest":
-            selected_worker = self._select_cheapest(capable_workers, task_type)
-        elif dispatch_strategy == "best_value":
-            selected_worker = self._select_best_value(capable_workers, task_type)
-        else:  # "default"
-            selected_worker = self._select_default(capable_workers, task_type)
-
-        worker_id = selected_worker.get("worker_id")
-        logger.info(
-            f"Dispatching task '{task_type}' to worker {worker_id} (strategy: {dispatch_strategy})",
-        )
+        worker_id = None
+        queue_name = None
+        if shared_queues:
+            # Tasks without constraints still go to an idle worker that has the task type
+            # in its hot cache, everything else is claimed from the shared queues
+            warm_workers = [
+                w for w in capable_workers if w.get("status", "idle") == "idle" and task_type in w.get("hot_cache", [])
+            ]
+            if warm_workers and not resource_requirements and max_cost is None:
+                capable_workers = warm_workers
+            else:
+                queue_name = await self._shared_queue_for(task_type, resource_requirements, max_cost)
+                logger.info(f"Dispatching task '{task_type}' to shared queue {queue_name}")
+
+        if queue_name is None:
+            selected_worker = await self._select_worker(capable_workers, task_type, dispatch_strategy)
+            worker_id = queue_name = selected_worker.get("worker_id")
+            logger.info(
+                f"Dispatching task '{task_type}' to worker {worker_id} (strategy: {dispatch_strategy})",
+            )
 
         # --- Task creation and enqueuing ---
         task_id = task_info.get("task_id") or str(uuid4())
+        params = task_info.get("params", {})
+        if self.blob_store and params:
+            params = await self.blob_store.offload(params, self.config.BLOB_STORE_THRESHOLD_BYTES)
         payload = {
             "job_id": job_id,
             "task_id": task_id,
             "type": task_type,
-            "params": task_info.get("params", {}),
+            "params": params,
             "tracing_context": {},
         }
+        # The in-flight entry of the task lasts as long as the task may run
+        if timeout_seconds := task_info.get("timeout_seconds"):
+            payload["timeout_seconds"] = timeout_seconds
         # Inject tracing context into the payload, not headers
         inject(payload["tracing_context"], context=job_state.get("tracing_context"))
 
         try:
             priority = task_info.get("priority", 0.0)
-            await self.storage.enqueue_task_for_worker(worker_id, payload, priority)
+            await storage.enqueue_task_for_worker(queue_name, payload, priority)
             logger.info(
-                f"Task {task_id} with priority {priority} successfully enqueued for worker {worker_id}",
+                f"Task {task_id} with priority {priority} successfully enqueued for {queue_name}",
             )
-            # Save task ID and worker ID in the Job state for cancellation capability
+            # Save task ID and worker ID in the Job state for cancellation capability.
+            # Tasks in a shared queue get their worker ID when a worker claims them.
             job_state["current_task_id"] = task_id
             job_state["task_worker_id"] = worker_id
-            await self.storage.save_job_state(job_id, job_state)
+            await storage.save_job_state(job_id, job_state)
 
         except Exception as e:
             logger.exception(
-                f"Error enqueuing task for worker {worker_id}",
+                f"Error enqueuing task for {queue_name}",
             )
             raise e
@@ -1,7 +1,8 @@
-from asyncio import Task, create_task, gather, get_running_loop, wait_for
+from asyncio import CancelledError, Event, Semaphore, Task, create_task, gather, get_running_loop, sleep, wait_for
 from asyncio import TimeoutError as AsyncTimeoutError
+from functools import partial
 from logging import getLogger
-from typing import Callable, Dict
+from typing import Any, Callable, Dict, Mapping
 from uuid import uuid4
 
 from aiohttp import ClientSession, WSMsgType, web
@@ -9,24 +10,35 @@ from aiohttp.web import AppKey
 from aioprometheus import render
 
 from . import metrics
+from .blobs.base import BlobStore
+from .blobs.filesystem import FileSystemBlobStore
 from .blueprint import StateMachineBlueprint
 from .client_config_loader import load_client_configs_to_redis
 from .compression import compression_middleware
 from .config import Config
-from .dispatcher import Dispatcher
+from .dispatcher import SHARED_QUEUE_PREFIX, TASK_QUEUE_MODES, Dispatcher
 from .executor import JobExecutor
 from .health_checker import HealthChecker
 from .history.base import HistoryStorageBase
+from .history.buffered import BufferedHistoryStorage
 from .history.noop import NoOpHistoryStorage
+from .job_partitions import JobPartitions
+from .job_queue_maintenance import JobQueueMaintenance
 from .logging_config import setup_logging
 from .quota import quota_middleware_factory
 from .ratelimit import rate_limit_middleware_factory
 from .reputation import ReputationCalculator
+from .retention import BlobRetention, HistoryRetention
 from .security import client_auth_middleware_factory, worker_auth_middleware_factory
-from .storage.base import StorageBackend
+from .shard_leases import ShardLeases
+from .storage.base import StorageBackend, to_wall_clock
+from .storage.unit_of_work import JobUnitOfWork
+from .task_notifier import TaskNotifier
 from .telemetry import setup_telemetry
 from .watcher import Watcher
+from .worker_cache import WorkerCache
 from .worker_config_loader import load_worker_configs_to_redis
+from .worker_stats import summarize_task_stats
 from .ws_manager import WebSocketManager
 
 # Application keys for storing components
@@ -37,10 +49,19 @@ EXECUTOR_KEY = AppKey("executor", JobExecutor)
 WATCHER_KEY = AppKey("watcher", Watcher)
 REPUTATION_CALCULATOR_KEY = AppKey("reputation_calculator", ReputationCalculator)
 HEALTH_CHECKER_KEY = AppKey("health_checker", HealthChecker)
+JOB_QUEUE_MAINTENANCE_KEY = AppKey("job_queue_maintenance", JobQueueMaintenance)
 EXECUTOR_TASK_KEY = AppKey("executor_task", Task)
 WATCHER_TASK_KEY = AppKey("watcher_task", Task)
 REPUTATION_CALCULATOR_TASK_KEY = AppKey("reputation_calculator_task", Task)
 HEALTH_CHECKER_TASK_KEY = AppKey("health_checker_task", Task)
+JOB_QUEUE_MAINTENANCE_TASK_KEY = AppKey("job_queue_maintenance_task", Task)
+WORKER_CACHE_TASK_KEY = AppKey("worker_cache_task", Task)
+HISTORY_RETENTION_KEY = AppKey("history_retention", HistoryRetention)
+HISTORY_RETENTION_TASK_KEY = AppKey("history_retention_task", Task)
+BLOB_RETENTION_KEY = AppKey("blob_retention", BlobRetention)
+BLOB_RETENTION_TASK_KEY = AppKey("blob_retention_task", Task)
+TASK_NOTIFIER_TASK_KEY = AppKey("task_notifier_task", Task)
+SHARD_LEASES_TASK_KEY = AppKey("shard_leases_task", Task)
 
 
 metrics.init_metrics()
@@ -58,14 +79,27 @@ async def metrics_handler(_request: web.Request) -> web.Response:
 
 
 class OrchestratorEngine:
-    def __init__(self, storage: StorageBackend, config: Config):
+    def __init__(self, storage: StorageBackend, config: Config, blob_store: BlobStore | None = None):
         setup_logging(config.LOG_LEVEL, config.LOG_FORMAT)
         setup_telemetry()
         self.storage = storage
         self.config = config
+        # Payloads above BLOB_STORE_THRESHOLD_BYTES are offloaded here when a blob store is configured
+        if blob_store is None and config.BLOB_STORE_PATH:
+            blob_store = FileSystemBlobStore(config.BLOB_STORE_PATH)
+        self.blob_store = blob_store
         self.blueprints: Dict[str, StateMachineBlueprint] = {}
+        # Partitions of the job queue, by the blueprints registered later
+        self.job_partitions = JobPartitions(config, self.blueprints)
         self.history_storage: HistoryStorageBase = NoOpHistoryStorage()
         self.ws_manager = WebSocketManager()
+        self.task_notifier = TaskNotifier(storage)
+        self.task_notifier.add_listener(self._wake_push_workers)
+        # Blocking pops of long polls, each holds a connection of the blocking Redis pool while it waits
+        self._blocking_polls = Semaphore(config.WORKER_BLOCKING_POLLS_MAX)
+        # Splits the Watcher, ReputationCalculator and job queue maintenance work between the orchestrator instances
+        self.shard_leases = ShardLeases(storage, config.INSTANCE_ID, config.SHARD_LEASE_TTL_SECONDS)
+        self.worker_cache: WorkerCache | None = None
         self.app = web.Application(middlewares=[compression_middleware])
         self.app[ENGINE_KEY] = self
         self._setup_done = False
@@ -129,7 +163,20 @@ class OrchestratorEngine:
             return
 
         if storage_class:
-            self.history_storage = storage_class(*storage_args)
+            self.history_storage = storage_class(
+                *storage_args,
+                full_snapshot_interval=self.config.HISTORY_FULL_SNAPSHOT_INTERVAL,
+                partition_interval=self.config.HISTORY_PARTITION_INTERVAL,
+            )
+            if self.config.HISTORY_BUFFER_ENABLED:
+                self.history_storage = BufferedHistoryStorage(
+                    self.history_storage,
+                    max_size=self.config.HISTORY_BUFFER_MAX_SIZE,
+                    batch_size=self.config.HISTORY_BATCH_SIZE,
+                    flush_interval=self.config.HISTORY_FLUSH_INTERVAL_SECONDS,
+                    overflow_policy=self.config.HISTORY_OVERFLOW_POLICY,
+                    spill_path=self.config.HISTORY_SPILL_PATH,
+                )
             try:
                 await self.history_storage.initialize()
             except Exception as e:
@@ -150,6 +197,7 @@ class OrchestratorEngine:
             logger.info(
                 "opentelemetry-instrumentation-aiohttp-client not found. AIOHTTP client instrumentation is disabled."
             )
+        await self.storage.initialize()
         await self._setup_history_storage()
 
         # Load client configs if the path is provided
@@ -186,17 +234,42 @@ class OrchestratorEngine:
             )
 
         app[HTTP_SESSION_KEY] = ClientSession()
-        self.dispatcher = Dispatcher(self.storage, self.config)
+        if self.config.WORKER_CACHE_ENABLED:
+            self.worker_cache = WorkerCache(self.storage, self.config.WORKER_CACHE_MAX_STALENESS_SECONDS)
+            app[WORKER_CACHE_TASK_KEY] = create_task(self.worker_cache.run())
+        if self.config.TASK_NOTIFICATIONS_ENABLED or self.config.WORKER_PUSH_ENABLED:
+            app[TASK_NOTIFIER_TASK_KEY] = create_task(self.task_notifier.run())
+        if self.config.TASK_QUEUE_MODE not in TASK_QUEUE_MODES:
+            raise ValueError(
+                f"Unknown task queue mode '{self.config.TASK_QUEUE_MODE}', expected one of {TASK_QUEUE_MODES}"
+            )
+        self.dispatcher = Dispatcher(
+            self.storage,
+            self.config,
+            worker_cache=self.worker_cache,
+            blob_store=self.blob_store,
+        )
         app[DISPATCHER_KEY] = self.dispatcher
+        # Take the shards before the background processes start, so they have work from the beginning
+        await self.shard_leases.rebalance()
+        app[SHARD_LEASES_TASK_KEY] = create_task(self.shard_leases.run())
         app[EXECUTOR_KEY] = JobExecutor(self, self.history_storage)
         app[WATCHER_KEY] = Watcher(self)
         app[REPUTATION_CALCULATOR_KEY] = ReputationCalculator(self)
         app[HEALTH_CHECKER_KEY] = HealthChecker(self)
+        app[JOB_QUEUE_MAINTENANCE_KEY] = JobQueueMaintenance(self)
 
         app[EXECUTOR_TASK_KEY] = create_task(app[EXECUTOR_KEY].run())
         app[WATCHER_TASK_KEY] = create_task(app[WATCHER_KEY].run())
         app[REPUTATION_CALCULATOR_TASK_KEY] = create_task(app[REPUTATION_CALCULATOR_KEY].run())
         app[HEALTH_CHECKER_TASK_KEY] = create_task(app[HEALTH_CHECKER_KEY].run())
+        app[JOB_QUEUE_MAINTENANCE_TASK_KEY] = create_task(app[JOB_QUEUE_MAINTENANCE_KEY].run())
+        if self.config.HISTORY_RETENTION_DAYS > 0 and not isinstance(self.history_storage, NoOpHistoryStorage):
+            app[HISTORY_RETENTION_KEY] = HistoryRetention(self)
+            app[HISTORY_RETENTION_TASK_KEY] = create_task(app[HISTORY_RETENTION_KEY].run())
+        if self.blob_store and self.config.BLOB_STORE_RETENTION_DAYS > 0:
+            app[BLOB_RETENTION_KEY] = BlobRetention(self)
+            app[BLOB_RETENTION_TASK_KEY] = create_task(app[BLOB_RETENTION_KEY].run())
 
     async def on_shutdown(self, app: web.Application):
         logger.info("Shutdown sequence started.")
@@ -204,6 +277,15 @@ class OrchestratorEngine:
         app[WATCHER_KEY].stop()
         app[REPUTATION_CALCULATOR_KEY].stop()
         app[HEALTH_CHECKER_KEY].stop()
+        app[JOB_QUEUE_MAINTENANCE_KEY].stop()
+        if self.worker_cache:
+            self.worker_cache.stop()
+        self.task_notifier.stop()
+        self.shard_leases.stop()
+        if HISTORY_RETENTION_KEY in app:
+            app[HISTORY_RETENTION_KEY].stop()
+        if BLOB_RETENTION_KEY in app:
+            app[BLOB_RETENTION_KEY].stop()
         logger.info("Background task running flags set to False.")
 
         if hasattr(self.history_storage, "close"):
@@ -219,27 +301,50 @@ class OrchestratorEngine:
         app[WATCHER_TASK_KEY].cancel()
         app[REPUTATION_CALCULATOR_TASK_KEY].cancel()
         app[EXECUTOR_TASK_KEY].cancel()
+        app[SHARD_LEASES_TASK_KEY].cancel()
+        app[JOB_QUEUE_MAINTENANCE_TASK_KEY].cancel()
+        background_tasks = [
+            app[HEALTH_CHECKER_TASK_KEY],
+            app[WATCHER_TASK_KEY],
+            app[REPUTATION_CALCULATOR_TASK_KEY],
+            app[EXECUTOR_TASK_KEY],
+            app[SHARD_LEASES_TASK_KEY],
+            app[JOB_QUEUE_MAINTENANCE_TASK_KEY],
+        ]
+        if WORKER_CACHE_TASK_KEY in app:
+            app[WORKER_CACHE_TASK_KEY].cancel()
+            background_tasks.append(app[WORKER_CACHE_TASK_KEY])
+        if HISTORY_RETENTION_TASK_KEY in app:
+            app[HISTORY_RETENTION_TASK_KEY].cancel()
+            background_tasks.append(app[HISTORY_RETENTION_TASK_KEY])
+        if BLOB_RETENTION_TASK_KEY in app:
+            app[BLOB_RETENTION_TASK_KEY].cancel()
+            background_tasks.append(app[BLOB_RETENTION_TASK_KEY])
+        if TASK_NOTIFIER_TASK_KEY in app:
+            app[TASK_NOTIFIER_TASK_KEY].cancel()
+            background_tasks.append(app[TASK_NOTIFIER_TASK_KEY])
         logger.info("Background tasks cancelled.")
 
         logger.info("Gathering background tasks with a 10s timeout...")
         try:
             await wait_for(
-                gather(
-                    app[HEALTH_CHECKER_TASK_KEY],
-                    app[WATCHER_TASK_KEY],
-                    app[REPUTATION_CALCULATOR_TASK_KEY],
-                    app[EXECUTOR_TASK_KEY],
-                    return_exceptions=True,
-                ),
+                gather(*background_tasks, return_exceptions=True),
                 timeout=10.0,
             )
             logger.info("Background tasks gathered successfully.")
         except AsyncTimeoutError:
             logger.error("Timed out waiting for background tasks to shut down.")
 
+        # Let the other instances take over the shards without waiting for the leases to expire
+        try:
+            await self.shard_leases.release()
+        except Exception:
+            logger.exception("Failed to release the shard leases.")
+
         logger.info("Closing HTTP session...")
         await app[HTTP_SESSION_KEY].close()
         logger.info("HTTP session closed.")
+        await self.storage.close()
         logger.info("Shutdown sequence finished.")
 
     def _create_job_handler(self, blueprint: StateMachineBlueprint) -> Callable:
@@ -249,8 +354,22 @@ class OrchestratorEngine:
             except Exception:
                 return web.json_response({"error": "Invalid JSON body"}, status=400)
 
+            # Optional scheduling hints, e.g. ?priority=10&deadline=1767225600
+            scheduling = {}
+            try:
+                if "priority" in request.query:
+                    scheduling["priority"] = int(request.query["priority"])
+                if "deadline" in request.query:
+                    scheduling["deadline"] = float(request.query["deadline"])
+            except ValueError:
+                return web.json_response(
+                    {"error": "priority must be an integer and deadline a Unix timestamp"}, status=400
+                )
+
             client_config = request["client_config"]
             carrier = {str(k): v for k, v in request.headers.items()}
+            if self.blob_store and isinstance(initial_data, dict):
+                initial_data = await self.blob_store.offload(initial_data, self.config.BLOB_STORE_THRESHOLD_BYTES)
 
             job_id = str(uuid4())
             job_state = {
@@ -262,9 +381,12 @@ class OrchestratorEngine:
                 "status": "pending",
                 "tracing_context": carrier,
                 "client_config": client_config,
+                **scheduling,
             }
-            await self.storage.save_job_state(job_id, job_state)
-            await self.storage.enqueue_job(job_id)
+            job_writes = JobUnitOfWork(self.storage)
+            await job_writes.save_job_state(job_id, job_state)
+            await job_writes.enqueue_job(job_id, self.job_partitions.of(job_state))
+            await job_writes.commit()
             metrics.jobs_total.inc({metrics.LABEL_BLUEPRINT: blueprint.name})
             return web.json_response({"status": "accepted", "job_id": job_id}, status=202)
 
@@ -274,7 +396,12 @@ class OrchestratorEngine:
         job_id = request.match_info.get("job_id")
         if not job_id:
             return web.json_response({"error": "job_id is required in path"}, status=400)
-        job_state = await self.storage.get_job_state(job_id)
+        # Optional projection, e.g. ?fields=status,current_state
+        fields = [field for field in request.query.get("fields", "").split(",") if field]
+        if fields:
+            job_state = await self.storage.get_job_fields(job_id, fields)
+        else:
+            job_state = await self.storage.get_job_state(job_id)
         if not job_state:
             return web.json_response({"error": "Job not found"}, status=404)
         return web.json_response(job_state, status=200)
@@ -284,7 +411,7 @@ class OrchestratorEngine:
         if not job_id:
             return web.json_response({"error": "job_id is required in path"}, status=400)
 
-        job_state = await self.storage.get_job_state(job_id)
+        job_state = await self.storage.get_job_fields(job_id, ["status", "task_worker_id", "current_task_id"])
         if not job_state:
             return web.json_response({"error": "Job not found"}, status=404)
 
@@ -294,23 +421,28 @@ class OrchestratorEngine:
                 status=409,
             )
 
-        worker_id = job_state.get("task_worker_id")
-        if not worker_id:
+        task_id = job_state.get("current_task_id")
+        if not task_id:
             return web.json_response(
-                {"error": "Cannot cancel job: worker_id not found in job state."},
+                {"error": "Cannot cancel job: task_id not found in job state."},
                 status=500,
             )
 
-        worker_info = await self.storage.get_worker_info(worker_id)
-        task_id = job_state.get("current_task_id")
-        if not task_id:
+        # A task claimed from a queue other than its own is recorded per task, otherwise it runs
+        # on the worker it was dispatched to
+        worker_id = await self.storage.get_task_worker(job_id, task_id) or job_state.get("task_worker_id")
+        # A task waiting in a shared queue has no worker yet, the flag is seen by whoever claims it
+        if not worker_id and self.config.TASK_QUEUE_MODE != "shared":
             return web.json_response(
-                {"error": "Cannot cancel job: task_id not found in job state."},
+                {"error": "Cannot cancel job: worker_id not found in job state."},
                 status=500,
             )
 
         # Set Redis flag as a reliable fallback/primary mechanism
         await self.storage.set_task_cancellation_flag(task_id)
+        if not worker_id:
+            return web.json_response({"status": "cancellation_request_accepted"})
+        worker_info = await self.storage.get_worker_info(worker_id)
 
         # Attempt WebSocket-based cancellation if supported
         if worker_info and worker_info.get("capabilities", {}).get("websockets"):
@@ -349,7 +481,18 @@ class OrchestratorEngine:
             return web.json_response({"error": error_msg}, status=501)
 
     async def _get_workers_handler(self, request: web.Request) -> web.Response:
-        workers = await self.storage.get_available_workers()
+        workers = await (self.worker_cache or self.storage).get_available_workers()
+        stats = await self.storage.get_workers_stats([w["worker_id"] for w in workers if w.get("worker_id")])
+        workers = [
+            {
+                **w,
+                "stats": {
+                    task_type: summarize_task_stats(task_stats)
+                    for task_type, task_stats in stats.get(w.get("worker_id"), {}).items()
+                },
+            }
+            for w in workers
+        ]
         return web.json_response(workers)
 
     async def _get_jobs_handler(self, request: web.Request) -> web.Response:
@@ -359,7 +502,14 @@ class OrchestratorEngine:
         except ValueError:
             return web.json_response({"error": "Invalid limit/offset parameter"}, status=400)
 
-        jobs = await self.history_storage.get_jobs(limit=limit, offset=offset)
+        try:
+            jobs = await self.history_storage.get_jobs(
+                limit=limit,
+                offset=offset,
+                cursor=request.query.get("cursor"),
+            )
+        except ValueError:
+            return web.json_response({"error": "Invalid cursor parameter"}, status=400)
         return web.json_response(jobs)
 
     async def _get_dashboard_handler(self, request: web.Request) -> web.Response:
@@ -374,8 +524,6 @@ class OrchestratorEngine:
         return web.json_response(dashboard_data)
 
     async def _task_result_handler(self, request: web.Request) -> web.Response:
-        import logging
-
         # Use pre-parsed data from middleware if available, otherwise read the body
         data = request.get("task_result_data")
         if data is None:
@@ -384,6 +532,88 @@ class OrchestratorEngine:
             except Exception:
                 return web.json_response({"error": "Invalid JSON body"}, status=400)
 
+        # Security check: Ensure the worker_id from the payload matches the authenticated worker
+        authenticated_worker_id = request.get("worker_id")
+        if not authenticated_worker_id:
+            # This should not happen if the auth middleware is working correctly
+            return web.json_response({"error": "Could not identify authenticated worker."}, status=500)
+
+        # Job changes made for this result are committed to storage together, and only once the
+        # result is applied in full: on an error the unit of work is dropped with its partial changes
+        job_writes = JobUnitOfWork(self.storage)
+        response, status = await self._apply_task_result(data, authenticated_worker_id, job_writes, request.headers)
+        await job_writes.commit()
+        return web.json_response(response, status=status)
+
+    async def _task_results_handler(self, request: web.Request) -> web.Response:
+        """Accepts the results of several tasks of one worker.
+        The job states of all tasks are read in one batch, and the job changes of all results
+        are committed together; the in-flight entries of the applied results are then cleared
+        in one batch. A result that cannot be applied leaves no changes and is reported with its
+        error. The response lists the outcome of each result, in the order of the request.
+        """
+        data = request.get("task_result_data")
+        if data is None:
+            try:
+                data = await request.json()
+            except Exception:
+                return web.json_response({"error": "Invalid JSON body"}, status=400)
+
+        results = data.get("results")
+        if not isinstance(results, list) or not all(isinstance(item, dict) for item in results):
+            return web.json_response({"error": "results must be a list of task results"}, status=400)
+
+        authenticated_worker_id = request.get("worker_id")
+        if not authenticated_worker_id:
+            return web.json_response({"error": "Could not identify authenticated worker."}, status=500)
+
+        job_writes = JobUnitOfWork(self.storage)
+        # Registered first, so the service times are known when the results' own callbacks run
+        applied_task_ids: list[str] = []
+        in_flight_seconds: dict[str, float | None] = {}
+        job_writes.after_commit(
+            partial(self._clear_tasks_in_flight, authenticated_worker_id, applied_task_ids, in_flight_seconds)
+        )
+        await job_writes.load_job_states(list({item["job_id"] for item in results if item.get("job_id")}))
+        responses = []
+        for item in results:
+            # The changes of each result are merged into the batch only once it is applied in full
+            item_writes = JobUnitOfWork(job_writes)
+            try:
+                response, status = await self._apply_task_result(
+                    item, authenticated_worker_id, item_writes, request.headers, in_flight_seconds
+                )
+                await item_writes.commit()
+                if item.get("job_id") and item.get("task_id"):
+                    applied_task_ids.append(item["task_id"])
+            except Exception as e:
+                logger.exception(f"Error applying the result of task {item.get('task_id')} of job {item.get('job_id')}")
+                response = {"error": f"Failed to apply the task result: {e}"}
+            responses.append({"job_id": item.get("job_id"), "task_id": item.get("task_id"), **response})
+        await job_writes.commit()
+        return web.json_response({"results": responses}, status=200)
+
+    async def _apply_task_result(
+        self,
+        data: dict[str, Any],
+        authenticated_worker_id: str,
+        job_writes: JobUnitOfWork,
+        headers: Mapping[str, str],
+        in_flight_seconds: dict[str, float | None] | None = None,
+    ) -> tuple[dict[str, Any], int]:
+        """Applies one task result to its job, buffering the job changes in `job_writes`.
+
+        Side effects outside the job writes (the in-flight entry, worker stats and parallel branch
+        counters) run only once `job_writes` is committed, so a result retried after a failed
+        commit is applied as if it came for the first time.
+
+        :param in_flight_seconds: Filled with the service times of tasks whose in-flight entries
+            the caller clears in bulk after the commit. Without it the entry of the task is cleared
+            after the commit here.
+        :return: The response body and HTTP status for the result.
+        """
+        import logging
+
         job_id = data.get("job_id")
         task_id = data.get("task_id")
         result = data.get("result", {})
@@ -391,55 +621,49 @@ class OrchestratorEngine:
         error_message = result.get("error")
         payload_worker_id = data.get("worker_id")
 
-        # Security check: Ensure the worker_id from the payload matches the authenticated worker
-        authenticated_worker_id = request.get("worker_id")
-        if not authenticated_worker_id:
-            # This should not happen if the auth middleware is working correctly
-            return web.json_response({"error": "Could not identify authenticated worker."}, status=500)
-
         if payload_worker_id and payload_worker_id != authenticated_worker_id:
-            return web.json_response(
-                {
-                    "error": f"Forbidden: Authenticated worker '{authenticated_worker_id}' "
-                    f"cannot submit results for another worker '{payload_worker_id}'.",
-                },
-                status=403,
-            )
+            return {
+                "error": f"Forbidden: Authenticated worker '{authenticated_worker_id}' "
+                f"cannot submit results for another worker '{payload_worker_id}'.",
+            }, 403
 
         if not job_id or not task_id:
-            return web.json_response({"error": "job_id and task_id are required"}, status=400)
+            return {"error": "job_id and task_id are required"}, 400
 
-        job_state = await self.storage.get_job_state(job_id)
+        # Time the worker spent on the task, unlike `duration_ms` below it excludes the time in its queue
+        if in_flight_seconds is None:
+            in_flight_seconds = {}
+            job_writes.after_commit(
+                partial(self._clear_tasks_in_flight, authenticated_worker_id, [task_id], in_flight_seconds)
+            )
+
+        job_state = await job_writes.get_job_state(job_id)
         if not job_state:
-            return web.json_response({"error": "Job not found"}, status=404)
+            return {"error": "Job not found"}, 404
+
+        # Large result data is kept in the blob store, the job state and history only reference it
+        if self.blob_store and isinstance(result.get("data"), dict):
+            result["data"] = await self.blob_store.offload(result["data"], self.config.BLOB_STORE_THRESHOLD_BYTES)
 
         # Handle parallel task completion
         if job_state.get("status") == "waiting_for_parallel_tasks":
-            await self.storage.remove_job_from_watch(f"{job_id}:{task_id}")
-            job_state.setdefault("aggregation_results", {})[task_id] = result
-            job_state.setdefault("active_branches", []).remove(task_id)
-
-            if not job_state["active_branches"]:
-                logger.info(f"All parallel branches for job {job_id} have completed.")
-                job_state["status"] = "running"
-                job_state["current_state"] = job_state["aggregation_target"]
-                await self.storage.save_job_state(job_id, job_state)
-                await self.storage.enqueue_job(job_id)
-            else:
-                logger.info(
-                    f"Branch {task_id} for job {job_id} completed. "
-                    f"Waiting for {len(job_state['active_branches'])} more.",
-                )
-                await self.storage.save_job_state(job_id, job_state)
+            await job_writes.remove_job_from_watch(f"{job_id}:{task_id}")
+            await self.record_branch_result(job_writes, job_id, job_state, task_id, result)
+
+            return {"status": "parallel_branch_result_accepted"}, 200
 
-            return web.json_response({"status": "parallel_branch_result_accepted"}, status=200)
+        # A result sent again, e.g. when a worker retries a request whose response it lost,
+        # finds the job no longer waiting for the task and is not applied a second time
+        if job_state.get("status") != "waiting_for_worker" or job_state.get("current_task_id", task_id) != task_id:
+            logging.info(f"Ignoring the result of task {task_id} for job {job_id}, the task is no longer in flight.")
+            return {"status": "result_ignored"}, 200
 
-        await self.storage.remove_job_from_watch(job_id)
+        await job_writes.remove_job_from_watch(job_id)
 
         import time
 
-        now = time.monotonic()
-        dispatched_at = job_state.get("task_dispatched_at", now)
+        now = time.time()
+        dispatched_at = to_wall_clock(job_state.get("task_dispatched_at", now))
         duration_ms = int((now - dispatched_at) * 1000)
 
         await self.history_storage.log_job_event(
@@ -449,11 +673,28 @@ class OrchestratorEngine:
                 "event_type": "task_finished",
                 "duration_ms": duration_ms,
                 "worker_id": authenticated_worker_id,  # Use authenticated worker_id
+                "result_status": result_status,
                 "context_snapshot": {**job_state, "result": result},
             },
         )
 
-        job_state["tracing_context"] = {str(k): v for k, v in request.headers.items()}
+        task_type = job_state.get("current_task_info", {}).get("type")
+        if task_type and "task_dispatched_at" in job_state and result_status != "cancelled":
+
+            async def record_task_stats() -> None:
+                task_seconds = in_flight_seconds.get(task_id)
+                await self.storage.record_task_stats(
+                    authenticated_worker_id,
+                    task_type,
+                    duration_ms if task_seconds is None else task_seconds * 1000,
+                    success=result_status != "failure",
+                    ewma_alpha=self.config.WORKER_STATS_EWMA_ALPHA,
+                    window=self.config.WORKER_STATS_WINDOW,
+                )
+
+            job_writes.after_commit(record_task_stats)
+
+        job_state["tracing_context"] = {str(k): v for k, v in headers.items()}
 
         if result_status == "failure":
             error_details = result.get("error", {})
@@ -472,29 +713,29 @@ class OrchestratorEngine:
             if error_type == "PERMANENT_ERROR":
                 job_state["status"] = "quarantined"
                 job_state["error_message"] = f"Task failed with permanent error: {error_message}"
-                await self.storage.save_job_state(job_id, job_state)
-                await self.storage.quarantine_job(job_id)
+                await job_writes.save_job_state(job_id, job_state)
+                await job_writes.quarantine_job(job_id)
             elif error_type == "INVALID_INPUT_ERROR":
                 job_state["status"] = "failed"
                 job_state["error_message"] = f"Task failed due to invalid input: {error_message}"
-                await self.storage.save_job_state(job_id, job_state)
+                await job_writes.save_job_state(job_id, job_state)
             else:  # TRANSIENT_ERROR or any other/unspecified error
-                await self._handle_task_failure(job_state, task_id, error_message)
+                await self._handle_task_failure(job_state, task_id, error_message, storage=job_writes)
 
-            return web.json_response({"status": "result_accepted_failure"}, status=200)
+            return {"status": "result_accepted_failure"}, 200
 
         if result_status == "cancelled":
             logging.info(f"Task {task_id} for job {job_id} was cancelled by worker.")
             job_state["status"] = "cancelled"
-            await self.storage.save_job_state(job_id, job_state)
+            await job_writes.save_job_state(job_id, job_state)
             # Optionally, trigger a specific 'cancelled' transition if defined in the blueprint
             transitions = job_state.get("current_task_transitions", {})
             if next_state := transitions.get("cancelled"):
                 job_state["current_state"] = next_state
                 job_state["status"] = "running"  # It's running the cancellation handler now
-                await self.storage.save_job_state(job_id, job_state)
-                await self.storage.enqueue_job(job_id)
-            return web.json_response({"status": "result_accepted_cancelled"}, status=200)
+                await job_writes.save_job_state(job_id, job_state)
+                await job_writes.enqueue_job(job_id, self.job_partitions.of(job_state))
+            return {"status": "result_accepted_cancelled"}, 200
 
         transitions = job_state.get("current_task_transitions", {})
         if next_state := transitions.get(result_status):
@@ -508,19 +749,76 @@ class OrchestratorEngine:
 
             job_state["current_state"] = next_state
             job_state["status"] = "running"
-            await self.storage.save_job_state(job_id, job_state)
-            await self.storage.enqueue_job(job_id)
+            await job_writes.save_job_state(job_id, job_state)
+            await job_writes.enqueue_job(job_id, self.job_partitions.of(job_state))
         else:
             logging.error(f"Job {job_id} failed. Worker returned unhandled status '{result_status}'.")
             job_state["status"] = "failed"
             job_state["error_message"] = f"Worker returned unhandled status: {result_status}"
-            await self.storage.save_job_state(job_id, job_state)
-
-        return web.json_response({"status": "result_accepted_success"}, status=200)
+            await job_writes.save_job_state(job_id, job_state)
+
+        return {"status": "result_accepted_success"}, 200
+
+    async def record_branch_result(
+        self,
+        job_writes: JobUnitOfWork,
+        job_id: str,
+        job_state: dict[str, Any],
+        task_id: str,
+        result: dict[str, Any],
+    ) -> None:
+        """Records the result of a branch of a parallel step once `job_writes` is committed, and
+        moves the job to its aggregator state once the last branch has finished.
+
+        Branches finish concurrently, so the storage counts them down atomically and the job
+        state is only written once the last branch has finished. The count only goes down after
+        the other changes made for the result are written: a result retried after a failed
+        commit still finds its branch running.
+        """
+        job_writes.after_commit(
+            partial(self._count_down_branch, job_id, task_id, result, list(job_state.get("active_branches", [])))
+        )
 
-    async def _handle_task_failure(self, job_state: dict, task_id: str, error_message: str | None):
+    async def _count_down_branch(
+        self, job_id: str, task_id: str, result: dict[str, Any], active_branches: list[str]
+    ) -> None:
+        remaining, branch_results = await self.storage.record_branch_result(job_id, task_id, result, active_branches)
+        if remaining < 0:
+            logger.warning(f"Ignoring the result of unknown or already finished branch {task_id} of job {job_id}.")
+        elif remaining == 0:
+            job_state = await self.storage.get_job_state(job_id)
+            if not job_state or job_state.get("status") != "waiting_for_parallel_tasks":
+                logger.warning(f"Job {job_id} is no longer waiting for its parallel branches, not aggregating.")
+                return
+            logger.info(f"All parallel branches for job {job_id} have completed.")
+            job_state["aggregation_results"] = branch_results
+            job_state["active_branches"] = []
+            job_state["status"] = "running"
+            job_state["current_state"] = job_state["aggregation_target"]
+            job_writes = JobUnitOfWork(self.storage)
+            await job_writes.save_job_state(job_id, job_state)
+            await job_writes.enqueue_job(job_id, self.job_partitions.of(job_state))
+            await job_writes.commit()
+        else:
+            logger.info(f"Branch {task_id} for job {job_id} completed. Waiting for {remaining} more.")
+
+    async def _clear_tasks_in_flight(
+        self, worker_id: str, task_ids: list[str], in_flight_seconds: dict[str, float | None]
+    ) -> None:
+        """Clears the in-flight entries of finished tasks, keeping their service times for the worker stats."""
+        in_flight_seconds.update(await self.storage.clear_tasks_in_flight(worker_id, task_ids))
+
+    async def _handle_task_failure(
+        self,
+        job_state: dict,
+        task_id: str,
+        error_message: str | None,
+        storage: StorageBackend | JobUnitOfWork | None = None,
+    ):
         import logging
 
+        storage = storage or self.storage
+
         job_id = job_state["id"]
         retry_count = job_state.get("retry_count", 0)
         max_retries = self.config.JOB_MAX_RETRIES
@@ -534,25 +832,39 @@ class OrchestratorEngine:
                 logging.error(f"Cannot retry job {job_id}: missing 'current_task_info' in job state.")
                 job_state["status"] = "failed"
                 job_state["error_message"] = "Cannot retry: original task info not found."
-                await self.storage.save_job_state(job_id, job_state)
+                await storage.save_job_state(job_id, job_state)
                 return
 
-            now = get_running_loop().time()
+            import time
+
+            now = time.time()
             timeout_seconds = task_info.get("timeout_seconds", self.config.WORKER_TIMEOUT_SECONDS)
             timeout_at = now + timeout_seconds
 
             job_state["status"] = "waiting_for_worker"
             job_state["task_dispatched_at"] = now
-            await self.storage.save_job_state(job_id, job_state)
-            await self.storage.add_job_to_watch(job_id, timeout_at)
+            await storage.save_job_state(job_id, job_state)
+            await storage.add_job_to_watch(job_id, timeout_at)
 
-            await self.dispatcher.dispatch(job_state, task_info)
+            await self.dispatcher.dispatch(job_state, task_info, storage=storage)
         else:
             logging.critical(f"Job {job_id} has failed {max_retries + 1} times. Moving to quarantine.")
             job_state["status"] = "quarantined"
             job_state["error_message"] = f"Task failed after {max_retries + 1} attempts: {error_message}"
-            await self.storage.save_job_state(job_id, job_state)
-            await self.storage.quarantine_job(job_id)
+            await storage.save_job_state(job_id, job_state)
+            await storage.quarantine_job(job_id)
+
+    async def _get_blob_handler(self, request: web.Request) -> web.Response:
+        """Returns an offloaded payload (JSON) so that workers can resolve references in task params."""
+        if not self.blob_store:
+            return web.json_response({"error": "Blob store is not configured"}, status=404)
+        try:
+            data = await self.blob_store.get(request.match_info["key"])
+        except ValueError:
+            return web.json_response({"error": "Invalid blob key"}, status=400)
+        if data is None:
+            return web.json_response({"error": "Blob not found"}, status=404)
+        return web.Response(body=data, content_type="application/json")
 
     async def _human_approval_webhook_handler(self, request: web.Request) -> web.Response:
         job_id = request.match_info.get("job_id")
@@ -576,8 +888,10 @@ class OrchestratorEngine:
             return web.json_response({"error": f"Invalid decision '{decision}' for this job"}, status=400)
         job_state["current_state"] = next_state
         job_state["status"] = "running"
-        await self.storage.save_job_state(job_id, job_state)
-        await self.storage.enqueue_job(job_id)
+        job_writes = JobUnitOfWork(self.storage)
+        await job_writes.save_job_state(job_id, job_state)
+        await job_writes.enqueue_job(job_id, self.job_partitions.of(job_state))
+        await job_writes.commit()
         return web.json_response({"status": "approval_received", "job_id": job_id})
 
     async def _get_quarantined_jobs_handler(self, request: web.Request) -> web.Response:
@@ -666,6 +980,8 @@ class OrchestratorEngine:
         worker_app.router.add_get("/workers/{worker_id}/tasks/next", self._handle_get_next_task)
         worker_app.router.add_patch("/workers/{worker_id}", self._worker_update_handler)
         worker_app.router.add_post("/tasks/result", self._task_result_handler)
+        worker_app.router.add_post("/tasks/results", self._task_results_handler)
+        worker_app.router.add_get("/workers/{worker_id}/blobs/{key}", self._get_blob_handler)
         worker_app.router.add_get("/ws/{worker_id}", self._websocket_handler)
         self.app.add_subapp("/_worker/", worker_app)
 
@@ -689,12 +1005,17 @@ class OrchestratorEngine:
         await ws.prepare(request)
 
         await self.ws_manager.register(worker_id, ws)
+        push_task: Task | None = None
         try:
             async for msg in ws:
                 if msg.type == WSMsgType.TEXT:
                     try:
                         data = msg.json()
-                        await self.ws_manager.handle_message(worker_id, data)
+                        if data.get("event") == "push_start":
+                            if push_task is None:
+                                push_task = await self._start_push(worker_id, ws, data.get("credits", 0))
+                        else:
+                            await self._handle_ws_message(worker_id, ws, data)
                     except Exception as e:
                         logger.error(f"Error processing WebSocket message from {worker_id}: {e}")
                 elif msg.type == WSMsgType.ERROR:
@@ -702,22 +1023,210 @@ class OrchestratorEngine:
                     break
         finally:
             await self.ws_manager.unregister(worker_id)
+            if push_task:
+                push_task.cancel()
         return ws
 
+    async def _handle_ws_message(self, worker_id: str, ws: web.WebSocketResponse, data: dict[str, Any]) -> None:
+        """Handles the messages of a push worker (credits, task results and heartbeats), other
+        messages (e.g. progress updates) go to the WebSocketManager.
+        """
+        event = data.get("event")
+        if event == "credit":
+            self.ws_manager.add_credits(worker_id, int(data.get("amount", 1)))
+        elif event == "task_result":
+            # As over HTTP, the job changes are committed only once the result is applied in full
+            job_writes = JobUnitOfWork(self.storage)
+            response, status = await self._apply_task_result(data.get("payload", {}), worker_id, job_writes, {})
+            await job_writes.commit()
+            await ws.send_json({"command": "result_ack", "task_id": data.get("payload", {}).get("task_id"), **response})
+        elif event == "heartbeat":
+            ttl = self.config.WORKER_HEALTH_CHECK_INTERVAL_SECONDS * 2
+            if update_data := data.get("data"):
+                await self._apply_worker_update(worker_id, update_data, ttl)
+            else:
+                await self.storage.refresh_worker_ttl(worker_id, ttl)
+        else:
+            await self.ws_manager.handle_message(worker_id, data)
+
+    async def _start_push(self, worker_id: str, ws: web.WebSocketResponse, free_slots: int) -> Task | None:
+        """Switches a worker to push delivery if it is enabled, and tells the worker the outcome."""
+        if not self.config.WORKER_PUSH_ENABLED:
+            await ws.send_json({"command": "push_rejected"})
+            return None
+        wakeup = self.ws_manager.start_push(worker_id, int(free_slots))
+        await ws.send_json({"command": "push_accepted"})
+        logger.info(f"Worker {worker_id} receives tasks over its WebSocket connection.")
+        return create_task(self._push_tasks(worker_id, wakeup))
+
+    async def _push_tasks(self, worker_id: str, wakeup: Event) -> None:
+        """Sends queued tasks to a push worker while it has free slots (credits).
+
+        Tasks stay in the worker's queue until it can take them, so pushing keeps the queue
+        semantics of polling. The loop is woken up by task events and credit grants, and checks
+        the queues every WORKER_POLL_TIMEOUT_SECONDS in case an event was missed.
+        """
+        while self.ws_manager.is_pushing(worker_id):
+            try:
+                await wait_for(wakeup.wait(), timeout=self.config.WORKER_POLL_TIMEOUT_SECONDS)
+            except AsyncTimeoutError:
+                pass
+            except CancelledError:
+                break
+            wakeup.clear()
+            try:
+                while (free_slots := self.ws_manager.get_credits(worker_id)) > 0:
+                    taken = await self._take_tasks(worker_id, free_slots, None)
+                    if not taken:
+                        break
+                    self.ws_manager.use_credits(worker_id, len(taken))
+                    for i, (_, task, _) in enumerate(taken):
+                        if not await self.ws_manager.send_json(worker_id, {"command": "run_task", "task": task}):
+                            await self._requeue_unsent_tasks(worker_id, taken[i:])
+                            return
+            except CancelledError:
+                break
+            except Exception:
+                logger.exception(f"Error pushing tasks to worker {worker_id}.")
+
+    async def _requeue_unsent_tasks(self, worker_id: str, taken: list[tuple[str, dict[str, Any], float]]) -> None:
+        """Puts tasks a push worker did not receive back into the queues they were taken from,
+        with their original priority, so another worker can claim a task from a shared queue.
+        """
+        for queue_name, task, priority in taken:
+            await self.storage.clear_task_in_flight(worker_id, task["task_id"])
+            if queue_name != worker_id:
+                await self.storage.set_task_worker(task["job_id"], task["task_id"], None)
+            await self.storage.enqueue_task_for_worker(queue_name, task, priority)
+
+    def _wake_push_workers(self, queue_name: str | None) -> None:
+        """Wakes up the push delivery of workers connected to this instance when tasks are enqueued."""
+        if queue_name is None:
+            self.ws_manager.notify_tasks("", shared=True)
+        else:
+            self.ws_manager.notify_tasks(queue_name, shared=queue_name.startswith(SHARED_QUEUE_PREFIX))
+
     async def _handle_get_next_task(self, request: web.Request) -> web.Response:
         worker_id = request.match_info.get("worker_id")
         if not worker_id:
             return web.json_response({"error": "worker_id is required in path"}, status=400)
 
-        logger.debug(f"Worker {worker_id} is requesting a new task.")
-        task = await self.storage.dequeue_task_for_worker(worker_id, self.config.WORKER_POLL_TIMEOUT_SECONDS)
-
-        if task:
-            logger.info(f"Sending task {task.get('task_id')} to worker {worker_id}")
-            return web.json_response(task, status=200)
+        max_tasks = request.query.get("max")
+        if max_tasks is not None:
+            try:
+                count = int(max_tasks)
+            except ValueError:
+                count = 0
+            if count < 1:
+                return web.json_response({"error": "max must be a positive integer"}, status=400)
+        else:
+            count = 1
+
+        logger.debug(f"Worker {worker_id} is requesting up to {count} tasks.")
+        tasks = [
+            task for _, task, _ in await self._take_tasks(worker_id, count, self.config.WORKER_POLL_TIMEOUT_SECONDS)
+        ]
+        if tasks:
+            # Without `max` the response is a single task object, as before
+            return web.json_response(tasks if max_tasks is not None else tasks[0], status=200)
         logger.debug(f"No tasks for worker {worker_id}, responding 204.")
         return web.Response(status=204)
 
+    async def _take_tasks(
+        self,
+        worker_id: str,
+        count: int,
+        timeout: int | None,
+    ) -> list[tuple[str, dict[str, Any], float]]:
+        """Takes up to `count` tasks for a worker and marks them in flight.
+        Waits up to `timeout` seconds for the first task, None only takes the tasks already queued.
+
+        :return: (queue_name, task_payload, priority) tuples, so a task can be put back where it came from.
+        """
+        if timeout is None:
+            tasks = await self._dequeue_tasks(worker_id, count, None)
+        elif self.config.TASK_NOTIFICATIONS_ENABLED:
+            return await self._wait_for_tasks(worker_id, count, timeout)
+        elif self._blocking_polls.locked():
+            # The connections set aside for blocking pops are all taken, check the queues periodically instead
+            return await self._poll_tasks(worker_id, count, timeout)
+        else:
+            async with self._blocking_polls:
+                tasks = await self._dequeue_tasks(worker_id, count, timeout)
+
+        for _, task, _ in tasks:
+            logger.info(f"Sending task {task.get('task_id')} to worker {worker_id}")
+            ttl = task.get("timeout_seconds") or self.config.WORKER_TIMEOUT_SECONDS
+            await self.storage.mark_task_in_flight(worker_id, task["task_id"], ttl)
+        return tasks
+
+    async def _dequeue_tasks(
+        self,
+        worker_id: str,
+        count: int,
+        timeout: int | None,
+    ) -> list[tuple[str, dict[str, Any], float]]:
+        """Takes up to `count` tasks from the queues of a worker, blocking up to `timeout` seconds for the first."""
+        if self.config.TASK_QUEUE_MODE == "shared":
+            job_writes = JobUnitOfWork(self.storage)
+            tasks = await self.dispatcher.claim_queued_tasks(worker_id, timeout, count, storage=job_writes)
+            await job_writes.commit()
+        elif timeout is None:
+            tasks = await self.storage.dequeue_tasks_from_queues([worker_id], count)
+        else:
+            first = await self.storage.dequeue_task_from_queues([worker_id], timeout)
+            tasks = [first] if first else []
+            if first and count > 1:
+                # The first task was waited for, the rest of the batch is whatever is already queued
+                tasks.extend(await self.storage.dequeue_tasks_from_queues([worker_id], count - 1))
+        return tasks
+
+    async def _poll_tasks(
+        self,
+        worker_id: str,
+        count: int,
+        timeout: int,
+    ) -> list[tuple[str, dict[str, Any], float]]:
+        """Waits up to `timeout` seconds for tasks, checking the queues without blocking
+        every WORKER_POLL_FALLBACK_INTERVAL_SECONDS.
+        """
+        deadline = get_running_loop().time() + timeout
+        while not (tasks := await self._take_tasks(worker_id, count, None)):
+            remaining = deadline - get_running_loop().time()
+            if remaining <= 0:
+                break
+            await sleep(min(self.config.WORKER_POLL_FALLBACK_INTERVAL_SECONDS, remaining))
+        return tasks
+
+    async def _wait_for_tasks(
+        self,
+        worker_id: str,
+        count: int,
+        timeout: int,
+    ) -> list[tuple[str, dict[str, Any], float]]:
+        """Waits up to `timeout` seconds for tasks without holding a storage connection.
+
+        The worker's queues are checked with non-blocking pops whenever the task notifier
+        reports a new task in one of them, so all waiting workers share its single subscription.
+        """
+        if self.config.TASK_QUEUE_MODE == "shared":
+            queue_names = await self.dispatcher.claimable_queues(worker_id)
+        else:
+            queue_names = [worker_id]
+        deadline = get_running_loop().time() + timeout
+        # Watching starts before the first check, so a task enqueued in between still wakes us up
+        with self.task_notifier.watch(queue_names) as wakeup:
+            while not (tasks := await self._take_tasks(worker_id, count, None)):
+                remaining = deadline - get_running_loop().time()
+                if remaining <= 0:
+                    break
+                try:
+                    await wait_for(wakeup.wait(), timeout=remaining)
+                except AsyncTimeoutError:
+                    break
+                wakeup.clear()
+        return tasks
+
     async def _worker_update_handler(self, request: web.Request) -> web.Response:
         """
         Handles both full updates and lightweight heartbeats for a worker.
@@ -746,10 +1255,23 @@ class OrchestratorEngine:
 
         if update_data:
             # Full update path
-            updated_worker = await self.storage.update_worker_status(worker_id, update_data, ttl)
+            updated_worker = await self._apply_worker_update(worker_id, update_data, ttl)
             if not updated_worker:
                 return web.json_response({"error": "Worker not found"}, status=404)
+            return web.json_response(updated_worker, status=200)
+        else:
+            # Lightweight TTL-only heartbeat path
+            refreshed = await self.storage.refresh_worker_ttl(worker_id, ttl)
+            if not refreshed:
+                return web.json_response({"error": "Worker not found"}, status=404)
+            return web.json_response({"status": "ttl_refreshed"})
 
+    async def _apply_worker_update(
+        self, worker_id: str, update_data: dict[str, Any], ttl: int
+    ) -> dict[str, Any] | None:
+        """Saves a heartbeat with worker data and logs it, returns the updated worker or None if it is unknown."""
+        updated_worker = await self.storage.update_worker_status(worker_id, update_data, ttl)
+        if updated_worker:
             await self.history_storage.log_worker_event(
                 {
                     "worker_id": worker_id,
@@ -757,13 +1279,7 @@ class OrchestratorEngine:
                     "worker_info_snapshot": updated_worker,
                 },
             )
-            return web.json_response(updated_worker, status=200)
-        else:
-            # Lightweight TTL-only heartbeat path
-            refreshed = await self.storage.refresh_worker_ttl(worker_id, ttl)
-            if not refreshed:
-                return web.json_response({"error": "Worker not found"}, status=404)
-            return web.json_response({"status": "ttl_refreshed"})
+        return updated_worker
 
     async def _register_worker_handler(self, request: web.Request) -> web.Response:
         # The worker_registration_data is attached by the auth middleware
@@ -1,7 +1,7 @@
 from asyncio import CancelledError, Task, create_task, sleep
 from inspect import signature
 from logging import getLogger
-from time import monotonic
+from time import monotonic, time
 from types import SimpleNamespace
 from typing import TYPE_CHECKING, Any
 from uuid import uuid4
@@ -51,6 +51,9 @@ except ImportError:
 from .context import ActionFactory
 from .data_types import ClientConfig, JobContext
 from .history.base import HistoryStorageBase
+from .job_partitions import WeightedFairScheduler
+from .storage.base import message_partition
+from .storage.unit_of_work import JobUnitOfWork
 
 if TYPE_CHECKING:
     from .engine import OrchestratorEngine
@@ -60,6 +63,8 @@ logger = getLogger(
 )  # Re-declare logger after potential redefinition in except block if opentelemetry was missing
 
 TERMINAL_STATES = {"finished", "failed", "error", "quarantined"}
+# Partitions found empty are given no slots for this long, while others have jobs
+EMPTY_PARTITION_BACKOFF_SECONDS = 1.0
 
 
 class JobExecutor:
@@ -74,6 +79,14 @@ class JobExecutor:
         self.dispatcher = engine.dispatcher
         self._running = False
         self._processing_messages: set[str] = set()
+        # Acks collected while the main loop is running, flushed with a single multi-ID ack
+        self._pending_acks: list[str] = []
+        self.partitions = engine.job_partitions
+        self._scheduler = WeightedFairScheduler(self.partitions)
+        # blueprint name -> jobs being processed, for the blueprints with a concurrency cap
+        self._running_by_blueprint: dict[str, int] = {}
+        # partition -> monotonic time it was last found empty
+        self._empty_partitions: dict[str, float] = {}
 
     async def _process_job(self, job_id: str, message_id: str):
         """The core logic for processing a single job dequeued from storage."""
@@ -81,6 +94,8 @@ class JobExecutor:
             return
 
         self._processing_messages.add(message_id)
+        # All state changes made while handling this message are committed together at the end
+        job_writes = JobUnitOfWork(self.storage)
         try:
             start_time = monotonic()
             job_state = await self.storage.get_job_state(job_id)
@@ -130,6 +145,7 @@ class JobExecutor:
                     # This is a critical, non-retriable error.
                     duration_ms = int((monotonic() - start_time) * 1000)
                     await self._handle_failure(
+                        job_writes,
                         job_state,
                         RuntimeError(
                             f"Blueprint '{job_state['blueprint_name']}' not found",
@@ -156,6 +172,7 @@ class JobExecutor:
                     data_stores=SimpleNamespace(**blueprint.data_stores),
                     tracing_context=tracing_context,
                     aggregation_results=job_state.get("aggregation_results"),
+                    blobs=self.engine.blob_store,
                 )
 
                 try:
@@ -197,24 +214,28 @@ class JobExecutor:
                     # Process the single action requested by the handler.
                     if action_factory.next_state:
                         await self._handle_transition(
+                            job_writes,
                             job_state,
                             action_factory.next_state,
                             duration_ms,
                         )
                     elif action_factory.task_to_dispatch:
                         await self._handle_dispatch(
+                            job_writes,
                             job_state,
                             action_factory.task_to_dispatch,
                             duration_ms,
                         )
                     elif action_factory.parallel_tasks_to_dispatch:
                         await self._handle_parallel_dispatch(
+                            job_writes,
                             job_state,
                             action_factory.parallel_tasks_to_dispatch,
                             duration_ms,
                         )
                     elif action_factory.sub_blueprint_to_run:
                         await self._handle_run_blueprint(
+                            job_writes,
                             job_state,
                             action_factory.sub_blueprint_to_run,
                             duration_ms,
@@ -223,14 +244,21 @@ class JobExecutor:
                 except Exception as e:
                     # This catches errors within the handler's execution.
                     duration_ms = int((monotonic() - start_time) * 1000)
-                    await self._handle_failure(job_state, e, duration_ms)
+                    await self._handle_failure(job_writes, job_state, e, duration_ms)
         finally:
-            await self.storage.ack_job(message_id)
+            try:
+                await job_writes.commit()
+            except Exception:
+                # Leave the message unacknowledged so that it is redelivered
+                logger.exception(f"Failed to save changes for job {job_id}, message {message_id} is not acknowledged.")
+            else:
+                await self._ack(message_id)
             if message_id in self._processing_messages:
                 self._processing_messages.remove(message_id)
 
     async def _handle_transition(
         self,
+        job_writes: JobUnitOfWork,
         job_state: dict[str, Any],
         next_state: str,
         duration_ms: int,
@@ -255,16 +283,17 @@ class JobExecutor:
         job_state["retry_count"] = 0
         job_state["current_state"] = next_state
         job_state["status"] = "running"
-        await self.storage.save_job_state(job_id, job_state)
+        await job_writes.save_job_state(job_id, job_state)
 
         if next_state not in TERMINAL_STATES:
-            await self.storage.enqueue_job(job_id)
+            await job_writes.enqueue_job(job_id, self.engine.job_partitions.of(job_state))
         else:
             logger.info(f"Job {job_id} reached terminal state {next_state}")
-            await self._check_and_resume_parent(job_state)
+            await self._check_and_resume_parent(job_writes, job_state)
 
     async def _handle_dispatch(
         self,
+        job_writes: JobUnitOfWork,
         job_state: dict[str, Any],
         task_info: dict[str, Any],
         duration_ms: int,
@@ -285,12 +314,13 @@ class JobExecutor:
         if task_info.get("type") == "human_approval":
             job_state["status"] = "waiting_for_human"
             job_state["current_task_transitions"] = task_info.get("transitions", {})
-            await self.storage.save_job_state(job_id, job_state)
+            await job_writes.save_job_state(job_id, job_state)
             logger.info(f"Job {job_id} is now paused, awaiting human approval.")
         else:
             logger.info(f"Job {job_id} dispatching task: {task_info}")
 
-            now = monotonic()
+            # Wall-clock time, deadlines are compared by the watcher of any instance
+            now = time()
             # Safely get timeout, falling back to the global config if not provided in the task.
             # This prevents TypeErrors if 'timeout_seconds' is missing or wrong type.
             timeout_seconds = task_info.get("timeout_seconds") or self.engine.config.WORKER_TIMEOUT_SECONDS
@@ -303,14 +333,15 @@ class JobExecutor:
             job_state["task_dispatched_at"] = now
             job_state["current_task_info"] = task_info  # Save for retries
             job_state["current_task_transitions"] = task_info.get("transitions", {})
-            await self.storage.save_job_state(job_id, job_state)
-            await self.storage.add_job_to_watch(job_id, timeout_at)
+            await job_writes.save_job_state(job_id, job_state)
+            await job_writes.add_job_to_watch(job_id, timeout_at)
 
             # Now, dispatch the task
-            await self.dispatcher.dispatch(job_state, task_info)
+            await self.dispatcher.dispatch(job_state, task_info, storage=job_writes)
 
     async def _handle_run_blueprint(
         self,
+        job_writes: JobUnitOfWork,
         parent_job_state: dict[str, Any],
         sub_blueprint_info: dict[str, Any],
         duration_ms: int,
@@ -337,8 +368,12 @@ class JobExecutor:
             "status": "pending",
             "parent_job_id": parent_job_id,
         }
-        await self.storage.save_job_state(child_job_id, child_job_state)
-        await self.storage.enqueue_job(child_job_id)
+        # The sub-job runs with the priority and deadline of its parent
+        for field in ("priority", "deadline"):
+            if field in parent_job_state:
+                child_job_state[field] = parent_job_state[field]
+        await job_writes.save_job_state(child_job_id, child_job_state)
+        await job_writes.enqueue_job(child_job_id, self.engine.job_partitions.of(child_job_state))
 
         parent_job_state["status"] = "waiting_for_sub_job"
         parent_job_state["child_job_id"] = child_job_id
@@ -346,11 +381,12 @@ class JobExecutor:
             "transitions",
             {},
         )
-        await self.storage.save_job_state(parent_job_id, parent_job_state)
+        await job_writes.save_job_state(parent_job_id, parent_job_state)
         logger.info(f"Job {parent_job_id} paused, starting sub-job {child_job_id}.")
 
     async def _handle_parallel_dispatch(
         self,
+        job_writes: JobUnitOfWork,
         job_state: dict[str, Any],
         parallel_info: dict[str, Any],
         duration_ms: int,
@@ -371,7 +407,8 @@ class JobExecutor:
         job_state["aggregation_target"] = aggregate_into
         job_state["active_branches"] = branch_task_ids
         job_state["aggregation_results"] = {}
-        await self.storage.save_job_state(job_id, job_state)
+        await self.storage.start_parallel_branches(job_id, branch_task_ids)
+        await job_writes.save_job_state(job_id, job_state)
 
         # Dispatch each task as a "branch"
         for i, task_info in enumerate(tasks_to_dispatch):
@@ -387,18 +424,18 @@ class JobExecutor:
                 **task_info,
             }
 
-            now = monotonic()
             timeout_seconds = task_info.get("timeout_seconds") or self.engine.config.WORKER_TIMEOUT_SECONDS
-            timeout_at = now + timeout_seconds
+            timeout_at = time() + timeout_seconds
 
-            await self.storage.add_job_to_watch(
+            await job_writes.add_job_to_watch(
                 f"{job_id}:{branch_id}",
                 timeout_at,
             )  # Watch each branch
-            await self.dispatcher.dispatch(job_state, full_task_info)
+            await self.dispatcher.dispatch(job_state, full_task_info, storage=job_writes)
 
     async def _handle_failure(
         self,
+        job_writes: JobUnitOfWork,
         job_state: dict[str, Any],
         error: Exception,
         duration_ms: int,
@@ -434,9 +471,9 @@ class JobExecutor:
             job_state["retry_count"] = current_retries + 1
             job_state["status"] = "awaiting_retry"
             job_state["error_message"] = str(error)
-            await self.storage.save_job_state(job_id, job_state)
+            await job_writes.save_job_state(job_id, job_state)
             # Re-enqueue the job to try the same state handler again.
-            await self.storage.enqueue_job(job_id)
+            await job_writes.enqueue_job(job_id, self.engine.job_partitions.of(job_state))
             logger.warning(
                 f"Job {job_id} failed in-handler, will be retried. Attempt {job_state['retry_count']}.",
             )
@@ -447,17 +484,17 @@ class JobExecutor:
             )
             job_state["status"] = "quarantined"
             job_state["error_message"] = str(error)
-            await self.storage.save_job_state(job_id, job_state)
-            await self.storage.quarantine_job(job_id)
+            await job_writes.save_job_state(job_id, job_state)
+            await job_writes.quarantine_job(job_id)
             # If this quarantined job was a sub-job, we must now resume its parent.
-            await self._check_and_resume_parent(job_state)
+            await self._check_and_resume_parent(job_writes, job_state)
             from . import metrics
 
             metrics.jobs_failed_total.inc(
                 {metrics.LABEL_BLUEPRINT: job_state.get("blueprint_name", "unknown")},
             )
 
-    async def _check_and_resume_parent(self, child_job_state: dict[str, Any]):
+    async def _check_and_resume_parent(self, job_writes: JobUnitOfWork, child_job_state: dict[str, Any]):
         """Checks if a completed job was a sub-job. If so, it resumes the parent
         job, passing the success/failure outcome of the child.
         """
@@ -469,7 +506,7 @@ class JobExecutor:
         logger.info(
             f"Sub-job {child_job_id} finished. Resuming parent job {parent_job_id}.",
         )
-        parent_job_state = await self.storage.get_job_state(parent_job_id)
+        parent_job_state = await job_writes.get_job_state(parent_job_id)
         if not parent_job_state:
             logger.error(
                 f"Parent job {parent_job_id} not found for child {child_job_id}.",
@@ -493,8 +530,8 @@ class JobExecutor:
         # Update the parent job to its new state and re-enqueue it.
         parent_job_state["current_state"] = next_state
         parent_job_state["status"] = "running"
-        await self.storage.save_job_state(parent_job_id, parent_job_state)
-        await self.storage.enqueue_job(parent_job_id)
+        await job_writes.save_job_state(parent_job_id, parent_job_state)
+        await job_writes.enqueue_job(parent_job_id, self.engine.job_partitions.of(parent_job_state))
 
     @staticmethod
     def _handle_task_completion(task: Task):
@@ -509,35 +546,159 @@ class JobExecutor:
             # Log any other exceptions that occurred in the task.
             logger.exception("Unhandled exception in job processing task")
 
+    async def _ack(self, message_id: str):
+        """Acknowledges a message, deferring it to the next batch flush while the main loop is running."""
+        if self._running:
+            self._pending_acks.append(message_id)
+        else:
+            await self.storage.ack_job(message_id)
+
+    async def _flush_acks(self):
+        if not self._pending_acks:
+            return
+        message_ids, self._pending_acks = self._pending_acks, []
+        try:
+            await self.storage.ack_jobs(message_ids)
+        except Exception:
+            # Keep them for the next flush, unacknowledged messages would otherwise be redelivered
+            self._pending_acks[:0] = message_ids
+            raise
+
+    def _blueprint_room(self, blueprint_name: str | None) -> int | None:
+        """How many more jobs of a blueprint may be processed now, None if it has no cap."""
+        cap = self.partitions.max_concurrent_jobs(blueprint_name) if blueprint_name else None
+        if cap is None:
+            return None
+        return max(cap - self._running_by_blueprint.get(blueprint_name, 0), 0)
+
+    def _plan_partitions(self, slots: int) -> dict[str, int]:
+        """Shares the free slots between the partitions whose blueprint is below its cap."""
+        rooms = {}
+        for partition in self.partitions.all():
+            blueprint_name = self.partitions.blueprint_of(partition)
+            rooms[partition] = self._blueprint_room(blueprint_name)
+        eligible = [partition for partition, room in rooms.items() if room != 0]
+        now = monotonic()
+        empty_since = self._empty_partitions
+        busy = [
+            partition
+            for partition in eligible
+            if partition not in empty_since or now - empty_since[partition] >= EMPTY_PARTITION_BACKOFF_SECONDS
+        ]
+        sharing = busy or eligible
+        if self.partitions.strict_priority:
+            # Only the highest lane with jobs shares the slots, the lower ones wait until it is empty
+            top_rank = max(self.partitions.rank_of(partition) for partition in sharing)
+            sharing = [partition for partition in sharing if self.partitions.rank_of(partition) == top_rank]
+        # Partitions left out of the share are still waited on when the others are empty
+        plan = dict.fromkeys(eligible, 0)
+        plan.update(self._scheduler.plan(slots, sharing))
+
+        remaining: dict[str, int] = {}
+        for partition, count in plan.items():
+            blueprint_name = self.partitions.blueprint_of(partition)
+            if blueprint_name is None or rooms[partition] is None:
+                continue
+            room = remaining.setdefault(blueprint_name, rooms[partition])
+            plan[partition] = min(count, room)
+            remaining[blueprint_name] -= plan[partition]
+        return plan
+
+    async def _dequeue_jobs(self, slots: int, block_ms: int) -> list[tuple[str, str]]:
+        """Takes jobs for the free slots, from the partitions in their fair share when the queue is
+        partitioned. Jobs that cannot start now (over the slots or the cap of their blueprint, which
+        happens when a wait is ended by a partition that got no slot) go back to the end of their partition.
+        """
+        if not self.partitions.enabled:
+            return await self.storage.dequeue_jobs(slots, block_ms)
+
+        # Never empty, the default partition has no cap
+        plan = self._plan_partitions(slots)
+        jobs = []
+        requeue = []
+        dequeued = await self.storage.dequeue_jobs(slots, block_ms, plan)
+        received: dict[str, int] = {}
+        for _, message_id in dequeued:
+            partition = message_partition(message_id)
+            received[partition] = received.get(partition, 0) + 1
+        now = monotonic()
+        for partition, count in plan.items():
+            if received.get(partition, 0) < count:
+                self._empty_partitions[partition] = now
+            elif partition in received:
+                self._empty_partitions.pop(partition, None)
+
+        for job_id, message_id in dequeued:
+            blueprint_name = self.partitions.blueprint_of(message_partition(message_id))
+            if len(jobs) < slots and self._blueprint_room(blueprint_name) != 0:
+                jobs.append((job_id, message_id))
+                self._track_blueprint(blueprint_name, 1)
+            else:
+                requeue.append((job_id, message_id))
+        for job_id, message_id in requeue:
+            await self.storage.enqueue_job(job_id, message_partition(message_id))
+            await self._ack(message_id)
+        return jobs
+
+    def _track_blueprint(self, blueprint_name: str | None, delta: int) -> None:
+        if blueprint_name is not None and self.partitions.max_concurrent_jobs(blueprint_name) is not None:
+            self._running_by_blueprint[blueprint_name] = self._running_by_blueprint.get(blueprint_name, 0) + delta
+
     async def run(self):
         import asyncio
 
         logger.info("JobExecutor started.")
         self._running = True
-        semaphore = asyncio.Semaphore(self.engine.config.EXECUTOR_MAX_CONCURRENT_JOBS)
+        config = self.engine.config
+        semaphore = asyncio.Semaphore(config.EXECUTOR_MAX_CONCURRENT_JOBS)
+        batch_size = max(1, config.EXECUTOR_DEQUEUE_BATCH_SIZE)
 
-        while self._running:
+        def release_slot(_):
+            semaphore.release()
+
+        try:
+            while self._running:
+                try:
+                    # Wait for an available slot, then take any other free slots up to the batch size
+                    await semaphore.acquire()
+                    slots = 1
+                    while slots < batch_size and not semaphore.locked():
+                        await semaphore.acquire()
+                        slots += 1
+
+                    started = 0
+                    try:
+                        await self._flush_acks()
+                        # Blocks in storage until jobs arrive instead of polling
+                        dequeue_started = monotonic()
+                        jobs = await self._dequeue_jobs(slots, config.EXECUTOR_DEQUEUE_BLOCK_MS)
+                        for job_id, message_id in jobs:
+                            task = create_task(self._process_job(job_id, message_id))
+                            task.add_done_callback(self._handle_task_completion)
+                            # Release the semaphore slot when the task is done
+                            task.add_done_callback(release_slot)
+                            if self.partitions.by_blueprint:
+                                blueprint_name = self.partitions.blueprint_of(message_partition(message_id))
+                                task.add_done_callback(lambda _, name=blueprint_name: self._track_blueprint(name, -1))
+                            started += 1
+                    finally:
+                        # Return the slots that were not used by this batch
+                        for _ in range(slots - started):
+                            semaphore.release()
+                    if not jobs and monotonic() - dequeue_started < config.EXECUTOR_DEQUEUE_BLOCK_MS / 1000:
+                        # The backend returned early without blocking, prevent a busy loop
+                        await sleep(0.1)
+                except CancelledError:
+                    break
+                except Exception:
+                    logger.exception("Error in JobExecutor main loop.")
+                    await sleep(1)
+        finally:
+            self._running = False
             try:
-                # Wait for an available slot before fetching a new job
-                await semaphore.acquire()
-
-                result = await self.storage.dequeue_job()
-                if result:
-                    job_id, message_id = result
-                    task = create_task(self._process_job(job_id, message_id))
-                    task.add_done_callback(self._handle_task_completion)
-                    # Release the semaphore slot when the task is done
-                    task.add_done_callback(lambda _: semaphore.release())
-                else:
-                    # No job found, release the slot and wait a bit
-                    semaphore.release()
-                    # Prevent busy loop if storage returns None immediately
-                    await sleep(0.1)
-            except CancelledError:
-                break
+                await self._flush_acks()
             except Exception:
-                logger.exception("Error in JobExecutor main loop.")
-                await sleep(1)
+                logger.exception("Failed to acknowledge processed jobs on shutdown.")
         logger.info("JobExecutor stopped.")
 
     def stop(self):
@@ -1,12 +1,10 @@
-"""This module previously contained an active HealthChecker.
-In the new architecture with heartbeat messages from workers,
+"""In the architecture with heartbeat messages from workers,
 the orchestrator no longer needs to actively poll workers.
 
-Redis automatically deletes worker keys when their TTL expires,
-and `storage.get_available_workers()` only retrieves active keys.
-
-This file is left as a placeholder in case passive health-check
-logic is needed in the future (e.g., for logging expired workers).
+Storage backends expire worker records on their own (e.g., via the TTL of
+the worker keys in Redis), but the worker registry indexes used for dispatch
+have to be cleaned up explicitly. The HealthChecker periodically prunes
+expired workers from those indexes.
 """
 
 from asyncio import CancelledError, sleep
@@ -21,18 +19,23 @@ logger = getLogger(__name__)
 
 class HealthChecker:
     def __init__(self, engine: "OrchestratorEngine"):
+        self.storage = engine.storage
+        self.interval_seconds = engine.config.WORKER_HEALTH_CHECK_INTERVAL_SECONDS
         self._running = False
 
     async def run(self):
-        logger.info("HealthChecker is now passive and will not perform active checks.")
+        logger.info("HealthChecker started. It will prune expired workers from the registry.")
         self._running = True
         while self._running:
             try:
-                # Sleep for a long time, as this checker is passive.
-                # The loop exists to allow for a clean shutdown.
-                await sleep(3600)
+                await sleep(self.interval_seconds)
+                pruned = await self.storage.prune_expired_workers()
+                if pruned:
+                    logger.info(f"Pruned {pruned} expired workers from the registry.")
             except CancelledError:
                 break
+            except Exception:
+                logger.exception("Error in HealthChecker main loop.")
         logger.info("HealthChecker stopped.")
 
     def stop(self):
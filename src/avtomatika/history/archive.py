@@ -0,0 +1,39 @@
+"""Export of expired history partitions to compressed Parquet files before they are dropped.
+Requires the optional `pyarrow` dependency (`avtomatika[archive]`).
+"""
+
+from datetime import datetime
+from os import makedirs, path, replace
+from typing import Any
+
+try:
+    from pyarrow import Table  # type: ignore[import-untyped]
+    from pyarrow.parquet import write_table  # type: ignore[import-untyped]
+except ImportError:
+    Table = None
+    write_table = None
+
+
+def check_archive_support():
+    if Table is None:
+        raise ImportError("Archiving history partitions requires pyarrow, install avtomatika[archive].")
+
+
+def _column_value(value: Any) -> Any:
+    # UUIDs and other driver types are stored as text, snapshots stay JSON text
+    if value is None or isinstance(value, (str, int, float, bool, datetime)):
+        return value
+    return str(value)
+
+
+def write_archive(directory: str, name: str, rows: list[dict[str, Any]]) -> str:
+    """Writes the rows to `<directory>/<name>.parquet` with zstd compression and returns the file path.
+    The file is written under a temporary name first, so a partial file is never left behind.
+    """
+    check_archive_support()
+    makedirs(directory, exist_ok=True)
+    file_path = path.join(directory, f"{name}.parquet")
+    table = Table.from_pylist([{key: _column_value(value) for key, value in row.items()} for row in rows])
+    write_table(table, f"{file_path}.tmp", compression="zstd")
+    replace(f"{file_path}.tmp", file_path)
+    return file_path
@@ -1,6 +1,17 @@
 from abc import ABC, abstractmethod
 from typing import Any
 
+from orjson import dumps
+
+
+def encode_snapshot(snapshot: Any) -> str | None:
+    """Serializes an event snapshot to JSON. Snapshots that are already encoded are returned as is."""
+    if not snapshot:
+        return None
+    if isinstance(snapshot, str):
+        return snapshot
+    return dumps(snapshot).decode("utf-8")
+
 
 class HistoryStorageBase(ABC):
     """Abstract base class for a history store.
@@ -22,15 +33,44 @@ class HistoryStorageBase(ABC):
         """Logs an event related to the worker lifecycle."""
         raise NotImplementedError
 
+    async def log_job_events(self, events: list[dict[str, Any]]):
+        """Logs a batch of job events.
+        Unlike `log_job_event`, write errors are raised so the caller can decide what to do with the batch.
+        Backends should override it to write the whole batch at once.
+        """
+        for event_data in events:
+            await self.log_job_event(event_data)
+
+    async def log_worker_events(self, events: list[dict[str, Any]]):
+        """Logs a batch of worker events, see `log_job_events`."""
+        for event_data in events:
+            await self.log_worker_event(event_data)
+
+    async def drop_expired_events(self, before: float, archive_path: str = ""):
+        """Removes job and worker events logged before `before` (Unix time), together with jobs
+        whose last event is older. Partitioned stores drop whole partitions that ended before it,
+        exporting them to `archive_path` first if it is set; other stores delete the expired rows.
+        Stores without persistent history ignore it.
+        """
+        return None
+
     @abstractmethod
     async def get_job_history(self, job_id: str) -> list[dict[str, Any]]:
         """Gets the full history for the specified job."""
         raise NotImplementedError
 
     @abstractmethod
-    async def get_jobs(self, limit: int = 100, offset: int = 0) -> list[dict[str, Any]]:
+    async def get_jobs(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        cursor: str | None = None,
+    ) -> list[dict[str, Any]]:
         """Gets a paginated list of recent jobs.
         Primarily returns the last event for each job.
+        Each job contains a `cursor`: passing the cursor of the last returned job
+        returns the next page without scanning the skipped jobs, as `offset` does.
+        Raises ValueError for a malformed cursor.
         """
         raise NotImplementedError
 
@@ -41,6 +81,13 @@ class HistoryStorageBase(ABC):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    async def get_task_outcomes(self, since_days: int) -> list[dict[str, Any]]:
+        """Counts the `task_finished` events of the last N days per worker and day.
+        Returns rows with `worker_id`, `age_days` (0 for the last 24 hours), `total` and `successes`.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     async def get_worker_history(
         self,
@@ -0,0 +1,233 @@
+from asyncio import CancelledError, Event, Lock, Queue, QueueEmpty, QueueFull, Task, create_task, to_thread, wait_for
+from contextlib import suppress
+from logging import getLogger
+from os import path, remove, rename
+from time import monotonic, time
+from typing import Any
+
+from orjson import dumps, loads
+
+from .. import metrics
+from .base import HistoryStorageBase, encode_snapshot
+
+logger = getLogger(__name__)
+
+JOB_EVENT = "job"
+WORKER_EVENT = "worker"
+
+OVERFLOW_POLICIES = ("block", "drop", "spill")
+
+
+def _append_lines(file_path: str, events: list[tuple[str, dict[str, Any]]]):
+    with open(file_path, "ab") as f:
+        f.writelines(dumps({"kind": kind, "event": event}) + b"\n" for kind, event in events)
+
+
+def _take_lines(file_path: str) -> list[tuple[str, dict[str, Any]]]:
+    """Atomically takes over the spill file and reads all events from it."""
+    replay_path = f"{file_path}.replay"
+    if not path.exists(replay_path):
+        if not path.exists(file_path):
+            return []
+        rename(file_path, replay_path)
+    with open(replay_path, "rb") as f:
+        events = []
+        for line in f:
+            with suppress(ValueError, KeyError):
+                record = loads(line)
+                events.append((record["kind"], record["event"]))
+    remove(replay_path)
+    return events
+
+
+class BufferedHistoryStorage(HistoryStorageBase):
+    """Writes history events to the wrapped store in the background, in batches.
+
+    `log_job_event` and `log_worker_event` only put the event into a bounded in-memory
+    queue, so the job processing path does not wait for the history database. A background
+    task writes the queue out when it holds `batch_size` events or every `flush_interval`
+    seconds, whichever comes first, using the batch methods of the wrapped store.
+
+    When the queue is full, `overflow_policy` decides what happens to a new event:
+    "block" makes the caller wait for free space (backpressure), "drop" discards the event,
+    "spill" appends it to the `spill_path` file. Spilled events, as well as batches that
+    failed to be written, are replayed from the file once the queue has been drained.
+
+    Snapshots are serialized when the event is logged, because callers pass live job
+    states that keep changing after the call. Reads flush the queue first, so the history
+    returned by the API includes all events logged before the request.
+    """
+
+    def __init__(
+        self,
+        storage: HistoryStorageBase,
+        max_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        overflow_policy: str = "block",
+        spill_path: str = "",
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown history overflow policy '{overflow_policy}', expected one of: {', '.join(OVERFLOW_POLICIES)}"
+            )
+        if overflow_policy == "spill" and not spill_path:
+            raise ValueError("The 'spill' history overflow policy requires a spill file path.")
+
+        self.storage = storage
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path
+        self._queue: Queue[tuple[str, dict[str, Any]]] = Queue(maxsize=max_size)
+        self._flush_lock = Lock()
+        self._wakeup = Event()
+        self._flusher: Task | None = None
+        self._running = False
+        self._dropped = 0
+
+    async def initialize(self):
+        await self.storage.initialize()
+        self._running = True
+        self._flusher = create_task(self._run())
+
+    async def close(self):
+        """Stops the background writer, writes out all buffered events and closes the wrapped store."""
+        self._running = False
+        if self._flusher:
+            self._flusher.cancel()
+            with suppress(CancelledError):
+                await self._flusher
+            self._flusher = None
+        await self.flush()
+        if hasattr(self.storage, "close"):
+            await self.storage.close()
+
+    async def log_job_event(self, event_data: dict[str, Any]):
+        await self._put(JOB_EVENT, event_data, "context_snapshot")
+
+    async def log_worker_event(self, event_data: dict[str, Any]):
+        await self._put(WORKER_EVENT, event_data, "worker_info_snapshot")
+
+    async def _put(self, kind: str, event_data: dict[str, Any], snapshot_key: str):
+        event = {**event_data, "timestamp": event_data.get("timestamp") or time()}
+        if snapshot_key in event:
+            event[snapshot_key] = encode_snapshot(event[snapshot_key])
+        item = (kind, event)
+
+        if self._queue.full():
+            self._wakeup.set()
+
+        if self.overflow_policy == "block":
+            await self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except QueueFull:
+                if self.overflow_policy == "spill":
+                    await self._spill([item])
+                else:
+                    self._dropped += 1
+                    metrics.history_events_dropped_total.inc({})
+
+        metrics.history_queue_depth.set({}, self._queue.qsize())
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        logger.info("History writer started.")
+        while self._running:
+            try:
+                with suppress(TimeoutError):
+                    await wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                self._wakeup.clear()
+                await self.flush()
+                if self.spill_path and self._queue.empty():
+                    await self._replay_spill()
+            except CancelledError:
+                break
+            except Exception:
+                logger.exception("Error in history writer loop.")
+        logger.info("History writer stopped.")
+
+    async def flush(self):
+        """Writes all events currently in the queue to the wrapped store."""
+        async with self._flush_lock:
+            while not self._queue.empty():
+                batch = []
+                with suppress(QueueEmpty):
+                    while len(batch) < self.batch_size:
+                        batch.append(self._queue.get_nowait())
+                metrics.history_queue_depth.set({}, self._queue.qsize())
+                await self._write_batch(batch)
+
+        if self._dropped:
+            logger.warning(f"History buffer is full, dropped {self._dropped} events.")
+            self._dropped = 0
+
+    async def _write_batch(self, batch: list[tuple[str, dict[str, Any]]]):
+        start = monotonic()
+        for kind, write in ((JOB_EVENT, self.storage.log_job_events), (WORKER_EVENT, self.storage.log_worker_events)):
+            events = [event for event_kind, event in batch if event_kind == kind]
+            if not events:
+                continue
+            try:
+                await write(events)
+            except Exception as e:
+                # A failed batch is written again from the spill file when one is configured.
+                if self.spill_path:
+                    logger.error(f"Failed to write {len(events)} history events, spilling them to disk: {e}")
+                    await self._spill([(kind, event) for event in events])
+                else:
+                    logger.error(f"Failed to write {len(events)} history events, dropping them: {e}")
+                    metrics.history_events_dropped_total.add({}, len(events))
+        metrics.history_flush_latency_seconds.observe({}, monotonic() - start)
+
+    async def _spill(self, events: list[tuple[str, dict[str, Any]]]):
+        try:
+            await to_thread(_append_lines, self.spill_path, events)
+        except OSError as e:
+            logger.error(f"Failed to spill {len(events)} history events to {self.spill_path}, dropping them: {e}")
+            metrics.history_events_dropped_total.add({}, len(events))
+            return
+        metrics.history_events_spilled_total.add({}, len(events))
+
+    async def _replay_spill(self):
+        events = await to_thread(_take_lines, self.spill_path)
+        if events:
+            logger.info(f"Replaying {len(events)} spilled history events.")
+        async with self._flush_lock:
+            for i in range(0, len(events), self.batch_size):
+                await self._write_batch(events[i : i + self.batch_size])
+
+    async def get_job_history(self, job_id: str) -> list[dict[str, Any]]:
+        await self.flush()
+        return await self.storage.get_job_history(job_id)
+
+    async def get_jobs(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        cursor: str | None = None,
+    ) -> list[dict[str, Any]]:
+        await self.flush()
+        return await self.storage.get_jobs(limit=limit, offset=offset, cursor=cursor)
+
+    async def get_job_summary(self) -> dict[str, int]:
+        await self.flush()
+        return await self.storage.get_job_summary()
+
+    async def get_task_outcomes(self, since_days: int) -> list[dict[str, Any]]:
+        await self.flush()
+        return await self.storage.get_task_outcomes(since_days)
+
+    async def get_worker_history(
+        self,
+        worker_id: str,
+        since_days: int,
+    ) -> list[dict[str, Any]]:
+        await self.flush()
+        return await self.storage.get_worker_history(worker_id, since_days)
+
+    async def drop_expired_events(self, before: float, archive_path: str = ""):
+        await self.storage.drop_expired_events(before, archive_path)
@@ -24,7 +24,15 @@ class NoOpHistoryStorage(HistoryStorageBase):
         # Always return an empty list
         return []
 
-    async def get_jobs(self, limit: int = 100, offset: int = 0) -> list[dict[str, Any]]:
+    async def get_jobs(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        cursor: str | None = None,
+    ) -> list[dict[str, Any]]:
+        return []
+
+    async def get_task_outcomes(self, since_days: int) -> list[dict[str, Any]]:
         return []
 
     async def get_job_summary(self) -> dict[str, int]:
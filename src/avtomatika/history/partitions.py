@@ -0,0 +1,41 @@
+from datetime import datetime, timezone
+
+# Length of a history partition in seconds. Weekly partitions start on Monday, all periods are in UTC.
+PARTITION_INTERVALS = {"day": 86400, "week": 7 * 86400}
+
+# The Unix epoch is a Thursday, the first Monday after it is 4 days later
+_WEEK_ORIGIN = 4 * 86400
+
+
+def validate_partition_interval(interval: str):
+    if interval and interval not in PARTITION_INTERVALS:
+        raise ValueError(
+            f"Unknown history partition interval '{interval}', expected one of: {', '.join(PARTITION_INTERVALS)}"
+        )
+
+
+def partition_start(timestamp: float, interval: str) -> float:
+    """Returns the start of the period that contains the timestamp (Unix time)."""
+    length = PARTITION_INTERVALS[interval]
+    origin = _WEEK_ORIGIN if interval == "week" else 0
+    return (timestamp - origin) // length * length + origin
+
+
+def partition_end(start: float, interval: str) -> float:
+    return start + PARTITION_INTERVALS[interval]
+
+
+def partition_name(table: str, start: float) -> str:
+    """Returns the name of the partition of the table that starts at `start`, e.g. `job_history_p20240101`."""
+    return f"{table}_p{datetime.fromtimestamp(start, timezone.utc):%Y%m%d}"
+
+
+def parse_partition_start(table: str, name: str) -> float | None:
+    """Returns the start of a partition from its name, or None if it is not a partition of the table."""
+    prefix = f"{table}_p"
+    if not name.startswith(prefix):
+        return None
+    try:
+        return datetime.strptime(name[len(prefix) :], "%Y%m%d").replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
@@ -1,15 +1,25 @@
 from abc import ABC
+from asyncio import to_thread
 from contextlib import suppress
-from datetime import datetime
+from datetime import datetime, timezone
 from logging import getLogger
 from typing import Any
 from uuid import uuid4
 from zoneinfo import ZoneInfo
 
 from asyncpg import Connection, Pool, PostgresError, create_pool  # type: ignore[import-untyped]
-from orjson import dumps, loads
-
-from .base import HistoryStorageBase
+from orjson import loads
+
+from .archive import write_archive
+from .base import HistoryStorageBase, encode_snapshot
+from .partitions import (
+    parse_partition_start,
+    partition_end,
+    partition_name,
+    partition_start,
+    validate_partition_interval,
+)
+from .snapshots import SnapshotCompactor, rebase_diffs, resolve_snapshots
 
 logger = getLogger(__name__)
 
@@ -25,7 +35,10 @@ CREATE TABLE IF NOT EXISTS job_history (
     next_state TEXT,
     worker_id TEXT,
     attempt_number INTEGER,
-    context_snapshot JSONB
+    context_snapshot JSONB,
+    status TEXT,
+    snapshot_base UUID,
+    result_status TEXT
 );
 """
 
@@ -39,17 +52,200 @@ CREATE TABLE IF NOT EXISTS worker_history (
 );
 """
 
+# With a partition interval the history tables are created range-partitioned by timestamp.
+# The partition key has to be part of the primary key.
+CREATE_PARTITIONED_JOB_HISTORY_TABLE_PG = """
+CREATE TABLE IF NOT EXISTS job_history (
+    event_id UUID NOT NULL,
+    job_id TEXT NOT NULL,
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    state TEXT,
+    event_type TEXT NOT NULL,
+    duration_ms INTEGER,
+    previous_state TEXT,
+    next_state TEXT,
+    worker_id TEXT,
+    attempt_number INTEGER,
+    context_snapshot JSONB,
+    status TEXT,
+    snapshot_base UUID,
+    result_status TEXT,
+    PRIMARY KEY (event_id, timestamp)
+) PARTITION BY RANGE (timestamp);
+"""
+
+CREATE_PARTITIONED_WORKER_HISTORY_TABLE_PG = """
+CREATE TABLE IF NOT EXISTS worker_history (
+    event_id UUID NOT NULL,
+    worker_id TEXT NOT NULL,
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    event_type TEXT NOT NULL,
+    worker_info_snapshot JSONB,
+    PRIMARY KEY (event_id, timestamp)
+) PARTITION BY RANGE (timestamp);
+"""
+
 CREATE_JOB_ID_INDEX_PG = "CREATE INDEX IF NOT EXISTS idx_job_id ON job_history(job_id);"
 
+# Indexes on a partitioned table are created on each of its partitions
+CREATE_HISTORY_INDEXES_PG = (
+    "CREATE INDEX IF NOT EXISTS idx_job_history_worker_id_timestamp ON job_history(worker_id, timestamp);",
+    "CREATE INDEX IF NOT EXISTS idx_job_history_event_type_timestamp ON job_history(event_type, timestamp);",
+    "CREATE INDEX IF NOT EXISTS idx_worker_history_worker_id_timestamp ON worker_history(worker_id, timestamp);",
+)
+
+HISTORY_TABLES = ("job_history", "worker_history")
+
+# Events logged before result_status was stored only have the status in a full snapshot
+SELECT_TASK_OUTCOMES_PG = """
+SELECT
+    worker_id,
+    FLOOR(EXTRACT(EPOCH FROM NOW() - timestamp) / 86400)::int as age_days,
+    COUNT(*)::int as total,
+    COUNT(*) FILTER (
+        WHERE COALESCE(
+            result_status,
+            CASE WHEN snapshot_base IS NULL THEN context_snapshot->'result'->>'status' END
+        ) = 'success'
+    )::int as successes
+FROM job_history
+WHERE event_type = 'task_finished'
+AND timestamp >= NOW() - ($1 * INTERVAL '1 day')
+AND worker_id IS NOT NULL
+GROUP BY worker_id, age_days
+"""
+
+SELECT_PARTITIONS_PG = """
+SELECT c.relname FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = to_regclass($1)
+"""
+
+# Columns added to job_history after its first release
+ADD_JOB_HISTORY_COLUMNS_PG = """
+ALTER TABLE job_history
+    ADD COLUMN IF NOT EXISTS status TEXT,
+    ADD COLUMN IF NOT EXISTS snapshot_base UUID,
+    ADD COLUMN IF NOT EXISTS result_status TEXT;
+"""
+
+# The last event and the current status of every job, maintained when job events are logged
+CREATE_JOB_LATEST_TABLE_PG = """
+CREATE TABLE IF NOT EXISTS job_latest (
+    job_id TEXT PRIMARY KEY,
+    blueprint_name TEXT,
+    status TEXT,
+    current_state TEXT,
+    last_event_type TEXT,
+    last_event_id UUID NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL
+);
+"""
+
+CREATE_JOB_LATEST_INDEXES_PG = (
+    "CREATE INDEX IF NOT EXISTS idx_job_latest_updated_at ON job_latest(updated_at DESC, job_id DESC);",
+    "CREATE INDEX IF NOT EXISTS idx_job_latest_status ON job_latest(status);",
+    "CREATE INDEX IF NOT EXISTS idx_job_latest_blueprint ON job_latest(blueprint_name, updated_at DESC);",
+)
+
+# Fills job_latest from the existing history when the table is created on an older database
+BACKFILL_JOB_LATEST_PG = """
+INSERT INTO job_latest (
+    job_id, blueprint_name, status, current_state, last_event_type, last_event_id, created_at, updated_at
+)
+SELECT DISTINCT ON (job_id)
+    job_id,
+    context_snapshot->>'blueprint_name',
+    COALESCE(status, context_snapshot->>'status'),
+    COALESCE(context_snapshot->>'current_state', state),
+    event_type,
+    event_id,
+    MIN(timestamp) OVER(PARTITION BY job_id),
+    timestamp
+FROM job_history
+ORDER BY job_id, timestamp DESC
+ON CONFLICT (job_id) DO NOTHING;
+"""
+
+JOB_HISTORY_COLUMNS = (
+    "event_id",
+    "job_id",
+    "timestamp",
+    "state",
+    "event_type",
+    "duration_ms",
+    "previous_state",
+    "next_state",
+    "worker_id",
+    "attempt_number",
+    "context_snapshot",
+    "status",
+    "snapshot_base",
+    "result_status",
+)
+WORKER_HISTORY_COLUMNS = ("event_id", "worker_id", "timestamp", "event_type", "worker_info_snapshot")
+
+INSERT_JOB_EVENT_PG = f"""
+INSERT INTO job_history ({", ".join(JOB_HISTORY_COLUMNS)})
+VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14)
+"""
+
+INSERT_WORKER_EVENT_PG = f"""
+INSERT INTO worker_history ({", ".join(WORKER_HISTORY_COLUMNS)})
+VALUES ($1, $2, $3, $4, $5)
+"""
+
+UPSERT_JOB_LATEST_PG = """
+INSERT INTO job_latest (
+    job_id, blueprint_name, status, current_state, last_event_type, last_event_id, created_at, updated_at
+) VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+ON CONFLICT (job_id) DO UPDATE SET
+    blueprint_name = COALESCE(excluded.blueprint_name, job_latest.blueprint_name),
+    status = COALESCE(excluded.status, job_latest.status),
+    current_state = COALESCE(excluded.current_state, job_latest.current_state),
+    last_event_type = excluded.last_event_type,
+    last_event_id = excluded.last_event_id,
+    updated_at = excluded.updated_at
+WHERE excluded.updated_at >= job_latest.updated_at
+"""
+
+SELECT_LATEST_JOBS_PG = """
+SELECT
+    h.event_id, h.job_id, h.timestamp, h.state, h.event_type, h.duration_ms, h.previous_state,
+    h.next_state, h.worker_id, h.attempt_number, h.context_snapshot, h.snapshot_base, h.result_status,
+    l.status, l.blueprint_name, l.current_state, l.created_at, l.updated_at
+FROM job_latest l
+JOIN job_history h ON h.event_id = l.last_event_id
+"""
+
 
 class PostgresHistoryStorage(HistoryStorageBase, ABC):
-    """Implementation of the history store based on asyncpg for PostgreSQL."""
+    """Implementation of the history store based on asyncpg for PostgreSQL.
+    Job snapshots are stored as diffs between periodic full snapshots, see `SnapshotCompactor`.
 
-    def __init__(self, dsn: str, tz_name: str = "UTC"):
+    With a `partition_interval` ("day" or "week"), new databases get history tables that are
+    range-partitioned by timestamp, with partitions such as `job_history_p20240101` created as
+    events arrive, so expired periods are removed by dropping their partitions. Tables created
+    without partitions stay as they are, their expired events are deleted instead.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        tz_name: str = "UTC",
+        full_snapshot_interval: int = 10,
+        partition_interval: str = "",
+    ):
+        validate_partition_interval(partition_interval)
         self._dsn = dsn
         self._pool: Pool | None = None
         self.tz_name = tz_name
         self.tz = ZoneInfo(tz_name)
+        self._snapshots = SnapshotCompactor(full_snapshot_interval)
+        self.partition_interval = partition_interval
+        # Partitioned table -> {partition name: start of its period}
+        self._partitions: dict[str, dict[str, float]] = {}
 
     async def _setup_connection(self, conn: Connection):
         """Configures the connection session with the correct timezone."""
@@ -67,41 +263,94 @@ class PostgresHistoryStorage(HistoryStorageBase, ABC):
                 raise RuntimeError("Failed to create a connection pool.")
 
             async with self._pool.acquire() as conn:
-                await conn.execute(CREATE_JOB_HISTORY_TABLE_PG)
-                await conn.execute(CREATE_WORKER_HISTORY_TABLE_PG)
+                if self.partition_interval:
+                    await conn.execute(CREATE_PARTITIONED_JOB_HISTORY_TABLE_PG)
+                    await conn.execute(CREATE_PARTITIONED_WORKER_HISTORY_TABLE_PG)
+                else:
+                    await conn.execute(CREATE_JOB_HISTORY_TABLE_PG)
+                    await conn.execute(CREATE_WORKER_HISTORY_TABLE_PG)
+                await conn.execute(ADD_JOB_HISTORY_COLUMNS_PG)
                 await conn.execute(CREATE_JOB_ID_INDEX_PG)
+                for index in CREATE_HISTORY_INDEXES_PG:
+                    await conn.execute(index)
+                await self._load_partitions(conn)
+                await self._create_job_latest_table(conn)
             logger.info(f"PostgreSQL history storage initialized (TZ={self.tz_name}).")
         except (PostgresError, OSError) as e:
             logger.error(f"Failed to initialize PostgreSQL history storage: {e}")
             raise
 
+    async def _load_partitions(self, conn: Connection):
+        """Reads the partitions of the partitioned history tables from the catalog."""
+        self._partitions = {}
+        for table in HISTORY_TABLES:
+            kind = await conn.fetchval("SELECT relkind FROM pg_class WHERE oid = to_regclass($1)", table)
+            if kind != "p":
+                if self.partition_interval:
+                    logger.warning(
+                        f"{table} was created without partitions, its expired events are deleted row by row."
+                    )
+                continue
+            if not self.partition_interval:
+                raise RuntimeError(f"{table} is partitioned, history partition interval must be set.")
+            self._partitions[table] = {}
+            for row in await conn.fetch(SELECT_PARTITIONS_PG, table):
+                start = parse_partition_start(table, row["relname"])
+                if start is not None:
+                    self._partitions[table][row["relname"]] = start
+
+    async def _ensure_partitions(self, conn: Connection, table: str, event_times: list[datetime]):
+        """Creates the partitions of the periods of the events that don't exist yet."""
+        if table not in self._partitions:
+            return
+        for start in {partition_start(event_time.timestamp(), self.partition_interval) for event_time in event_times}:
+            name = partition_name(table, start)
+            if name in self._partitions[table]:
+                continue
+            lower = datetime.fromtimestamp(start, timezone.utc).isoformat()
+            upper = datetime.fromtimestamp(partition_end(start, self.partition_interval), timezone.utc).isoformat()
+            await conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+            )
+            self._partitions[table][name] = start
+
+    async def _create_job_latest_table(self, conn: Connection):
+        exists = await conn.fetchval("SELECT to_regclass('job_latest') IS NOT NULL")
+        await conn.execute(CREATE_JOB_LATEST_TABLE_PG)
+        for index in CREATE_JOB_LATEST_INDEXES_PG:
+            await conn.execute(index)
+        if not exists:
+            await conn.execute(BACKFILL_JOB_LATEST_PG)
+
     async def close(self):
         """Closes the connection pool."""
         if self._pool:
             await self._pool.close()
             logger.info("PostgreSQL history storage connection pool closed.")
 
-    async def log_job_event(self, event_data: dict[str, Any]):
-        """Logs a job lifecycle event to PostgreSQL."""
-        if not self._pool:
-            raise RuntimeError("History storage is not initialized.")
-
-        query = """
-            INSERT INTO job_history (
-                event_id, job_id, timestamp, state, event_type, duration_ms,
-                previous_state, next_state, worker_id, attempt_number,
-                context_snapshot
-            ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-        """
-        now = datetime.now(self.tz)
-
-        context_snapshot = event_data.get("context_snapshot")
-        context_snapshot_json = dumps(context_snapshot).decode("utf-8") if context_snapshot else None
-
-        params = (
-            uuid4(),
-            event_data.get("job_id"),
-            now,
+    def _event_time(self, event_data: dict[str, Any]) -> datetime:
+        timestamp = event_data.get("timestamp")
+        return datetime.fromtimestamp(timestamp, self.tz) if timestamp else datetime.now(self.tz)
+
+    def _job_event_record(self, event_data: dict[str, Any]) -> tuple[tuple, tuple]:
+        """Returns the job_history record of the event and the job_latest record it updates."""
+        event_id = uuid4()
+        job_id = event_data.get("job_id")
+        event_time = self._event_time(event_data)
+        snapshot = event_data.get("context_snapshot")
+        if isinstance(snapshot, str):
+            snapshot = loads(snapshot)
+        if not isinstance(snapshot, dict):
+            snapshot = {}
+        period = None
+        if "job_history" in self._partitions:
+            period = partition_start(event_time.timestamp(), self.partition_interval)
+        context_snapshot_json, snapshot_base = self._snapshots.compact(job_id, str(event_id), snapshot, period)
+        status = snapshot.get("status")
+        history_record = (
+            event_id,
+            job_id,
+            event_time,
             event_data.get("state"),
             event_data.get("event_type"),
             event_data.get("duration_ms"),
@@ -110,41 +359,96 @@ class PostgresHistoryStorage(HistoryStorageBase, ABC):
             event_data.get("worker_id"),
             event_data.get("attempt_number"),
             context_snapshot_json,
+            status,
+            snapshot_base,
+            event_data.get("result_status"),
+        )
+        latest_record = (
+            job_id,
+            snapshot.get("blueprint_name"),
+            status,
+            snapshot.get("current_state") or event_data.get("state"),
+            event_data.get("event_type"),
+            event_id,
+            event_time,
+            event_time,
+        )
+        return history_record, latest_record
+
+    def _worker_event_record(self, event_data: dict[str, Any]) -> tuple:
+        return (
+            uuid4(),
+            event_data.get("worker_id"),
+            self._event_time(event_data),
+            event_data.get("event_type"),
+            encode_snapshot(event_data.get("worker_info_snapshot")),
         )
+
+    @staticmethod
+    async def _insert_records(
+        conn: Connection,
+        table: str,
+        columns: tuple[str, ...],
+        query: str,
+        records: list[tuple],
+    ):
+        """Writes a single record with INSERT and larger batches with one COPY."""
+        if len(records) == 1:
+            await conn.execute(query, *records[0])
+        else:
+            await conn.copy_records_to_table(table, records=records, columns=columns)
+
+    async def log_job_event(self, event_data: dict[str, Any]):
+        """Logs a job lifecycle event to PostgreSQL."""
         try:
-            async with self._pool.acquire() as conn:
-                await conn.execute(query, *params)
+            await self.log_job_events([event_data])
         except PostgresError as e:
             logger.error(f"Failed to log job event to PostgreSQL: {e}")
 
-    async def log_worker_event(self, event_data: dict[str, Any]):
-        """Logs a worker lifecycle event to PostgreSQL."""
+    async def log_job_events(self, events: list[dict[str, Any]]):
+        """Logs a batch of job events to PostgreSQL and updates job_latest in one transaction."""
         if not self._pool:
             raise RuntimeError("History storage is not initialized.")
-
-        query = """
-            INSERT INTO worker_history (
-                event_id, worker_id, timestamp, event_type, worker_info_snapshot
-            ) VALUES ($1, $2, $3, $4, $5)
-        """
-        now = datetime.now(self.tz)
-
-        worker_info = event_data.get("worker_info_snapshot")
-        worker_info_json = dumps(worker_info).decode("utf-8") if worker_info else None
-
-        params = (
-            uuid4(),
-            event_data.get("worker_id"),
-            now,
-            event_data.get("event_type"),
-            worker_info_json,
-        )
         try:
+            records = [self._job_event_record(event) for event in events]
             async with self._pool.acquire() as conn:
-                await conn.execute(query, *params)
+                await self._ensure_partitions(conn, "job_history", [record[2] for record, _ in records])
+                async with conn.transaction():
+                    await self._insert_records(
+                        conn,
+                        "job_history",
+                        JOB_HISTORY_COLUMNS,
+                        INSERT_JOB_EVENT_PG,
+                        [history_record for history_record, _ in records],
+                    )
+                    await conn.executemany(UPSERT_JOB_LATEST_PG, [latest_record for _, latest_record in records])
+        except (PostgresError, OSError):
+            # Diffs must not refer to full snapshots that were not written
+            self._snapshots.forget([event.get("job_id") for event in events])
+            raise
+
+    async def log_worker_event(self, event_data: dict[str, Any]):
+        """Logs a worker lifecycle event to PostgreSQL."""
+        try:
+            await self.log_worker_events([event_data])
         except PostgresError as e:
             logger.error(f"Failed to log worker event to PostgreSQL: {e}")
 
+    async def log_worker_events(self, events: list[dict[str, Any]]):
+        """Logs a batch of worker events to PostgreSQL."""
+        if not self._pool:
+            raise RuntimeError("History storage is not initialized.")
+        records = [self._worker_event_record(event) for event in events]
+        async with self._pool.acquire() as conn:
+            await self._ensure_partitions(conn, "worker_history", [record[2] for record in records])
+            await self._insert_records(
+                conn,
+                "worker_history",
+                WORKER_HISTORY_COLUMNS,
+                INSERT_WORKER_EVENT_PG,
+                records,
+            )
+
     def _format_row(self, row: dict[str, Any]) -> dict[str, Any]:
         """Helper to format a row from DB: convert timestamp to local TZ and decode JSON."""
         item = dict(row)
@@ -157,11 +461,25 @@ class PostgresHistoryStorage(HistoryStorageBase, ABC):
             with suppress(Exception):
                 item["worker_info_snapshot"] = loads(item["worker_info_snapshot"])
 
-        if "timestamp" in item and isinstance(item["timestamp"], datetime):
-            item["timestamp"] = item["timestamp"].astimezone(self.tz)
+        for key in ("timestamp", "created_at", "updated_at"):
+            if key in item and isinstance(item[key], datetime):
+                item[key] = item[key].astimezone(self.tz)
 
         return item
 
+    async def _resolve_snapshots(self, conn: Connection, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Reconstructs the full snapshots of events that store a diff."""
+        bases = {str(row.get("event_id")): row.get("context_snapshot") for row in rows if not row.get("snapshot_base")}
+        missing = {str(row["snapshot_base"]) for row in rows if row.get("snapshot_base")} - bases.keys()
+        if missing:
+            query = "SELECT event_id, context_snapshot FROM job_history WHERE event_id = ANY($1::uuid[])"
+            for row in await conn.fetch(query, list(missing)):
+                bases[str(row["event_id"])] = self._format_row(row).get("context_snapshot")
+        resolve_snapshots(rows, bases)
+        for row in rows:
+            row.pop("snapshot_base", None)
+        return rows
+
     async def get_job_history(self, job_id: str) -> list[dict[str, Any]]:
         """Gets the full history for the specified job from PostgreSQL."""
         if not self._pool:
@@ -171,56 +489,57 @@ class PostgresHistoryStorage(HistoryStorageBase, ABC):
         try:
             async with self._pool.acquire() as conn:
                 rows = await conn.fetch(query, job_id)
-                return [self._format_row(row) for row in rows]
+                return await self._resolve_snapshots(conn, [self._format_row(row) for row in rows])
         except PostgresError as e:
             logger.error(
                 f"Failed to get job history for job_id {job_id} from PostgreSQL: {e}",
             )
             return []
 
-    async def get_jobs(self, limit: int = 100, offset: int = 0) -> list[dict[str, Any]]:
+    async def get_jobs(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        cursor: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """Gets a list of the most recently updated jobs with their last event, newest first.
+        Each job has a `cursor`; passing the cursor of the last job returns the next page.
+        """
         if not self._pool:
             raise RuntimeError("History storage is not initialized.")
 
-        query = """
-            WITH latest_events AS (
-                SELECT
-                    *,
-                    ROW_NUMBER() OVER(PARTITION BY job_id ORDER BY timestamp DESC) as rn
-                FROM job_history
-            )
-            SELECT * FROM latest_events
-            WHERE rn = 1
-            ORDER BY timestamp DESC
-            LIMIT $1 OFFSET $2;
-        """
+        params: tuple = (limit, offset)
+        where = ""
+        if cursor:
+            updated_at, job_id = self._parse_cursor(cursor)
+            where = "WHERE (l.updated_at, l.job_id) < ($3, $4)"
+            params = (limit, offset, updated_at, job_id)
+        query = f"{SELECT_LATEST_JOBS_PG} {where} ORDER BY l.updated_at DESC, l.job_id DESC LIMIT $1 OFFSET $2"
         try:
             async with self._pool.acquire() as conn:
-                rows = await conn.fetch(query, limit, offset)
-                return [self._format_row(row) for row in rows]
+                jobs = []
+                for row in await conn.fetch(query, *params):
+                    job = self._format_row(row)
+                    if isinstance(row.get("updated_at"), datetime):
+                        job["cursor"] = f"{row['updated_at'].isoformat()}|{row['job_id']}"
+                    jobs.append(job)
+                return await self._resolve_snapshots(conn, jobs)
         except PostgresError as e:
             logger.error(f"Failed to get jobs list from PostgreSQL: {e}")
             return []
 
+    @staticmethod
+    def _parse_cursor(cursor: str) -> tuple[datetime, str]:
+        updated_at, separator, job_id = cursor.partition("|")
+        if not separator:
+            raise ValueError(f"Invalid jobs cursor: {cursor}")
+        return datetime.fromisoformat(updated_at), job_id
+
     async def get_job_summary(self) -> dict[str, int]:
         if not self._pool:
             raise RuntimeError("History storage is not initialized.")
 
-        query = """
-            WITH latest_events AS (
-                SELECT
-                    context_snapshot->>'status' as status,
-                    ROW_NUMBER() OVER(PARTITION BY job_id ORDER BY timestamp DESC) as rn
-                FROM job_history
-                WHERE context_snapshot->>'status' IS NOT NULL
-            )
-            SELECT
-                status,
-                COUNT(*)::int as count
-            FROM latest_events
-            WHERE rn = 1
-            GROUP BY status;
-        """
+        query = "SELECT status, COUNT(*)::int as count FROM job_latest WHERE status IS NOT NULL GROUP BY status"
         summary = {}
         try:
             async with self._pool.acquire() as conn:
@@ -232,6 +551,17 @@ class PostgresHistoryStorage(HistoryStorageBase, ABC):
             logger.error(f"Failed to get job summary from PostgreSQL: {e}")
             return {}
 
+    async def get_task_outcomes(self, since_days: int) -> list[dict[str, Any]]:
+        if not self._pool:
+            raise RuntimeError("History storage is not initialized.")
+
+        try:
+            async with self._pool.acquire() as conn:
+                return [dict(row) for row in await conn.fetch(SELECT_TASK_OUTCOMES_PG, since_days)]
+        except PostgresError as e:
+            logger.error(f"Failed to get task outcomes from PostgreSQL: {e}")
+            return []
+
     async def get_worker_history(
         self,
         worker_id: str,
@@ -249,7 +579,62 @@ class PostgresHistoryStorage(HistoryStorageBase, ABC):
         try:
             async with self._pool.acquire() as conn:
                 rows = await conn.fetch(query, worker_id, since_days)
-                return [self._format_row(row) for row in rows]
+                return await self._resolve_snapshots(conn, [self._format_row(row) for row in rows])
         except PostgresError as e:
             logger.error(f"Failed to get worker history for worker_id {worker_id} from PostgreSQL: {e}")
             return []
+
+    async def drop_expired_events(self, before: float, archive_path: str = ""):
+        """Drops partitions whose period ended before `before`, or deletes older rows from tables
+        without partitions, and removes jobs whose last event is older than the kept history.
+        """
+        if not self._pool:
+            raise RuntimeError("History storage is not initialized.")
+
+        async with self._pool.acquire() as conn:
+            # Other orchestrator instances create and drop partitions too
+            await self._load_partitions(conn)
+            # Only whole partitions are dropped, so the kept history starts with the partition of `before`
+            partitions_before = partition_start(before, self.partition_interval) if self._partitions else before
+            job_history_before = partitions_before if "job_history" in self._partitions else before
+            await self._rebase_diffs(conn, datetime.fromtimestamp(job_history_before, timezone.utc))
+            for table in HISTORY_TABLES:
+                if table not in self._partitions:
+                    await conn.execute(
+                        f"DELETE FROM {table} WHERE timestamp < $1", datetime.fromtimestamp(before, timezone.utc)
+                    )
+                    continue
+                for name, start in sorted(self._partitions[table].items()):
+                    if start >= partitions_before:
+                        continue
+                    if archive_path:
+                        await self._archive_partition(conn, name, archive_path)
+                    await conn.execute(f"DROP TABLE IF EXISTS {name}")
+                    del self._partitions[table][name]
+                    logger.info(f"Dropped expired history partition {name}.")
+
+            await conn.execute(
+                "DELETE FROM job_latest WHERE updated_at < $1", datetime.fromtimestamp(job_history_before, timezone.utc)
+            )
+
+    async def _rebase_diffs(self, conn: Connection, before: datetime):
+        """Stores the full snapshot in the kept diffs whose base is older than `before`,
+        so that they can still be resolved once their base is deleted or its partition dropped.
+        """
+        rows = await conn.fetch(
+            "SELECT d.event_id, d.context_snapshot AS diff, b.context_snapshot AS base FROM job_history d "
+            "JOIN job_history b ON d.snapshot_base = b.event_id WHERE d.timestamp >= $1 AND b.timestamp < $1",
+            before,
+        )
+        if rows:
+            await conn.executemany(
+                "UPDATE job_history SET context_snapshot = $1, snapshot_base = NULL WHERE event_id = $2",
+                rebase_diffs([(row["event_id"], row["diff"], row["base"]) for row in rows]),
+            )
+            logger.info(f"Stored full snapshots in {len(rows)} history events whose base expires.")
+
+    async def _archive_partition(self, conn: Connection, name: str, archive_path: str):
+        rows = [dict(row) for row in await conn.fetch(f"SELECT * FROM {name}")]
+        if rows:
+            file_path = await to_thread(write_archive, archive_path, name, rows)
+            logger.info(f"Archived {len(rows)} events of history partition {name} to {file_path}.")
@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from typing import Any
+
+from orjson import dumps, loads
+
+# A diff is a list of JSON Patch (RFC 6902) operations limited to "add", "replace" and
+# "remove". Objects are compared key by key, any other value is replaced as a whole.
+Patch = list[dict[str, Any]]
+
+
+def _escape(key: str) -> str:
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(part: str) -> str:
+    return part.replace("~1", "/").replace("~0", "~")
+
+
+def diff_snapshots(old: Any, new: Any, path: str = "") -> Patch:
+    """Returns the operations that turn `old` into `new`."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        patch: Patch = []
+        for key, value in new.items():
+            key_path = f"{path}/{_escape(str(key))}"
+            if key not in old:
+                patch.append({"op": "add", "path": key_path, "value": value})
+            elif old[key] != value or type(old[key]) is not type(value):
+                patch.extend(diff_snapshots(old[key], value, key_path))
+        for key in old:
+            if key not in new:
+                patch.append({"op": "remove", "path": f"{path}/{_escape(str(key))}"})
+        return patch
+    if old == new and type(old) is type(new):
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def apply_patch(snapshot: Any, patch: Patch) -> Any:
+    """Applies a diff to a snapshot without modifying it.
+    Only the objects along the changed paths are copied, the rest is shared with `snapshot`.
+    """
+    for op in patch:
+        if not op["path"]:
+            snapshot = op.get("value")
+            continue
+        parts = [_unescape(part) for part in op["path"].split("/")[1:]]
+        snapshot = dict(snapshot)
+        target = snapshot
+        for part in parts[:-1]:
+            target[part] = dict(target[part])
+            target = target[part]
+        if op["op"] == "remove":
+            target.pop(parts[-1], None)
+        else:
+            target[parts[-1]] = op["value"]
+    return snapshot
+
+
+class SnapshotCompactor:
+    """Decides how the context snapshot of each job event is stored.
+
+    The first event of a job, and every `full_snapshot_interval`-th event after it, stores
+    the full snapshot. The events in between store only a diff against that full snapshot
+    together with its event id, so every event can be reconstructed from two rows, regardless
+    of how events of different orchestrator instances are interleaved.
+    The last full snapshot of up to `max_jobs` jobs is kept in memory; for other jobs the
+    next event simply starts a new full snapshot.
+    When the history is partitioned, events pass the `period` of their partition and a new
+    period starts a new full snapshot, so diffs normally stay in the partition of their base.
+    Retention still rewrites any diff that outlives its base as a full snapshot, see `rebase_diffs`.
+    """
+
+    def __init__(self, full_snapshot_interval: int = 10, max_jobs: int = 10000):
+        self.full_snapshot_interval = full_snapshot_interval
+        self.max_jobs = max_jobs
+        # job_id -> (event_id of the full snapshot, the snapshot, events stored since then, period)
+        self._bases: OrderedDict[str, tuple[str, Any, int, float | None]] = OrderedDict()
+
+    def compact(
+        self,
+        job_id: str,
+        event_id: str,
+        snapshot: Any,
+        period: float | None = None,
+    ) -> tuple[str | None, str | None]:
+        """Returns the JSON to store for the snapshot and the event id of its base, if it is a diff."""
+        if not snapshot:
+            return None, None
+        encoded = dumps(snapshot).decode("utf-8")
+        if self.full_snapshot_interval <= 1:
+            return encoded, None
+
+        base = self._bases.get(job_id)
+        if base:
+            base_event_id, base_snapshot, count, base_period = base
+            if count < self.full_snapshot_interval and base_period == period:
+                encoded_diff = dumps(diff_snapshots(base_snapshot, snapshot)).decode("utf-8")
+                if len(encoded_diff) < len(encoded):
+                    self._bases[job_id] = (base_event_id, base_snapshot, count + 1, period)
+                    self._bases.move_to_end(job_id)
+                    return encoded_diff, base_event_id
+
+        # The snapshot may be a live job state, so the kept copy is decoded from the stored JSON
+        self._bases[job_id] = (event_id, loads(encoded), 1, period)
+        self._bases.move_to_end(job_id)
+        while len(self._bases) > self.max_jobs:
+            self._bases.popitem(last=False)
+        return encoded, None
+
+    def forget(self, job_ids: list[str]):
+        """Drops the full snapshots of jobs whose events were not written."""
+        for job_id in job_ids:
+            self._bases.pop(job_id, None)
+
+
+def resolve_snapshots(rows: list[dict[str, Any]], bases: dict[str, Any]):
+    """Replaces diffs in formatted history rows with full snapshots.
+    `bases` maps event ids to decoded full snapshots, rows whose base is not found keep no snapshot.
+    """
+    for row in rows:
+        base_event_id = row.get("snapshot_base")
+        if not base_event_id:
+            continue
+        base = bases.get(str(base_event_id))
+        row["context_snapshot"] = apply_patch(base, row["context_snapshot"]) if base is not None else None
+
+
+def rebase_diffs(rows: list[tuple[Any, Any, Any]]) -> list[tuple[str, Any]]:
+    """Turns diffs whose full snapshot is about to be removed by retention into full snapshots.
+
+    :param rows: (event_id, stored diff, stored base snapshot) of each diff, as JSON or decoded.
+    :return: (full snapshot JSON, event_id) of each diff, in the order of the update statement.
+    """
+    rebased = []
+    for event_id, diff, base in rows:
+        diff = loads(diff) if isinstance(diff, str | bytes) else diff
+        base = loads(base) if isinstance(base, str | bytes) else base
+        rebased.append((dumps(apply_patch(base, diff)).decode("utf-8"), event_id))
+    return rebased
@@ -1,3 +1,4 @@
+from asyncio import to_thread
 from contextlib import suppress
 from datetime import datetime
 from logging import getLogger
@@ -7,14 +8,18 @@ from uuid import uuid4
 from zoneinfo import ZoneInfo
 
 from aiosqlite import Connection, Error, Row, connect
-from orjson import dumps, loads
+from orjson import loads
 
-from .base import HistoryStorageBase
+from .archive import write_archive
+from .base import HistoryStorageBase, encode_snapshot
+from .partitions import parse_partition_start, partition_name, partition_start, validate_partition_interval
+from .snapshots import SnapshotCompactor, rebase_diffs, resolve_snapshots
 
 logger = getLogger(__name__)
 
+# Table templates are created as the table itself or, when the history is partitioned, as each of its partitions
 CREATE_JOB_HISTORY_TABLE = """
-CREATE TABLE IF NOT EXISTS job_history (
+CREATE TABLE IF NOT EXISTS {table} (
     event_id TEXT PRIMARY KEY,
     job_id TEXT NOT NULL,
     timestamp REAL NOT NULL,
@@ -25,12 +30,15 @@ CREATE TABLE IF NOT EXISTS job_history (
     next_state TEXT,
     worker_id TEXT,
     attempt_number INTEGER,
-    context_snapshot TEXT
+    context_snapshot TEXT,
+    status TEXT,
+    snapshot_base TEXT,
+    result_status TEXT
 );
 """
 
 CREATE_WORKER_HISTORY_TABLE = """
-CREATE TABLE IF NOT EXISTS worker_history (
+CREATE TABLE IF NOT EXISTS {table} (
     event_id TEXT PRIMARY KEY,
     worker_id TEXT NOT NULL,
     timestamp REAL NOT NULL,
@@ -41,17 +49,171 @@ CREATE TABLE IF NOT EXISTS worker_history (
 
 CREATE_JOB_ID_INDEX = "CREATE INDEX IF NOT EXISTS idx_job_id ON job_history(job_id);"
 
+JOB_HISTORY_COLUMNS = (
+    "event_id",
+    "job_id",
+    "timestamp",
+    "state",
+    "event_type",
+    "duration_ms",
+    "previous_state",
+    "next_state",
+    "worker_id",
+    "attempt_number",
+    "context_snapshot",
+    "status",
+    "snapshot_base",
+    "result_status",
+)
+WORKER_HISTORY_COLUMNS = ("event_id", "worker_id", "timestamp", "event_type", "worker_info_snapshot")
+
+# Indexes of each history table or partition; the unpartitioned job_history keeps CREATE_JOB_ID_INDEX
+PARTITION_JOB_ID_INDEX = "CREATE INDEX IF NOT EXISTS idx_{table}_job_id ON {table}(job_id);"
+JOB_HISTORY_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_{table}_worker_id_timestamp ON {table}(worker_id, timestamp);",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_event_type_timestamp ON {table}(event_type, timestamp);",
+)
+WORKER_HISTORY_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_{table}_worker_id_timestamp ON {table}(worker_id, timestamp);",
+)
+
+# table -> (table template, indexes, columns)
+HISTORY_TABLES = {
+    "job_history": (CREATE_JOB_HISTORY_TABLE, (PARTITION_JOB_ID_INDEX, *JOB_HISTORY_INDEXES), JOB_HISTORY_COLUMNS),
+    "worker_history": (CREATE_WORKER_HISTORY_TABLE, WORKER_HISTORY_INDEXES, WORKER_HISTORY_COLUMNS),
+}
+
+# The last event and the current status of every job, maintained when job events are logged
+CREATE_JOB_LATEST_TABLE = """
+CREATE TABLE IF NOT EXISTS job_latest (
+    job_id TEXT PRIMARY KEY,
+    blueprint_name TEXT,
+    status TEXT,
+    current_state TEXT,
+    last_event_type TEXT,
+    last_event_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+CREATE_JOB_LATEST_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_job_latest_updated_at ON job_latest(updated_at DESC, job_id DESC);",
+    "CREATE INDEX IF NOT EXISTS idx_job_latest_status ON job_latest(status);",
+    "CREATE INDEX IF NOT EXISTS idx_job_latest_blueprint ON job_latest(blueprint_name, updated_at DESC);",
+)
+
+# Fills job_latest from the existing history when the table is created on an older database
+BACKFILL_JOB_LATEST = """
+INSERT OR IGNORE INTO job_latest (
+    job_id, blueprint_name, status, current_state, last_event_type, last_event_id, created_at, updated_at
+)
+SELECT
+    job_id,
+    CASE WHEN json_valid(context_snapshot) THEN json_extract(context_snapshot, '$.blueprint_name') END,
+    COALESCE(status, CASE WHEN json_valid(context_snapshot) THEN json_extract(context_snapshot, '$.status') END),
+    COALESCE(CASE WHEN json_valid(context_snapshot) THEN json_extract(context_snapshot, '$.current_state') END, state),
+    event_type,
+    event_id,
+    created_at,
+    timestamp
+FROM (
+    SELECT
+        *,
+        MIN(timestamp) OVER(PARTITION BY job_id) as created_at,
+        ROW_NUMBER() OVER(PARTITION BY job_id ORDER BY timestamp DESC) as rn
+    FROM job_history
+)
+WHERE rn = 1;
+"""
+
+# Columns added to job_history after its first release, created on databases that lack them
+JOB_HISTORY_ADDED_COLUMNS = {"status": "TEXT", "snapshot_base": "TEXT", "result_status": "TEXT"}
+
+INSERT_JOB_EVENT = f"""
+INSERT INTO {{table}} ({", ".join(JOB_HISTORY_COLUMNS)})
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPSERT_JOB_LATEST = """
+INSERT INTO job_latest (
+    job_id, blueprint_name, status, current_state, last_event_type, last_event_id, created_at, updated_at
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(job_id) DO UPDATE SET
+    blueprint_name = COALESCE(excluded.blueprint_name, job_latest.blueprint_name),
+    status = COALESCE(excluded.status, job_latest.status),
+    current_state = COALESCE(excluded.current_state, job_latest.current_state),
+    last_event_type = excluded.last_event_type,
+    last_event_id = excluded.last_event_id,
+    updated_at = excluded.updated_at
+WHERE excluded.updated_at >= job_latest.updated_at
+"""
+
+SELECT_LATEST_JOBS = """
+SELECT job_id, status, blueprint_name, current_state, last_event_id, created_at, updated_at
+FROM job_latest
+"""
+
+# The last events are loaded by id rather than joined: SQLite can't push a join into the view over partitions
+SELECT_LAST_EVENTS = """
+SELECT
+    event_id, job_id, timestamp, state, event_type, duration_ms, previous_state,
+    next_state, worker_id, attempt_number, context_snapshot, snapshot_base, result_status
+FROM job_history
+WHERE event_id IN ({placeholders})
+"""
+
+# Events logged before result_status was stored only have the status in a full snapshot
+SELECT_TASK_OUTCOMES = """
+SELECT
+    worker_id,
+    CAST((? - timestamp) / 86400 AS INTEGER) as age_days,
+    COUNT(*) as total,
+    SUM(
+        CASE COALESCE(
+            result_status,
+            CASE WHEN snapshot_base IS NULL AND json_valid(context_snapshot)
+                THEN json_extract(context_snapshot, '$.result.status') END
+        ) WHEN 'success' THEN 1 ELSE 0 END
+    ) as successes
+FROM job_history
+WHERE event_type = 'task_finished' AND timestamp >= ? AND worker_id IS NOT NULL
+GROUP BY worker_id, age_days
+"""
+
+INSERT_WORKER_EVENT = f"""
+INSERT INTO {{table}} ({", ".join(WORKER_HISTORY_COLUMNS)})
+VALUES (?, ?, ?, ?, ?)
+"""
+
 
 class SQLiteHistoryStorage(HistoryStorageBase):
     """Implementation of the history store based on aiosqlite.
     Stores timestamps as Unix time (UTC) for correct sorting,
     and converts them to the configured timezone upon retrieval.
+    Job snapshots are stored as diffs between periodic full snapshots, see `SnapshotCompactor`.
+
+    With a `partition_interval` ("day" or "week"), events are written to one table per period,
+    e.g. `job_history_p20240101`, and `job_history` and `worker_history` become views over them,
+    so expired periods are removed by dropping their tables. History written before partitioning
+    was enabled is kept in `job_history_legacy` and `worker_history_legacy`.
     """
 
-    def __init__(self, db_path: str, tz_name: str = "UTC"):
+    def __init__(
+        self,
+        db_path: str,
+        tz_name: str = "UTC",
+        full_snapshot_interval: int = 10,
+        partition_interval: str = "",
+    ):
+        validate_partition_interval(partition_interval)
         self._db_path = db_path
         self._conn: Connection | None = None
         self.tz = ZoneInfo(tz_name)
+        self._snapshots = SnapshotCompactor(full_snapshot_interval)
+        self.partition_interval = partition_interval
+        # table -> {partition name: start of its period}, the legacy table has no period
+        self._partitions: dict[str, dict[str, float | None]] = {table: {} for table in HISTORY_TABLES}
 
     async def initialize(self):
         """Initializes the database connection and creates tables if they don't exist."""
@@ -59,15 +221,90 @@ class SQLiteHistoryStorage(HistoryStorageBase):
             self._conn = await connect(self._db_path)
             # Enable WAL mode for better concurrency performance
             await self._conn.execute("PRAGMA journal_mode=WAL;")
-            await self._conn.execute(CREATE_JOB_HISTORY_TABLE)
-            await self._conn.execute(CREATE_WORKER_HISTORY_TABLE)
-            await self._conn.execute(CREATE_JOB_ID_INDEX)
+            if self.partition_interval:
+                await self._create_partitioned_tables()
+            else:
+                await self._create_tables()
+            await self._create_job_latest_table()
             await self._conn.commit()
             logger.info(f"SQLite history storage initialized at {self._db_path}")
         except Error as e:
             logger.error(f"Failed to initialize SQLite history storage: {e}")
             raise
 
+    async def _object_type(self, name: str) -> str | None:
+        async with self._conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)) as cursor:
+            row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def _create_tables(self):
+        for table in HISTORY_TABLES:
+            if await self._object_type(table) == "view":
+                raise RuntimeError(f"{table} is partitioned, history partition interval must be set.")
+        await self._conn.execute(CREATE_JOB_HISTORY_TABLE.format(table="job_history"))
+        await self._add_missing_columns("job_history")
+        await self._conn.execute(CREATE_WORKER_HISTORY_TABLE.format(table="worker_history"))
+        await self._conn.execute(CREATE_JOB_ID_INDEX)
+        for index in JOB_HISTORY_INDEXES:
+            await self._conn.execute(index.format(table="job_history"))
+        for index in WORKER_HISTORY_INDEXES:
+            await self._conn.execute(index.format(table="worker_history"))
+
+    async def _create_partitioned_tables(self):
+        for table in HISTORY_TABLES:
+            if await self._object_type(table) == "table":
+                # History written before partitioning was enabled is kept as a partition without a period
+                if table == "job_history":
+                    await self._add_missing_columns(table)
+                await self._conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+            async with self._conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (f"{table}_%",)
+            ) as cursor:
+                for (name,) in await cursor.fetchall():
+                    if name == f"{table}_legacy":
+                        self._partitions[table][name] = None
+                    elif (start := parse_partition_start(table, name)) is not None:
+                        self._partitions[table][name] = start
+            if table == "job_history":
+                for name in self._partitions[table]:
+                    await self._add_missing_columns(name)
+            # The current partition always exists, so the view is never empty
+            await self._create_partition(table, partition_start(time(), self.partition_interval))
+
+    async def _create_partition(self, table: str, start: float) -> str:
+        name = partition_name(table, start)
+        create_table, indexes, _ = HISTORY_TABLES[table]
+        await self._conn.execute(create_table.format(table=name))
+        for index in indexes:
+            await self._conn.execute(index.format(table=name))
+        self._partitions[table][name] = start
+        await self._create_view(table)
+        return name
+
+    async def _create_view(self, table: str):
+        columns = ", ".join(HISTORY_TABLES[table][2])
+        partitions = " UNION ALL ".join(f"SELECT {columns} FROM {name}" for name in sorted(self._partitions[table]))
+        await self._conn.execute(f"DROP VIEW IF EXISTS {table}")
+        await self._conn.execute(f"CREATE VIEW {table} AS {partitions}")
+
+    async def _add_missing_columns(self, table: str):
+        async with self._conn.execute(f"PRAGMA table_info({table})") as cursor:
+            existing = {row[1] for row in await cursor.fetchall()}
+        for column, column_type in JOB_HISTORY_ADDED_COLUMNS.items():
+            if column not in existing:
+                await self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    async def _create_job_latest_table(self):
+        async with self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'job_latest'"
+        ) as cursor:
+            exists = await cursor.fetchone()
+        await self._conn.execute(CREATE_JOB_LATEST_TABLE)
+        for index in CREATE_JOB_LATEST_INDEXES:
+            await self._conn.execute(index)
+        if not exists:
+            await self._conn.execute(BACKFILL_JOB_LATEST)
+
     async def close(self):
         """Closes the database connection."""
         if self._conn:
@@ -86,32 +323,33 @@ class SQLiteHistoryStorage(HistoryStorageBase):
             with suppress(Exception):
                 item["worker_info_snapshot"] = loads(item["worker_info_snapshot"])
 
-        if "timestamp" in item and isinstance(item["timestamp"], (int, float)):
-            item["timestamp"] = datetime.fromtimestamp(item["timestamp"], self.tz)
+        for key in ("timestamp", "created_at", "updated_at"):
+            if key in item and isinstance(item[key], (int, float)):
+                item[key] = datetime.fromtimestamp(item[key], self.tz)
 
         return item
 
-    async def log_job_event(self, event_data: dict[str, Any]):
-        """Logs a job lifecycle event to the job_history table."""
-        if not self._conn:
-            raise RuntimeError("History storage is not initialized.")
-
-        query = """
-            INSERT INTO job_history (
-                event_id, job_id, timestamp, state, event_type, duration_ms,
-                previous_state, next_state, worker_id, attempt_number,
-                context_snapshot
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        now_ts = time()
-
-        context_snapshot = event_data.get("context_snapshot")
-        context_snapshot_json = dumps(context_snapshot).decode("utf-8") if context_snapshot else None
-
-        params = (
-            str(uuid4()),
-            event_data.get("job_id"),
-            now_ts,
+    def _period(self, timestamp: float) -> float | None:
+        return partition_start(timestamp, self.partition_interval) if self.partition_interval else None
+
+    def _job_event_params(self, event_data: dict[str, Any]) -> tuple[tuple, tuple]:
+        """Returns the job_history row of the event and the job_latest row it updates."""
+        event_id = str(uuid4())
+        job_id = event_data.get("job_id")
+        timestamp = event_data.get("timestamp") or time()
+        snapshot = event_data.get("context_snapshot")
+        if isinstance(snapshot, str):
+            snapshot = loads(snapshot)
+        if not isinstance(snapshot, dict):
+            snapshot = {}
+        context_snapshot_json, snapshot_base = self._snapshots.compact(
+            job_id, event_id, snapshot, self._period(timestamp)
+        )
+        status = snapshot.get("status")
+        history_row = (
+            event_id,
+            job_id,
+            timestamp,
             event_data.get("state"),
             event_data.get("event_type"),
             event_data.get("duration_ms"),
@@ -120,43 +358,114 @@ class SQLiteHistoryStorage(HistoryStorageBase):
             event_data.get("worker_id"),
             event_data.get("attempt_number"),
             context_snapshot_json,
+            status,
+            snapshot_base,
+            event_data.get("result_status"),
+        )
+        latest_row = (
+            job_id,
+            snapshot.get("blueprint_name"),
+            status,
+            snapshot.get("current_state") or event_data.get("state"),
+            event_data.get("event_type"),
+            event_id,
+            timestamp,
+            timestamp,
+        )
+        return history_row, latest_row
+
+    def _worker_event_params(self, event_data: dict[str, Any]) -> tuple:
+        return (
+            str(uuid4()),
+            event_data.get("worker_id"),
+            event_data.get("timestamp") or time(),
+            event_data.get("event_type"),
+            encode_snapshot(event_data.get("worker_info_snapshot")),
         )
 
+    async def _insert_statements(self, table: str, query: str, rows: list[tuple]) -> list[tuple[str, list[tuple]]]:
+        """Groups rows by the table or partition they are inserted into, creating missing partitions.
+        The timestamp is the third value of both job and worker rows.
+        """
+        if not self.partition_interval:
+            return [(query.format(table=table), rows)]
+        grouped: dict[str, list[tuple]] = {}
+        for row in rows:
+            start = partition_start(row[2], self.partition_interval)
+            name = partition_name(table, start)
+            if name not in self._partitions[table]:
+                await self._create_partition(table, start)
+                await self._conn.commit()
+            grouped.setdefault(name, []).append(row)
+        return [(query.format(table=name), partition_rows) for name, partition_rows in grouped.items()]
+
+    async def _execute_in_transaction(self, *statements: tuple[str, list[tuple]]):
+        """Executes every statement for all of its rows in a single transaction."""
+        if not self._conn:
+            raise RuntimeError("History storage is not initialized.")
         try:
-            await self._conn.execute(query, params)
+            for query, params in statements:
+                if len(params) == 1:
+                    await self._conn.execute(query, params[0])
+                else:
+                    await self._conn.executemany(query, params)
             await self._conn.commit()
+        except Error:
+            await self._conn.rollback()
+            raise
+
+    async def log_job_event(self, event_data: dict[str, Any]):
+        """Logs a job lifecycle event to the job_history table."""
+        try:
+            await self.log_job_events([event_data])
         except Error as e:
             logger.error(f"Failed to log job event: {e}")
 
+    async def log_job_events(self, events: list[dict[str, Any]]):
+        """Logs a batch of job events to the job_history table and updates job_latest in one transaction."""
+        try:
+            rows = [self._job_event_params(event) for event in events]
+            inserts = await self._insert_statements(
+                "job_history", INSERT_JOB_EVENT, [history_row for history_row, _ in rows]
+            )
+            await self._execute_in_transaction(
+                *inserts,
+                (UPSERT_JOB_LATEST, [latest_row for _, latest_row in rows]),
+            )
+        except Error:
+            # Diffs must not refer to full snapshots that were rolled back
+            self._snapshots.forget([event.get("job_id") for event in events])
+            raise
+
     async def log_worker_event(self, event_data: dict[str, Any]):
         """Logs a worker lifecycle event to the worker_history table."""
-        if not self._conn:
-            raise RuntimeError("History storage is not initialized.")
-
-        query = """
-            INSERT INTO worker_history (
-                event_id, worker_id, timestamp, event_type, worker_info_snapshot
-            ) VALUES (?, ?, ?, ?, ?)
-        """
-        now_ts = time()
-
-        worker_info = event_data.get("worker_info_snapshot")
-        worker_info_json = dumps(worker_info).decode("utf-8") if worker_info else None
-
-        params = (
-            str(uuid4()),
-            event_data.get("worker_id"),
-            now_ts,
-            event_data.get("event_type"),
-            worker_info_json,
-        )
-
         try:
-            await self._conn.execute(query, params)
-            await self._conn.commit()
+            await self.log_worker_events([event_data])
         except Error as e:
             logger.error(f"Failed to log worker event: {e}")
 
+    async def log_worker_events(self, events: list[dict[str, Any]]):
+        """Logs a batch of worker events to the worker_history table in one transaction."""
+        inserts = await self._insert_statements(
+            "worker_history", INSERT_WORKER_EVENT, [self._worker_event_params(event) for event in events]
+        )
+        await self._execute_in_transaction(*inserts)
+
+    async def _resolve_snapshots(self, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Reconstructs the full snapshots of events that store a diff."""
+        bases = {row.get("event_id"): row.get("context_snapshot") for row in rows if not row.get("snapshot_base")}
+        missing = {row["snapshot_base"] for row in rows if row.get("snapshot_base")} - bases.keys()
+        if missing:
+            placeholders = ", ".join("?" * len(missing))
+            query = f"SELECT event_id, context_snapshot FROM job_history WHERE event_id IN ({placeholders})"
+            async with self._conn.execute(query, tuple(missing)) as cursor:
+                for row in await cursor.fetchall():
+                    bases[row["event_id"]] = self._format_row(row).get("context_snapshot")
+        resolve_snapshots(rows, bases)
+        for row in rows:
+            row.pop("snapshot_base", None)
+        return rows
+
     async def get_job_history(self, job_id: str) -> list[dict[str, Any]]:
         """Gets the full history for the specified job, sorted by time."""
         if not self._conn:
@@ -167,57 +476,67 @@ class SQLiteHistoryStorage(HistoryStorageBase):
             self._conn.row_factory = Row
             async with self._conn.execute(query, (job_id,)) as cursor:
                 rows = await cursor.fetchall()
-                return [self._format_row(row) for row in rows]
+                return await self._resolve_snapshots([self._format_row(row) for row in rows])
         except Error as e:
             logger.error(f"Failed to get job history for job_id {job_id}: {e}")
             return []
 
-    async def get_jobs(self, limit: int = 100, offset: int = 0) -> list[dict[str, Any]]:
-        """Gets a list of the latest unique jobs with pagination."""
+    async def get_jobs(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        cursor: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """Gets a list of the most recently updated jobs with their last event, newest first.
+        Each job has a `cursor`; passing the cursor of the last job returns the next page.
+        """
         if not self._conn:
             raise RuntimeError("History storage is not initialized.")
 
-        query = """
-            WITH latest_events AS (
-                SELECT
-                    *,
-                    ROW_NUMBER() OVER(PARTITION BY job_id ORDER BY timestamp DESC) as rn
-                FROM job_history
-            )
-            SELECT * FROM latest_events
-            WHERE rn = 1
-            ORDER BY timestamp DESC
-            LIMIT ? OFFSET ?;
-        """
+        params: tuple = (limit, offset)
+        where = ""
+        if cursor:
+            updated_at, job_id = self._parse_cursor(cursor)
+            where = "WHERE (updated_at, job_id) < (?, ?)"
+            params = (updated_at, job_id, limit, offset)
+        query = f"{SELECT_LATEST_JOBS} {where} ORDER BY updated_at DESC, job_id DESC LIMIT ? OFFSET ?"
         try:
             self._conn.row_factory = Row
-            async with self._conn.execute(query, (limit, offset)) as cursor:
-                rows = await cursor.fetchall()
-                return [self._format_row(row) for row in rows]
+            async with self._conn.execute(query, params) as db_cursor:
+                latest = await db_cursor.fetchall()
+            if not latest:
+                return []
+            event_ids = [row["last_event_id"] for row in latest]
+            events_query = SELECT_LAST_EVENTS.format(placeholders=", ".join("?" * len(event_ids)))
+            async with self._conn.execute(events_query, event_ids) as db_cursor:
+                events = {row["event_id"]: row for row in await db_cursor.fetchall()}
+            jobs = []
+            for row in latest:
+                # Jobs whose last event has already expired are skipped
+                if row["last_event_id"] not in events:
+                    continue
+                job = {**self._format_row(events[row["last_event_id"]]), **self._format_row(row)}
+                job.pop("last_event_id")
+                job["cursor"] = f"{row['updated_at']!r}|{row['job_id']}"
+                jobs.append(job)
+            return await self._resolve_snapshots(jobs)
         except Error as e:
             logger.error(f"Failed to get jobs list: {e}")
             return []
 
+    @staticmethod
+    def _parse_cursor(cursor: str) -> tuple[float, str]:
+        updated_at, separator, job_id = cursor.partition("|")
+        if not separator:
+            raise ValueError(f"Invalid jobs cursor: {cursor}")
+        return float(updated_at), job_id
+
     async def get_job_summary(self) -> dict[str, int]:
         """Returns a summary of job statuses."""
         if not self._conn:
             raise RuntimeError("History storage is not initialized.")
 
-        query = """
-            WITH latest_events AS (
-                SELECT
-                    json_extract(context_snapshot, '$.status') as status,
-                    ROW_NUMBER() OVER(PARTITION BY job_id ORDER BY timestamp DESC) as rn
-                FROM job_history
-                WHERE json_valid(context_snapshot) AND json_extract(context_snapshot, '$.status') IS NOT NULL
-            )
-            SELECT
-                status,
-                COUNT(*) as count
-            FROM latest_events
-            WHERE rn = 1
-            GROUP BY status;
-        """
+        query = "SELECT status, COUNT(*) as count FROM job_latest WHERE status IS NOT NULL GROUP BY status"
         summary = {}
         try:
             self._conn.row_factory = Row
@@ -230,6 +549,19 @@ class SQLiteHistoryStorage(HistoryStorageBase):
             logger.error(f"Failed to get job summary: {e}")
             return {}
 
+    async def get_task_outcomes(self, since_days: int) -> list[dict[str, Any]]:
+        if not self._conn:
+            raise RuntimeError("History storage is not initialized.")
+
+        now = time()
+        try:
+            self._conn.row_factory = Row
+            async with self._conn.execute(SELECT_TASK_OUTCOMES, (now, now - since_days * 86400)) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+        except Error as e:
+            logger.error(f"Failed to get task outcomes: {e}")
+            return []
+
     async def get_worker_history(
         self,
         worker_id: str,
@@ -250,7 +582,77 @@ class SQLiteHistoryStorage(HistoryStorageBase):
             self._conn.row_factory = Row
             async with self._conn.execute(query, (worker_id, threshold_ts)) as cursor:
                 rows = await cursor.fetchall()
-                return [self._format_row(row) for row in rows]
+                return await self._resolve_snapshots([self._format_row(row) for row in rows])
         except Error as e:
             logger.error(f"Failed to get worker history for worker_id {worker_id}: {e}")
             return []
+
+    async def drop_expired_events(self, before: float, archive_path: str = ""):
+        """Drops partitions whose period ended before `before`, or deletes older rows if the history
+        is not partitioned, and removes jobs whose last event is older than the kept history.
+        """
+        if not self._conn:
+            raise RuntimeError("History storage is not initialized.")
+
+        if self.partition_interval:
+            # Only whole partitions are dropped, so the kept history starts with the partition of `before`
+            before = partition_start(before, self.partition_interval)
+            for table in HISTORY_TABLES:
+                expired = await self._expired_partitions(table, before)
+                for name in expired:
+                    if table == "job_history":
+                        for kept in [kept for kept in self._partitions[table] if kept not in expired]:
+                            await self._rebase_diffs(kept, name)
+                    if archive_path:
+                        await self._archive_partition(name, archive_path)
+                    await self._conn.execute(f"DROP TABLE {name}")
+                    del self._partitions[table][name]
+                    await self._create_view(table)
+                    await self._conn.commit()
+                    logger.info(f"Dropped expired history partition {name}.")
+        else:
+            await self._rebase_diffs(
+                "job_history", "job_history", "d.timestamp >= ? AND b.timestamp < ?", (before, before)
+            )
+            await self._conn.execute("DELETE FROM job_history WHERE timestamp < ?", (before,))
+            await self._conn.execute("DELETE FROM worker_history WHERE timestamp < ?", (before,))
+        await self._conn.execute("DELETE FROM job_latest WHERE updated_at < ?", (before,))
+        await self._conn.commit()
+
+    async def _rebase_diffs(self, table: str, base_table: str, condition: str = "1", params: tuple = ()):
+        """Stores the full snapshot in the diffs of `table` whose base is in `base_table`,
+        so that they can still be resolved once their base is removed.
+        """
+        query = (
+            f"SELECT d.event_id, d.context_snapshot, b.context_snapshot FROM {table} d "
+            f"JOIN {base_table} b ON d.snapshot_base = b.event_id WHERE {condition}"
+        )
+        async with self._conn.execute(query, params) as cursor:
+            rows = await cursor.fetchall()
+        if rows:
+            await self._conn.executemany(
+                f"UPDATE {table} SET context_snapshot = ?, snapshot_base = NULL WHERE event_id = ?",
+                rebase_diffs([tuple(row) for row in rows]),
+            )
+            logger.info(f"Stored full snapshots in {len(rows)} history events whose base expires.")
+
+    async def _expired_partitions(self, table: str, before: float) -> list[str]:
+        expired = []
+        for name, start in sorted(self._partitions[table].items()):
+            if start is None:
+                # The legacy table expires once its newest event does
+                async with self._conn.execute(f"SELECT MAX(timestamp) FROM {name}") as cursor:
+                    (newest,) = await cursor.fetchone()
+                if newest is None or newest < before:
+                    expired.append(name)
+            elif start < before:
+                expired.append(name)
+        return expired
+
+    async def _archive_partition(self, name: str, archive_path: str):
+        self._conn.row_factory = Row
+        async with self._conn.execute(f"SELECT * FROM {name}") as cursor:
+            rows = [dict(row) for row in await cursor.fetchall()]
+        if rows:
+            file_path = await to_thread(write_archive, archive_path, name, rows)
+            logger.info(f"Archived {len(rows)} events of history partition {name} to {file_path}.")
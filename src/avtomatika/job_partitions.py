@@ -0,0 +1,204 @@
+from collections.abc import Collection, Mapping
+from logging import getLogger
+from time import time
+from typing import TYPE_CHECKING, Any
+from zlib import crc32
+
+from .storage.base import DEFAULT_JOB_PARTITION
+
+if TYPE_CHECKING:
+    from .config import Config
+
+logger = getLogger(__name__)
+
+# "none" keeps a single job stream, "blueprint" has one per blueprint, "hash" splits the jobs into
+# JOB_PARTITION_COUNT streams by job ID, and "blueprint_hash" splits the stream of each blueprint so.
+JOB_PARTITIONING_MODES = ("none", "blueprint", "hash", "blueprint_hash")
+JOB_PRIORITY_DRAINING_MODES = ("weighted", "strict")
+# Separates the priority lane from the rest of a partition, e.g. "reports@urgent"
+LANE_SEPARATOR = "@"
+
+
+def parse_blueprint_values(value: str) -> dict[str, float]:
+    """Parses a setting of the form "blueprint_a:3,blueprint_b:0.5" (also used for the priority lanes)."""
+    values = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, separator, number = item.rpartition(":")
+        if not separator or not name.strip():
+            raise ValueError(f"Invalid blueprint setting '{item}', expected 'blueprint:value'")
+        values[name.strip()] = float(number)
+    return values
+
+
+class JobPartitions:
+    """Decides which partition of the job queue a job goes to, and the weight and concurrency cap of
+    each partition for the executor.
+
+    The default partition is always part of the queue: it holds jobs of blueprints that are not
+    registered, and jobs enqueued before partitioning was enabled. Likewise, partitions of an
+    earlier JOB_PARTITIONING or lane setup found in storage (see `set_stored`) stay part of the
+    queue, so their jobs are still run.
+
+    With priority lanes, each partition has a copy per lane ("reports@urgent") that holds the jobs
+    whose `priority` reaches the lane's minimum, or whose `deadline` is less than
+    JOB_DEADLINE_BOOST_SECONDS away (those go to the highest lane). Jobs below every lane stay in
+    the plain partition, the lowest lane.
+    """
+
+    def __init__(self, config: "Config", blueprints: Mapping[str, Any]):
+        if config.JOB_PARTITIONING not in JOB_PARTITIONING_MODES:
+            raise ValueError(
+                f"Unknown job partitioning '{config.JOB_PARTITIONING}', expected one of {JOB_PARTITIONING_MODES}"
+            )
+        self.mode = config.JOB_PARTITIONING
+        self.hash_count = max(1, config.JOB_PARTITION_COUNT)
+        # The registered blueprints, read on each use since they are registered after the engine is created
+        self._blueprints = blueprints
+        self._weights = parse_blueprint_values(config.JOB_PARTITION_WEIGHTS)
+        self._max_concurrent_jobs = {
+            name: int(cap) for name, cap in parse_blueprint_values(config.JOB_PARTITION_MAX_CONCURRENT_JOBS).items()
+        }
+        if self._max_concurrent_jobs and not self.by_blueprint:
+            logger.warning("JOB_PARTITION_MAX_CONCURRENT_JOBS is ignored unless jobs are partitioned by blueprint.")
+
+        if config.JOB_PRIORITY_DRAINING not in JOB_PRIORITY_DRAINING_MODES:
+            raise ValueError(
+                f"Unknown priority draining '{config.JOB_PRIORITY_DRAINING}', "
+                f"expected one of {JOB_PRIORITY_DRAINING_MODES}"
+            )
+        self.strict_priority = config.JOB_PRIORITY_DRAINING == "strict"
+        # (lane, minimum priority), highest lane first
+        self.lanes = sorted(
+            ((lane, int(minimum)) for lane, minimum in parse_blueprint_values(config.JOB_PRIORITY_LANES).items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        self._lane_weights = parse_blueprint_values(config.JOB_PRIORITY_LANE_WEIGHTS)
+        self.deadline_boost_seconds = config.JOB_DEADLINE_BOOST_SECONDS
+        # Partitions in storage that the current settings do not produce
+        self._leftover: list[str] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "none" or bool(self.lanes) or bool(self._leftover)
+
+    @property
+    def by_blueprint(self) -> bool:
+        return self.mode in ("blueprint", "blueprint_hash")
+
+    def of(self, job_state: dict[str, Any]) -> str:
+        """Returns the partition of a job, in its priority lane. Called on every enqueue, so a job
+        moves up to the highest lane once its deadline comes close.
+        """
+        partition = self._base_partition(job_state)
+        lane = self.lane_of(job_state)
+        return f"{partition}{LANE_SEPARATOR}{lane}" if lane else partition
+
+    def _base_partition(self, job_state: dict[str, Any]) -> str:
+        blueprint_name = job_state.get("blueprint_name")
+        if self.mode == "none" or (self.by_blueprint and blueprint_name not in self._blueprints):
+            return DEFAULT_JOB_PARTITION
+        if self.mode == "blueprint":
+            return blueprint_name
+        shard = crc32(job_state["id"].encode("utf-8")) % self.hash_count
+        return f"{blueprint_name}:{shard}" if self.mode == "blueprint_hash" else str(shard)
+
+    def lane_of(self, job_state: dict[str, Any]) -> str | None:
+        """Returns the priority lane of a job, None for the lowest lane."""
+        if not self.lanes:
+            return None
+        deadline = job_state.get("deadline")
+        if deadline is not None and deadline - time() <= self.deadline_boost_seconds:
+            return self.lanes[0][0]
+        priority = job_state.get("priority", 0)
+        for lane, minimum in self.lanes:
+            if priority >= minimum:
+                return lane
+        return None
+
+    def set_stored(self, partitions: Collection[str]) -> None:
+        """Sets the partitions found in storage, those the current settings do not produce are
+        added to `all` until they are gone from storage.
+        """
+        configured = set(self._configured())
+        leftover = [partition for partition in partitions if partition not in configured]
+        if set(leftover) - set(self._leftover):
+            logger.info(f"Job queue partitions {leftover} are not produced by the current settings, draining them.")
+        self._leftover = leftover
+
+    def all(self) -> list[str]:
+        """Returns all partitions, the default one first and those left from earlier settings last."""
+        return self._configured() + self._leftover
+
+    def _configured(self) -> list[str]:
+        partitions = [DEFAULT_JOB_PARTITION]
+        if self.mode == "blueprint":
+            partitions.extend(self._blueprints)
+        elif self.mode == "hash":
+            partitions.extend(str(shard) for shard in range(self.hash_count))
+        elif self.mode == "blueprint_hash":
+            partitions.extend(f"{name}:{shard}" for name in self._blueprints for shard in range(self.hash_count))
+        return partitions + [f"{partition}{LANE_SEPARATOR}{lane}" for lane, _ in self.lanes for partition in partitions]
+
+    def blueprint_of(self, partition: str) -> str | None:
+        partition = partition.partition(LANE_SEPARATOR)[0]
+        if not partition or not self.by_blueprint:
+            return None
+        return partition.rpartition(":")[0] if self.mode == "blueprint_hash" else partition
+
+    def rank_of(self, partition: str) -> int:
+        """The priority of a partition's lane: 0 for the lowest lane, the number of lanes for the highest."""
+        lane = partition.partition(LANE_SEPARATOR)[2]
+        names = [name for name, _ in self.lanes]
+        # A lane that is no longer configured counts as the lowest one
+        if lane not in names:
+            return 0
+        return len(self.lanes) - names.index(lane)
+
+    def weight(self, partition: str) -> float:
+        """The share of executor slots a partition gets while others have jobs too. The weight of a
+        blueprint (1 unless set) is split evenly between its hash partitions, and multiplied by the
+        weight of the priority lane (1 unless set).
+        """
+        weight = 1.0
+        lane = partition.partition(LANE_SEPARATOR)[2]
+        if lane:
+            weight = self._lane_weights.get(lane, 1.0)
+        blueprint_name = self.blueprint_of(partition)
+        if blueprint_name is None:
+            return weight
+        weight *= self._weights.get(blueprint_name, 1.0)
+        return weight / self.hash_count if self.mode == "blueprint_hash" else weight
+
+    def max_concurrent_jobs(self, blueprint_name: str) -> int | None:
+        return self._max_concurrent_jobs.get(blueprint_name)
+
+
+class WeightedFairScheduler:
+    """Shares executor slots between partitions in proportion to their weights (smooth weighted
+    round-robin). The position in the rotation is kept between calls, so a partition that gets no
+    slot now is first in line for the next ones.
+    """
+
+    def __init__(self, partitions: JobPartitions):
+        self.partitions = partitions
+        self._current: dict[str, float] = {}
+
+    def plan(self, slots: int, eligible: Collection[str]) -> dict[str, int]:
+        """Returns the number of jobs to take from each eligible partition, 0 for those that get no
+        slot this time (they are still waited on if all others are empty).
+        """
+        counts = dict.fromkeys(eligible, 0)
+        if not counts:
+            return counts
+        weights = {partition: self.partitions.weight(partition) for partition in counts}
+        total = sum(weights.values())
+        for _ in range(slots):
+            for partition, weight in weights.items():
+                self._current[partition] = self._current.get(partition, 0.0) + weight
+            chosen = max(counts, key=lambda partition: self._current[partition])
+            self._current[chosen] -= total
+            counts[chosen] += 1
+        return counts
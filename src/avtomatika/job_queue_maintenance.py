@@ -0,0 +1,71 @@
+from asyncio import CancelledError, sleep
+from logging import getLogger
+from typing import TYPE_CHECKING
+
+from . import metrics
+from .storage.base import shard_of
+
+if TYPE_CHECKING:
+    from .engine import OrchestratorEngine
+
+logger = getLogger(__name__)
+
+
+class JobQueueMaintenance:
+    """A background process that keeps the job queue from growing without bound.
+
+    Every instance reports the length, pending jobs and lag of each partition. The instance owning
+    the shard of a partition (see `shard_of`) also trims the jobs all consumers acknowledged, and
+    removes the consumers of instances that left. The partitions are those found in storage as well
+    as the configured ones, so partitions left by earlier partitioning settings are drained too.
+    """
+
+    def __init__(self, engine: "OrchestratorEngine"):
+        self.engine = engine
+        self.storage = engine.storage
+        self.interval_seconds = engine.config.JOB_QUEUE_MAINTENANCE_INTERVAL_SECONDS
+        self.consumer_idle_ms = engine.config.JOB_QUEUE_CONSUMER_IDLE_SECONDS * 1000
+        self._running = False
+
+    async def run(self):
+        logger.info(f"JobQueueMaintenance started (Instance ID: {self.engine.shard_leases.instance_id}).")
+        self._running = True
+        while self._running:
+            try:
+                await self.maintain()
+            except CancelledError:
+                break
+            except Exception:
+                logger.exception("Error in JobQueueMaintenance main loop.")
+            try:
+                await sleep(self.interval_seconds)
+            except CancelledError:
+                break
+        logger.info("JobQueueMaintenance stopped.")
+
+    def stop(self):
+        self._running = False
+
+    async def maintain(self) -> None:
+        self.engine.job_partitions.set_stored(await self.storage.get_job_partitions())
+        partitions = self.engine.job_partitions.all()
+        stats = await self.storage.get_job_queue_stats(partitions)
+        for partition, values in stats.items():
+            labels = {metrics.LABEL_PARTITION: partition or "default"}
+            metrics.task_queue_length.set(labels, values["length"])
+            metrics.job_queue_pending.set(labels, values["pending"])
+            metrics.job_queue_lag.set(labels, values["lag"])
+
+        owned_shards = self.engine.shard_leases.owned_shards
+        owned = [partition for partition in partitions if shard_of(partition) in owned_shards]
+        if not owned:
+            return
+        if trimmed := await self.storage.trim_job_queues(owned):
+            logger.debug(f"Trimmed {trimmed} acknowledged entries from the job queue.")
+        removed = await self.storage.remove_dead_job_consumers(
+            owned,
+            self.engine.shard_leases.instances,
+            self.consumer_idle_ms,
+        )
+        if removed:
+            logger.info(f"Removed consumers {removed} of orchestrator instances that left from the job queue.")
@@ -3,13 +3,23 @@ from aioprometheus.collectors import REGISTRY
 
 # Constants for labels
 LABEL_BLUEPRINT = "blueprint"
+LABEL_PARTITION = "partition"
 
 # Global variables for metrics
 jobs_total: Counter
 jobs_failed_total: Counter
 job_duration_seconds: Summary
 task_queue_length: Gauge
+job_queue_pending: Gauge
+job_queue_lag: Gauge
 active_workers: Gauge
+worker_cache_hits_total: Counter
+worker_cache_misses_total: Counter
+worker_cache_staleness_seconds: Gauge
+history_queue_depth: Gauge
+history_flush_latency_seconds: Summary
+history_events_dropped_total: Counter
+history_events_spilled_total: Counter
 
 
 def init_metrics():
@@ -18,6 +28,10 @@ def init_metrics():
     Uses a registry check for idempotency, which is important for tests.
     """
     global jobs_total, jobs_failed_total, job_duration_seconds, task_queue_length, active_workers
+    global job_queue_pending, job_queue_lag
+    global worker_cache_hits_total, worker_cache_misses_total, worker_cache_staleness_seconds
+    global history_queue_depth, history_flush_latency_seconds, history_events_dropped_total
+    global history_events_spilled_total
 
     if "orchestrator_jobs_total" in REGISTRY.collectors:
         # Get existing metrics if they are already registered
@@ -25,7 +39,16 @@ def init_metrics():
         jobs_failed_total = REGISTRY.collectors["orchestrator_jobs_failed_total"]
         job_duration_seconds = REGISTRY.collectors["orchestrator_job_duration_seconds"]
         task_queue_length = REGISTRY.collectors["orchestrator_task_queue_length"]
+        job_queue_pending = REGISTRY.collectors["orchestrator_job_queue_pending"]
+        job_queue_lag = REGISTRY.collectors["orchestrator_job_queue_lag"]
         active_workers = REGISTRY.collectors["orchestrator_active_workers"]
+        worker_cache_hits_total = REGISTRY.collectors["orchestrator_worker_cache_hits_total"]
+        worker_cache_misses_total = REGISTRY.collectors["orchestrator_worker_cache_misses_total"]
+        worker_cache_staleness_seconds = REGISTRY.collectors["orchestrator_worker_cache_staleness_seconds"]
+        history_queue_depth = REGISTRY.collectors["orchestrator_history_queue_depth"]
+        history_flush_latency_seconds = REGISTRY.collectors["orchestrator_history_flush_latency_seconds"]
+        history_events_dropped_total = REGISTRY.collectors["orchestrator_history_events_dropped_total"]
+        history_events_spilled_total = REGISTRY.collectors["orchestrator_history_events_spilled_total"]
         return
 
     jobs_total = Counter(
@@ -45,9 +68,45 @@ def init_metrics():
     )
     task_queue_length = Gauge(
         "orchestrator_task_queue_length",
-        "Number of tasks waiting in the job queue.",
+        "Number of entries held by each partition of the job queue.",
+    )
+    job_queue_pending = Gauge(
+        "orchestrator_job_queue_pending",
+        "Number of jobs delivered from each partition of the job queue but not acknowledged yet.",
+    )
+    job_queue_lag = Gauge(
+        "orchestrator_job_queue_lag",
+        "Number of jobs in each partition of the job queue not delivered to any executor yet.",
     )
     active_workers = Gauge(
         "orchestrator_active_workers",
         "Number of active workers reporting to the orchestrator.",
     )
+    worker_cache_hits_total = Counter(
+        "orchestrator_worker_cache_hits_total",
+        "Number of worker lookups served from the in-process worker cache.",
+    )
+    worker_cache_misses_total = Counter(
+        "orchestrator_worker_cache_misses_total",
+        "Number of worker lookups that required reloading the worker cache from storage.",
+    )
+    worker_cache_staleness_seconds = Gauge(
+        "orchestrator_worker_cache_staleness_seconds",
+        "Age of the worker cache snapshot at the last lookup.",
+    )
+    history_queue_depth = Gauge(
+        "orchestrator_history_queue_depth",
+        "Number of history events buffered in memory and waiting to be written.",
+    )
+    history_flush_latency_seconds = Summary(
+        "orchestrator_history_flush_latency_seconds",
+        "Time taken to write one batch of history events.",
+    )
+    history_events_dropped_total = Counter(
+        "orchestrator_history_events_dropped_total",
+        "Number of history events discarded because the buffer was full or the write failed.",
+    )
+    history_events_spilled_total = Counter(
+        "orchestrator_history_events_spilled_total",
+        "Number of history events written to the spill file instead of the history database.",
+    )
@@ -1,7 +1,10 @@
 from asyncio import CancelledError, sleep
+from collections import defaultdict
+from collections.abc import Collection
 from logging import getLogger
-from typing import TYPE_CHECKING
-from uuid import uuid4
+from typing import TYPE_CHECKING, Any
+
+from .storage.base import shard_of
 
 if TYPE_CHECKING:
     from .engine import OrchestratorEngine
@@ -10,10 +13,14 @@ logger = getLogger(__name__)
 
 # Number of days of history collected to calculate reputation
 REPUTATION_HISTORY_DAYS = 30
+# Number of days after which a task outcome counts half as much
+REPUTATION_HALF_LIFE_DAYS = 7
 
 
 class ReputationCalculator:
-    """A background process for periodically recalculating worker reputations."""
+    """A background process for periodically recalculating worker reputations.
+    Each orchestrator instance recalculates the workers of the shards it holds the lease of.
+    """
 
     def __init__(self, engine: "OrchestratorEngine", interval_seconds: int = 3600):
         self.engine = engine
@@ -21,22 +28,17 @@ class ReputationCalculator:
         self.history_storage = engine.history_storage
         self.interval_seconds = interval_seconds
         self._running = False
-        self._instance_id = str(uuid4())
 
     async def run(self):
         """The main loop that periodically triggers reputation recalculation."""
-        logger.info(f"ReputationCalculator started (Instance ID: {self._instance_id}).")
+        logger.info(f"ReputationCalculator started (Instance ID: {self.engine.shard_leases.instance_id}).")
         self._running = True
         while self._running:
             try:
-                # Attempt to acquire lock
-                if await self.storage.acquire_lock("global_reputation_lock", self._instance_id, 300):
-                    try:
-                        await self.calculate_all_reputations()
-                    finally:
-                        await self.storage.release_lock("global_reputation_lock", self._instance_id)
+                if shards := self.engine.shard_leases.owned_shards:
+                    await self.calculate_all_reputations(shards)
                 else:
-                    logger.debug("ReputationCalculator lock held by another instance. Skipping.")
+                    logger.debug("This instance owns no shards. Skipping reputation calculation.")
             except CancelledError:
                 break
             except Exception:
@@ -49,51 +51,55 @@ class ReputationCalculator:
     def stop(self):
         self._running = False
 
-    async def calculate_all_reputations(self):
-        """Calculates and updates the reputation for all active workers."""
+    async def calculate_all_reputations(self, shards: Collection[int] | None = None):
+        """Calculates and updates the reputation for all active workers, or only for those of the given shards.
+        Task outcomes are counted per worker and day by a single history query, and the
+        reputation is the success rate with each day weighted by its age (see `decayed_success_rates`).
+        """
         logger.info("Starting reputation calculation for all workers...")
         workers = await self.storage.get_available_workers()
+        if shards is not None:
+            workers = [worker for worker in workers if shard_of(worker.get("worker_id") or "") in shards]
         if not workers:
             logger.info("No active workers found for reputation calculation.")
             return
 
+        outcomes = await self.history_storage.get_task_outcomes(since_days=REPUTATION_HISTORY_DAYS)
+        success_rates = decayed_success_rates(outcomes)
+
+        updates = {}
         for worker in workers:
             worker_id = worker.get("worker_id")
-            if not worker_id:
-                continue
-
-            history = await self.history_storage.get_worker_history(
-                worker_id,
-                since_days=REPUTATION_HISTORY_DAYS,
-            )
-
-            # Count only task completion events
-            task_finished_events = [event for event in history if event.get("event_type") == "task_finished"]
-
-            if not task_finished_events:
-                # If there is no history, the reputation does not change (remains 1.0 by default)
+            # If there is no history, the reputation does not change (remains 1.0 by default)
+            if worker_id not in success_rates:
                 continue
 
-            successful_tasks = 0
-            for event in task_finished_events:
-                # Extract the result from the snapshot
-                snapshot = event.get("context_snapshot", {})
-                result = snapshot.get("result", {})
-                if result.get("status") == "success":
-                    successful_tasks += 1
-
-            total_tasks = len(task_finished_events)
-            new_reputation = successful_tasks / total_tasks if total_tasks > 0 else 1.0
-
             # Round for cleanliness
-            new_reputation = round(new_reputation, 4)
+            new_reputation = round(success_rates[worker_id], 4)
+            if new_reputation == worker.get("reputation"):
+                continue
 
             logger.info(
                 f"Updating reputation for worker {worker_id}: {worker.get('reputation')} -> {new_reputation}",
             )
-            await self.storage.update_worker_data(
-                worker_id,
-                {"reputation": new_reputation},
-            )
-
-        logger.info("Reputation calculation finished.")
+            updates[worker_id] = {"reputation": new_reputation}
+
+        if updates:
+            await self.storage.update_workers_data(updates)
+        logger.info(f"Reputation calculation finished, {len(updates)} workers updated.")
+
+
+def decayed_success_rates(
+    outcomes: list[dict[str, Any]],
+    half_life_days: float = REPUTATION_HALF_LIFE_DAYS,
+) -> dict[str, float]:
+    """Returns the success rate of each worker from its daily task outcomes.
+    Outcomes lose half of their weight every `half_life_days`, so recent results matter most.
+    """
+    successes: dict[str, float] = defaultdict(float)
+    totals: dict[str, float] = defaultdict(float)
+    for row in outcomes:
+        weight = 0.5 ** (row["age_days"] / half_life_days)
+        successes[row["worker_id"]] += weight * (row["successes"] or 0)
+        totals[row["worker_id"]] += weight * row["total"]
+    return {worker_id: successes[worker_id] / total for worker_id, total in totals.items() if total > 0}
@@ -0,0 +1,132 @@
+from asyncio import CancelledError, sleep
+from logging import getLogger
+from time import time
+from typing import TYPE_CHECKING, Any
+from uuid import uuid4
+
+from .blobs import find_blob_keys
+from .constants import JOB_STATUS_CANCELLED, JOB_STATUS_FAILED, JOB_STATUS_QUARANTINED
+from .executor import TERMINAL_STATES
+
+if TYPE_CHECKING:
+    from .engine import OrchestratorEngine
+
+logger = getLogger(__name__)
+
+# Jobs read per batch when looking for the payloads live jobs reference
+BLOB_RETENTION_BATCH_SIZE = 500
+
+
+class HistoryRetention:
+    """A background process that periodically removes history events older than the retention period.
+    Partitioned history stores drop whole partitions, optionally archiving them first.
+    """
+
+    def __init__(self, engine: "OrchestratorEngine"):
+        self.storage = engine.storage
+        self.history_storage = engine.history_storage
+        self.retention_days = engine.config.HISTORY_RETENTION_DAYS
+        self.interval_seconds = engine.config.HISTORY_RETENTION_INTERVAL_SECONDS
+        self.archive_path = engine.config.HISTORY_ARCHIVE_PATH
+        self._running = False
+        self._instance_id = str(uuid4())
+
+    async def run(self):
+        logger.info(f"HistoryRetention started, keeping {self.retention_days} days of history.")
+        self._running = True
+        while self._running:
+            try:
+                # Only one orchestrator instance removes expired history at a time
+                if await self.storage.acquire_lock("global_history_retention_lock", self._instance_id, 600):
+                    try:
+                        await self.history_storage.drop_expired_events(
+                            time() - self.retention_days * 86400,
+                            archive_path=self.archive_path,
+                        )
+                    finally:
+                        await self.storage.release_lock("global_history_retention_lock", self._instance_id)
+                else:
+                    logger.debug("HistoryRetention lock held by another instance. Skipping.")
+            except CancelledError:
+                break
+            except Exception:
+                logger.exception("Error in HistoryRetention main loop.")
+
+            await sleep(self.interval_seconds)
+
+        logger.info("HistoryRetention stopped.")
+
+    def stop(self):
+        self._running = False
+
+
+class BlobRetention:
+    """A background process that periodically deletes blob store payloads no job has used
+    for the retention period. It runs at the interval of the history retention.
+    Payloads referenced by jobs that have not finished yet are renewed before each sweep,
+    so jobs waiting longer than the retention period keep their data.
+    """
+
+    def __init__(self, engine: "OrchestratorEngine"):
+        self.storage = engine.storage
+        self.blueprints = engine.blueprints
+        self.blob_store = engine.blob_store
+        self.retention_days = engine.config.BLOB_STORE_RETENTION_DAYS
+        self.interval_seconds = engine.config.HISTORY_RETENTION_INTERVAL_SECONDS
+        self._running = False
+        self._instance_id = str(uuid4())
+
+    async def run(self):
+        logger.info(f"BlobRetention started, keeping payloads used in the last {self.retention_days} days.")
+        self._running = True
+        while self._running:
+            try:
+                # Only one orchestrator instance sweeps a shared blob store at a time
+                if await self.storage.acquire_lock("global_blob_retention_lock", self._instance_id, 600):
+                    try:
+                        await self._renew_live_payloads()
+                        deleted = await self.blob_store.sweep(time() - self.retention_days * 86400)
+                        if deleted:
+                            logger.info(f"Deleted {deleted} unused payloads from the blob store.")
+                    finally:
+                        await self.storage.release_lock("global_blob_retention_lock", self._instance_id)
+                else:
+                    logger.debug("BlobRetention lock held by another instance. Skipping.")
+            except CancelledError:
+                break
+            except Exception:
+                logger.exception("Error in BlobRetention main loop.")
+
+            await sleep(self.interval_seconds)
+
+        logger.info("BlobRetention stopped.")
+
+    def _is_live(self, state: dict[str, Any]) -> bool:
+        if state.get("status") in (JOB_STATUS_FAILED, JOB_STATUS_QUARANTINED, JOB_STATUS_CANCELLED, "error"):
+            return False
+        current_state = state.get("current_state")
+        blueprint = self.blueprints.get(state.get("blueprint_name", ""))
+        return current_state not in TERMINAL_STATES and not (blueprint and current_state in blueprint.end_states)
+
+    async def _renew_live_payloads(self) -> None:
+        """Renews the payloads referenced by the states of jobs that have not finished yet."""
+        batch: list[str] = []
+        async for job_id in self.storage.iter_job_ids():
+            batch.append(job_id)
+            if len(batch) >= BLOB_RETENTION_BATCH_SIZE:
+                await self._renew_payloads_of(batch)
+                batch = []
+        if batch:
+            await self._renew_payloads_of(batch)
+
+    async def _renew_payloads_of(self, job_ids: list[str]) -> None:
+        states = await self.storage.get_job_states(job_ids)
+        keys: set[str] = set()
+        for state in states.values():
+            if self._is_live(state):
+                keys |= find_blob_keys(state)
+        if keys:
+            await self.blob_store.touch(keys)
+
+    def stop(self):
+        self._running = False
@@ -67,7 +67,7 @@ def worker_auth_middleware_factory(
         # For specific endpoints, worker_id is in the body.
         # We need to read the body here, which can be tricky as it's a stream.
         # We clone the request to allow the handler to read the body again.
-        if not worker_id and (request.path.endswith("/register") or request.path.endswith("/tasks/result")):
+        if not worker_id and request.path.endswith(("/register", "/tasks/result", "/tasks/results")):
             try:
                 cloned_request = request.clone()
                 data = await cloned_request.json()
@@ -75,7 +75,7 @@ def worker_auth_middleware_factory(
                 # Attach the parsed data to the request so the handler doesn't need to re-parse
                 if request.path.endswith("/register"):
                     request["worker_registration_data"] = data
-                elif request.path.endswith("/tasks/result"):
+                else:
                     request["task_result_data"] = data
             except Exception:
                 return web.json_response({"error": "Invalid JSON body"}, status=400)
@@ -0,0 +1,112 @@
+from asyncio import CancelledError, sleep
+from collections.abc import Callable
+from hashlib import sha1
+from logging import getLogger
+
+from .storage.base import SHARD_COUNT, StorageBackend
+
+logger = getLogger(__name__)
+
+
+def preferred_shards(instance_id: str, instances: list[str], shard_count: int = SHARD_COUNT) -> frozenset[int]:
+    """Returns the shards an instance should own among the live instances (rendezvous hashing).
+    Each shard goes to the instance with the highest weight for it, so an instance joining or
+    leaving only moves the shards it gains or loses, about `shard_count / len(instances)`.
+    """
+
+    def weight(instance: str, shard: int) -> int:
+        return int.from_bytes(sha1(f"{instance}:{shard}".encode("utf-8")).digest()[:8], "big")
+
+    return frozenset(
+        shard
+        for shard in range(shard_count)
+        if max(instances, key=lambda instance: weight(instance, shard)) == instance_id
+    )
+
+
+class ShardLeases:
+    """Spreads the shards of background work (see `shard_of`) over the live orchestrator instances.
+
+    Every instance renews its record in the storage and a lease on each shard it owns every third
+    of `lease_ttl_seconds`. Shards are assigned by rendezvous hashing over the live instances, so
+    when an instance joins, the others release the shards it takes over, and when one leaves or
+    stops renewing, its leases expire and the shards go to the remaining ones.
+    """
+
+    def __init__(self, storage: StorageBackend, instance_id: str, lease_ttl_seconds: int):
+        self.storage = storage
+        self.instance_id = instance_id
+        self.lease_ttl_seconds = lease_ttl_seconds
+        self.owned_shards: frozenset[int] = frozenset()
+        # The live instances as of the last rebalance
+        self.instances: list[str] = []
+        # Called with the new owned shards whenever they change
+        self._listeners: list[Callable[[frozenset[int]], None]] = []
+        self._running = False
+
+    def add_listener(self, listener: Callable[[frozenset[int]], None]) -> None:
+        self._listeners.append(listener)
+
+    @staticmethod
+    def _lease_key(shard: int) -> str:
+        return f"shard_lease:{shard}"
+
+    async def rebalance(self) -> frozenset[int]:
+        """Renews the leases of the shards this instance should keep, releases those it should
+        hand over and acquires the free ones it should take.
+        """
+        instances = await self.storage.refresh_instance(self.instance_id, self.lease_ttl_seconds)
+        self.instances = instances or [self.instance_id]
+        preferred = preferred_shards(self.instance_id, self.instances)
+
+        owned = set()
+        for shard in self.owned_shards:
+            key = self._lease_key(shard)
+            if shard not in preferred:
+                await self.storage.release_lock(key, self.instance_id)
+            elif await self.storage.extend_lock(key, self.instance_id, self.lease_ttl_seconds):
+                owned.add(shard)
+            else:
+                logger.warning(f"Lost the lease of shard {shard}.")
+        for shard in preferred - self.owned_shards:
+            # Held until the previous owner hands it over or its lease expires
+            if await self.storage.acquire_lock(self._lease_key(shard), self.instance_id, self.lease_ttl_seconds):
+                owned.add(shard)
+
+        self._set_owned_shards(frozenset(owned))
+        return self.owned_shards
+
+    def _set_owned_shards(self, owned: frozenset[int]) -> None:
+        if owned == self.owned_shards:
+            return
+        logger.info(f"Instance {self.instance_id} owns shards {sorted(owned)}.")
+        self.owned_shards = owned
+        for listener in self._listeners:
+            listener(owned)
+
+    async def release(self) -> None:
+        """Hands over all shards right away, used on shutdown."""
+        for shard in self.owned_shards:
+            await self.storage.release_lock(self._lease_key(shard), self.instance_id)
+        await self.storage.remove_instance(self.instance_id)
+        self._set_owned_shards(frozenset())
+
+    async def run(self):
+        """Rebalances the shards periodically."""
+        logger.info(f"ShardLeases started (Instance ID: {self.instance_id}).")
+        self._running = True
+        while self._running:
+            try:
+                await self.rebalance()
+            except CancelledError:
+                break
+            except Exception:
+                logger.exception("Error in ShardLeases rebalancing.")
+            try:
+                await sleep(self.lease_ttl_seconds / 3)
+            except CancelledError:
+                break
+        logger.info("ShardLeases stopped.")
+
+    def stop(self):
+        self._running = False
@@ -7,5 +7,6 @@ __all__ = ["StorageBackend", "MemoryStorage"]
 
 with suppress(ImportError):
     from .redis import RedisStorage  # noqa: F401
+    from .redis_connections import create_redis_storage  # noqa: F401
 
-    __all__.append("RedisStorage")
+    __all__ += ["RedisStorage", "create_redis_storage"]
@@ -1,5 +1,49 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from collections.abc import Collection
+from time import monotonic, time
+from typing import Any, AsyncIterator
+from zlib import crc32
+
+from ..worker_stats import STATS_EWMA_ALPHA, STATS_WINDOW
+
+# Number of shards the timeout tracking list and other background work are split into.
+# Must be the same on all orchestrator instances of a cluster.
+SHARD_COUNT = 16
+
+
+def shard_of(key: str) -> int:
+    """Returns the shard of a job ID, a `{job_id}:{task_id}` branch entry or a worker ID.
+    The entries of a job are always in the shard of the job.
+    """
+    return crc32(key.partition(":")[0].encode("utf-8")) % SHARD_COUNT
+
+
+# Watch deadlines and `task_dispatched_at` used to be monotonic clock readings, which stay far below
+# any wall-clock timestamp. Values under this limit were written by those versions.
+MONOTONIC_CLOCK_LIMIT = 1e9
+
+
+def to_wall_clock(timestamp: float) -> float:
+    """Converts a timestamp written on the monotonic clock by an earlier version to wall-clock time,
+    keeping the time left until it on the monotonic clock of this host. Wall-clock timestamps are returned as is.
+    """
+    if timestamp >= MONOTONIC_CLOCK_LIMIT:
+        return timestamp
+    return time() + (timestamp - monotonic())
+
+
+# Partition of the job queue used when partitioning is off, it also holds jobs enqueued before it was enabled
+DEFAULT_JOB_PARTITION = ""
+
+
+def partition_message_id(partition: str, message_id: str) -> str:
+    """Qualifies the message ID of a job queue partition, so it can be acknowledged in its partition."""
+    return f"{partition}/{message_id}" if partition else message_id
+
+
+def message_partition(message_id: str) -> str:
+    """Returns the job queue partition of a message ID returned by `dequeue_jobs`."""
+    return message_id.rpartition("/")[0]
 
 
 class StorageBackend(ABC):
@@ -16,6 +60,40 @@ class StorageBackend(ABC):
         """
         raise NotImplementedError
 
+    async def get_job_states(self, job_ids: list[str]) -> dict[str, dict[str, Any]]:
+        """Get the full states of several jobs.
+
+        The default implementation reads them one by one, backends override it to read them in one batch.
+
+        :param job_ids: Unique identifiers of the jobs.
+        :return: A dictionary mapping job IDs to their states, jobs that are not found are left out.
+        """
+        states = {}
+        for job_id in job_ids:
+            if (state := await self.get_job_state(job_id)) is not None:
+                states[job_id] = state
+        return states
+
+    def iter_job_ids(self) -> AsyncIterator[str]:
+        """Yields the IDs of all stored jobs. Used by background maintenance, e.g. to find
+        the blob store payloads that live jobs still reference. The order is unspecified.
+        """
+        raise NotImplementedError
+
+    async def get_job_fields(self, job_id: str, fields: list[str]) -> dict[str, Any] | None:
+        """Get selected top-level fields of a job state, e.g. only 'status' and 'current_state'.
+
+        The default implementation loads the full state. Missing fields are returned as None.
+
+        :param job_id: Unique identifier for the job.
+        :param fields: The names of the fields to return.
+        :return: A dictionary with the requested fields or None if the job is not found.
+        """
+        state = await self.get_job_state(job_id)
+        if state is None:
+            return None
+        return {field: state.get(field) for field in fields}
+
     @abstractmethod
     async def update_worker_data(
         self,
@@ -31,6 +109,20 @@ class StorageBackend(ABC):
         """
         raise NotImplementedError
 
+    async def update_workers_data(self, updates: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+        """Partially update the information of several workers at once, see `update_worker_data`.
+        Backends should override it to write all updates in one round trip.
+
+        :param updates: A dictionary mapping worker IDs to the fields to update.
+        :return: The updated full states of the workers that were found.
+        """
+        updated = {}
+        for worker_id, update_data in updates.items():
+            worker_info = await self.update_worker_data(worker_id, update_data)
+            if worker_info is not None:
+                updated[worker_id] = worker_info
+        return updated
+
     @abstractmethod
     async def remove_job_from_watch(self, job_id: str) -> None:
         """Remove a job from the timeout tracking list (when it completes).
@@ -81,12 +173,13 @@ class StorageBackend(ABC):
         self,
         job_id: str,
         update_data: dict[str, Any],
-    ) -> dict[str, Any]:
+    ) -> dict[str, Any] | None:
         """Partially update the state of a job.
 
         :param job_id: Unique identifier for the job.
         :param update_data: A dictionary with the data to update.
-        :return: The updated full state of the job.
+        :return: The updated full state of the job, or None if the job does not exist.
+            A missing job is not created from the partial update.
         """
         raise NotImplementedError
 
@@ -135,9 +228,80 @@ class StorageBackend(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    async def get_available_workers(self) -> list[dict[str, Any]]:
-        """Get a list of all active (not expired) workers.
+    async def dequeue_task_from_queues(
+        self,
+        queue_names: list[str],
+        timeout: int | None,
+    ) -> tuple[str, dict[str, Any], float] | None:
+        """Take the highest priority task from the first non-empty of several task queues.
+        Queue names are worker IDs or shared queue names (see `Dispatcher`).
+
+        :param queue_names: The queues to check, in order of preference.
+        :param timeout: Seconds to wait for a task, None to return immediately.
+        :return: A (queue_name, task_payload, priority) tuple or None if no task arrived in time.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def dequeue_tasks_from_queues(
+        self,
+        queue_names: list[str],
+        count: int,
+    ) -> list[tuple[str, dict[str, Any], float]]:
+        """Take up to `count` of the highest priority tasks from several task queues without waiting.
+        The queues are drained in order, each one with a single atomic pop.
+
+        :param queue_names: The queues to check, in order of preference.
+        :param count: The maximum number of tasks to take.
+        :return: A list of (queue_name, task_payload, priority) tuples, possibly empty.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def dequeue_task_of_types(
+        self,
+        queue_name: str,
+        task_types: Collection[str],
+    ) -> tuple[str, dict[str, Any], float] | None:
+        """Take the highest priority task of a queue only if its type is one of `task_types`.
+        A task of another type stays in place, so it keeps its position in the queue.
+
+        :param queue_name: The queue to take the task from.
+        :param task_types: The task types the caller can run.
+        :return: A (queue_name, task_payload, priority) tuple or None.
+        """
+        raise NotImplementedError
 
+    @abstractmethod
+    async def register_resource_class(self, task_type: str, class_id: str, constraints: dict[str, Any]) -> None:
+        """Remember the constraints of a shared task queue, so workers can find the queues they can serve.
+
+        :param task_type: The type of the tasks in the queue.
+        :param class_id: The identifier of the constraints, part of the queue name.
+        :param constraints: The `resource_requirements` and `max_cost` of the tasks in the queue.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_resource_classes(self, task_types: list[str]) -> dict[str, dict[str, dict[str, Any]]]:
+        """Get the registered resource classes of several task types.
+
+        :return: A dictionary mapping task types to {class_id: constraints}.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_available_workers(
+        self,
+        task_type: str | None = None,
+        status: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """Get a list of active (not expired) workers, optionally narrowed down
+        using the worker registry indexes.
+
+        :param task_type: If set, only workers that list this type in `supported_tasks` are returned.
+        :param status: If set, only workers with this status are returned.
+            Workers that do not report a status are treated as 'idle'.
         :return: A list of dictionaries, where each dictionary represents information about a worker.
         """
         raise NotImplementedError
@@ -146,22 +310,85 @@ class StorageBackend(ABC):
     async def add_job_to_watch(self, job_id: str, timeout_at: float) -> None:
         """Add a job to the list for timeout tracking.
 
-        :param job_id: The job identifier.
-        :param timeout_at: The time (timestamp) when the job will be considered overdue.
+        :param job_id: The job identifier, or `{job_id}:{task_id}` for a branch of a parallel step.
+        :param timeout_at: The wall-clock time (Unix timestamp) when the job will be considered overdue.
         """
         raise NotImplementedError
 
     @abstractmethod
-    async def get_timed_out_jobs(self) -> list[str]:
-        """Get a list of job IDs that are overdue and remove them from the tracking list.
+    async def get_timed_out_jobs(
+        self,
+        limit: int | None = None,
+        shards: Collection[int] | None = None,
+    ) -> list[str]:
+        """Atomically take overdue entries off the tracking list, earliest first.
+        Each entry is returned to only one caller, even with several orchestrator instances.
+
+        :param limit: The maximum number of entries to take, all overdue ones if None.
+        :param shards: Take only entries of these shards (see `shard_of`), all shards if None.
+        :return: A list of overdue job IDs (or `{job_id}:{task_id}` branch entries).
+        """
+        raise NotImplementedError
 
-        :return: A list of overdue job IDs.
+    @abstractmethod
+    async def get_next_watch_deadline(self, shards: Collection[int] | None = None) -> float | None:
+        """Get the earliest timeout time on the tracking list.
+
+        :param shards: Consider only entries of these shards, all shards if None.
+        :return: The wall-clock time of the earliest deadline, or None if nothing is watched.
         """
         raise NotImplementedError
 
     @abstractmethod
-    async def enqueue_job(self, job_id: str) -> None:
-        """Add a job ID to the execution queue."""
+    async def start_parallel_branches(self, job_id: str, task_ids: list[str]) -> None:
+        """Starts tracking the branch tasks of a parallel step of a job, dropping any previous step.
+
+        :param job_id: Unique identifier of the job.
+        :param task_ids: The task IDs of the branches.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def record_branch_result(
+        self,
+        job_id: str,
+        task_id: str,
+        result: dict[str, Any],
+        active_branches: list[str],
+    ) -> tuple[int, dict[str, Any] | None]:
+        """Atomically marks a branch of a parallel step as finished and stores its result.
+
+        :param job_id: Unique identifier of the job.
+        :param task_id: The task ID of the finished branch.
+        :param result: The result of the branch.
+        :param active_branches: The branches of the step as recorded in the job state, tracked
+            if the step was started without `start_parallel_branches`.
+        :return: The number of branches still running (-1 if the branch is unknown or already
+            finished) and, once the last branch finished, the results of all branches.
+        """
+        raise NotImplementedError
+
+    async def set_task_worker(self, job_id: str, task_id: str, worker_id: str | None) -> None:
+        """Records which worker claimed a task of a job from a queue other than its own, per task,
+        so that the branches of a parallel step each keep their worker.
+
+        :param job_id: Unique identifier of the job.
+        :param task_id: The claimed task.
+        :param worker_id: The claiming worker, or None when the task was put back into its queue.
+        """
+        raise NotImplementedError
+
+    async def get_task_worker(self, job_id: str, task_id: str) -> str | None:
+        """Returns the worker recorded with `set_task_worker` for a task of a job, if any."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def enqueue_job(self, job_id: str, partition: str = DEFAULT_JOB_PARTITION) -> None:
+        """Add a job ID to the execution queue.
+
+        :param job_id: The job identifier.
+        :param partition: The partition of the execution queue (see `JobPartitions`).
+        """
         raise NotImplementedError
 
     @abstractmethod
@@ -172,6 +399,66 @@ class StorageBackend(ABC):
         """
         raise NotImplementedError
 
+    async def commit_job_writes(
+        self,
+        job_states: dict[str, dict[str, Any]],
+        enqueued_jobs: list[tuple[str, str]],
+        watched_jobs: dict[str, float],
+        unwatched_jobs: list[str],
+        worker_tasks: list[tuple[str, dict[str, Any], float]],
+        quarantined_jobs: list[str],
+        task_workers: dict[str, dict[str, str | None]] | None = None,
+    ) -> None:
+        """Apply the writes collected by a `JobUnitOfWork` in one batch.
+
+        Backends that support transactions should apply them atomically.
+        The default implementation applies them one by one.
+
+        :param job_states: Job states to save, keyed by job ID.
+        :param enqueued_jobs: (job_id, partition) tuples to add to the execution queue.
+        :param watched_jobs: Timeout times of jobs to watch, keyed by job ID.
+        :param unwatched_jobs: Job IDs to remove from timeout tracking.
+        :param worker_tasks: (worker_id, task_payload, priority) tuples to enqueue for workers.
+        :param quarantined_jobs: Job IDs to move to the quarantine queue.
+        :param task_workers: Claiming workers to record with `set_task_worker`, keyed by job ID and task ID.
+        """
+        for job_id, state in job_states.items():
+            await self.save_job_state(job_id, state)
+        for job_id in unwatched_jobs:
+            await self.remove_job_from_watch(job_id)
+        for job_id, timeout_at in watched_jobs.items():
+            await self.add_job_to_watch(job_id, timeout_at)
+        for worker_id, task_payload, priority in worker_tasks:
+            await self.enqueue_task_for_worker(worker_id, task_payload, priority)
+        for job_id, partition in enqueued_jobs:
+            await self.enqueue_job(job_id, partition)
+        for job_id in quarantined_jobs:
+            await self.quarantine_job(job_id)
+        for job_id, workers in (task_workers or {}).items():
+            for task_id, worker_id in workers.items():
+                await self.set_task_worker(job_id, task_id, worker_id)
+
+    async def dequeue_jobs(
+        self,
+        count: int,
+        block_ms: int | None = None,
+        partitions: dict[str, int] | None = None,
+    ) -> list[tuple[str, str]]:
+        """Retrieve up to `count` jobs from the execution queue in one call.
+
+        The default implementation falls back to a single `dequeue_job` and has no partitions.
+
+        :param count: The maximum number of jobs to return.
+        :param block_ms: How long to wait for the first job if the queue is empty.
+        :param partitions: The maximum number of jobs to take from each partition, instead of `count`
+            from the default partition. When all of them are empty, the wait ends with the first job
+            of any of them, so a partition may return one job over its number (even if it is 0).
+        :return: A list of (job_id, message_id) tuples, empty if the timeout has expired.
+            The partition of a message is given by `message_partition`.
+        """
+        result = await self.dequeue_job()
+        return [result] if result else []
+
     @abstractmethod
     async def ack_job(self, message_id: str) -> None:
         """Acknowledge successful processing of a job from the queue.
@@ -180,6 +467,16 @@ class StorageBackend(ABC):
         """
         raise NotImplementedError
 
+    async def ack_jobs(self, message_ids: list[str]) -> None:
+        """Acknowledge several processed jobs at once.
+
+        The default implementation acknowledges them one by one.
+
+        :param message_ids: The identifiers of the messages to acknowledge.
+        """
+        for message_id in message_ids:
+            await self.ack_job(message_id)
+
     @abstractmethod
     async def quarantine_job(self, job_id: str) -> None:
         """Move a job ID to the quarantine queue."""
@@ -230,11 +527,52 @@ class StorageBackend(ABC):
 
     @abstractmethod
     async def get_job_queue_length(self) -> int:
-        """Get the current length of the main job queue.
-        Used for metrics.
+        """Get the current length of the job queue, summed over all its partitions.
+        Used for metrics and the dashboard.
         """
         raise NotImplementedError
 
+    async def get_job_partitions(self) -> list[str]:
+        """Get the partitions the job queue holds, whatever partitioning created them.
+        The default implementation only knows the default partition.
+        """
+        return [DEFAULT_JOB_PARTITION]
+
+    async def get_job_queue_lengths(self, partitions: list[str]) -> dict[str, int]:
+        """Get the current length of each partition of the job queue.
+        Used for metrics. The default implementation only knows the default partition.
+        """
+        return {partition: await self.get_job_queue_length() for partition in partitions if not partition}
+
+    async def get_job_queue_stats(self, partitions: list[str]) -> dict[str, dict[str, int]]:
+        """Get the state of each partition of the job queue, for metrics.
+
+        :return: partition -> {"length": entries held, "pending": jobs delivered but not acknowledged,
+            "lag": jobs not delivered yet}. The default implementation acknowledges jobs on delivery.
+        """
+        lengths = await self.get_job_queue_lengths(partitions)
+        return {partition: {"length": length, "pending": 0, "lag": length} for partition, length in lengths.items()}
+
+    async def trim_job_queues(self, partitions: list[str]) -> int:
+        """Drop the acknowledged jobs still held by the given partitions of the job queue.
+
+        :return: The number of entries dropped. The default implementation holds none.
+        """
+        return 0
+
+    async def remove_dead_job_consumers(
+        self,
+        partitions: list[str],
+        live_consumers: Collection[str],
+        min_idle_ms: int,
+    ) -> list[str]:
+        """Forget the consumers of the job queue that left: those without pending jobs that are not
+        in `live_consumers` and have not read the queue for `min_idle_ms`.
+
+        :return: The names of the removed consumers. The default implementation has no consumers.
+        """
+        return []
+
     @abstractmethod
     async def get_priority_queue_stats(self, task_type: str) -> dict[str, Any]:
         """Get statistics on the priority queue for a given task type.
@@ -244,6 +582,76 @@ class StorageBackend(ABC):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    async def mark_task_in_flight(self, worker_id: str, task_id: str, ttl: int) -> None:
+        """Remember that a worker has taken a task from its queue and not yet reported its result.
+
+        :param worker_id: The worker that received the task.
+        :param task_id: The task identifier.
+        :param ttl: Seconds after which the task no longer counts as in flight, e.g. if its result never arrives.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def clear_task_in_flight(self, worker_id: str, task_id: str) -> float | None:
+        """Forget an in-flight task once its result has arrived.
+
+        :return: Seconds since the worker took the task, or None if it was not in flight.
+        """
+        raise NotImplementedError
+
+    async def clear_tasks_in_flight(self, worker_id: str, task_ids: list[str]) -> dict[str, float | None]:
+        """Forget several in-flight tasks of a worker, e.g. when their results arrive in one batch.
+
+        :return: A dictionary mapping each task ID to the seconds since the worker took it,
+            or None if it was not in flight.
+        """
+        return {task_id: await self.clear_task_in_flight(worker_id, task_id) for task_id in task_ids}
+
+    @abstractmethod
+    async def get_worker_loads(self, worker_ids: list[str]) -> dict[str, dict[str, int]]:
+        """Get the current load of several workers as seen by the orchestrator.
+
+        :param worker_ids: The workers to look up.
+        :return: A dictionary mapping each worker ID to {"queued": tasks waiting in its queue,
+            "in_flight": tasks taken from the queue without a result yet}.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def record_task_stats(
+        self,
+        worker_id: str,
+        task_type: str,
+        duration_ms: float,
+        success: bool,
+        ewma_alpha: float = STATS_EWMA_ALPHA,
+        window: int = STATS_WINDOW,
+    ) -> None:
+        """Update the live statistics of a worker for a task type with a finished task.
+        See `worker_stats.record_task_outcome` for what is kept.
+
+        :param worker_id: The worker that executed the task.
+        :param task_type: The type of the task.
+        :param duration_ms: Time from dispatch to result in milliseconds.
+        :param success: False if the task failed.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_workers_stats(
+        self,
+        worker_ids: list[str],
+        task_type: str | None = None,
+    ) -> dict[str, dict[str, dict[str, Any]]]:
+        """Get the live statistics of several workers.
+
+        :param worker_ids: The workers to look up.
+        :param task_type: Only return the statistics of this task type.
+        :return: A dictionary mapping worker IDs to {task_type: statistics}, workers without statistics are omitted.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     async def set_task_cancellation_flag(self, task_id: str) -> None:
         """Set a cancellation flag for a task with a TTL."""
@@ -269,10 +677,50 @@ class StorageBackend(ABC):
         """Completely clears the storage. Used mainly for tests."""
         raise NotImplementedError
 
+    async def initialize(self) -> None:
+        """Prepares the backend on startup. Backends that need nothing do nothing."""
+        return None
+
+    async def close(self) -> None:
+        """Stops the background work of the backend on shutdown. Backends without any do nothing."""
+        return None
+
     async def get_active_worker_count(self) -> int:
         """Returns the number of currently active workers."""
         raise NotImplementedError
 
+    def subscribe_worker_events(self) -> AsyncIterator[dict[str, Any]]:
+        """Subscribes to worker registry changes made by any orchestrator instance.
+
+        Yields events of the form `{"event": "updated", "worker_id": ..., "info": {...}}`
+        or `{"event": "removed", "worker_id": ...}`. Delivery is best-effort.
+        """
+        raise NotImplementedError
+
+    def subscribe_task_events(self) -> AsyncIterator[str]:
+        """Subscribes to task enqueues made by any orchestrator instance.
+
+        Yields the name of the queue (a worker ID or a shared queue name) a task was added to.
+        Used to wake up the delivery of pushed tasks, delivery is best-effort.
+        """
+        raise NotImplementedError
+
+    def subscribe_watch_events(self) -> AsyncIterator[tuple[int, float]]:
+        """Subscribes to entries added to the timeout tracking list by any orchestrator instance.
+
+        Yields the shard and the earliest timeout time of the entries added to each shard. Used to wake
+        up the watcher when a deadline comes sooner than it planned to sleep, delivery is best-effort.
+        """
+        raise NotImplementedError
+
+    async def prune_expired_workers(self) -> int:
+        """Removes workers whose TTL has expired from the worker registry indexes.
+        Called periodically by the HealthChecker.
+
+        :return: The number of workers that were pruned.
+        """
+        return 0
+
     async def set_nx_ttl(self, key: str, value: str, ttl: int) -> bool:
         """
         Atomically sets key to value if it does not exist.
@@ -312,3 +760,35 @@ class StorageBackend(ABC):
         :return: True if the lock was successfully released, False otherwise.
         """
         raise NotImplementedError
+
+    @abstractmethod
+    async def extend_lock(self, key: str, holder_id: str, ttl: int) -> bool:
+        """
+        Resets the time-to-live of a distributed lock if it is held by the specified holder_id.
+
+        :param key: The unique key of the lock.
+        :param holder_id: The identifier of the caller who presumably holds the lock.
+        :param ttl: The new time-to-live for the lock in seconds.
+        :return: True if the lock is still held and was extended, False otherwise.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def refresh_instance(self, instance_id: str, ttl: int) -> list[str]:
+        """
+        Records that an orchestrator instance is alive for the next `ttl` seconds.
+
+        :param instance_id: The unique identifier of the orchestrator instance.
+        :param ttl: Time-to-live of the record in seconds.
+        :return: The IDs of all instances that are alive, including this one.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def remove_instance(self, instance_id: str) -> None:
+        """
+        Removes the record of an orchestrator instance that shuts down.
+
+        :param instance_id: The unique identifier of the orchestrator instance.
+        """
+        raise NotImplementedError
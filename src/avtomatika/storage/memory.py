@@ -1,9 +1,21 @@
-from asyncio import Lock, PriorityQueue, Queue, QueueEmpty, wait_for
+from asyncio import Event, Lock, PriorityQueue, Queue, wait_for
 from asyncio import TimeoutError as AsyncTimeoutError
-from time import monotonic
-from typing import Any
-
-from .base import StorageBackend
+from collections import deque
+from collections.abc import Collection
+from itertools import count
+from time import monotonic, time
+from typing import Any, AsyncIterator
+
+from ..worker_stats import STATS_EWMA_ALPHA, STATS_WINDOW, record_task_outcome
+from .base import (
+    DEFAULT_JOB_PARTITION,
+    MONOTONIC_CLOCK_LIMIT,
+    StorageBackend,
+    partition_message_id,
+    shard_of,
+    to_wall_clock,
+)
+from .worker_index import WorkerIndex
 
 
 class MemoryStorage(StorageBackend):
@@ -16,16 +28,42 @@ class MemoryStorage(StorageBackend):
         self._jobs: dict[str, dict[str, Any]] = {}
         self._workers: dict[str, dict[str, Any]] = {}
         self._worker_ttls: dict[str, float] = {}
+        self._worker_index = WorkerIndex()
+        self._worker_event_subscribers: list[Queue] = []
+        self._task_event_subscribers: list[Queue] = []
+        self._watch_event_subscribers: list[Queue] = []
         self._worker_task_queues: dict[str, PriorityQueue] = {}
-        self._job_queue = Queue()
+        # worker_id -> task_id -> (monotonic time the task was taken, time until which it counts as in flight)
+        self._in_flight_tasks: dict[str, dict[str, tuple[float, float]]] = {}
+        # worker_id -> task_type -> live task statistics
+        self._worker_stats: dict[str, dict[str, dict[str, Any]]] = {}
+        # Set and replaced whenever a task is enqueued, wakes up readers waiting on several queues
+        self._task_enqueued = Event()
+        # task_type -> class_id -> constraints of the shared task queues
+        self._resource_classes: dict[str, dict[str, dict[str, Any]]] = {}
+        # Tie-breaker for tasks with equal priority, keeps them FIFO and avoids comparing payloads
+        self._task_sequence = count()
+        # partition -> queued job IDs
+        self._job_queues: dict[str, deque[str]] = {}
+        # Set and replaced whenever a job is enqueued, wakes up readers waiting on the partitions
+        self._job_enqueued = Event()
+        # Message IDs must be unique, the executor uses them to deduplicate in-flight jobs
+        self._message_sequence = count()
         self._quarantine_queue: list[str] = []
         self._watched_jobs: dict[str, float] = {}
+        # job_id -> task IDs of the running branches, and the results of the finished ones, of its parallel step
+        self._active_branches: dict[str, set[str]] = {}
+        self._branch_results: dict[str, dict[str, Any]] = {}
+        # job_id -> task_id -> worker that claimed the task from a queue other than its own
+        self._task_workers: dict[str, dict[str, str]] = {}
         self._client_configs: dict[str, dict[str, Any]] = {}
         self._quotas: dict[str, int] = {}
         self._worker_tokens: dict[str, str] = {}
         self._generic_keys: dict[str, Any] = {}
         self._generic_key_ttls: dict[str, float] = {}
         self._locks: dict[str, tuple[str, float]] = {}
+        # instance_id -> monotonic time the instance counts as alive until
+        self._instances: dict[str, float] = {}
 
         self._lock = Lock()
 
@@ -33,6 +71,46 @@ class MemoryStorage(StorageBackend):
         async with self._lock:
             return self._jobs.get(job_id)
 
+    async def iter_job_ids(self) -> AsyncIterator[str]:
+        async with self._lock:
+            job_ids = list(self._jobs)
+        for job_id in job_ids:
+            yield job_id
+
+    def _publish_worker_event(self, event: str, worker_id: str, worker_info: dict[str, Any] | None = None) -> None:
+        message: dict[str, Any] = {"event": event, "worker_id": worker_id}
+        if worker_info is not None:
+            message["info"] = dict(worker_info)
+        for queue in self._worker_event_subscribers:
+            queue.put_nowait(message)
+
+    async def subscribe_worker_events(self) -> AsyncIterator[dict[str, Any]]:
+        queue: Queue = Queue()
+        self._worker_event_subscribers.append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._worker_event_subscribers.remove(queue)
+
+    async def subscribe_task_events(self) -> AsyncIterator[str]:
+        queue: Queue = Queue()
+        self._task_event_subscribers.append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._task_event_subscribers.remove(queue)
+
+    async def subscribe_watch_events(self) -> AsyncIterator[tuple[int, float]]:
+        queue: Queue = Queue()
+        self._watch_event_subscribers.append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._watch_event_subscribers.remove(queue)
+
     async def _clean_expired(self):
         """Helper to remove expired keys."""
         now = monotonic()
@@ -46,6 +124,8 @@ class MemoryStorage(StorageBackend):
         for k in expired_workers:
             self._worker_ttls.pop(k, None)
             self._workers.pop(k, None)
+            self._worker_index.remove(k)
+            self._publish_worker_event("removed", k)
 
     async def save_job_state(self, job_id: str, state: dict[str, Any]):
         async with self._lock:
@@ -55,10 +135,10 @@ class MemoryStorage(StorageBackend):
         self,
         job_id: str,
         update_data: dict[str, Any],
-    ) -> dict[str, Any]:
+    ) -> dict[str, Any] | None:
         async with self._lock:
             if job_id not in self._jobs:
-                self._jobs[job_id] = {}
+                return None
             self._jobs[job_id].update(update_data)
             return self._jobs[job_id]
 
@@ -74,6 +154,8 @@ class MemoryStorage(StorageBackend):
             worker_info.setdefault("reputation", 1.0)
             self._workers[worker_id] = worker_info
             self._worker_ttls[worker_id] = monotonic() + ttl
+            self._worker_index.add(worker_id, worker_info)
+            self._publish_worker_event("updated", worker_id, worker_info)
             if worker_id not in self._worker_task_queues:
                 self._worker_task_queues[worker_id] = PriorityQueue()
 
@@ -87,7 +169,11 @@ class MemoryStorage(StorageBackend):
         async with self._lock:
             if worker_id not in self._worker_task_queues:
                 self._worker_task_queues[worker_id] = PriorityQueue()
-        await self._worker_task_queues[worker_id].put((-priority, task_payload))
+        await self._worker_task_queues[worker_id].put((-priority, next(self._task_sequence), task_payload))
+        self._task_enqueued.set()
+        self._task_enqueued = Event()
+        for queue in self._task_event_subscribers:
+            queue.put_nowait(worker_id)
 
     async def dequeue_task_for_worker(
         self,
@@ -102,11 +188,66 @@ class MemoryStorage(StorageBackend):
             queue = self._worker_task_queues[worker_id]
 
         try:
-            _, task_payload = await wait_for(queue.get(), timeout=timeout)
+            _, _, task_payload = await wait_for(queue.get(), timeout=timeout)
             return task_payload
         except AsyncTimeoutError:
             return None
 
+    async def dequeue_task_from_queues(
+        self,
+        queue_names: list[str],
+        timeout: int | None,
+    ) -> tuple[str, dict[str, Any], float] | None:
+        deadline = monotonic() + (timeout or 0)
+        while True:
+            for queue_name in queue_names:
+                queue = self._worker_task_queues.get(queue_name)
+                if queue is not None and not queue.empty():
+                    negative_priority, _, task_payload = queue.get_nowait()
+                    return queue_name, task_payload, -negative_priority
+            remaining = deadline - monotonic()
+            if timeout is None or remaining <= 0:
+                return None
+            try:
+                await wait_for(self._task_enqueued.wait(), timeout=remaining)
+            except AsyncTimeoutError:
+                return None
+
+    async def dequeue_tasks_from_queues(
+        self,
+        queue_names: list[str],
+        count: int,
+    ) -> list[tuple[str, dict[str, Any], float]]:
+        tasks = []
+        async with self._lock:
+            for queue_name in queue_names:
+                queue = self._worker_task_queues.get(queue_name)
+                while queue is not None and not queue.empty() and len(tasks) < count:
+                    negative_priority, _, task_payload = queue.get_nowait()
+                    tasks.append((queue_name, task_payload, -negative_priority))
+        return tasks
+
+    async def dequeue_task_of_types(
+        self,
+        queue_name: str,
+        task_types: Collection[str],
+    ) -> tuple[str, dict[str, Any], float] | None:
+        async with self._lock:
+            queue = self._worker_task_queues.get(queue_name)
+            # The head of the heap behind the priority queue is its next task
+            if queue is None or queue.empty() or queue._queue[0][2].get("type") not in task_types:  # type: ignore[attr-defined]
+                return None
+            negative_priority, _, task_payload = queue.get_nowait()
+            return queue_name, task_payload, -negative_priority
+
+    async def register_resource_class(self, task_type: str, class_id: str, constraints: dict[str, Any]) -> None:
+        async with self._lock:
+            self._resource_classes.setdefault(task_type, {})[class_id] = constraints
+
+    async def get_resource_classes(self, task_types: list[str]) -> dict[str, dict[str, dict[str, Any]]]:
+        async with self._lock:
+            return {task_type: dict(self._resource_classes.get(task_type, {})) for task_type in task_types}
+
     async def refresh_worker_ttl(self, worker_id: str, ttl: int) -> bool:
         async with self._lock:
             if worker_id in self._workers:
@@ -124,6 +265,8 @@ class MemoryStorage(StorageBackend):
             if worker_id in self._workers:
                 self._workers[worker_id].update(status_update)
                 self._worker_ttls[worker_id] = monotonic() + ttl
+                self._worker_index.add(worker_id, self._workers[worker_id])
+                self._publish_worker_event("updated", worker_id, self._workers[worker_id])
                 return self._workers[worker_id]
             return None
 
@@ -135,51 +278,219 @@ class MemoryStorage(StorageBackend):
         async with self._lock:
             if worker_id in self._workers:
                 self._workers[worker_id].update(update_data)
+                self._worker_index.add(worker_id, self._workers[worker_id])
+                self._publish_worker_event("updated", worker_id, self._workers[worker_id])
                 return self._workers[worker_id]
             return None
 
-    async def get_available_workers(self) -> list[dict[str, Any]]:
+    async def update_workers_data(self, updates: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+        async with self._lock:
+            updated = {}
+            for worker_id, update_data in updates.items():
+                if worker_id in self._workers:
+                    self._workers[worker_id].update(update_data)
+                    self._worker_index.add(worker_id, self._workers[worker_id])
+                    self._publish_worker_event("updated", worker_id, self._workers[worker_id])
+                    updated[worker_id] = self._workers[worker_id]
+            return updated
+
+    async def mark_task_in_flight(self, worker_id: str, task_id: str, ttl: int) -> None:
         async with self._lock:
             now = monotonic()
-            active_workers = []
-            active_workers.extend(
-                worker_info
-                for worker_id, worker_info in self._workers.items()
-                if self._worker_ttls.get(worker_id, 0) > now
+            self._in_flight_tasks.setdefault(worker_id, {})[task_id] = (now, now + ttl)
+
+    async def clear_task_in_flight(self, worker_id: str, task_id: str) -> float | None:
+        async with self._lock:
+            in_flight = self._in_flight_tasks.get(worker_id, {}).pop(task_id, None)
+            return None if in_flight is None else monotonic() - in_flight[0]
+
+    async def get_worker_loads(self, worker_ids: list[str]) -> dict[str, dict[str, int]]:
+        async with self._lock:
+            now = monotonic()
+            loads = {}
+            for worker_id in worker_ids:
+                in_flight = self._in_flight_tasks.get(worker_id, {})
+                for task_id in [task_id for task_id, (_, expires_at) in in_flight.items() if expires_at <= now]:
+                    del in_flight[task_id]
+                queue = self._worker_task_queues.get(worker_id)
+                loads[worker_id] = {"queued": queue.qsize() if queue else 0, "in_flight": len(in_flight)}
+            return loads
+
+    async def record_task_stats(
+        self,
+        worker_id: str,
+        task_type: str,
+        duration_ms: float,
+        success: bool,
+        ewma_alpha: float = STATS_EWMA_ALPHA,
+        window: int = STATS_WINDOW,
+    ) -> None:
+        async with self._lock:
+            worker_stats = self._worker_stats.setdefault(worker_id, {})
+            worker_stats[task_type] = record_task_outcome(
+                worker_stats.get(task_type), duration_ms, success, ewma_alpha, window
             )
-            return active_workers
+
+    async def get_workers_stats(
+        self,
+        worker_ids: list[str],
+        task_type: str | None = None,
+    ) -> dict[str, dict[str, dict[str, Any]]]:
+        async with self._lock:
+            result = {}
+            for worker_id in worker_ids:
+                worker_stats = self._worker_stats.get(worker_id, {})
+                if task_type is not None:
+                    worker_stats = {task_type: worker_stats[task_type]} if task_type in worker_stats else {}
+                if worker_stats:
+                    result[worker_id] = {t: dict(stats) for t, stats in worker_stats.items()}
+            return result
+
+    async def get_available_workers(
+        self,
+        task_type: str | None = None,
+        status: str | None = None,
+    ) -> list[dict[str, Any]]:
+        async with self._lock:
+            now = monotonic()
+            candidate_ids = self._worker_index.find(task_type, status)
+            return [
+                self._workers[worker_id]
+                for worker_id in candidate_ids
+                if worker_id in self._workers and self._worker_ttls.get(worker_id, 0) > now
+            ]
 
     async def add_job_to_watch(self, job_id: str, timeout_at: float) -> None:
         async with self._lock:
             self._watched_jobs[job_id] = timeout_at
+        for queue in self._watch_event_subscribers:
+            queue.put_nowait((shard_of(job_id), timeout_at))
 
     async def remove_job_from_watch(self, job_id: str) -> None:
         async with self._lock:
             self._watched_jobs.pop(job_id, None)
 
-    async def get_timed_out_jobs(self) -> list[str]:
+    def _watched_in_shards(self, shards: Collection[int] | None) -> dict[str, float]:
+        if shards is None:
+            return self._watched_jobs
+        return {job_id: timeout_at for job_id, timeout_at in self._watched_jobs.items() if shard_of(job_id) in shards}
+
+    async def get_timed_out_jobs(
+        self,
+        limit: int | None = None,
+        shards: Collection[int] | None = None,
+    ) -> list[str]:
         async with self._lock:
-            now = monotonic()
-            timed_out_ids = [job_id for job_id, timeout_at in self._watched_jobs.items() if timeout_at <= now]
+            now = time()
+            watched = self._watched_in_shards(shards)
+            for job_id, timeout_at in watched.items():
+                if timeout_at < MONOTONIC_CLOCK_LIMIT:
+                    watched[job_id] = self._watched_jobs[job_id] = to_wall_clock(timeout_at)
+            due = sorted((timeout_at, job_id) for job_id, timeout_at in watched.items() if timeout_at <= now)
+            timed_out_ids = [job_id for _, job_id in due[:limit]]
             for job_id in timed_out_ids:
                 self._watched_jobs.pop(job_id, None)
             return timed_out_ids
 
-    async def enqueue_job(self, job_id: str) -> None:
-        await self._job_queue.put(job_id)
+    async def get_next_watch_deadline(self, shards: Collection[int] | None = None) -> float | None:
+        async with self._lock:
+            return min(self._watched_in_shards(shards).values(), default=None)
+
+    async def start_parallel_branches(self, job_id: str, task_ids: list[str]) -> None:
+        async with self._lock:
+            self._active_branches[job_id] = set(task_ids)
+            self._branch_results.pop(job_id, None)
+
+    async def set_task_worker(self, job_id: str, task_id: str, worker_id: str | None) -> None:
+        async with self._lock:
+            if worker_id is None:
+                self._task_workers.get(job_id, {}).pop(task_id, None)
+            else:
+                self._task_workers.setdefault(job_id, {})[task_id] = worker_id
+
+    async def get_task_worker(self, job_id: str, task_id: str) -> str | None:
+        async with self._lock:
+            return self._task_workers.get(job_id, {}).get(task_id)
+
+    async def record_branch_result(
+        self,
+        job_id: str,
+        task_id: str,
+        result: dict[str, Any],
+        active_branches: list[str],
+    ) -> tuple[int, dict[str, Any] | None]:
+        async with self._lock:
+            if job_id not in self._active_branches and job_id not in self._branch_results:
+                self._active_branches[job_id] = set(active_branches)
+            active = self._active_branches.get(job_id, set())
+            if task_id not in active:
+                return -1, None
+            active.discard(task_id)
+            results = self._branch_results.setdefault(job_id, {})
+            results[task_id] = result
+            if active:
+                return len(active), None
+            del self._active_branches[job_id]
+            return 0, dict(results)
+
+    async def enqueue_job(self, job_id: str, partition: str = DEFAULT_JOB_PARTITION) -> None:
+        self._job_queues.setdefault(partition, deque()).append(job_id)
+        self._job_enqueued.set()
+        self._job_enqueued = Event()
 
     async def dequeue_job(self) -> tuple[str, str] | None:
         """Waits indefinitely for a job ID from the queue and returns it.
         Returns a tuple of (job_id, message_id). In MemoryStorage, message_id is dummy.
         """
-        job_id = await self._job_queue.get()
-        self._job_queue.task_done()
-        return job_id, "memory-msg-id"
+        jobs = await self.dequeue_jobs(1)
+        return jobs[0] if jobs else None
+
+    def _take_jobs(self, partitions: dict[str, int], at_least_one: bool = False) -> list[tuple[str, str]]:
+        jobs = []
+        for partition, limit in partitions.items():
+            queue = self._job_queues.get(partition)
+            taken = 0
+            while queue and (taken < limit or (at_least_one and not taken)):
+                job_id = queue.popleft()
+                jobs.append((job_id, partition_message_id(partition, f"memory-msg-{next(self._message_sequence)}")))
+                taken += 1
+        return jobs
+
+    async def dequeue_jobs(
+        self,
+        count: int,
+        block_ms: int | None = None,
+        partitions: dict[str, int] | None = None,
+    ) -> list[tuple[str, str]]:
+        """Waits up to `block_ms` for the first job, then drains up to the requested number of jobs
+        that are already queued without waiting.
+        """
+        if partitions is None:
+            partitions = {DEFAULT_JOB_PARTITION: count}
+        deadline = None if block_ms is None else monotonic() + block_ms / 1000
+        while True:
+            if jobs := self._take_jobs(partitions):
+                return jobs
+            if any(self._job_queues.get(partition) for partition in partitions):
+                # Only partitions asked for no jobs have some, end the wait with one of their jobs
+                return self._take_jobs(partitions, at_least_one=True)
+            wakeup = self._job_enqueued
+            try:
+                if deadline is None:
+                    await wakeup.wait()
+                else:
+                    await wait_for(wakeup.wait(), timeout=max(deadline - monotonic(), 0))
+            except AsyncTimeoutError:
+                return []
 
     async def ack_job(self, message_id: str) -> None:
         """No-op for MemoryStorage as it doesn't support persistent streams."""
         pass
 
+    async def ack_jobs(self, message_ids: list[str]) -> None:
+        """No-op for MemoryStorage as it doesn't support persistent streams."""
+        pass
+
     async def quarantine_job(self, job_id: str) -> None:
         async with self._lock:
             self._quarantine_queue.append(job_id)
@@ -193,6 +504,8 @@ class MemoryStorage(StorageBackend):
             self._workers.pop(worker_id, None)
             self._worker_ttls.pop(worker_id, None)
             self._worker_task_queues.pop(worker_id, None)
+            self._worker_index.remove(worker_id)
+            self._publish_worker_event("removed", worker_id)
 
     async def increment_key_with_ttl(self, key: str, ttl: int) -> int:
         async with self._lock:
@@ -233,28 +546,44 @@ class MemoryStorage(StorageBackend):
             self._jobs.clear()
             self._workers.clear()
             self._worker_ttls.clear()
+            self._worker_index.clear()
             self._worker_task_queues.clear()
-            while not self._job_queue.empty():
-                try:
-                    self._job_queue.get_nowait()
-                except QueueEmpty:
-                    break
+            self._resource_classes.clear()
+            self._worker_stats.clear()
+            self._in_flight_tasks.clear()
+            self._job_queues.clear()
             self._quarantine_queue.clear()
             self._watched_jobs.clear()
+            self._active_branches.clear()
+            self._branch_results.clear()
+            self._task_workers.clear()
             self._client_configs.clear()
             self._quotas.clear()
             self._generic_keys.clear()
             self._generic_key_ttls.clear()
             self._locks.clear()
+            self._instances.clear()
 
     async def get_job_queue_length(self) -> int:
-        return self._job_queue.qsize()
+        return sum(len(queue) for queue in self._job_queues.values())
+
+    async def get_job_partitions(self) -> list[str]:
+        return [DEFAULT_JOB_PARTITION, *sorted(partition for partition in self._job_queues if partition)]
+
+    async def get_job_queue_lengths(self, partitions: list[str]) -> dict[str, int]:
+        return {partition: len(self._job_queues.get(partition, ())) for partition in partitions}
 
     async def get_active_worker_count(self) -> int:
         async with self._lock:
             await self._clean_expired()
             return len(self._workers)
 
+    async def prune_expired_workers(self) -> int:
+        async with self._lock:
+            count_before = len(self._workers)
+            await self._clean_expired()
+            return count_before - len(self._workers)
+
     async def set_nx_ttl(self, key: str, value: str, ttl: int) -> bool:
         async with self._lock:
             await self._clean_expired()
@@ -329,3 +658,23 @@ class MemoryStorage(StorageBackend):
                     del self._locks[key]
                     return True
             return False
+
+    async def extend_lock(self, key: str, holder_id: str, ttl: int) -> bool:
+        async with self._lock:
+            now = monotonic()
+            current_lock = self._locks.get(key)
+            if not current_lock or current_lock[0] != holder_id or current_lock[1] <= now:
+                return False
+            self._locks[key] = (holder_id, now + ttl)
+            return True
+
+    async def refresh_instance(self, instance_id: str, ttl: int) -> list[str]:
+        async with self._lock:
+            now = monotonic()
+            self._instances[instance_id] = now + ttl
+            self._instances = {key: expiry for key, expiry in self._instances.items() if expiry > now}
+            return list(self._instances)
+
+    async def remove_instance(self, instance_id: str) -> None:
+        async with self._lock:
+            self._instances.pop(instance_id, None)
@@ -1,17 +1,67 @@
-from asyncio import CancelledError, get_running_loop
+from asyncio import CancelledError
+from collections import OrderedDict, defaultdict
+from collections.abc import Awaitable, Callable, Collection
 from logging import getLogger
+from math import ceil
 from os import getenv
 from socket import gethostname
-from typing import Any
+from time import time
+from typing import Any, AsyncIterator
 
 from msgpack import packb, unpackb
 from redis import Redis, WatchError
-from redis.exceptions import NoScriptError, ResponseError
-
-from .base import StorageBackend
+from redis.exceptions import ResponseError
+
+from ..worker_stats import STATS_EWMA_ALPHA, STATS_WINDOW, record_task_outcome
+from .base import (
+    DEFAULT_JOB_PARTITION,
+    MONOTONIC_CLOCK_LIMIT,
+    SHARD_COUNT,
+    StorageBackend,
+    message_partition,
+    partition_message_id,
+    shard_of,
+    to_wall_clock,
+)
+from .redis_connections import TrackedKeyCache
+from .redis_scripts import ScriptRegistry
 
 logger = getLogger(__name__)
 
+WORKER_INFO_PREFIX = "orchestrator:worker:info"
+# Sorted set of worker_id -> wall-clock expiry time, mirrors the TTL of the info keys.
+WORKER_EXPIRY_KEY = "orchestrator:worker:expiry"
+WORKER_TASK_INDEX_PREFIX = "orchestrator:worker:index:task"
+WORKER_STATUS_INDEX_PREFIX = "orchestrator:worker:index:status"
+# Per-worker set of the index keys the worker is a member of, used to clean up after expiry.
+WORKER_MEMBERSHIP_PREFIX = "orchestrator:worker:indexes"
+# Pub/sub channel announcing worker registry changes to all orchestrator instances.
+WORKER_EVENTS_CHANNEL = "orchestrator:worker:events"
+TASK_EVENTS_CHANNEL = "orchestrator:task_events"
+# Pub/sub channel announcing "{shard}:{deadline}", the earliest deadline of entries added to a shard
+WATCH_EVENTS_CHANNEL = "orchestrator:watch_events"
+# One sorted set of entry -> deadline per shard, "{WATCHED_JOBS_KEY}:{shard}". Before sharding, this key held all.
+WATCHED_JOBS_KEY = "orchestrator:watched_jobs"
+# Sorted set of instance_id -> wall-clock time the orchestrator instance counts as alive until
+INSTANCES_KEY = "orchestrator:instances"
+# Workers updated in one WATCH/MULTI transaction by update_workers_data, and how often a conflicting batch is retried
+WORKER_UPDATE_BATCH_SIZE = 100
+WORKER_UPDATE_ATTEMPTS = 3
+# Hash of class_id -> msgpack-encoded constraints of the shared task queues of a task type
+TASK_CLASSES_PREFIX = "orchestrator:task_classes"
+# Sorted set of task_id -> deadline of the tasks a worker has taken and not yet reported,
+# and a hash of task_id -> time taken of the same tasks
+WORKER_IN_FLIGHT_PREFIX = "orchestrator:worker:in_flight"
+WORKER_IN_FLIGHT_TAKEN_PREFIX = "orchestrator:worker:in_flight_taken"
+# Hash of task_type -> msgpack-encoded live task statistics per worker
+WORKER_STATS_PREFIX = "orchestrator:worker:stats"
+# Statistics of workers that stopped reporting results expire after this many seconds
+WORKER_STATS_TTL_SECONDS = 7 * 86400
+# Bookkeeping of the branches of parallel job steps expires this long after the last branch result
+BRANCH_STATE_TTL_SECONDS = 7 * 86400
+# "blob" stores each job as one msgpack string, "hash" as a hash with one msgpack value per top-level field.
+JOB_STATE_LAYOUTS = ("blob", "hash")
+
 
 class RedisStorage(StorageBackend):
     """Implementation of the state store based on Redis."""
@@ -23,18 +73,88 @@ class RedisStorage(StorageBackend):
         group_name: str = "orchestrator_group",
         consumer_name: str | None = None,
         min_idle_time_ms: int = 60000,
+        job_state_layout: str = "blob",
+        job_field_cache_size: int = 10000,
+        blocking_client: Redis | None = None,
+        key_cache: TrackedKeyCache | None = None,
     ):
+        if job_state_layout not in JOB_STATE_LAYOUTS:
+            raise ValueError(f"Unknown job state layout '{job_state_layout}', expected one of {JOB_STATE_LAYOUTS}")
         self._redis = redis_client
+        # Blocking reads and subscriptions hold a connection for long, they can use a separate pool
+        self._blocking_redis = blocking_client or redis_client
+        self._key_cache = key_cache
+        self._scripts = ScriptRegistry(redis_client)
         self._prefix = prefix
         self._stream_key = "orchestrator:job_stream"
         self._group_name = group_name
         self._consumer_name = consumer_name or getenv("INSTANCE_ID", gethostname())
-        self._group_created = False
+        # Job streams the consumer group is known to exist on
+        self._groups_created: set[str] = set()
+        # partition -> where the next XAUTOCLAIM continues the scan of the pending entries
+        self._reclaim_cursors: dict[str, str] = {}
         self._min_idle_time_ms = min_idle_time_ms
+        self._job_state_layout = job_state_layout
+        # With the hash layout: job_id -> {field: hash of its encoded value} as last read or written
+        # by this instance, used to write only the fields that changed. Bounded LRU.
+        self._job_field_hashes: OrderedDict[str, dict[str, int]] = OrderedDict()
+        self._job_field_cache_size = job_field_cache_size
 
     def _get_key(self, job_id: str) -> str:
         return f"{self._prefix}:{job_id}"
 
+    async def _run_script(self, name: str, keys: list[str], args: list[Any], fallback: Callable[[], Awaitable[Any]]):
+        """Runs a registered script, or the non-atomic `fallback` when the server has no scripting
+        (e.g. fakeredis without Lua in tests).
+        """
+        try:
+            return await self._scripts.run(name, keys, args)
+        except ResponseError as e:
+            if "unknown command" not in str(e).lower():
+                raise
+            return await fallback()
+
+    async def initialize(self) -> None:
+        """Loads the Lua scripts once, so that their first use does not have to, and moves entries
+        watched before the timeout tracking list was sharded into their shards.
+        """
+        try:
+            await self._scripts.load()
+        except ResponseError as e:
+            if "unknown command" not in str(e).lower():
+                raise
+            logger.warning("Redis does not support scripting (likely fakeredis), compound operations are not atomic.")
+
+        legacy_entries = await self._redis.zrange(WATCHED_JOBS_KEY, 0, -1, withscores=True)
+        if legacy_entries:
+            # Versions before the shards may also have scored the entries on the monotonic clock
+            watched = {entry.decode("utf-8"): to_wall_clock(deadline) for entry, deadline in legacy_entries}
+            async with self._redis.pipeline(transaction=True) as pipe:
+                self._queue_watch(pipe, watched)
+                pipe.delete(WATCHED_JOBS_KEY)
+                await pipe.execute()
+            logger.info(f"Moved {len(legacy_entries)} watched jobs into the sharded timeout tracking list.")
+
+    @staticmethod
+    def _watch_key(shard: int) -> str:
+        return f"{WATCHED_JOBS_KEY}:{shard}"
+
+    def _queue_watch(self, pipe: Any, watched_jobs: dict[str, float]) -> None:
+        """Queues adding entries to the sorted sets of their shards and announcing the deadlines."""
+        by_shard: dict[int, dict[str, float]] = defaultdict(dict)
+        for job_id, timeout_at in watched_jobs.items():
+            by_shard[shard_of(job_id)][job_id] = timeout_at
+        for shard, entries in by_shard.items():
+            pipe.zadd(self._watch_key(shard), entries)
+            pipe.publish(WATCH_EVENTS_CHANNEL, f"{shard}:{min(entries.values())}")
+
+    def _queue_unwatch(self, pipe: Any, job_ids: list[str]) -> None:
+        by_shard: dict[int, list[str]] = defaultdict(list)
+        for job_id in job_ids:
+            by_shard[shard_of(job_id)].append(job_id)
+        for shard, entries in by_shard.items():
+            pipe.zrem(self._watch_key(shard), *entries)
+
     @staticmethod
     def _pack(data: Any) -> bytes:
         return packb(data, use_bin_type=True)
@@ -43,11 +163,191 @@ class RedisStorage(StorageBackend):
     def _unpack(data: bytes) -> Any:
         return unpackb(data, raw=False)
 
+    @staticmethod
+    def _worker_index_keys(worker_info: dict[str, Any]) -> set[str]:
+        """Returns the registry index keys a worker belongs to based on its info."""
+        status = worker_info.get("status") or "idle"
+        keys = {f"{WORKER_STATUS_INDEX_PREFIX}:{status}"}
+        keys.update(f"{WORKER_TASK_INDEX_PREFIX}:{task}" for task in worker_info.get("supported_tasks") or [])
+        return keys
+
+    @staticmethod
+    def _queue_reindex(pipe: Any, worker_id: str, old_keys: set[str], new_keys: set[str]) -> None:
+        """Queues the commands that move a worker between index sets on a MULTI pipeline."""
+        membership_key = f"{WORKER_MEMBERSHIP_PREFIX}:{worker_id}"
+        for key in old_keys - new_keys:
+            pipe.srem(key, worker_id)
+        for key in new_keys:
+            pipe.sadd(key, worker_id)
+        pipe.delete(membership_key)
+        if new_keys:
+            pipe.sadd(membership_key, *new_keys)
+
+    def _queue_worker_event(
+        self,
+        pipe: Any,
+        event: str,
+        worker_id: str,
+        worker_info: dict[str, Any] | None = None,
+    ) -> None:
+        """Queues a PUBLISH of a worker registry change on a pipeline."""
+        message: dict[str, Any] = {"event": event, "worker_id": worker_id}
+        if worker_info is not None:
+            message["info"] = worker_info
+        pipe.publish(WORKER_EVENTS_CHANNEL, self._pack(message))
+
+    async def subscribe_worker_events(self) -> AsyncIterator[dict[str, Any]]:
+        """Listens to the worker events channel using a dedicated pub/sub connection."""
+        pubsub = self._blocking_redis.pubsub()
+        await pubsub.subscribe(WORKER_EVENTS_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield self._unpack(message["data"])
+        finally:
+            await pubsub.unsubscribe(WORKER_EVENTS_CHANNEL)
+            await pubsub.aclose()
+
+    async def subscribe_task_events(self) -> AsyncIterator[str]:
+        """Listens to the task events channel using a dedicated pub/sub connection."""
+        pubsub = self._blocking_redis.pubsub()
+        await pubsub.subscribe(TASK_EVENTS_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["data"].decode("utf-8")
+        finally:
+            await pubsub.unsubscribe(TASK_EVENTS_CHANNEL)
+            await pubsub.aclose()
+
+    async def subscribe_watch_events(self) -> AsyncIterator[tuple[int, float]]:
+        """Listens to the watch events channel using a dedicated pub/sub connection."""
+        pubsub = self._blocking_redis.pubsub()
+        await pubsub.subscribe(WATCH_EVENTS_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    shard, _, deadline = message["data"].decode("utf-8").partition(":")
+                    yield int(shard), float(deadline)
+        finally:
+            await pubsub.unsubscribe(WATCH_EVENTS_CHANNEL)
+            await pubsub.aclose()
+
+    async def _write_worker_indexes(
+        self,
+        worker_id: str,
+        new_keys: set[str],
+        queue_writes: Callable[[Any], None],
+    ) -> None:
+        """Runs the writes queued by `queue_writes` and moves the worker between the index sets in one
+        transaction. The membership set is watched, so a concurrent register or deregister of the same
+        worker makes the transaction retry with the fresh membership instead of leaving stale indexes.
+        """
+        membership_key = f"{WORKER_MEMBERSHIP_PREFIX}:{worker_id}"
+        while True:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                try:
+                    await pipe.watch(membership_key)
+                    members = await pipe.smembers(membership_key)  # type: ignore[misc]
+                    pipe.multi()
+                    queue_writes(pipe)
+                    self._queue_reindex(pipe, worker_id, {m.decode("utf-8") for m in members}, new_keys)
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def _remember_job_fields(self, job_id: str, field_hashes: dict[str, int]) -> None:
+        self._job_field_hashes[job_id] = field_hashes
+        self._job_field_hashes.move_to_end(job_id)
+        while len(self._job_field_hashes) > self._job_field_cache_size:
+            self._job_field_hashes.popitem(last=False)
+
+    def _decode_job_hash(self, job_id: str, fields: dict[bytes, bytes]) -> dict[str, Any]:
+        self._remember_job_fields(job_id, {field.decode("utf-8"): hash(value) for field, value in fields.items()})
+        return {field.decode("utf-8"): self._unpack(value) for field, value in fields.items()}
+
     async def get_job_state(self, job_id: str) -> dict[str, Any] | None:
-        """Get the job state from Redis."""
+        """Get the job state from Redis.
+        Jobs written with the other layout (e.g. before the layout was switched) are read as well.
+        """
         key = self._get_key(job_id)
-        data = await self._redis.get(key)
-        return self._unpack(data) if data else None
+        read_hash = self._job_state_layout == "hash"
+        try:
+            if read_hash:
+                fields = await self._redis.hgetall(key)  # type: ignore[misc]
+                return self._decode_job_hash(job_id, fields) if fields else None
+            data = await self._redis.get(key)
+            return self._unpack(data) if data else None
+        except ResponseError as e:
+            if "WRONGTYPE" not in str(e):
+                raise
+        if read_hash:
+            data = await self._redis.get(key)
+            return self._unpack(data) if data else None
+        fields = await self._redis.hgetall(key)  # type: ignore[misc]
+        return self._decode_job_hash(job_id, fields) if fields else None
+
+    async def iter_job_ids(self) -> AsyncIterator[str]:
+        """Finds the job states with SCAN, skipping the per-job bookkeeping keys stored under the same prefix."""
+        prefix = f"{self._prefix}:"
+        async for key in self._redis.scan_iter(match=f"{prefix}*", count=1000):
+            job_id = (key.decode("utf-8") if isinstance(key, bytes) else key).removeprefix(prefix)
+            if not job_id.endswith((":active_branches", ":branch_results", ":task_workers")):
+                yield job_id
+
+    async def get_job_states(self, job_ids: list[str]) -> dict[str, dict[str, Any]]:
+        """Reads the states of several jobs in one pipeline.
+        Jobs stored with the other layout are read again one by one.
+        """
+        if not job_ids:
+            return {}
+        read_hash = self._job_state_layout == "hash"
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                if read_hash:
+                    pipe.hgetall(self._get_key(job_id))
+                else:
+                    pipe.get(self._get_key(job_id))
+            replies = await pipe.execute(raise_on_error=False)
+
+        states = {}
+        for job_id, reply in zip(job_ids, replies, strict=True):
+            if isinstance(reply, ResponseError):
+                if "WRONGTYPE" not in str(reply):
+                    raise reply
+                state = await self.get_job_state(job_id)
+            elif not reply:
+                state = None
+            else:
+                state = self._decode_job_hash(job_id, reply) if read_hash else self._unpack(reply)
+            if state is not None:
+                states[job_id] = state
+        return states
+
+    async def get_job_fields(self, job_id: str, fields: list[str]) -> dict[str, Any] | None:
+        """Get selected top-level fields of the job state.
+        With the hash layout only the requested fields are transferred.
+        """
+        if self._job_state_layout != "hash":
+            return await super().get_job_fields(job_id, fields)
+
+        key = self._get_key(job_id)
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.exists(key)
+        pipe.hmget(key, fields)
+        try:
+            exists, values = await pipe.execute()
+        except ResponseError as e:
+            if "WRONGTYPE" not in str(e):
+                raise
+            return await super().get_job_fields(job_id, fields)
+        if not exists:
+            return None
+        return {
+            field: self._unpack(value) if value is not None else None
+            for field, value in zip(fields, values, strict=True)
+        }
 
     async def get_priority_queue_stats(self, task_type: str) -> dict[str, Any]:
         """Gets statistics for the priority queue (Sorted Set) for a given task type."""
@@ -83,25 +383,122 @@ class RedisStorage(StorageBackend):
         key = f"orchestrator:task_cancel:{task_id}"
         await self._redis.set(key, "1", ex=3600)
 
+    def _queue_job_state_write(self, pipe: Any, job_id: str, state: dict[str, Any]) -> dict[str, int] | None:
+        """Queues the commands that store a job state.
+
+        With the hash layout only the fields that differ from the last known
+        contents are written. If the previous contents are unknown to this
+        instance, the whole hash is rewritten. Returns the field hashes to
+        remember once the commands have been executed.
+        """
+        key = self._get_key(job_id)
+        if self._job_state_layout == "blob":
+            pipe.set(key, self._pack(state))
+            return None
+
+        encoded = {field: self._pack(value) for field, value in state.items()}
+        field_hashes = {field: hash(value) for field, value in encoded.items()}
+        known_hashes = self._job_field_hashes.get(job_id)
+        if known_hashes is None:
+            # Also replaces a job that was stored with the blob layout
+            pipe.delete(key)
+            if encoded:
+                pipe.hset(key, mapping=encoded)
+        else:
+            changed = {
+                field: value for field, value in encoded.items() if known_hashes.get(field) != field_hashes[field]
+            }
+            removed = [field for field in known_hashes if field not in encoded]
+            if changed:
+                pipe.hset(key, mapping=changed)
+            if removed:
+                pipe.hdel(key, *removed)
+        return field_hashes
+
     async def save_job_state(self, job_id: str, state: dict[str, Any]) -> None:
         """Save the job state to Redis."""
-        key = self._get_key(job_id)
-        await self._redis.set(key, self._pack(state))
+        async with self._redis.pipeline(transaction=True) as pipe:
+            field_hashes = self._queue_job_state_write(pipe, job_id, state)
+            await pipe.execute()
+        if field_hashes is not None:
+            self._remember_job_fields(job_id, field_hashes)
+
+    async def commit_job_writes(
+        self,
+        job_states: dict[str, dict[str, Any]],
+        enqueued_jobs: list[tuple[str, str]],
+        watched_jobs: dict[str, float],
+        unwatched_jobs: list[str],
+        worker_tasks: list[tuple[str, dict[str, Any], float]],
+        quarantined_jobs: list[str],
+        task_workers: dict[str, dict[str, str | None]] | None = None,
+    ) -> None:
+        """Applies the writes of a job unit of work in a single MULTI/EXEC transaction."""
+        written_fields = {}
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for job_id, state in job_states.items():
+                written_fields[job_id] = self._queue_job_state_write(pipe, job_id, state)
+            self._queue_unwatch(pipe, unwatched_jobs)
+            self._queue_watch(pipe, watched_jobs)
+            for worker_id, task_payload, priority in worker_tasks:
+                pipe.zadd(f"orchestrator:task_queue:{worker_id}", {self._pack(task_payload): priority})
+            for worker_id in dict.fromkeys(worker_id for worker_id, _, _ in worker_tasks):
+                pipe.publish(TASK_EVENTS_CHANNEL, worker_id)
+            for job_id, partition in enqueued_jobs:
+                pipe.xadd(self._job_stream_key(partition), {"job_id": job_id})
+            for job_id in quarantined_jobs:
+                pipe.lpush("orchestrator:quarantine_queue", job_id)
+            for job_id, workers in (task_workers or {}).items():
+                self._queue_task_workers(pipe, job_id, workers)
+            await pipe.execute()
+        for job_id, field_hashes in written_fields.items():
+            if field_hashes is not None:
+                self._remember_job_fields(job_id, field_hashes)
 
     async def update_job_state(
         self,
         job_id: str,
         update_data: dict[str, Any],
     ) -> dict[Any, Any] | None | Any:
-        """Atomically update the job state in Redis using a transaction."""
+        """Atomically update the job state in Redis using a transaction.
+        Returns None, without writing anything, if the job does not exist.
+        """
         key = self._get_key(job_id)
 
+        if self._job_state_layout == "hash":
+            # Fields are stored separately, so the update is a plain HSET instead of rewriting the state.
+            # The key is watched, so that a job deleted meanwhile is not recreated with only these fields.
+            encoded = {field: self._pack(value) for field, value in update_data.items()}
+            try:
+                async with self._redis.pipeline(transaction=True) as pipe:
+                    while True:
+                        try:
+                            await pipe.watch(key)
+                            if not await pipe.exists(key):
+                                await pipe.unwatch()
+                                return None
+                            pipe.multi()
+                            if encoded:
+                                pipe.hset(key, mapping=encoded)
+                            pipe.hgetall(key)
+                            fields = (await pipe.execute())[-1]
+                            return self._decode_job_hash(job_id, fields)
+                        except WatchError:
+                            continue
+            except ResponseError as e:
+                # A job stored with the blob layout, fall back to the read-modify-write loop
+                if "WRONGTYPE" not in str(e):
+                    raise
+
         async with self._redis.pipeline(transaction=True) as pipe:
             while True:
                 try:
                     await pipe.watch(key)
                     current_state_raw = await pipe.get(key)
-                    current_state = self._unpack(current_state_raw) if current_state_raw else {}
+                    if not current_state_raw:
+                        await pipe.unwatch()
+                        return None
+                    current_state = self._unpack(current_state_raw)
 
                     # Simple dictionary merge. For nested structures, a deep merge may be required.
                     current_state.update(update_data)
@@ -119,10 +516,16 @@ class RedisStorage(StorageBackend):
         worker_info: dict[str, Any],
         ttl: int,
     ) -> None:
-        """Registers a worker in Redis."""
+        """Registers a worker in Redis and adds it to the registry indexes."""
         worker_info.setdefault("reputation", 1.0)
-        key = f"orchestrator:worker:info:{worker_id}"
-        await self._redis.set(key, self._pack(worker_info), ex=ttl)
+        key = f"{WORKER_INFO_PREFIX}:{worker_id}"
+
+        def queue_writes(pipe: Any) -> None:
+            pipe.set(key, self._pack(worker_info), ex=ttl)
+            pipe.zadd(WORKER_EXPIRY_KEY, {worker_id: time() + ttl})
+            self._queue_worker_event(pipe, "updated", worker_id, worker_info)
+
+        await self._write_worker_indexes(worker_id, self._worker_index_keys(worker_info), queue_writes)
 
     async def enqueue_task_for_worker(
         self,
@@ -130,9 +533,11 @@ class RedisStorage(StorageBackend):
         task_payload: dict[str, Any],
         priority: float,
     ) -> None:
-        """Adds a task to the priority queue (Sorted Set) for a worker."""
-        key = f"orchestrator:task_queue:{worker_id}"
-        await self._redis.zadd(key, {self._pack(task_payload): priority})
+        """Adds a task to the priority queue (Sorted Set) for a worker and announces it on the task events channel."""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(f"orchestrator:task_queue:{worker_id}", {self._pack(task_payload): priority})
+            pipe.publish(TASK_EVENTS_CHANNEL, worker_id)
+            await pipe.execute()
 
     async def dequeue_task_for_worker(
         self,
@@ -145,7 +550,7 @@ class RedisStorage(StorageBackend):
         key = f"orchestrator:task_queue:{worker_id}"
         try:
             # BZPOPMAX returns a tuple (key, member, score)
-            result = await self._redis.bzpopmax([key], timeout=timeout)
+            result = await self._blocking_redis.bzpopmax([key], timeout=timeout)
             return self._unpack(result[1]) if result else None
         except CancelledError:
             return None
@@ -157,16 +562,104 @@ class RedisStorage(StorageBackend):
                     "Falling back to non-blocking ZPOPMAX for testing.",
                 )
                 # Non-blocking fallback for tests
-                res = await self._redis.zpopmax(key)
+                res = await self._redis.zpopmax(key, 1)
                 if res:
                     return self._unpack(res[0][0])
             raise e
 
+    async def dequeue_task_from_queues(
+        self,
+        queue_names: list[str],
+        timeout: int | None,
+    ) -> tuple[str, dict[str, Any], float] | None:
+        """Takes a task with ZPOPMAX from each queue in turn, or with a BZPOPMAX over all of them
+        when waiting. BZPOPMAX serves the first non-empty key, so the order of the queues is kept.
+        """
+        keys = [f"orchestrator:task_queue:{queue_name}" for queue_name in queue_names]
+        if timeout is None:
+            for queue_name, key in zip(queue_names, keys, strict=True):
+                # With a count the reply is a list of pairs in both RESP2 and RESP3
+                if popped := await self._redis.zpopmax(key, 1):
+                    member, priority = popped[0]
+                    return queue_name, self._unpack(member), priority
+            return None
+
+        try:
+            result = await self._blocking_redis.bzpopmax(keys, timeout=timeout)
+        except CancelledError:
+            return None
+        except ResponseError as e:
+            if "unknown command" not in str(e).lower() and "wrong number of arguments" not in str(e).lower():
+                raise e
+            logger.warning("BZPOPMAX is not supported (likely running with fakeredis), falling back to ZPOPMAX.")
+            return await self.dequeue_task_from_queues(queue_names, None)
+        if not result:
+            return None
+        key, member, priority = result
+        queue_name = queue_names[keys.index(key.decode("utf-8"))]
+        return queue_name, self._unpack(member), priority
+
+    async def dequeue_tasks_from_queues(
+        self,
+        queue_names: list[str],
+        count: int,
+    ) -> list[tuple[str, dict[str, Any], float]]:
+        """Takes tasks with ZPOPMAX and a count, so each queue is drained in one atomic command."""
+        tasks = []
+        for queue_name in queue_names:
+            if len(tasks) >= count:
+                break
+            popped = await self._redis.zpopmax(f"orchestrator:task_queue:{queue_name}", count - len(tasks))
+            tasks.extend((queue_name, self._unpack(member), priority) for member, priority in popped)
+        return tasks
+
+    async def dequeue_task_of_types(
+        self,
+        queue_name: str,
+        task_types: Collection[str],
+    ) -> tuple[str, dict[str, Any], float] | None:
+        """Peeks at the highest priority task and removes it in a WATCH/MULTI transaction,
+        so a task of another type is never taken out of the queue.
+        """
+        key = f"orchestrator:task_queue:{queue_name}"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    head = await pipe.zrange(key, -1, -1, withscores=True)
+                    task = self._unpack(head[0][0]) if head else None
+                    if task is None or task.get("type") not in task_types:
+                        await pipe.unwatch()
+                        return None
+                    pipe.multi()
+                    pipe.zrem(key, head[0][0])
+                    await pipe.execute()
+                    return queue_name, task, head[0][1]
+                except WatchError:
+                    continue
+
+    async def register_resource_class(self, task_type: str, class_id: str, constraints: dict[str, Any]) -> None:
+        await self._redis.hset(f"{TASK_CLASSES_PREFIX}:{task_type}", class_id, self._pack(constraints))
+
+    async def get_resource_classes(self, task_types: list[str]) -> dict[str, dict[str, dict[str, Any]]]:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for task_type in task_types:
+                pipe.hgetall(f"{TASK_CLASSES_PREFIX}:{task_type}")
+            replies = await pipe.execute()
+        return {
+            task_type: {class_id.decode("utf-8"): self._unpack(raw) for class_id, raw in reply.items()}
+            for task_type, reply in zip(task_types, replies, strict=True)
+        }
+
     async def refresh_worker_ttl(self, worker_id: str, ttl: int) -> bool:
         """Updates the TTL for a worker key using the EXPIRE command."""
-        key = f"orchestrator:worker:info:{worker_id}"
-        # EXPIRE returns 1 if the TTL was set, and 0 if the key does not exist.
-        was_set = await self._redis.expire(key, ttl)  # type: ignore[misc]
+        key = f"{WORKER_INFO_PREFIX}:{worker_id}"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.expire(key, ttl)
+            # XX: only move the expiry of workers that are already in the registry.
+            pipe.zadd(WORKER_EXPIRY_KEY, {worker_id: time() + ttl}, xx=True)
+            # EXPIRE returns 1 if the TTL was set, and 0 if the key does not exist.
+            was_set, _ = await pipe.execute()
         return bool(was_set)
 
     async def update_worker_status(
@@ -175,7 +668,7 @@ class RedisStorage(StorageBackend):
         status_update: dict[str, Any],
         ttl: int,
     ) -> dict[str, Any] | None:
-        key = f"orchestrator:worker:info:{worker_id}"
+        key = f"{WORKER_INFO_PREFIX}:{worker_id}"
         async with self._redis.pipeline(transaction=True) as pipe:
             try:
                 await pipe.watch(key)
@@ -194,12 +687,22 @@ class RedisStorage(StorageBackend):
                 # Only write to Redis if the state has actually changed.
                 if new_state != current_state:
                     pipe.set(key, self._pack(new_state), ex=ttl)
-                    current_state = new_state  # Update the state to be returned
+                    self._queue_worker_event(pipe, "updated", worker_id, new_state)
                 else:
                     # If nothing changed, just refresh the TTL to keep the worker alive.
                     pipe.expire(key, ttl)
+                pipe.zadd(WORKER_EXPIRY_KEY, {worker_id: time() + ttl})
+                # Re-applying the indexes on every heartbeat also heals workers
+                # that were registered before the indexes existed.
+                self._queue_reindex(
+                    pipe,
+                    worker_id,
+                    self._worker_index_keys(current_state),
+                    self._worker_index_keys(new_state),
+                )
 
                 await pipe.execute()
+                current_state = new_state  # Update the state to be returned
                 return current_state
             except WatchError:
                 # In case of a conflict, the operation can be repeated,
@@ -211,7 +714,7 @@ class RedisStorage(StorageBackend):
         worker_id: str,
         update_data: dict[str, Any],
     ) -> dict[str, Any] | None:
-        key = f"orchestrator:worker:info:{worker_id}"
+        key = f"{WORKER_INFO_PREFIX}:{worker_id}"
         async with self._redis.pipeline(transaction=True) as pipe:
             try:
                 await pipe.watch(key)
@@ -220,11 +723,16 @@ class RedisStorage(StorageBackend):
                     return None
 
                 current_state = self._unpack(current_state_raw)
+                old_index_keys = self._worker_index_keys(current_state)
                 current_state.update(update_data)
+                new_index_keys = self._worker_index_keys(current_state)
 
                 pipe.multi()
                 # Do not set TTL, as this is a data update, not a heartbeat
-                pipe.set(key, self._pack(current_state))
+                pipe.set(key, self._pack(current_state), keepttl=True)
+                if new_index_keys != old_index_keys:
+                    self._queue_reindex(pipe, worker_id, old_index_keys, new_index_keys)
+                self._queue_worker_event(pipe, "updated", worker_id, current_state)
                 await pipe.execute()
                 return current_state
             except WatchError:
@@ -235,111 +743,544 @@ class RedisStorage(StorageBackend):
                 # In this case, it is better to repeat, as updating the reputation is important
                 return await self.update_worker_data(worker_id, update_data)
 
-    async def get_available_workers(self) -> list[dict[str, Any]]:
-        """Gets a list of active workers by scanning keys in Redis."""
-        worker_keys = [key async for key in self._redis.scan_iter("orchestrator:worker:info:*")]  # type: ignore[attr-defined]
+    async def update_workers_data(self, updates: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+        """Updates workers in transactions of up to WORKER_UPDATE_BATCH_SIZE workers.
+        A batch that conflicts with a concurrent worker update is retried a few times and then skipped.
+        """
+        updated: dict[str, dict[str, Any]] = {}
+        worker_ids = list(updates)
+        for i in range(0, len(worker_ids), WORKER_UPDATE_BATCH_SIZE):
+            batch = {worker_id: updates[worker_id] for worker_id in worker_ids[i : i + WORKER_UPDATE_BATCH_SIZE]}
+            for _ in range(WORKER_UPDATE_ATTEMPTS):
+                try:
+                    updated.update(await self._update_workers_batch(batch))
+                    break
+                except WatchError:
+                    logger.warning(f"WatchError during batch update of {len(batch)} workers, retrying.")
+            else:
+                logger.warning(f"Skipped the update of {len(batch)} workers after repeated conflicts.")
+        return updated
+
+    async def _update_workers_batch(self, updates: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+        keys = [f"{WORKER_INFO_PREFIX}:{worker_id}" for worker_id in updates]
+        async with self._redis.pipeline(transaction=True) as pipe:
+            await pipe.watch(*keys)
+            current_states_raw = await pipe.mget(keys)
+
+            pipe.multi()
+            updated = {}
+            for (worker_id, update_data), key, current_state_raw in zip(
+                updates.items(), keys, current_states_raw, strict=True
+            ):
+                if not current_state_raw:
+                    continue
+                current_state = self._unpack(current_state_raw)
+                old_index_keys = self._worker_index_keys(current_state)
+                current_state.update(update_data)
+                new_index_keys = self._worker_index_keys(current_state)
+
+                pipe.set(key, self._pack(current_state), keepttl=True)
+                if new_index_keys != old_index_keys:
+                    self._queue_reindex(pipe, worker_id, old_index_keys, new_index_keys)
+                self._queue_worker_event(pipe, "updated", worker_id, current_state)
+                updated[worker_id] = current_state
+            if updated:
+                await pipe.execute()
+            return updated
+
+    async def mark_task_in_flight(self, worker_id: str, task_id: str, ttl: int) -> None:
+        """Each task is dropped at its own deadline, so tasks with a long timeout are not dropped by
+        the expiry of shorter ones, e.g. when a result never arrives.
+        """
+        keys = [f"{WORKER_IN_FLIGHT_PREFIX}:{worker_id}", f"{WORKER_IN_FLIGHT_TAKEN_PREFIX}:{worker_id}"]
+        now = time()
+
+        async def mark() -> None:
+            deadlines_key, taken_key = keys
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.zadd(deadlines_key, {task_id: now + ttl})
+                pipe.hset(taken_key, task_id, now)
+                pipe.zrangebyscore(deadlines_key, "-inf", now)
+                pipe.zrange(deadlines_key, -1, -1, withscores=True)
+                _, _, expired, last = await pipe.execute()
+            async with self._redis.pipeline(transaction=True) as pipe:
+                if expired:
+                    pipe.zrem(deadlines_key, *expired)
+                    pipe.hdel(taken_key, *expired)
+                for key in keys:
+                    pipe.expire(key, max(1, ceil(last[0][1] - now)))
+                await pipe.execute()
+
+        await self._run_script("mark_task_in_flight", keys, [task_id, now, ttl], mark)
 
-        if not worker_keys:
+    async def clear_task_in_flight(self, worker_id: str, task_id: str) -> float | None:
+        return (await self.clear_tasks_in_flight(worker_id, [task_id]))[task_id]
+
+    async def clear_tasks_in_flight(self, worker_id: str, task_ids: list[str]) -> dict[str, float | None]:
+        if not task_ids:
+            return {}
+        taken_key = f"{WORKER_IN_FLIGHT_TAKEN_PREFIX}:{worker_id}"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zmscore(f"{WORKER_IN_FLIGHT_PREFIX}:{worker_id}", task_ids)
+            pipe.hmget(taken_key, task_ids)
+            pipe.zrem(f"{WORKER_IN_FLIGHT_PREFIX}:{worker_id}", *task_ids)
+            pipe.hdel(taken_key, *task_ids)
+            deadlines, taken_at, _, _ = await pipe.execute()
+        now = time()
+        return {
+            task_id: None if deadline is None or taken is None else now - float(taken)
+            for task_id, deadline, taken in zip(task_ids, deadlines, taken_at, strict=True)
+        }
+
+    async def get_worker_loads(self, worker_ids: list[str]) -> dict[str, dict[str, int]]:
+        """Reads the queue length and the in-flight tasks of all workers in one pipeline."""
+        if not worker_ids:
+            return {}
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for worker_id in worker_ids:
+                pipe.zcard(f"orchestrator:task_queue:{worker_id}")
+                pipe.zcard(f"{WORKER_IN_FLIGHT_PREFIX}:{worker_id}")
+            replies = await pipe.execute()
+        return {
+            worker_id: {"queued": queued, "in_flight": in_flight}
+            for worker_id, queued, in_flight in zip(worker_ids, replies[::2], replies[1::2], strict=True)
+        }
+
+    async def record_task_stats(
+        self,
+        worker_id: str,
+        task_type: str,
+        duration_ms: float,
+        success: bool,
+        ewma_alpha: float = STATS_EWMA_ALPHA,
+        window: int = STATS_WINDOW,
+    ) -> None:
+        """Updates the statistics hash field of the task type in a WATCH/MULTI transaction.
+        The statistics are best-effort: an update that keeps conflicting with results
+        of the same worker reported concurrently is dropped.
+        """
+        key = f"{WORKER_STATS_PREFIX}:{worker_id}"
+        for _ in range(WORKER_UPDATE_ATTEMPTS):
+            async with self._redis.pipeline(transaction=True) as pipe:
+                try:
+                    await pipe.watch(key)
+                    stats_raw = await pipe.hget(key, task_type)
+                    stats = record_task_outcome(
+                        self._unpack(stats_raw) if stats_raw else None, duration_ms, success, ewma_alpha, window
+                    )
+                    pipe.multi()
+                    pipe.hset(key, task_type, self._pack(stats))
+                    pipe.expire(key, WORKER_STATS_TTL_SECONDS)
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+        logger.warning(f"Dropped a task statistics update for worker {worker_id} after repeated conflicts.")
+
+    async def get_workers_stats(
+        self,
+        worker_ids: list[str],
+        task_type: str | None = None,
+    ) -> dict[str, dict[str, dict[str, Any]]]:
+        if not worker_ids:
+            return {}
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for worker_id in worker_ids:
+                key = f"{WORKER_STATS_PREFIX}:{worker_id}"
+                if task_type is None:
+                    pipe.hgetall(key)
+                else:
+                    pipe.hget(key, task_type)
+            replies = await pipe.execute()
+
+        result = {}
+        for worker_id, reply in zip(worker_ids, replies, strict=True):
+            if not reply:
+                continue
+            if task_type is None:
+                result[worker_id] = {field.decode("utf-8"): self._unpack(raw) for field, raw in reply.items()}
+            else:
+                result[worker_id] = {task_type: self._unpack(reply)}
+        return result
+
+    async def get_available_workers(
+        self,
+        task_type: str | None = None,
+        status: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """Gets a list of active workers from the registry indexes.
+        Without filters, all workers with a future expiry are returned.
+        Index entries whose info key has already expired are purged on the fly.
+        """
+        if task_type is None and status is None:
+            worker_ids_raw = await self._redis.zrangebyscore(WORKER_EXPIRY_KEY, time(), "+inf")
+        else:
+            index_keys = []
+            if task_type is not None:
+                index_keys.append(f"{WORKER_TASK_INDEX_PREFIX}:{task_type}")
+            if status is not None:
+                index_keys.append(f"{WORKER_STATUS_INDEX_PREFIX}:{status}")
+            worker_ids_raw = await self._redis.sinter(index_keys)  # type: ignore[misc]
+
+        if not worker_ids_raw:
             return []
 
-        worker_data_list = await self._redis.mget(worker_keys)
-        return [self._unpack(data) for data in worker_data_list if data]
+        worker_ids = [worker_id.decode("utf-8") for worker_id in worker_ids_raw]
+        worker_data_list = await self._redis.mget([f"{WORKER_INFO_PREFIX}:{worker_id}" for worker_id in worker_ids])
+
+        workers = []
+        expired_ids = []
+        for worker_id, data in zip(worker_ids, worker_data_list, strict=True):
+            if data:
+                workers.append(self._unpack(data))
+            else:
+                expired_ids.append(worker_id)
+        if expired_ids:
+            await self._purge_workers(expired_ids)
+        return workers
+
+    async def _purge_workers(self, worker_ids: list[str]) -> int:
+        """Removes workers whose info key no longer exists from all registry indexes.
+        The info keys are watched so that a worker re-registering concurrently is left intact.
+        """
+        info_keys = [f"{WORKER_INFO_PREFIX}:{worker_id}" for worker_id in worker_ids]
+        async with self._redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(*info_keys)
+                infos = await pipe.mget(info_keys)
+                dead_ids = [worker_id for worker_id, info in zip(worker_ids, infos, strict=True) if info is None]
+                if not dead_ids:
+                    await pipe.unwatch()
+                    return 0
+
+                membership_keys = [f"{WORKER_MEMBERSHIP_PREFIX}:{worker_id}" for worker_id in dead_ids]
+                await pipe.watch(*info_keys, *membership_keys)
+                memberships = [await pipe.smembers(key) for key in membership_keys]  # type: ignore[misc]
+
+                pipe.multi()
+                for worker_id, members in zip(dead_ids, memberships, strict=True):
+                    old_keys = {m.decode("utf-8") for m in members}
+                    self._queue_reindex(pipe, worker_id, old_keys, set())
+                    self._queue_worker_event(pipe, "removed", worker_id)
+                pipe.zrem(WORKER_EXPIRY_KEY, *dead_ids)
+                await pipe.execute()
+                return len(dead_ids)
+            except WatchError:
+                # A worker changed under us; the next pruning pass will pick it up.
+                return 0
+
+    async def prune_expired_workers(self) -> int:
+        """Purges workers whose expiry time has passed from the registry indexes."""
+        expired_raw = await self._redis.zrangebyscore(WORKER_EXPIRY_KEY, "-inf", time())
+        if not expired_raw:
+            return 0
+        return await self._purge_workers([worker_id.decode("utf-8") for worker_id in expired_raw])
 
     async def add_job_to_watch(self, job_id: str, timeout_at: float) -> None:
-        """Adds a job to a Redis sorted set.
+        """Adds a job to the Redis sorted set of its shard.
         The score is the timeout time.
         """
-        await self._redis.zadd("orchestrator:watched_jobs", {job_id: timeout_at})
+        async with self._redis.pipeline(transaction=False) as pipe:
+            self._queue_watch(pipe, {job_id: timeout_at})
+            await pipe.execute()
 
     async def remove_job_from_watch(self, job_id: str) -> None:
         """Removes a job from the sorted set for tracking."""
-        await self._redis.zrem("orchestrator:watched_jobs", job_id)
-
-    async def get_timed_out_jobs(self) -> list[str]:
-        """Finds and removes overdue jobs from the sorted set."""
-        now = get_running_loop().time()
-        # Find all jobs with a timeout up to the current moment
-        timed_out_ids = await self._redis.zrangebyscore(
-            "orchestrator:watched_jobs",
-            0,
-            now,
+        await self._redis.zrem(self._watch_key(shard_of(job_id)), job_id)
+
+    async def get_timed_out_jobs(
+        self,
+        limit: int | None = None,
+        shards: Collection[int] | None = None,
+    ) -> list[str]:
+        """Finds and removes overdue jobs from the sorted sets of the shards, earliest first.
+        Deadlines an earlier version wrote on the monotonic clock are moved to wall-clock time first,
+        and are never taken as overdue before that.
+        """
+        keys = [self._watch_key(shard) for shard in (range(SHARD_COUNT) if shards is None else sorted(shards))]
+        if not keys:
+            return []
+        await self._rebase_monotonic_deadlines(keys)
+        now = time()
+
+        async def pop_due() -> list[bytes]:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    if limit:
+                        pipe.zrangebyscore(key, MONOTONIC_CLOCK_LIMIT, now, start=0, num=limit, withscores=True)
+                    else:
+                        pipe.zrangebyscore(key, MONOTONIC_CLOCK_LIMIT, now, withscores=True)
+                replies = await pipe.execute()
+            due = [
+                (deadline, job_id, key)
+                for key, members in zip(keys, replies, strict=True)
+                for job_id, deadline in members
+            ]
+            due = sorted(due, key=lambda item: item[0])[:limit]
+            if due:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    for _, job_id, key in due:
+                        pipe.zrem(key, job_id)
+                    await pipe.execute()
+            return [job_id for _, job_id, _ in due]
+
+        # Finding and removing the jobs in one script keeps two instances from both taking a job
+        timed_out_ids = await self._run_script(
+            "pop_due_members", keys, [MONOTONIC_CLOCK_LIMIT, now, limit or 0], pop_due
         )
+        return [job_id.decode("utf-8") for job_id in timed_out_ids]
+
+    async def _rebase_monotonic_deadlines(self, keys: list[str]) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.zrangebyscore(key, "-inf", f"({MONOTONIC_CLOCK_LIMIT}", withscores=True)
+            replies = await pipe.execute()
+        if not any(replies):
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key, entries in zip(keys, replies, strict=True):
+                if entries:
+                    # XX: an entry taken or removed in the meantime is not added back
+                    pipe.zadd(key, {entry: to_wall_clock(deadline) for entry, deadline in entries}, xx=True)
+            await pipe.execute()
+        logger.info(f"Moved {sum(map(len, replies))} watch deadlines from the monotonic clock to wall-clock time.")
+
+    async def get_next_watch_deadline(self, shards: Collection[int] | None = None) -> float | None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for shard in range(SHARD_COUNT) if shards is None else shards:
+                pipe.zrange(self._watch_key(shard), 0, 0, withscores=True)
+            replies = await pipe.execute()
+        return min((earliest[0][1] for earliest in replies if earliest), default=None)
+
+    def _branch_keys(self, job_id: str) -> list[str]:
+        return [f"{self._prefix}:{job_id}:active_branches", f"{self._prefix}:{job_id}:branch_results"]
+
+    async def start_parallel_branches(self, job_id: str, task_ids: list[str]) -> None:
+        active_key, results_key = self._branch_keys(job_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(active_key, results_key)
+            if task_ids:
+                pipe.sadd(active_key, *task_ids)
+                pipe.expire(active_key, BRANCH_STATE_TTL_SECONDS)
+            await pipe.execute()
+
+    def _task_workers_key(self, job_id: str) -> str:
+        return f"{self._prefix}:{job_id}:task_workers"
+
+    def _queue_task_workers(self, pipe: Any, job_id: str, workers: dict[str, str | None]) -> None:
+        key = self._task_workers_key(job_id)
+        if claimed := {task_id: worker_id for task_id, worker_id in workers.items() if worker_id is not None}:
+            pipe.hset(key, mapping=claimed)
+            pipe.expire(key, BRANCH_STATE_TTL_SECONDS)
+        if released := [task_id for task_id, worker_id in workers.items() if worker_id is None]:
+            pipe.hdel(key, *released)
+
+    async def set_task_worker(self, job_id: str, task_id: str, worker_id: str | None) -> None:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            self._queue_task_workers(pipe, job_id, {task_id: worker_id})
+            await pipe.execute()
 
-        if timed_out_ids:
-            # Atomically remove the found IDs
-            await self._redis.zrem("orchestrator:watched_jobs", *timed_out_ids)  # type: ignore[arg-type]
-            return [job_id.decode("utf-8") for job_id in timed_out_ids]
+    async def get_task_worker(self, job_id: str, task_id: str) -> str | None:
+        worker_id = await self._redis.hget(self._task_workers_key(job_id), task_id)  # type: ignore[misc]
+        return worker_id.decode("utf-8") if isinstance(worker_id, bytes) else worker_id
 
-        return []
+    async def record_branch_result(
+        self,
+        job_id: str,
+        task_id: str,
+        result: dict[str, Any],
+        active_branches: list[str],
+    ) -> tuple[int, dict[str, Any] | None]:
+        keys = self._branch_keys(job_id)
+        packed = self._pack(result)
+
+        async def record() -> Any:
+            active_key, results_key = keys
+            if active_branches and not await self._redis.exists(active_key, results_key):
+                await self._redis.sadd(active_key, *active_branches)
+                await self._redis.expire(active_key, BRANCH_STATE_TTL_SECONDS)
+            if not await self._redis.srem(active_key, task_id):
+                return -1
+            await self._redis.hset(results_key, task_id, packed)
+            await self._redis.expire(results_key, BRANCH_STATE_TTL_SECONDS)
+            remaining = await self._redis.scard(active_key)
+            return remaining or await self._redis.hgetall(results_key)
+
+        reply = await self._run_script(
+            "record_branch_result", keys, [task_id, packed, BRANCH_STATE_TTL_SECONDS, *active_branches], record
+        )
+        if isinstance(reply, int):
+            return reply, None
+        # HGETALL is a flat list of fields and values from a script, a dict from the client
+        pairs = reply.items() if isinstance(reply, dict) else zip(reply[::2], reply[1::2], strict=True)
+        return 0, {field.decode("utf-8"): self._unpack(value) for field, value in pairs}
+
+    def _job_stream_key(self, partition: str) -> str:
+        """Each partition is a stream of its own, which may live in its own Redis Cluster slot."""
+        return f"{self._stream_key}:{partition}" if partition else self._stream_key
 
-    async def enqueue_job(self, job_id: str) -> None:
-        """Adds a job to the Redis stream."""
-        await self._redis.xadd(self._stream_key, {"job_id": job_id})
+    async def enqueue_job(self, job_id: str, partition: str = DEFAULT_JOB_PARTITION) -> None:
+        """Adds a job to the Redis stream of its partition."""
+        await self._redis.xadd(self._job_stream_key(partition), {"job_id": job_id})
 
     async def dequeue_job(self) -> tuple[str, str] | None:
         """Retrieves a job from the Redis stream using consumer groups.
         Implements a recovery strategy: checks for pending messages first.
         """
-        if not self._group_created:
+        jobs = await self.dequeue_jobs(1)
+        return jobs[0] if jobs else None
+
+    @staticmethod
+    def _stream_reply_items(reply: Any) -> list[tuple[str, list]]:
+        """Returns the (stream, messages) pairs of an XREADGROUP reply: a list of
+        [stream, messages] pairs with RESP2, a dict of stream -> [messages] with RESP3.
+        """
+        if isinstance(reply, dict):
+            return [(stream.decode("utf-8"), messages[0]) for stream, messages in reply.items()]
+        return [(stream.decode("utf-8"), messages) for stream, messages in reply]
+
+    @staticmethod
+    def _decode_stream_messages(messages: list, partition: str = DEFAULT_JOB_PARTITION) -> list[tuple[str, str]]:
+        """Converts raw stream entries into (job_id, message_id) tuples, skipping deleted entries."""
+        return [
+            (data[b"job_id"].decode("utf-8"), partition_message_id(partition, message_id.decode("utf-8")))
+            for message_id, data in messages
+            if data
+        ]
+
+    def _decode_stream_reply(self, reply: Any, partitions_by_stream: dict[str, str]) -> list[tuple[str, str]]:
+        jobs = []
+        for stream, messages in self._stream_reply_items(reply):
+            jobs.extend(self._decode_stream_messages(messages, partitions_by_stream[stream]))
+        return jobs
+
+    async def _ensure_job_groups(self, stream_keys: list[str]) -> None:
+        for stream_key in stream_keys:
+            if stream_key in self._groups_created:
+                continue
             try:
-                await self._redis.xgroup_create(self._stream_key, self._group_name, id="0", mkstream=True)
+                await self._redis.xgroup_create(stream_key, self._group_name, id="0", mkstream=True)
             except ResponseError as e:
                 if "BUSYGROUP" not in str(e):
                     raise e
-            self._group_created = True
+            self._groups_created.add(stream_key)
 
-        try:
-            try:
-                autoclaim_result = await self._redis.xautoclaim(
-                    self._stream_key,
+    async def _reclaim_pending_jobs(self, partitions: dict[str, int]) -> list[tuple[str, str]]:
+        """Claims the messages of crashed consumers that stayed pending for too long, for all partitions
+        in one round trip. Without XAUTOCLAIM, the own pending messages of this consumer are read again.
+
+        Each call continues the scan of the pending entries where the previous one stopped, and starts
+        over once it reached the end, so a long pending list is not scanned from the start every time.
+        Partitions planned no slots are not reclaimed from, their pending jobs wait for a round that plans some.
+        """
+        partitions = {partition: count for partition, count in partitions.items() if count > 0}
+        if not partitions:
+            return []
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for partition, count in partitions.items():
+                pipe.xautoclaim(
+                    self._job_stream_key(partition),
                     self._group_name,
                     self._consumer_name,
                     min_idle_time=self._min_idle_time_ms,
-                    start_id="0-0",
-                    count=1,
+                    start_id=self._reclaim_cursors.get(partition, "0-0"),
+                    count=count,
                 )
-                if autoclaim_result and autoclaim_result[1]:
-                    messages = autoclaim_result[1]
-                    message_id, data = messages[0]
-                    if data:
-                        job_id = data[b"job_id"].decode("utf-8")
-                        logger.info(f"Reclaimed pending message {message_id} for consumer {self._consumer_name}")
-                        return job_id, message_id.decode("utf-8")
-            except Exception as e:
-                if "unknown command" in str(e).lower() or isinstance(e, ResponseError):
-                    pending_result = await self._redis.xreadgroup(
-                        self._group_name,
-                        self._consumer_name,
-                        {self._stream_key: "0"},
-                        count=1,
-                    )
-                    if pending_result:
-                        stream_name, messages = pending_result[0]
-                        if messages:
-                            message_id, data = messages[0]
-                            job_id = data[b"job_id"].decode("utf-8")
-                            return job_id, message_id.decode("utf-8")
-                else:
-                    raise e
+            replies = await pipe.execute(raise_on_error=False)
+
+        jobs = []
+        for (partition, count), reply in zip(partitions.items(), replies, strict=True):
+            if isinstance(reply, Exception):
+                if not ("unknown command" in str(reply).lower() or isinstance(reply, ResponseError)):
+                    raise reply
+                pending_result = await self._redis.xreadgroup(
+                    self._group_name,
+                    self._consumer_name,
+                    {self._job_stream_key(partition): "0"},
+                    count=count,
+                )
+                if pending_result:
+                    jobs.extend(self._decode_stream_messages(self._stream_reply_items(pending_result)[0][1], partition))
+            elif reply:
+                self._reclaim_cursors[partition] = reply[0].decode("utf-8")
+                reclaimed = self._decode_stream_messages(reply[1], partition)
+                if reclaimed:
+                    logger.info(f"Reclaimed {len(reclaimed)} pending message(s) for consumer {self._consumer_name}")
+                    jobs.extend(reclaimed)
+        return jobs
+
+    async def dequeue_jobs(
+        self,
+        count: int,
+        block_ms: int | None = None,
+        partitions: dict[str, int] | None = None,
+    ) -> list[tuple[str, str]]:
+        """Retrieves up to `count` jobs from the Redis stream in a single round-trip.
+        Pending messages of crashed consumers are reclaimed first; otherwise new
+        messages are read with XREADGROUP, blocking for up to `block_ms`.
+
+        With several partitions, their streams are read with one non-blocking XREADGROUP each,
+        in one pipeline, and only when all are empty does a single XREADGROUP block on all of them.
+        """
+        if partitions is None:
+            partitions = {DEFAULT_JOB_PARTITION: count}
+        partitions_by_stream = {self._job_stream_key(partition): partition for partition in partitions}
+        await self._ensure_job_groups(list(partitions_by_stream))
 
-            result = await self._redis.xreadgroup(
+        try:
+            jobs = await self._reclaim_pending_jobs(partitions)
+            if jobs:
+                return jobs
+
+            if len(partitions) > 1:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    for partition, partition_count in partitions.items():
+                        if partition_count > 0:
+                            pipe.xreadgroup(
+                                self._group_name,
+                                self._consumer_name,
+                                {self._job_stream_key(partition): ">"},
+                                count=partition_count,
+                            )
+                    replies = await pipe.execute()
+                for reply in replies:
+                    if reply:
+                        jobs.extend(self._decode_stream_reply(reply, partitions_by_stream))
+                if jobs:
+                    return jobs
+
+            result = await self._blocking_redis.xreadgroup(
                 self._group_name,
                 self._consumer_name,
-                {self._stream_key: ">"},
-                count=1,
+                dict.fromkeys(partitions_by_stream, ">"),
+                count=max(partitions.values()) if len(partitions) == 1 else 1,
+                block=block_ms,
             )
             if result:
-                stream_name, messages = result[0]
-                message_id, data = messages[0]
-                job_id = data[b"job_id"].decode("utf-8")
-                return job_id, message_id.decode("utf-8")
-            return None
+                return self._decode_stream_reply(result, partitions_by_stream)
+            return []
         except CancelledError:
-            return None
+            return []
 
     async def ack_job(self, message_id: str) -> None:
         """Acknowledges a message in the Redis stream."""
-        await self._redis.xack(self._stream_key, self._group_name, message_id)
+        await self.ack_jobs([message_id])
+
+    async def ack_jobs(self, message_ids: list[str]) -> None:
+        """Acknowledges several messages with a single multi-ID XACK per partition."""
+        if not message_ids:
+            return
+        by_partition: dict[str, list[str]] = defaultdict(list)
+        for message_id in message_ids:
+            by_partition[message_partition(message_id)].append(message_id.rpartition("/")[2])
+        if len(by_partition) == 1:
+            partition, stream_ids = next(iter(by_partition.items()))
+            await self._redis.xack(self._job_stream_key(partition), self._group_name, *stream_ids)
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for partition, stream_ids in by_partition.items():
+                pipe.xack(self._job_stream_key(partition), self._group_name, *stream_ids)
+            await pipe.execute()
 
     async def quarantine_job(self, job_id: str) -> None:
         """Moves the job ID to the 'quarantine' list in Redis."""
@@ -351,20 +1292,29 @@ class RedisStorage(StorageBackend):
         return [job.decode("utf-8") for job in jobs_bytes]
 
     async def deregister_worker(self, worker_id: str) -> None:
-        """Deletes the worker key from Redis."""
-        key = f"orchestrator:worker:info:{worker_id}"
-        await self._redis.delete(key)
+        """Deletes the worker key from Redis and removes it from the registry indexes."""
+        key = f"{WORKER_INFO_PREFIX}:{worker_id}"
+
+        def queue_writes(pipe: Any) -> None:
+            pipe.delete(key)
+            pipe.zrem(WORKER_EXPIRY_KEY, worker_id)
+            self._queue_worker_event(pipe, "removed", worker_id)
+
+        await self._write_worker_indexes(worker_id, set(), queue_writes)
 
     async def increment_key_with_ttl(self, key: str, ttl: int) -> int:
-        """Atomically increments a counter and sets a TTL on the first call,
-        using a Lua script for atomicity.
+        """Atomically increments a counter and refreshes its TTL, using a Lua script for atomicity.
         Returns the new value of the counter.
         """
-        async with self._redis.pipeline(transaction=True) as pipe:
-            pipe.incr(key)
-            pipe.expire(key, ttl)
-            results = await pipe.execute()
-            return results[0]
+
+        async def increment() -> int:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.incr(key)
+                pipe.expire(key, ttl)
+                results = await pipe.execute()
+                return results[0]
+
+        return await self._run_script("increment_with_ttl", [key], [ttl], increment)
 
     async def save_client_config(self, token: str, config: dict[str, Any]) -> None:
         """Saves the static client configuration as a hash."""
@@ -372,15 +1322,23 @@ class RedisStorage(StorageBackend):
         # Convert all values to binary strings for storage in a Redis hash
         str_config = {k: self._pack(v) for k, v in config.items()}
         await self._redis.hset(key, mapping=str_config)
+        if self._key_cache:
+            self._key_cache.invalidate([key])
 
     async def get_client_config(self, token: str) -> dict[str, Any] | None:
         """Gets the static client configuration."""
         key = f"orchestrator:client_config:{token}"
-        config_raw = await self._redis.hgetall(key)  # type: ignore[misc]
-        if not config_raw:
-            return None
-        # Decode keys and values, parse binary
-        return {k.decode("utf-8"): self._unpack(v) for k, v in config_raw.items()}
+
+        async def load() -> dict[str, Any] | None:
+            config_raw = await self._redis.hgetall(key)  # type: ignore[misc]
+            if not config_raw:
+                return None
+            # Decode keys and values, parse binary
+            return {k.decode("utf-8"): self._unpack(v) for k, v in config_raw.items()}
+
+        if self._key_cache:
+            return await self._key_cache.get(key, load)
+        return await load()
 
     async def initialize_client_quota(self, token: str, quota: int) -> None:
         """Sets or resets the quota counter."""
@@ -391,40 +1349,15 @@ class RedisStorage(StorageBackend):
         """Atomically checks and decrements the quota. Returns True if successful."""
         key = f"orchestrator:quota:{token}"
 
-        LUA_SCRIPT = """
-        local current = redis.call('GET', KEYS[1])
-        if current and tonumber(current) > 0 then
-            redis.call('DECR', KEYS[1])
-            return 1
-        else
+        async def decrement() -> int:
+            # Not atomic, only used without server-side scripting
+            current_val = await self._redis.get(key)
+            if current_val and int(current_val) > 0:
+                await self._redis.decr(key)
+                return 1
             return 0
-        end
-        """
-
-        try:
-            # This is the most efficient path for a real Redis server.
-            # It loads the script once and then executes it by its SHA hash.
-            sha = await self._redis.script_load(LUA_SCRIPT)
-            result = await self._redis.evalsha(sha, 1, key)
-        except NoScriptError:
-            # If the script is not in the cache, Redis raises NoScriptError.
-            # We can then fall back to executing the full script.
-            result = await self._redis.eval(LUA_SCRIPT, 1, key)
-        except ResponseError as e:
-            # This is the fallback path for `fakeredis` used in tests, which
-            # does not support `SCRIPT LOAD` or `EVALSHA`. It raises a
-            # ResponseError: "unknown command `script`".
-            if "unknown command" in str(e):
-                # We resort to a non-atomic GET/DECR for testing purposes.
-                # This is not safe for production but allows tests to pass.
-                current_val = await self._redis.get(key)
-                if current_val and int(current_val) > 0:
-                    await self._redis.decr(key)
-                    return True
-                return False
-            # If it's a different ResponseError, re-raise it.
-            raise
 
+        result = await self._run_script("decrement_quota", [key], [], decrement)
         return bool(result)
 
     async def flush_all(self):
@@ -434,17 +1367,142 @@ class RedisStorage(StorageBackend):
         """
         logger.warning("Flushing all data from Redis database.")
         await self._redis.flushdb()
+        self._job_field_hashes.clear()
+        if self._key_cache:
+            self._key_cache.invalidate()
+
+    async def close(self) -> None:
+        """Stops the client-side cache listener. The Redis clients belong to the caller."""
+        if self._key_cache:
+            await self._key_cache.close()
 
     async def get_job_queue_length(self) -> int:
-        """Returns the length of the job stream."""
-        return await self._redis.xlen(self._stream_key)
+        """Returns the total length of the job streams of all partitions."""
+        return sum((await self.get_job_queue_lengths(await self.get_job_partitions())).values())
+
+    async def get_job_partitions(self) -> list[str]:
+        """Finds the streams of the partitions with SCAN, the default partition is always listed."""
+        prefix = f"{self._stream_key}:"
+        partitions = set()
+        async for key in self._redis.scan_iter(match=f"{prefix}*", count=1000, _type="stream"):
+            partitions.add((key.decode("utf-8") if isinstance(key, bytes) else key).removeprefix(prefix))
+        return [DEFAULT_JOB_PARTITION, *sorted(partitions)]
+
+    async def get_job_queue_lengths(self, partitions: list[str]) -> dict[str, int]:
+        """Returns the length of the stream of each partition."""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for partition in partitions:
+                pipe.xlen(self._job_stream_key(partition))
+            lengths = await pipe.execute()
+        return dict(zip(partitions, lengths, strict=True))
+
+    def _job_group_info(self, groups: Any) -> dict[str, Any] | None:
+        """Picks the consumer group of the job queue out of an XINFO GROUPS reply, None for a stream
+        that does not exist or was not read yet.
+        """
+        if isinstance(groups, Exception):
+            return None
+        for group in groups:
+            name = group["name"]
+            if (name.decode("utf-8") if isinstance(name, bytes) else name) == self._group_name:
+                return group
+        return None
+
+    async def get_job_queue_stats(self, partitions: list[str]) -> dict[str, dict[str, int]]:
+        """Returns the length, pending entries and lag of the stream of each partition, in one round trip.
+        The lag is taken from the group when Redis reports it (7.0+), otherwise it is the length.
+        """
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for partition in partitions:
+                stream_key = self._job_stream_key(partition)
+                pipe.xlen(stream_key)
+                pipe.xinfo_groups(stream_key)
+            replies = await pipe.execute(raise_on_error=False)
+
+        stats = {}
+        for index, partition in enumerate(partitions):
+            length, groups = replies[2 * index], replies[2 * index + 1]
+            group = self._job_group_info(groups) or {}
+            lag = group.get("lag")
+            stats[partition] = {
+                "length": length,
+                "pending": group.get("pending", 0),
+                "lag": length if lag is None else lag,
+            }
+        return stats
+
+    async def trim_job_queues(self, partitions: list[str]) -> int:
+        """Trims the stream of each partition up to the oldest entry that is still pending or not yet
+        delivered to the consumer group (XTRIM MINID). The trim is approximate, so Redis only drops
+        whole nodes of the stream, which is cheap, and never an entry at or after that ID.
+        """
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for partition in partitions:
+                stream_key = self._job_stream_key(partition)
+                pipe.xinfo_groups(stream_key)
+                pipe.xpending(stream_key, self._group_name)
+            replies = await pipe.execute(raise_on_error=False)
+
+        min_ids = {}
+        for index, partition in enumerate(partitions):
+            group, pending = self._job_group_info(replies[2 * index]), replies[2 * index + 1]
+            # Nothing can be trimmed before the group has read the stream
+            if group is None or isinstance(pending, Exception):
+                continue
+            candidates = [group["last-delivered-id"]]
+            if pending["pending"]:
+                candidates.append(pending["min"])
+            min_ids[partition] = min((candidate.decode("utf-8") for candidate in candidates), key=self._stream_id)
+        if not min_ids:
+            return 0
+
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for partition, min_id in min_ids.items():
+                pipe.xtrim(self._job_stream_key(partition), minid=min_id, approximate=True)
+            trimmed = await pipe.execute()
+        return sum(trimmed)
+
+    @staticmethod
+    def _stream_id(stream_id: str) -> tuple[int, int]:
+        milliseconds, _, sequence = stream_id.partition("-")
+        return int(milliseconds), int(sequence or 0)
+
+    async def remove_dead_job_consumers(
+        self,
+        partitions: list[str],
+        live_consumers: Collection[str],
+        min_idle_ms: int,
+    ) -> list[str]:
+        """Deletes the consumers of the job streams that left without pending entries. A consumer that
+        still has some is kept, its entries are reclaimed by the others first (see `dequeue_jobs`).
+        """
+        keep = {*live_consumers, self._consumer_name}
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for partition in partitions:
+                pipe.xinfo_consumers(self._job_stream_key(partition), self._group_name)
+            replies = await pipe.execute(raise_on_error=False)
+
+        dead = []
+        for partition, consumers in zip(partitions, replies, strict=True):
+            if isinstance(consumers, Exception):
+                continue
+            for consumer in consumers:
+                name = consumer["name"]
+                name = name.decode("utf-8") if isinstance(name, bytes) else name
+                if name not in keep and not consumer["pending"] and consumer["idle"] >= min_idle_ms:
+                    dead.append((partition, name))
+        if not dead:
+            return []
+
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for partition, name in dead:
+                pipe.xgroup_delconsumer(self._job_stream_key(partition), self._group_name, name)
+            await pipe.execute()
+        return sorted({name for _, name in dead})
 
     async def get_active_worker_count(self) -> int:
-        """Returns the number of active worker keys."""
-        count = 0
-        async for _ in self._redis.scan_iter("orchestrator:worker:info:*"):
-            count += 1
-        return count
+        """Returns the number of workers with a future expiry in the registry."""
+        return await self._redis.zcount(WORKER_EXPIRY_KEY, time(), "+inf")
 
     async def set_nx_ttl(self, key: str, value: str, ttl: int) -> bool:
         """
@@ -467,16 +1525,24 @@ class RedisStorage(StorageBackend):
         """Stores the individual token for a specific worker."""
         key = f"orchestrator:worker:token:{worker_id}"
         await self._redis.set(key, token)
+        if self._key_cache:
+            self._key_cache.invalidate([key])
 
     async def get_worker_token(self, worker_id: str) -> str | None:
         """Retrieves the individual token for a specific worker."""
         key = f"orchestrator:worker:token:{worker_id}"
-        token = await self._redis.get(key)
-        return token.decode("utf-8") if token else None
+
+        async def load() -> str | None:
+            token = await self._redis.get(key)
+            return token.decode("utf-8") if token else None
+
+        if self._key_cache:
+            return await self._key_cache.get(key, load)
+        return await load()
 
     async def get_worker_info(self, worker_id: str) -> dict[str, Any] | None:
         """Gets the full info for a worker by its ID."""
-        key = f"orchestrator:worker:info:{worker_id}"
+        key = f"{WORKER_INFO_PREFIX}:{worker_id}"
         data = await self._redis.get(key)
         return self._unpack(data) if data else None
 
@@ -490,21 +1556,38 @@ class RedisStorage(StorageBackend):
         """Releases the lock using a Lua script to ensure ownership."""
         redis_key = f"orchestrator:lock:{key}"
 
-        LUA_RELEASE_SCRIPT = """
-        if redis.call("get", KEYS[1]) == ARGV[1] then
-            return redis.call("del", KEYS[1])
-        else
+        async def release() -> int:
+            # Not atomic, only used without server-side scripting
+            current_val = await self._redis.get(redis_key)
+            if current_val and current_val.decode("utf-8") == holder_id:
+                await self._redis.delete(redis_key)
+                return 1
             return 0
-        end
-        """
-        try:
-            result = await self._redis.eval(LUA_RELEASE_SCRIPT, 1, redis_key, holder_id)
-            return bool(result)
-        except ResponseError as e:
-            if "unknown command" in str(e):
-                current_val = await self._redis.get(redis_key)
-                if current_val and current_val.decode("utf-8") == holder_id:
-                    await self._redis.delete(redis_key)
-                    return True
-                return False
-            raise e
+
+        return bool(await self._run_script("release_lock", [redis_key], [holder_id], release))
+
+    async def extend_lock(self, key: str, holder_id: str, ttl: int) -> bool:
+        """Resets the expiry of the lock using a Lua script to ensure ownership."""
+        redis_key = f"orchestrator:lock:{key}"
+
+        async def extend() -> int:
+            # Not atomic, only used without server-side scripting
+            current_val = await self._redis.get(redis_key)
+            if current_val and current_val.decode("utf-8") == holder_id:
+                return int(await self._redis.expire(redis_key, ttl))
+            return 0
+
+        return bool(await self._run_script("extend_lock", [redis_key], [holder_id, ttl], extend))
+
+    async def refresh_instance(self, instance_id: str, ttl: int) -> list[str]:
+        """Renews the instance in a sorted set scored by expiry time and drops expired instances."""
+        now = time()
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(INSTANCES_KEY, {instance_id: now + ttl})
+            pipe.zremrangebyscore(INSTANCES_KEY, "-inf", now)
+            pipe.zrange(INSTANCES_KEY, 0, -1)
+            *_, instances = await pipe.execute()
+        return [instance.decode("utf-8") for instance in instances]
+
+    async def remove_instance(self, instance_id: str) -> None:
+        await self._redis.zrem(INSTANCES_KEY, instance_id)
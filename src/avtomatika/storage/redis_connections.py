@@ -0,0 +1,173 @@
+from asyncio import CancelledError, Task, create_task, get_running_loop, sleep
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from contextlib import suppress
+from logging import getLogger
+from typing import TYPE_CHECKING, Any
+
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.exceptions import ResponseError
+
+if TYPE_CHECKING:
+    from ..config import Config
+    from .redis import RedisStorage
+
+logger = getLogger(__name__)
+
+# Channel Redis publishes key invalidations on for clients with tracking redirected to them (RESP2)
+INVALIDATE_CHANNEL = b"__redis__:invalidate"
+# Read-mostly keys read by the auth middlewares on every request
+CACHED_KEY_PREFIXES = ("orchestrator:client_config:", "orchestrator:worker:token:")
+
+
+class TrackedKeyCache:
+    """Client-side cache of read-mostly keys, kept coherent by Redis server-assisted invalidation.
+
+    Tracking runs in broadcasting mode for a set of key prefixes: Redis announces every change of a
+    matching key on a pub/sub connection of the cache, and the entry is dropped. The cache is only
+    consulted while that connection is up; entries also expire after `ttl_seconds` so that a missed
+    invalidation cannot keep a value forever. The listener starts with the first read.
+
+    The async redis client has no built-in client-side caching, so the cache uses two dedicated
+    RESP2 connections of its own client: one receives the invalidations, the other enables tracking
+    redirected to the first.
+    """
+
+    def __init__(
+        self,
+        redis_client: Redis,
+        prefixes: tuple[str, ...] = CACHED_KEY_PREFIXES,
+        max_size: int = 10000,
+        ttl_seconds: float = 60.0,
+    ):
+        self._redis = redis_client
+        self._prefixes = prefixes
+        self._max_size = max_size
+        self._ttl_seconds = ttl_seconds
+        # key -> (expiry on the loop clock, value), bounded LRU
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        # Bumped by every invalidation, a read that overlaps one is not cached
+        self._epoch = 0
+        self._active = False
+        self._running = False
+        self._task: Task | None = None
+
+    async def get(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Returns the cached value of a key, or loads it with `loader` and caches it."""
+        if self._task is None:
+            self._task = create_task(self.run())
+        if not self._active:
+            return await loader()
+
+        now = get_running_loop().time()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        epoch = self._epoch
+        value = await loader()
+        if self._active and epoch == self._epoch:
+            self._entries[key] = (now + self._ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, keys: list[str] | None = None) -> None:
+        """Drops the given keys, or all entries when `keys` is None."""
+        self._epoch += 1
+        if keys is None:
+            self._entries.clear()
+            return
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def run(self):
+        """Keeps tracking enabled and applies the invalidations Redis sends."""
+        self._running = True
+        while self._running:
+            listener = tracker = None
+            try:
+                listener = await self._redis.connection_pool.get_connection()
+                tracker = await self._redis.connection_pool.get_connection()
+                await listener.send_command("CLIENT", "ID")
+                client_id = await listener.read_response()
+                await listener.send_command("SUBSCRIBE", INVALIDATE_CHANNEL)
+                await listener.read_response()
+                prefixes = [arg for prefix in self._prefixes for arg in ("PREFIX", prefix)]
+                await tracker.send_command("CLIENT", "TRACKING", "ON", "REDIRECT", client_id, "BCAST", *prefixes)
+                await tracker.read_response()
+                self._active = True
+                logger.info("Client-side caching of Redis keys enabled.")
+                while self._running:
+                    message = await listener.read_response(timeout=None)
+                    if isinstance(message, list) and len(message) == 3 and message[1] == INVALIDATE_CHANNEL:
+                        keys = message[2]
+                        self.invalidate(None if keys is None else [key.decode("utf-8") for key in keys])
+            except CancelledError:
+                break
+            except ResponseError as e:
+                logger.warning(f"Redis does not support client tracking ({e}), client-side caching is disabled.")
+                break
+            except Exception:
+                logger.exception("Lost the Redis invalidation connection, reconnecting.")
+                await sleep(1)
+            finally:
+                self._active = False
+                self.invalidate()
+                for connection in (listener, tracker):
+                    if connection is not None:
+                        # Tracking and subscriptions must not leak into pooled connections
+                        await connection.disconnect()
+                        await self._redis.connection_pool.release(connection)
+        self._running = False
+
+    async def close(self):
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(CancelledError):
+                await self._task
+            self._task = None
+
+
+def create_redis_clients(config: "Config") -> tuple[Redis, Redis]:
+    """Creates the client for request traffic and the client for blocking commands, each with
+    its own sized pool, so that long blocking reads cannot starve ordinary requests.
+    A request waits up to REDIS_POOL_TIMEOUT_SECONDS for a free connection instead of failing.
+    """
+    clients = []
+    for max_connections in (config.REDIS_MAX_CONNECTIONS, config.REDIS_BLOCKING_MAX_CONNECTIONS):
+        pool = BlockingConnectionPool(
+            host=config.REDIS_HOST,
+            port=config.REDIS_PORT,
+            db=config.REDIS_DB,
+            max_connections=max_connections,
+            timeout=config.REDIS_POOL_TIMEOUT_SECONDS,
+            health_check_interval=config.REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+            protocol=config.REDIS_PROTOCOL,
+        )
+        clients.append(Redis(connection_pool=pool))
+    return clients[0], clients[1]
+
+
+def create_redis_storage(config: "Config", **storage_options: Any) -> "RedisStorage":
+    """Creates a RedisStorage with pooled connections, the job state layout of REDIS_JOB_STATE_LAYOUT
+    and, if REDIS_CLIENT_CACHE_ENABLED is set, client-side caching of client configs and worker tokens.
+    """
+    from .redis import RedisStorage
+
+    redis_client, blocking_client = create_redis_clients(config)
+    key_cache = None
+    if config.REDIS_CLIENT_CACHE_ENABLED:
+        # Two connections: the invalidation listener and the connection that owns the tracking
+        cache_client = Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, db=config.REDIS_DB, max_connections=2)
+        key_cache = TrackedKeyCache(
+            cache_client,
+            max_size=config.REDIS_CLIENT_CACHE_SIZE,
+            ttl_seconds=config.REDIS_CLIENT_CACHE_TTL_SECONDS,
+        )
+    storage_options.setdefault("consumer_name", config.INSTANCE_ID)
+    storage_options.setdefault("job_state_layout", config.REDIS_JOB_STATE_LAYOUT)
+    return RedisStorage(redis_client, blocking_client=blocking_client, key_cache=key_cache, **storage_options)
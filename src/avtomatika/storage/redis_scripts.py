@@ -0,0 +1,148 @@
+from hashlib import sha1
+from logging import getLogger
+from typing import Any
+
+from redis import Redis
+from redis.exceptions import NoScriptError
+
+logger = getLogger(__name__)
+
+# KEYS[1] quota counter. Returns 1 if a unit of the quota was taken.
+DECREMENT_QUOTA = """
+local current = redis.call('GET', KEYS[1])
+if current and tonumber(current) > 0 then
+    redis.call('DECR', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+# KEYS[1] lock, ARGV[1] holder. Deletes the lock only if the holder owns it.
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS[1] counter, ARGV[1] ttl. Returns the incremented counter.
+INCREMENT_WITH_TTL = """
+local value = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return value
+"""
+
+# KEYS[1] lock, ARGV[1] holder, ARGV[2] ttl. Resets the expiry only if the holder owns the lock.
+EXTEND_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS sorted sets, ARGV[1] min score, ARGV[2] max score, ARGV[3] max count (0 for all).
+# Removes and returns the members of all sets due by then, earliest first.
+POP_DUE_MEMBERS = """
+local limit = tonumber(ARGV[3])
+local due = {}
+for _, key in ipairs(KEYS) do
+    local members
+    if limit > 0 then
+        members = redis.call('ZRANGEBYSCORE', key, ARGV[1], ARGV[2], 'WITHSCORES', 'LIMIT', 0, limit)
+    else
+        members = redis.call('ZRANGEBYSCORE', key, ARGV[1], ARGV[2], 'WITHSCORES')
+    end
+    for i = 1, #members, 2 do
+        due[#due + 1] = {members[i], tonumber(members[i + 1]), key}
+    end
+end
+table.sort(due, function(a, b) return a[2] < b[2] end)
+local count = #due
+if limit > 0 and limit < count then
+    count = limit
+end
+local taken = {}
+for i = 1, count do
+    redis.call('ZREM', due[i][3], due[i][1])
+    taken[i] = due[i][1]
+end
+return taken
+"""
+
+# KEYS[1] set of active branches, KEYS[2] hash of branch results; ARGV[1] branch, ARGV[2] packed result,
+# ARGV[3] ttl, ARGV[4..] active branches to start from when neither key exists (a step begun without them).
+# Returns -1 for an unknown or repeated branch, the number of branches left, or all results after the last.
+RECORD_BRANCH_RESULT = """
+if #ARGV > 3 and redis.call('EXISTS', KEYS[1]) == 0 and redis.call('EXISTS', KEYS[2]) == 0 then
+    redis.call('SADD', KEYS[1], unpack(ARGV, 4))
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+if redis.call('SREM', KEYS[1], ARGV[1]) == 0 then
+    return -1
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+local remaining = redis.call('SCARD', KEYS[1])
+if remaining > 0 then
+    return remaining
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+# KEYS[1] sorted set of in-flight deadlines, KEYS[2] hash of start times; ARGV[1] task, ARGV[2] now, ARGV[3] ttl.
+# Drops the tasks past their deadline, and keeps both keys until the last deadline.
+MARK_TASK_IN_FLIGHT = """
+local now = tonumber(ARGV[2])
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now)
+if #expired > 0 then
+    redis.call('ZREM', KEYS[1], unpack(expired))
+    redis.call('HDEL', KEYS[2], unpack(expired))
+end
+local last = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+local ttl = math.max(1, math.ceil(tonumber(last[2]) - now))
+redis.call('EXPIRE', KEYS[1], ttl)
+redis.call('EXPIRE', KEYS[2], ttl)
+return 1
+"""
+
+SCRIPTS = {
+    "decrement_quota": DECREMENT_QUOTA,
+    "release_lock": RELEASE_LOCK,
+    "extend_lock": EXTEND_LOCK,
+    "increment_with_ttl": INCREMENT_WITH_TTL,
+    "pop_due_members": POP_DUE_MEMBERS,
+    "record_branch_result": RECORD_BRANCH_RESULT,
+    "mark_task_in_flight": MARK_TASK_IN_FLIGHT,
+}
+
+
+class ScriptRegistry:
+    """The Lua scripts of the compound operations of RedisStorage, each one atomic round trip.
+
+    Scripts run with EVALSHA by the SHA1 of their source, computed locally, so running one never
+    costs an extra SCRIPT LOAD. All scripts are loaded once by `load`, and again whenever Redis
+    reports that it lost them (a restart, a failover or SCRIPT FLUSH).
+    """
+
+    def __init__(self, redis_client: Redis, scripts: dict[str, str] = SCRIPTS):
+        self._redis = redis_client
+        self._scripts = scripts
+        self._shas = {name: sha1(source.encode("utf-8")).hexdigest() for name, source in scripts.items()}
+
+    async def load(self) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for source in self._scripts.values():
+                pipe.script_load(source)
+            await pipe.execute()
+        logger.debug(f"Loaded {len(self._scripts)} Redis scripts.")
+
+    async def run(self, name: str, keys: list[str], args: list[Any]) -> Any:
+        sha = self._shas[name]
+        try:
+            return await self._redis.evalsha(sha, len(keys), *keys, *args)
+        except NoScriptError:
+            logger.info(f"Redis lost script '{name}', reloading all scripts.")
+            await self.load()
+            return await self._redis.evalsha(sha, len(keys), *keys, *args)
@@ -0,0 +1,136 @@
+from collections.abc import Awaitable, Callable
+from copy import deepcopy
+from typing import Any
+
+from .base import DEFAULT_JOB_PARTITION, StorageBackend
+
+
+class JobUnitOfWork:
+    """Collects the job writes made while handling one message and commits them together.
+
+    Exposes the write methods of `StorageBackend` that change job state and queues.
+    Calls are buffered instead of being sent to storage: repeated saves of the same
+    job are coalesced, so each state is serialized once, with its latest contents, on
+    `commit`. Everything else (reads, worker registry, etc.) is passed through to the
+    wrapped storage, so the unit of work can be used wherever a storage is expected.
+
+    A unit of work can wrap another one: its changes are then merged into the outer unit on
+    `commit`, and dropped with it when it is discarded.
+
+    Side effects outside the job writes (e.g. counters a repeated message must not change twice)
+    are registered with `after_commit` and run, in order, only once the outermost unit is committed.
+    """
+
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
+        self._reset()
+
+    def _reset(self) -> None:
+        self.job_states: dict[str, dict[str, Any]] = {}
+        self.enqueued_jobs: list[tuple[str, str]] = []
+        self.watched_jobs: dict[str, float] = {}
+        self.unwatched_jobs: list[str] = []
+        self.worker_tasks: list[tuple[str, dict[str, Any], float]] = []
+        self.quarantined_jobs: list[str] = []
+        self.task_workers: dict[str, dict[str, str | None]] = {}
+        self.after_commit_callbacks: list[Callable[[], Awaitable[None]]] = []
+        self._loaded_states: dict[str, dict[str, Any]] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.storage, name)
+
+    @property
+    def has_writes(self) -> bool:
+        return bool(
+            self.job_states
+            or self.enqueued_jobs
+            or self.watched_jobs
+            or self.unwatched_jobs
+            or self.worker_tasks
+            or self.quarantined_jobs
+            or self.task_workers
+        )
+
+    async def get_job_state(self, job_id: str) -> dict[str, Any] | None:
+        if job_id in self.job_states:
+            return self.job_states[job_id]
+        if job_id in self._loaded_states:
+            return self._loaded_states[job_id]
+        state = await self.storage.get_job_state(job_id)
+        if isinstance(self.storage, JobUnitOfWork) and state is not None:
+            # The outer unit of work hands out its own dicts, changes stay here until committed
+            state = self._loaded_states[job_id] = deepcopy(state)
+        return state
+
+    async def load_job_states(self, job_ids: list[str]) -> None:
+        """Reads the states of several jobs in one batch, `get_job_state` then serves them from memory."""
+        self._loaded_states.update(await self.storage.get_job_states(job_ids))
+
+    async def save_job_state(self, job_id: str, state: dict[str, Any]) -> None:
+        self.job_states[job_id] = state
+
+    async def enqueue_job(self, job_id: str, partition: str = DEFAULT_JOB_PARTITION) -> None:
+        self.enqueued_jobs.append((job_id, partition))
+
+    async def add_job_to_watch(self, job_id: str, timeout_at: float) -> None:
+        self.watched_jobs[job_id] = timeout_at
+
+    async def remove_job_from_watch(self, job_id: str) -> None:
+        self.watched_jobs.pop(job_id, None)
+        self.unwatched_jobs.append(job_id)
+
+    async def enqueue_task_for_worker(self, worker_id: str, task_payload: dict[str, Any], priority: float) -> None:
+        self.worker_tasks.append((worker_id, task_payload, priority))
+
+    async def quarantine_job(self, job_id: str) -> None:
+        self.quarantined_jobs.append(job_id)
+
+    async def set_task_worker(self, job_id: str, task_id: str, worker_id: str | None) -> None:
+        self.task_workers.setdefault(job_id, {})[task_id] = worker_id
+
+    def after_commit(self, callback: Callable[[], Awaitable[None]]) -> None:
+        """Registers a callback to run once the changes are written; it is dropped with them otherwise."""
+        self.after_commit_callbacks.append(callback)
+
+    async def commit_job_writes(
+        self,
+        job_states: dict[str, dict[str, Any]],
+        enqueued_jobs: list[tuple[str, str]],
+        watched_jobs: dict[str, float],
+        unwatched_jobs: list[str],
+        worker_tasks: list[tuple[str, dict[str, Any], float]],
+        quarantined_jobs: list[str],
+        task_workers: dict[str, dict[str, str | None]] | None = None,
+    ) -> None:
+        """Takes over the changes of a nested unit of work."""
+        self.job_states.update(job_states)
+        self.enqueued_jobs.extend(enqueued_jobs)
+        for job_id in unwatched_jobs:
+            await self.remove_job_from_watch(job_id)
+        self.watched_jobs.update(watched_jobs)
+        self.worker_tasks.extend(worker_tasks)
+        self.quarantined_jobs.extend(quarantined_jobs)
+        for job_id, workers in (task_workers or {}).items():
+            self.task_workers.setdefault(job_id, {}).update(workers)
+
+    async def commit(self) -> None:
+        """Writes all collected changes to storage in a single batch, then runs the `after_commit` callbacks."""
+        callbacks = self.after_commit_callbacks
+        if self.has_writes:
+            await self.storage.commit_job_writes(
+                job_states=self.job_states,
+                enqueued_jobs=self.enqueued_jobs,
+                watched_jobs=self.watched_jobs,
+                unwatched_jobs=self.unwatched_jobs,
+                worker_tasks=self.worker_tasks,
+                quarantined_jobs=self.quarantined_jobs,
+                task_workers=self.task_workers,
+            )
+            self._reset()
+        self.after_commit_callbacks = []
+        for callback in callbacks:
+            if isinstance(self.storage, JobUnitOfWork):
+                # Nested: the callbacks wait for the outer unit of work to be committed
+                self.storage.after_commit(callback)
+            else:
+                await callback()
@@ -0,0 +1,46 @@
+from typing import Any
+
+
+class WorkerIndex:
+    """In-process index of worker IDs by supported task type and by status.
+    Mirrors the worker registry indexes kept by RedisStorage.
+    """
+
+    def __init__(self):
+        # ("task", task_type) / ("status", status) -> worker IDs
+        self._indexes: dict[tuple[str, str], set[str]] = {}
+        self._membership: dict[str, set[tuple[str, str]]] = {}
+
+    def add(self, worker_id: str, worker_info: dict[str, Any]) -> None:
+        """Places a worker into the indexes matching its current info, replacing previous entries."""
+        self.remove(worker_id)
+        # Workers that do not report a status are treated as idle
+        index_keys = {("status", worker_info.get("status") or "idle")}
+        index_keys.update(("task", task) for task in worker_info.get("supported_tasks") or [])
+        for index_key in index_keys:
+            self._indexes.setdefault(index_key, set()).add(worker_id)
+        self._membership[worker_id] = index_keys
+
+    def remove(self, worker_id: str) -> None:
+        """Removes a worker from all indexes it belongs to."""
+        for index_key in self._membership.pop(worker_id, set()):
+            members = self._indexes.get(index_key)
+            if members is not None:
+                members.discard(worker_id)
+                if not members:
+                    del self._indexes[index_key]
+
+    def find(self, task_type: str | None = None, status: str | None = None) -> set[str]:
+        """Returns the IDs of indexed workers matching all given filters."""
+        index_sets = []
+        if task_type is not None:
+            index_sets.append(self._indexes.get(("task", task_type), set()))
+        if status is not None:
+            index_sets.append(self._indexes.get(("status", status), set()))
+        if not index_sets:
+            return set(self._membership)
+        return set.intersection(*index_sets)
+
+    def clear(self) -> None:
+        self._indexes.clear()
+        self._membership.clear()
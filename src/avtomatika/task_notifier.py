@@ -0,0 +1,78 @@
+from asyncio import CancelledError, Event, sleep
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from logging import getLogger
+
+from .storage.base import StorageBackend
+
+logger = getLogger(__name__)
+
+
+class TaskNotifier:
+    """Wakes up the requests and push loops on this orchestrator instance that wait for tasks.
+
+    A single subscription to the task events of the storage serves all waiting workers, so
+    waiting does not hold a storage connection per worker. A woken waiter takes its tasks
+    with a non-blocking pop, and waiters that lose the race simply wait again.
+    """
+
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
+        self._waiters: dict[str, set[Event]] = {}
+        # Called with the queue name of every event, or None when events may have been missed
+        self._listeners: list[Callable[[str | None], None]] = []
+        self._running = False
+
+    def add_listener(self, listener: Callable[[str | None], None]) -> None:
+        self._listeners.append(listener)
+
+    @contextmanager
+    def watch(self, queue_names: list[str]) -> Iterator[Event]:
+        """Returns an event that is set whenever a task is added to one of the queues.
+        The event should be obtained before checking the queues, so no task is missed in between.
+        """
+        event = Event()
+        for queue_name in queue_names:
+            self._waiters.setdefault(queue_name, set()).add(event)
+        try:
+            yield event
+        finally:
+            for queue_name in queue_names:
+                waiters = self._waiters.get(queue_name)
+                if waiters is not None:
+                    waiters.discard(event)
+                    if not waiters:
+                        del self._waiters[queue_name]
+
+    def notify(self, queue_name: str) -> None:
+        for event in self._waiters.get(queue_name, ()):
+            event.set()
+        for listener in self._listeners:
+            listener(queue_name)
+
+    def notify_all(self) -> None:
+        for waiters in self._waiters.values():
+            for event in waiters:
+                event.set()
+        for listener in self._listeners:
+            listener(None)
+
+    async def run(self):
+        """Listens for task events and wakes up the waiters of their queues."""
+        logger.info("TaskNotifier started.")
+        self._running = True
+        while self._running:
+            try:
+                async for queue_name in self.storage.subscribe_task_events():
+                    self.notify(queue_name)
+            except CancelledError:
+                break
+            except Exception:
+                logger.exception("Error in TaskNotifier event subscription, resubscribing.")
+                await sleep(1)
+            # Events may have been missed while the subscription was down
+            self.notify_all()
+        logger.info("TaskNotifier stopped.")
+
+    def stop(self):
+        self._running = False
@@ -1,16 +1,32 @@
-from asyncio import CancelledError, sleep
+from asyncio import CancelledError, Event, create_task, sleep, wait_for
+from asyncio import TimeoutError as AsyncTimeoutError
+from contextlib import suppress
 from logging import getLogger
+from math import inf
+from time import time
 from typing import TYPE_CHECKING
-from uuid import uuid4
+
+from . import metrics
+from .storage.unit_of_work import JobUnitOfWork
 
 if TYPE_CHECKING:
     from .engine import OrchestratorEngine
 
 logger = getLogger(__name__)
 
+TIMEOUT_ERROR_MESSAGE = "Worker task timed out."
+
 
 class Watcher:
-    """A background process that monitors for "stuck" jobs."""
+    """A background process that fails jobs and parallel branches whose worker task timed out.
+
+    Deadlines are kept sorted by their wall-clock time, in shards by job. Each watcher only handles
+    the shards its instance holds the lease of (see `ShardLeases`). It sleeps until their earliest
+    deadline (at most WATCHER_INTERVAL_SECONDS) and is woken up early when any instance adds a
+    sooner one to them, or when the owned shards change. Overdue entries are claimed atomically in
+    batches, so an entry is never handled twice while leases move, and each batch is written in
+    one transaction.
+    """
 
     def __init__(self, engine: "OrchestratorEngine"):
         self.engine = engine
@@ -18,64 +34,95 @@ class Watcher:
         self.config = engine.config
         self._running = False
         self.watch_interval_seconds = self.config.WATCHER_INTERVAL_SECONDS
-        self._instance_id = str(uuid4())
+        self.batch_size = self.config.WATCHER_BATCH_SIZE
+        self.leases = engine.shard_leases
+        self._wakeup = Event()
+        # Wall-clock time the watcher sleeps until, sooner deadlines wake it up
+        self._sleep_until = inf
+        self.leases.add_listener(lambda _owned_shards: self._wakeup.set())
 
     async def run(self):
         """The main loop of the watcher."""
-        logger.info(f"Watcher started (Instance ID: {self._instance_id}).")
+        logger.info(f"Watcher started (Instance ID: {self.leases.instance_id}).")
         self._running = True
-        while self._running:
-            try:
-                await sleep(self.watch_interval_seconds)
-
-                # Attempt to acquire distributed lock
-                # We set TTL slightly longer than the expected execution time,
-                # but shorter than the interval if possible.
-                # Actually, a fixed TTL like 60s is fine as long as we release it.
-                if not await self.storage.acquire_lock("global_watcher_lock", self._instance_id, 60):
-                    logger.debug("Watcher lock held by another instance. Skipping check.")
-                    continue
-
+        listener = create_task(self._listen_watch_events())
+        try:
+            while self._running:
                 try:
-                    logger.info("Watcher running check for timed out jobs...")
-                    timed_out_job_ids = await self.storage.get_timed_out_jobs()
+                    # Until the next sleep is planned, any new deadline may be the earliest
+                    self._wakeup.clear()
+                    self._sleep_until = inf
+                    shards = self.leases.owned_shards
+                    timed_out = await self.storage.get_timed_out_jobs(self.batch_size, shards) if shards else []
+                    if timed_out:
+                        await self.handle_timeouts(timed_out)
+                        if len(timed_out) >= self.batch_size:
+                            continue
 
-                    for job_id in timed_out_job_ids:
-                        logger.warning(f"Job {job_id} timed out. Moving to failed state.")
-                        try:
-                            # Get the latest version to avoid overwriting
-                            job_state = await self.storage.get_job_state(job_id)
-                            if job_state and job_state["status"] == "waiting_for_worker":
-                                job_state["status"] = "failed"
-                                job_state["error_message"] = "Worker task timed out."
-                                await self.storage.save_job_state(job_id, job_state)
+                    now = time()
+                    next_deadline = await self.storage.get_next_watch_deadline(shards) if shards else None
+                    self._sleep_until = now + self.watch_interval_seconds
+                    if next_deadline is not None:
+                        self._sleep_until = min(self._sleep_until, next_deadline)
+                    with suppress(AsyncTimeoutError):
+                        await wait_for(self._wakeup.wait(), timeout=max(self._sleep_until - now, 0))
+                except CancelledError:
+                    logger.info("Watcher received cancellation request.")
+                    break
+                except Exception:
+                    logger.exception("Error in Watcher main loop.")
+                    await sleep(1)
+        finally:
+            listener.cancel()
+            with suppress(CancelledError):
+                await listener
 
-                                # Increment the metric
-                                from . import metrics
-
-                                metrics.jobs_failed_total.inc(
-                                    {
-                                        metrics.LABEL_BLUEPRINT: job_state.get(
-                                            "blueprint_name",
-                                            "unknown",
-                                        ),
-                                    },
-                                )
-                        except Exception:
-                            logger.exception(
-                                f"Failed to update state for timed out job {job_id}",
-                            )
-                finally:
-                    # Always release the lock so we (or others) can run next time
-                    await self.storage.release_lock("global_watcher_lock", self._instance_id)
+        logger.info("Watcher stopped.")
 
+    async def _listen_watch_events(self):
+        """Wakes up the main loop when a deadline is added to an owned shard before the time it sleeps until."""
+        while self._running:
+            try:
+                async for shard, deadline in self.storage.subscribe_watch_events():
+                    if deadline < self._sleep_until and shard in self.leases.owned_shards:
+                        self._wakeup.set()
+            except NotImplementedError:
+                logger.info("Storage has no watch events, the watcher checks every WATCHER_INTERVAL_SECONDS.")
+                return
             except CancelledError:
-                logger.info("Watcher received cancellation request.")
                 break
             except Exception:
-                logger.exception("Error in Watcher main loop.")
+                logger.exception("Error in the watch events subscription, resubscribing.")
+                await sleep(1)
 
-        logger.info("Watcher stopped.")
+    async def handle_timeouts(self, entries: list[str]):
+        """Fails the jobs waiting for a timed out task, and records a failure result for timed out
+        branches of parallel steps. Entries are job IDs or `{job_id}:{task_id}` for branches.
+        """
+        job_writes = JobUnitOfWork(self.storage)
+        await job_writes.load_job_states(list(dict.fromkeys(entry.partition(":")[0] for entry in entries)))
+        for entry in entries:
+            job_id, _, branch_id = entry.partition(":")
+            try:
+                job_state = await job_writes.get_job_state(job_id)
+                if not job_state:
+                    continue
+                if branch_id:
+                    if job_state.get("status") == "waiting_for_parallel_tasks":
+                        logger.warning(f"Branch {branch_id} of job {job_id} timed out.")
+                        result = {"status": "failure", "error": TIMEOUT_ERROR_MESSAGE}
+                        await self.engine.record_branch_result(job_writes, job_id, job_state, branch_id, result)
+                elif job_state.get("status") == "waiting_for_worker":
+                    logger.warning(f"Job {job_id} timed out. Moving to failed state.")
+                    job_state["status"] = "failed"
+                    job_state["error_message"] = TIMEOUT_ERROR_MESSAGE
+                    await job_writes.save_job_state(job_id, job_state)
+                    metrics.jobs_failed_total.inc(
+                        {metrics.LABEL_BLUEPRINT: job_state.get("blueprint_name", "unknown")},
+                    )
+            except Exception:
+                logger.exception(f"Failed to handle the timeout of {entry}")
+        await job_writes.commit()
 
     def stop(self):
         """Stops the watcher."""
@@ -0,0 +1,101 @@
+from asyncio import CancelledError, Lock, sleep
+from logging import getLogger
+from time import monotonic
+from typing import Any
+
+from . import metrics
+from .storage.base import StorageBackend
+from .storage.worker_index import WorkerIndex
+
+logger = getLogger(__name__)
+
+
+class WorkerCache:
+    """A process-local snapshot of the worker registry.
+
+    Reads are served from memory. The snapshot is patched by worker events
+    published through the storage backend (heartbeats, registrations,
+    deregistrations and TTL expiry on any orchestrator instance) and is fully
+    reloaded from storage once it is older than `max_staleness_seconds`.
+    Since pub/sub delivery is best-effort, the reload interval bounds how long
+    a missed event can keep the snapshot out of date.
+    """
+
+    def __init__(self, storage: StorageBackend, max_staleness_seconds: float):
+        self.storage = storage
+        self.max_staleness_seconds = max_staleness_seconds
+        self._workers: dict[str, dict[str, Any]] = {}
+        self._index = WorkerIndex()
+        self._loaded_at: float | None = None
+        self._reload_lock = Lock()
+        self._running = False
+
+    def invalidate(self) -> None:
+        """Forces a reload from storage on the next read."""
+        self._loaded_at = None
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and monotonic() - self._loaded_at <= self.max_staleness_seconds
+
+    async def _reload(self) -> None:
+        workers = await self.storage.get_available_workers()
+        self._workers = {w["worker_id"]: w for w in workers if w.get("worker_id")}
+        self._index.clear()
+        for worker_id, worker_info in self._workers.items():
+            self._index.add(worker_id, worker_info)
+        self._loaded_at = monotonic()
+
+    async def get_available_workers(
+        self,
+        task_type: str | None = None,
+        status: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """Same contract as `StorageBackend.get_available_workers`, served from the snapshot."""
+        if self._is_fresh():
+            metrics.worker_cache_hits_total.inc({})
+        else:
+            metrics.worker_cache_misses_total.inc({})
+            async with self._reload_lock:
+                # Another reader may have reloaded the snapshot while we were waiting
+                if not self._is_fresh():
+                    await self._reload()
+
+        if self._loaded_at is not None:
+            metrics.worker_cache_staleness_seconds.set({}, monotonic() - self._loaded_at)
+        return [self._workers[worker_id] for worker_id in self._index.find(task_type, status)]
+
+    def apply_event(self, event: dict[str, Any]) -> None:
+        """Patches the snapshot with a worker event."""
+        if self._loaded_at is None:
+            # Nothing to patch, the next read loads a full snapshot anyway
+            return
+
+        worker_id = event.get("worker_id")
+        if not worker_id:
+            return
+        if event.get("event") == "updated" and event.get("info") is not None:
+            self._workers[worker_id] = event["info"]
+            self._index.add(worker_id, event["info"])
+        elif event.get("event") == "removed":
+            self._workers.pop(worker_id, None)
+            self._index.remove(worker_id)
+
+    async def run(self):
+        """Listens for worker events and applies them to the snapshot."""
+        logger.info("WorkerCache started.")
+        self._running = True
+        while self._running:
+            try:
+                async for event in self.storage.subscribe_worker_events():
+                    self.apply_event(event)
+            except CancelledError:
+                break
+            except Exception:
+                logger.exception("Error in WorkerCache event subscription, resubscribing.")
+                await sleep(1)
+            # Events may have been missed while the subscription was down
+            self.invalidate()
+        logger.info("WorkerCache stopped.")
+
+    def stop(self):
+        self._running = False
@@ -0,0 +1,90 @@
+from math import ceil, log
+from typing import Any
+
+# Weight of the newest task in the latency and error rate moving averages
+STATS_EWMA_ALPHA = 0.2
+# Number of recent tasks the latency percentiles roughly cover, older tasks fade out
+STATS_WINDOW = 100
+# Relative error of the latency percentiles
+SKETCH_RELATIVE_ACCURACY = 0.02
+# The lowest buckets are merged once a sketch has more buckets than this
+SKETCH_MAX_BUCKETS = 64
+# Buckets whose decayed weight falls below this are dropped
+SKETCH_MIN_WEIGHT = 0.01
+
+_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+_LOG_GAMMA = log(_GAMMA)
+
+
+def _bucket_index(duration_ms: float) -> int:
+    # Durations below 1 ms all share the first bucket
+    return ceil(log(max(duration_ms, 1.0)) / _LOG_GAMMA)
+
+
+def _bucket_value(index: int) -> float:
+    return 2 * _GAMMA**index / (_GAMMA + 1)
+
+
+def record_task_outcome(
+    stats: dict[str, Any] | None,
+    duration_ms: float,
+    success: bool,
+    ewma_alpha: float = STATS_EWMA_ALPHA,
+    window: int = STATS_WINDOW,
+) -> dict[str, Any]:
+    """Returns the statistics of a worker for one task type updated with a finished task.
+
+    The statistics are a small dict that is stored as is: the number of tasks `n`, the moving
+    averages of latency `lat` and error rate `err`, and a DDSketch-like latency histogram `b`
+    that maps logarithmic bucket indexes to weights. The weights decay by `1 - 1 / window`
+    with every task, so the percentiles follow the recent behaviour of the worker.
+    Latency is only recorded for successful tasks, failures only move the error rate.
+    """
+    if not stats:
+        stats = {"n": 0, "lat": None, "err": 0.0, "b": {}}
+    stats["n"] += 1
+    stats["err"] += ewma_alpha * ((0.0 if success else 1.0) - stats["err"])
+    if not success:
+        return stats
+
+    duration_ms = max(duration_ms, 0.0)
+    stats["lat"] = duration_ms if stats["lat"] is None else stats["lat"] + ewma_alpha * (duration_ms - stats["lat"])
+
+    decay = 1 - 1 / window
+    buckets = {key: weight * decay for key, weight in stats["b"].items() if weight * decay >= SKETCH_MIN_WEIGHT}
+    # msgpack and JSON only allow string keys in maps
+    key = str(_bucket_index(duration_ms))
+    buckets[key] = buckets.get(key, 0.0) + 1.0
+    if len(buckets) > SKETCH_MAX_BUCKETS:
+        indexes = sorted(buckets, key=int)
+        collapsed = indexes[: len(indexes) - SKETCH_MAX_BUCKETS + 1]
+        buckets[collapsed[-1]] = sum(buckets.pop(index) for index in collapsed)
+    stats["b"] = buckets
+    return stats
+
+
+def latency_quantile(stats: dict[str, Any], q: float) -> float | None:
+    """Returns the latency below which the fraction `q` of recent tasks finished, in milliseconds."""
+    buckets = sorted((int(key), weight) for key, weight in stats.get("b", {}).items())
+    if not buckets:
+        return None
+    rank = q * sum(weight for _, weight in buckets)
+    cumulative = 0.0
+    for index, weight in buckets:
+        cumulative += weight
+        if cumulative >= rank:
+            return _bucket_value(index)
+    return _bucket_value(buckets[-1][0])
+
+
+def summarize_task_stats(stats: dict[str, Any]) -> dict[str, Any]:
+    """Converts stored statistics into the form exposed by the API and the dispatcher."""
+    p50 = latency_quantile(stats, 0.5)
+    p95 = latency_quantile(stats, 0.95)
+    return {
+        "count": stats.get("n", 0),
+        "ewma_latency_ms": None if stats.get("lat") is None else round(stats["lat"], 1),
+        "p50_latency_ms": None if p50 is None else round(p50, 1),
+        "p95_latency_ms": None if p95 is None else round(p95, 1),
+        "error_rate": round(stats.get("err", 0.0), 4),
+    }
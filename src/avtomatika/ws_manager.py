@@ -1,4 +1,4 @@
-from asyncio import Lock
+from asyncio import Event, Lock
 from logging import getLogger
 
 from aiohttp import web
@@ -12,6 +12,10 @@ class WebSocketManager:
     def __init__(self):
         self._connections: dict[str, web.WebSocketResponse] = {}
         self._lock = Lock()
+        # Workers that receive tasks over their connection: free slots granted by the
+        # worker (credits) and an event set when tasks may be waiting for it
+        self._credits: dict[str, int] = {}
+        self._wakeups: dict[str, Event] = {}
 
     async def register(self, worker_id: str, ws: web.WebSocketResponse):
         """Registers a new WebSocket connection for a worker."""
@@ -28,6 +32,10 @@ class WebSocketManager:
             if worker_id in self._connections:
                 del self._connections[worker_id]
                 logger.info(f"WebSocket connection for worker {worker_id} unregistered.")
+            self._credits.pop(worker_id, None)
+            if wakeup := self._wakeups.pop(worker_id, None):
+                # Let the push loop notice the connection is gone
+                wakeup.set()
 
     async def send_command(self, worker_id: str, command: dict):
         """Sends a JSON command to a specific worker."""
@@ -45,6 +53,54 @@ class WebSocketManager:
                 logger.warning(f"Cannot send command: No active WebSocket connection for worker {worker_id}.")
                 return False
 
+    def start_push(self, worker_id: str, free_slots: int) -> Event:
+        """Switches a connected worker to push delivery with an initial number of free slots.
+
+        :return: The event set whenever tasks may be waiting for the worker or it grants more credits.
+        """
+        self._credits[worker_id] = free_slots
+        wakeup = self._wakeups[worker_id] = Event()
+        wakeup.set()
+        return wakeup
+
+    def is_pushing(self, worker_id: str) -> bool:
+        return worker_id in self._wakeups
+
+    def add_credits(self, worker_id: str, amount: int) -> None:
+        """Grants a push worker more free slots, e.g. after it finished a task."""
+        if worker_id in self._credits:
+            self._credits[worker_id] += amount
+            self._wakeups[worker_id].set()
+
+    def get_credits(self, worker_id: str) -> int:
+        return self._credits.get(worker_id, 0)
+
+    def use_credits(self, worker_id: str, amount: int) -> None:
+        if worker_id in self._credits:
+            self._credits[worker_id] -= amount
+
+    def notify_tasks(self, queue_name: str, shared: bool = False) -> None:
+        """Wakes up the push delivery for a queue that received tasks.
+        A shared queue can be served by any push worker, so all of them are woken up.
+        """
+        if shared:
+            for wakeup in self._wakeups.values():
+                wakeup.set()
+        elif wakeup := self._wakeups.get(queue_name):
+            wakeup.set()
+
+    async def send_json(self, worker_id: str, message: dict) -> bool:
+        """Sends a JSON message to a worker without logging, for frequent messages like pushed tasks."""
+        connection = self._connections.get(worker_id)
+        if not connection or connection.closed:
+            return False
+        try:
+            await connection.send_json(message)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to send message to worker {worker_id}: {e}")
+            return False
+
     @staticmethod
     async def handle_message(worker_id: str, message: dict):
         """Handles an incoming message from a worker."""
@@ -66,4 +122,8 @@ class WebSocketManager:
             for ws in self._connections.values():
                 await ws.close(code=1001, message=b"Server shutdown")
             self._connections.clear()
+            self._credits.clear()
+            for wakeup in self._wakeups.values():
+                wakeup.set()
+            self._wakeups.clear()
             logger.info("All WebSocket connections closed.")
@@ -1,7 +1,8 @@
 import asyncio
+import time
 
 import pytest
-from src.avtomatika.storage.base import StorageBackend
+from src.avtomatika.storage.base import StorageBackend, message_partition, shard_of
 
 
 @pytest.mark.asyncio
@@ -25,6 +26,100 @@ class StorageTestSuite:
         # Acknowledge the job
         await storage.ack_job(message_id)
 
+    async def test_dequeue_jobs_batch(self, storage: StorageBackend):
+        job_ids = [f"batch-job-{i}" for i in range(3)]
+        for job_id in job_ids:
+            await storage.enqueue_job(job_id)
+
+        jobs = await storage.dequeue_jobs(2, block_ms=100)
+        assert [job_id for job_id, _ in jobs] == job_ids[:2]
+        jobs += await storage.dequeue_jobs(10, block_ms=100)
+        assert [job_id for job_id, _ in jobs] == job_ids
+        assert len({message_id for _, message_id in jobs}) == 3
+        await storage.ack_jobs([message_id for _, message_id in jobs])
+
+        # An empty queue returns nothing once the block time has passed
+        assert await storage.dequeue_jobs(10, block_ms=50) == []
+
+    async def test_partitioned_job_queue(self, storage: StorageBackend):
+        await storage.enqueue_job("default-job")
+        for i in range(3):
+            await storage.enqueue_job(f"a-job-{i}", "bp_a")
+        await storage.enqueue_job("b-job", "bp_b")
+        assert await storage.get_job_queue_lengths(["", "bp_a", "bp_b", "bp_c"]) == {
+            "": 1,
+            "bp_a": 3,
+            "bp_b": 1,
+            "bp_c": 0,
+        }
+        # The total, e.g. for the dashboard, counts every partition
+        assert await storage.get_job_queue_length() == 5
+
+        # Each partition gives at most its own count, and a partition without a count is not read
+        jobs = await storage.dequeue_jobs(3, block_ms=100, partitions={"": 0, "bp_a": 2, "bp_b": 1})
+        assert sorted(job_id for job_id, _ in jobs) == ["a-job-0", "a-job-1", "b-job"]
+        assert sorted(message_partition(message_id) for _, message_id in jobs) == ["bp_a", "bp_a", "bp_b"]
+        await storage.ack_jobs([message_id for _, message_id in jobs])
+
+        # When all planned partitions are empty, any of them wakes the read
+        jobs = await storage.dequeue_jobs(2, block_ms=100, partitions={"": 0, "bp_b": 2})
+        assert [job_id for job_id, _ in jobs] == ["default-job"]
+        await storage.ack_jobs([message_id for _, message_id in jobs])
+
+        jobs = await storage.dequeue_jobs(5, block_ms=100, partitions={"": 1, "bp_a": 4})
+        assert [job_id for job_id, _ in jobs] == ["a-job-2"]
+        await storage.ack_jobs([message_id for _, message_id in jobs])
+
+        assert await storage.get_job_partitions() == ["", "bp_a", "bp_b"]
+
+    async def test_job_queue_maintenance(self, storage: StorageBackend):
+        for i in range(3):
+            await storage.enqueue_job(f"kept-job-{i}")
+        jobs = await storage.dequeue_jobs(2, block_ms=100)
+        await storage.ack_jobs([jobs[0][1]])
+
+        stats = await storage.get_job_queue_stats(["", "empty"])
+        assert stats[""]["lag"] == 1
+        assert stats["empty"] == {"length": 0, "pending": 0, "lag": 0}
+        assert await storage.trim_job_queues(["", "empty"]) >= 0
+        assert await storage.remove_dead_job_consumers(["", "empty"], [], 0) == []
+        # Jobs not delivered yet survive the trim
+        assert [job_id for job_id, _ in await storage.dequeue_jobs(5, block_ms=100)] == ["kept-job-2"]
+
+    async def test_commit_job_writes(self, storage: StorageBackend):
+        await storage.add_job_to_watch("uow-old", 100.0)
+        await storage.commit_job_writes(
+            job_states={"uow-job": {"id": "uow-job", "status": "waiting_for_worker"}},
+            enqueued_jobs=[("uow-job", "")],
+            watched_jobs={"uow-job": 50.0},
+            unwatched_jobs=["uow-old"],
+            worker_tasks=[("uow-worker", {"task_id": "t1"}, 1.0)],
+            quarantined_jobs=["uow-bad"],
+            task_workers={"uow-job": {"t1": "uow-worker"}},
+        )
+
+        assert await storage.get_job_state("uow-job") == {"id": "uow-job", "status": "waiting_for_worker"}
+        job_id, message_id = await storage.dequeue_job()
+        assert job_id == "uow-job"
+        await storage.ack_job(message_id)
+        assert await storage.dequeue_task_for_worker("uow-worker", timeout=1) == {"task_id": "t1"}
+        assert await storage.get_quarantined_jobs() == ["uow-bad"]
+        # Both timeouts are in the past, only the job that is still watched times out
+        assert await storage.get_timed_out_jobs() == ["uow-job"]
+        assert await storage.get_task_worker("uow-job", "t1") == "uow-worker"
+
+    async def test_task_workers(self, storage: StorageBackend):
+        await storage.set_task_worker("job-1", "b1", "worker-a")
+        await storage.set_task_worker("job-1", "b2", "worker-b")
+        assert await storage.get_task_worker("job-1", "b1") == "worker-a"
+        assert await storage.get_task_worker("job-1", "b2") == "worker-b"
+
+        # A task put back into its queue has no claiming worker until it is claimed again
+        await storage.set_task_worker("job-1", "b1", None)
+        assert await storage.get_task_worker("job-1", "b1") is None
+        assert await storage.get_task_worker("job-1", "b2") == "worker-b"
+        assert await storage.get_task_worker("missing-job", "b1") is None
+
     async def test_job_state_serialization(self, storage: StorageBackend):
         job_id = "test-state-123"
         initial_state = {
@@ -57,6 +152,10 @@ class StorageTestSuite:
         assert final_state["status"] == "running"
         assert final_state["retry_count"] == 1
 
+        # A missing job is not created from a partial update
+        assert await storage.update_job_state("missing-job", {"task_worker_id": "worker-1"}) is None
+        assert await storage.get_job_state("missing-job") is None
+
     async def test_register_and_get_worker_info(self, storage: StorageBackend):
         worker_id = "worker-1"
         info = {
@@ -76,6 +175,210 @@ class StorageTestSuite:
         assert fetched_info["resources"]["cpu"] == 4
         assert "gpu" in fetched_info["tags"]
 
+    async def test_worker_registry_indexes(self, storage: StorageBackend):
+        await storage.register_worker(
+            "worker-a",
+            {"worker_id": "worker-a", "status": "idle", "supported_tasks": ["render", "encode"]},
+            60,
+        )
+        await storage.register_worker("worker-b", {"worker_id": "worker-b", "supported_tasks": ["render"]}, 60)
+        await storage.register_worker(
+            "worker-c",
+            {"worker_id": "worker-c", "status": "busy", "supported_tasks": ["render"]},
+            60,
+        )
+
+        def ids(workers):
+            return sorted(w["worker_id"] for w in workers)
+
+        # Workers without a status are indexed as idle
+        assert ids(await storage.get_available_workers(task_type="render", status="idle")) == ["worker-a", "worker-b"]
+        assert ids(await storage.get_available_workers(task_type="encode")) == ["worker-a"]
+        assert ids(await storage.get_available_workers(status="busy")) == ["worker-c"]
+        assert ids(await storage.get_available_workers()) == ["worker-a", "worker-b", "worker-c"]
+        assert await storage.get_active_worker_count() == 3
+
+        # A heartbeat moves the worker between indexes
+        await storage.update_worker_status("worker-a", {"status": "busy", "supported_tasks": []}, 60)
+        assert ids(await storage.get_available_workers(task_type="render", status="idle")) == ["worker-b"]
+        assert await storage.get_available_workers(task_type="encode") == []
+        assert ids(await storage.get_available_workers(status="busy")) == ["worker-a", "worker-c"]
+
+        await storage.deregister_worker("worker-b")
+        assert await storage.get_available_workers(task_type="render", status="idle") == []
+        assert ids(await storage.get_available_workers()) == ["worker-a", "worker-c"]
+
+    async def test_update_workers_data(self, storage: StorageBackend):
+        await storage.register_worker("worker-a", {"worker_id": "worker-a", "supported_tasks": ["render"]}, 60)
+        await storage.register_worker("worker-b", {"worker_id": "worker-b", "supported_tasks": ["render"]}, 60)
+
+        updated = await storage.update_workers_data(
+            {
+                "worker-a": {"reputation": 0.5},
+                "worker-b": {"reputation": 0.25, "status": "busy"},
+                "worker-missing": {"reputation": 0.1},
+            }
+        )
+
+        assert set(updated) == {"worker-a", "worker-b"}
+        assert (await storage.get_worker_info("worker-a"))["reputation"] == 0.5
+        assert (await storage.get_worker_info("worker-b"))["reputation"] == 0.25
+        assert await storage.get_worker_info("worker-missing") is None
+        # Changed fields move the worker between registry indexes
+        assert [w["worker_id"] for w in await storage.get_available_workers(status="busy")] == ["worker-b"]
+
+    async def test_record_task_stats(self, storage: StorageBackend):
+        await storage.record_task_stats("worker-a", "render", 100, success=True)
+        await storage.record_task_stats("worker-a", "render", 0, success=False)
+        await storage.record_task_stats("worker-a", "encode", 50, success=True)
+
+        stats = await storage.get_workers_stats(["worker-a", "worker-b"])
+        assert set(stats) == {"worker-a"}
+        assert set(stats["worker-a"]) == {"render", "encode"}
+        assert stats["worker-a"]["render"]["n"] == 2
+        assert stats["worker-a"]["render"]["lat"] == 100
+        assert stats["worker-a"]["render"]["err"] == pytest.approx(0.2)
+
+        only_render = await storage.get_workers_stats(["worker-a"], task_type="render")
+        assert set(only_render["worker-a"]) == {"render"}
+        assert await storage.get_workers_stats(["worker-a"], task_type="missing") == {}
+
+    async def test_worker_loads(self, storage: StorageBackend):
+        await storage.enqueue_task_for_worker("worker-a", {"task_id": "t1"}, 0)
+        await storage.enqueue_task_for_worker("worker-a", {"task_id": "t2"}, 0)
+        await storage.mark_task_in_flight("worker-a", "t0", 60)
+        await storage.mark_task_in_flight("worker-b", "t3", 60)
+        await storage.mark_task_in_flight("worker-b", "t4", 60)
+        assert 0 <= await storage.clear_task_in_flight("worker-b", "t3") < 5
+        assert await storage.clear_task_in_flight("worker-b", "t3") is None
+
+        assert await storage.get_worker_loads(["worker-a", "worker-b", "worker-c"]) == {
+            "worker-a": {"queued": 2, "in_flight": 1},
+            "worker-b": {"queued": 0, "in_flight": 1},
+            "worker-c": {"queued": 0, "in_flight": 0},
+        }
+
+    async def test_in_flight_tasks_expire_at_their_own_timeout(self, storage: StorageBackend):
+        await storage.mark_task_in_flight("worker-a", "long", 60)
+        await asyncio.sleep(1.1)
+        # Taking a task with a shorter timeout does not expire the longer running one
+        await storage.mark_task_in_flight("worker-a", "short", 1)
+        assert (await storage.get_worker_loads(["worker-a"]))["worker-a"]["in_flight"] == 2
+        assert 1 <= await storage.clear_task_in_flight("worker-a", "long") < 5
+
+    async def test_clear_tasks_in_flight(self, storage: StorageBackend):
+        await storage.mark_task_in_flight("worker-a", "t1", 60)
+        await storage.mark_task_in_flight("worker-a", "t2", 60)
+
+        cleared = await storage.clear_tasks_in_flight("worker-a", ["t1", "t2", "t3"])
+        assert cleared.keys() == {"t1", "t2", "t3"}
+        assert 0 <= cleared["t1"] < 5
+        assert cleared["t3"] is None
+        assert (await storage.get_worker_loads(["worker-a"]))["worker-a"]["in_flight"] == 0
+        assert await storage.clear_tasks_in_flight("worker-a", []) == {}
+
+    async def test_get_job_states(self, storage: StorageBackend):
+        await storage.save_job_state("job-1", {"id": "job-1", "status": "running"})
+        await storage.save_job_state("job-2", {"id": "job-2", "status": "finished"})
+
+        states = await storage.get_job_states(["job-1", "missing", "job-2"])
+        assert states.keys() == {"job-1", "job-2"}
+        assert states["job-2"]["status"] == "finished"
+        assert await storage.get_job_states([]) == {}
+
+    async def test_iter_job_ids(self, storage: StorageBackend):
+        await storage.save_job_state("job-1", {"id": "job-1", "status": "running"})
+        await storage.save_job_state("job-2", {"id": "job-2", "status": "waiting_for_parallel_tasks"})
+        # Parallel branch and claiming worker bookkeeping is not a job
+        await storage.start_parallel_branches("job-2", ["task-a"])
+        await storage.set_task_worker("job-2", "task-a", "worker-a")
+
+        assert {job_id async for job_id in storage.iter_job_ids()} == {"job-1", "job-2"}
+
+    async def test_task_events(self, storage: StorageBackend):
+        events = storage.subscribe_task_events()
+        listener = asyncio.create_task(anext(events))
+        # Let the subscription start before tasks are enqueued
+        await asyncio.sleep(0.05)
+
+        await storage.enqueue_task_for_worker("worker-a", {"task_id": "t1"}, 0)
+        assert await asyncio.wait_for(listener, timeout=1) == "worker-a"
+        await events.aclose()
+
+    async def test_dequeue_task_from_queues(self, storage: StorageBackend):
+        await storage.enqueue_task_for_worker("type:render", {"task_id": "shared-low"}, 1)
+        await storage.enqueue_task_for_worker("type:render", {"task_id": "shared-high"}, 5)
+        await storage.enqueue_task_for_worker("worker-a", {"task_id": "own"}, 0)
+
+        # Queues are served in the given order, each by priority
+        assert await storage.dequeue_task_from_queues(["worker-a", "type:render"], None) == (
+            "worker-a",
+            {"task_id": "own"},
+            0,
+        )
+        assert await storage.dequeue_task_from_queues(["worker-a", "type:render"], 1) == (
+            "type:render",
+            {"task_id": "shared-high"},
+            5,
+        )
+        assert (await storage.dequeue_task_from_queues(["worker-a", "type:render"], None))[1]["task_id"] == "shared-low"
+        assert await storage.dequeue_task_from_queues(["worker-a", "type:render"], None) is None
+
+    async def test_dequeue_task_of_types(self, storage: StorageBackend):
+        await storage.enqueue_task_for_worker("worker-a", {"task_id": "t1", "type": "encode"}, 2)
+        await storage.enqueue_task_for_worker("worker-a", {"task_id": "t2", "type": "encode"}, 1)
+
+        # A task of another type is left at its position
+        assert await storage.dequeue_task_of_types("worker-a", ["render"]) is None
+        assert await storage.dequeue_task_of_types("worker-b", ["render"]) is None
+        assert await storage.dequeue_task_of_types("worker-a", ["render", "encode"]) == (
+            "worker-a",
+            {"task_id": "t1", "type": "encode"},
+            2,
+        )
+        assert (await storage.dequeue_task_from_queues(["worker-a"], None))[1]["task_id"] == "t2"
+
+    async def test_dequeue_tasks_from_queues(self, storage: StorageBackend):
+        for priority in range(3):
+            await storage.enqueue_task_for_worker("worker-a", {"task_id": f"own-{priority}"}, priority)
+        await storage.enqueue_task_for_worker("type:render", {"task_id": "shared"}, 9)
+
+        tasks = await storage.dequeue_tasks_from_queues(["worker-a", "type:render"], 4)
+        assert [(queue_name, task["task_id"]) for queue_name, task, _ in tasks] == [
+            ("worker-a", "own-2"),
+            ("worker-a", "own-1"),
+            ("worker-a", "own-0"),
+            ("type:render", "shared"),
+        ]
+        assert await storage.dequeue_tasks_from_queues(["worker-a", "type:render"], 4) == []
+
+        await storage.enqueue_task_for_worker("worker-a", {"task_id": "t1"}, 0)
+        await storage.enqueue_task_for_worker("worker-a", {"task_id": "t2"}, 0)
+        assert len(await storage.dequeue_tasks_from_queues(["worker-a"], 1)) == 1
+        assert len(await storage.dequeue_tasks_from_queues(["worker-a"], 5)) == 1
+
+    async def test_resource_classes(self, storage: StorageBackend):
+        constraints = {"resource_requirements": {"gpu_info": {"vram_gb": 16}}, "max_cost": 0.5}
+        await storage.register_resource_class("render", "abc", constraints)
+        await storage.register_resource_class("render", "abc", constraints)
+
+        assert await storage.get_resource_classes(["render", "encode"]) == {
+            "render": {"abc": constraints},
+            "encode": {},
+        }
+
+    async def test_worker_registry_expiry(self, storage: StorageBackend):
+        await storage.register_worker("worker-short", {"worker_id": "worker-short", "supported_tasks": ["t"]}, 1)
+        await storage.register_worker("worker-long", {"worker_id": "worker-long", "supported_tasks": ["t"]}, 60)
+
+        await asyncio.sleep(1.1)
+
+        assert await storage.prune_expired_workers() == 1
+        assert [w["worker_id"] for w in await storage.get_available_workers(task_type="t")] == ["worker-long"]
+        assert await storage.get_active_worker_count() == 1
+        # A second pass has nothing left to prune
+        assert await storage.prune_expired_workers() == 0
+
     async def test_dequeue_empty_queue(self, storage: StorageBackend):
         # We assume queue is empty initially or flushed
         # For RedisStorage, dequeue has a timeout. MemoryStorage waits indefinitely.
@@ -121,3 +424,93 @@ class StorageTestSuite:
         assert result3 is not None
         assert result3[0] == job_id_2
         await storage.ack_job(result3[1])
+
+    async def test_parallel_branches(self, storage: StorageBackend):
+        branches = ["b1", "b2"]
+        await storage.start_parallel_branches("par-job", branches)
+        assert await storage.record_branch_result("par-job", "b1", {"status": "success"}, branches) == (1, None)
+        assert await storage.record_branch_result("par-job", "b1", {"status": "success"}, branches) == (-1, None)
+        assert await storage.record_branch_result("par-job", "b2", {"status": "failure"}, branches) == (
+            0,
+            {"b1": {"status": "success"}, "b2": {"status": "failure"}},
+        )
+        # A repeated result after the last branch does not restart the step
+        assert await storage.record_branch_result("par-job", "b2", {"status": "failure"}, branches) == (-1, None)
+
+        # A new step drops the results of the previous one
+        await storage.start_parallel_branches("par-job", ["b3"])
+        assert await storage.record_branch_result("par-job", "b3", {}, ["b3"]) == (0, {"b3": {}})
+
+    async def test_parallel_branches_finish_once(self, storage: StorageBackend):
+        # Branches of a step started without start_parallel_branches are taken from the job state
+        branches = [f"b{i}" for i in range(10)]
+        outcomes = await asyncio.gather(
+            *(storage.record_branch_result("par-job-2", b, {"i": i}, branches) for i, b in enumerate(branches))
+        )
+        finished = [results for remaining, results in outcomes if remaining == 0]
+        assert finished == [{branch: {"i": i} for i, branch in enumerate(branches)}]
+
+    async def test_timed_out_jobs_are_claimed_in_deadline_order(self, storage: StorageBackend):
+        now = time.time()
+        assert await storage.get_next_watch_deadline() is None
+        await storage.add_job_to_watch("late", now - 1)
+        await storage.add_job_to_watch("early", now - 3)
+        await storage.add_job_to_watch("job-1:branch-1", now - 2)
+        await storage.add_job_to_watch("future", now + 60)
+        assert await storage.get_next_watch_deadline() == pytest.approx(now - 3)
+
+        assert await storage.get_timed_out_jobs(limit=2) == ["early", "job-1:branch-1"]
+        assert await storage.get_timed_out_jobs(limit=2) == ["late"]
+        assert await storage.get_timed_out_jobs() == []
+        assert await storage.get_next_watch_deadline() == pytest.approx(now + 60)
+
+    async def test_monotonic_watch_deadlines_are_moved_to_wall_clock(self, storage: StorageBackend):
+        # Deadlines of earlier versions were monotonic clock readings
+        await storage.add_job_to_watch("legacy-due", time.monotonic() - 1)
+        await storage.add_job_to_watch("legacy-pending", time.monotonic() + 60)
+
+        assert await storage.get_timed_out_jobs() == ["legacy-due"]
+        assert await storage.get_next_watch_deadline() == pytest.approx(time.time() + 60, abs=5)
+
+    async def test_watch_events(self, storage: StorageBackend):
+        events = storage.subscribe_watch_events()
+        listener = asyncio.create_task(anext(events))
+        # Let the subscription start before the job is watched
+        await asyncio.sleep(0.05)
+
+        await storage.add_job_to_watch("watched-job", 123.5)
+        assert await asyncio.wait_for(listener, timeout=1) == (shard_of("watched-job"), 123.5)
+        await events.aclose()
+
+    async def test_timed_out_jobs_of_shards(self, storage: StorageBackend):
+        now = time.time()
+        job_ids = [f"sharded-{i}" for i in range(20)]
+        for i, job_id in enumerate(job_ids):
+            await storage.add_job_to_watch(job_id, now - 20 + i)
+            # Branches are in the shard of their job
+            await storage.add_job_to_watch(f"{job_id}:branch", now - 20 + i)
+        shards = {shard_of(job_ids[0]), shard_of(job_ids[1])}
+        in_shards = [job_id for job_id in job_ids if shard_of(job_id) in shards]
+
+        assert await storage.get_next_watch_deadline(shards) == pytest.approx(now - 20 + job_ids.index(in_shards[0]))
+        claimed = await storage.get_timed_out_jobs(shards=shards)
+        assert sorted(claimed) == sorted(in_shards + [f"{job_id}:branch" for job_id in in_shards])
+        assert await storage.get_next_watch_deadline(shards) is None
+        assert len(await storage.get_timed_out_jobs()) == 2 * len(job_ids) - len(claimed)
+        assert await storage.get_timed_out_jobs(shards=[]) == []
+
+    async def test_extend_lock(self, storage: StorageBackend):
+        assert await storage.extend_lock("lease", "holder-1", 10) is False
+        assert await storage.acquire_lock("lease", "holder-1", 10) is True
+        assert await storage.extend_lock("lease", "holder-2", 10) is False
+        assert await storage.extend_lock("lease", "holder-1", 10) is True
+        assert await storage.release_lock("lease", "holder-1") is True
+        assert await storage.extend_lock("lease", "holder-1", 10) is False
+
+    async def test_instances(self, storage: StorageBackend):
+        assert await storage.refresh_instance("instance-1", 10) == ["instance-1"]
+        assert sorted(await storage.refresh_instance("instance-2", 10)) == ["instance-1", "instance-2"]
+        await storage.remove_instance("instance-1")
+        assert await storage.refresh_instance("instance-2", 10) == ["instance-2"]
+        # Instances that stopped refreshing are gone
+        assert await storage.refresh_instance("instance-3", 0) == ["instance-2"]
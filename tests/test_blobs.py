@@ -0,0 +1,237 @@
+import asyncio
+from hashlib import sha256
+from os import utime
+from time import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from src.avtomatika.blobs import FileSystemBlobStore, is_blob_ref, make_blob_ref
+from src.avtomatika.blobs.redis import RedisBlobStore
+from src.avtomatika.blueprint import StateMachineBlueprint
+from src.avtomatika.engine import ENGINE_KEY
+from src.avtomatika.retention import BlobRetention
+from src.avtomatika.storage.memory import MemoryStorage
+
+from tests.conftest import STORAGE_KEY
+
+
+@pytest.fixture(params=["filesystem", "redis"])
+def blob_store(request, tmp_path, redis_client):
+    if request.param == "filesystem":
+        return FileSystemBlobStore(str(tmp_path))
+    return RedisBlobStore(redis_client)
+
+
+@pytest.mark.asyncio
+async def test_put_is_content_addressed(blob_store):
+    key = await blob_store.put(b'{"a":1}')
+    assert key.startswith("sha256:")
+    assert await blob_store.put(b'{"a":1}') == key
+    assert await blob_store.get(key) == b'{"a":1}'
+    assert await blob_store.load(key) == {"a": 1}
+    assert await blob_store.get("sha256:" + "0" * 64) is None
+    with pytest.raises(KeyError):
+        await blob_store.load("sha256:" + "0" * 64)
+
+
+@pytest.mark.asyncio
+async def test_offload_and_resolve(blob_store):
+    data = {"small": "x", "big": {"files": ["y" * 200]}}
+    offloaded = await blob_store.offload(data, threshold=100)
+
+    assert offloaded["small"] == "x"
+    assert is_blob_ref(offloaded["big"])
+    # Offloading is idempotent, references are kept as they are
+    assert await blob_store.offload(offloaded, threshold=100) == offloaded
+    assert await blob_store.resolve(offloaded["big"]) == data["big"]
+    assert await blob_store.resolve("x") == "x"
+    assert await blob_store.resolve_all(offloaded) == data
+
+
+@pytest.mark.asyncio
+async def test_sweep_deletes_unused_payloads(tmp_path):
+    blob_store = FileSystemBlobStore(str(tmp_path))
+    used = await blob_store.put(b'{"a":1}')
+    unused = await blob_store.put(b'{"b":2}')
+    read = await blob_store.put(b'{"c":3}')
+    for key in (used, unused, read):
+        utime(blob_store._path(key), (time() - 100, time() - 100))
+
+    # Storing the same content again and reading a payload renew it
+    await blob_store.put(b'{"a":1}')
+    await blob_store.load(read)
+    assert await blob_store.sweep(time() - 50) == 1
+    assert await blob_store.get(unused) is None
+    assert await blob_store.get(used) == b'{"a":1}'
+    assert await blob_store.get(read) == b'{"c":3}'
+
+
+@pytest.mark.asyncio
+async def test_redis_blob_ttl_is_renewed(redis_client):
+    blob_store = RedisBlobStore(redis_client, ttl=100)
+    key = await blob_store.put(b'{"a":1}')
+    await redis_client.expire(f"orchestrator:blob:{key}", 10)
+
+    await blob_store.put(b'{"a":1}')
+    assert await redis_client.ttl(f"orchestrator:blob:{key}") > 10
+    await redis_client.expire(f"orchestrator:blob:{key}", 10)
+    assert await blob_store.get(key) == b'{"a":1}'
+    assert await redis_client.ttl(f"orchestrator:blob:{key}") > 10
+    assert await blob_store.sweep(time()) == 0
+
+
+@pytest.mark.asyncio
+async def test_blob_retention_run(mocker, tmp_path):
+    engine = MagicMock()
+    engine.config.BLOB_STORE_RETENTION_DAYS = 7
+    engine.config.HISTORY_RETENTION_INTERVAL_SECONDS = 3600
+    engine.storage.acquire_lock = AsyncMock(return_value=True)
+    engine.storage.release_lock = AsyncMock()
+    engine.storage.iter_job_ids = MemoryStorage().iter_job_ids
+    engine.blob_store.sweep = AsyncMock(return_value=2)
+    retention = BlobRetention(engine)
+
+    async def stop(*args):
+        retention.stop()
+
+    mocker.patch("src.avtomatika.retention.sleep", side_effect=stop)
+    await retention.run()
+
+    engine.blob_store.sweep.assert_awaited_once()
+    assert engine.blob_store.sweep.call_args.args[0] == pytest.approx(time() - 7 * 86400, abs=5)
+    engine.storage.release_lock.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_blob_retention_keeps_payloads_of_live_jobs(mocker, tmp_path):
+    engine = MagicMock()
+    engine.config.BLOB_STORE_RETENTION_DAYS = 7
+    engine.config.HISTORY_RETENTION_INTERVAL_SECONDS = 3600
+    engine.storage = MemoryStorage()
+    engine.blob_store = FileSystemBlobStore(str(tmp_path))
+    engine.blueprints = {blob_bp.name: blob_bp}
+
+    waiting = await engine.blob_store.put(b'"waiting"')
+    done = await engine.blob_store.put(b'"done"')
+    failed = await engine.blob_store.put(b'"failed"')
+    for key in (waiting, done, failed):
+        utime(engine.blob_store._path(key), (time() - 30 * 86400, time() - 30 * 86400))
+    await engine.storage.save_job_state(
+        "job-waiting",
+        {
+            "id": "job-waiting",
+            "blueprint_name": blob_bp.name,
+            "current_state": "start",
+            "status": "waiting_for_worker",
+            "state_history": {"results": [{"data": make_blob_ref(waiting, 9)}]},
+        },
+    )
+    await engine.storage.save_job_state(
+        "job-done",
+        {
+            "id": "job-done",
+            "blueprint_name": blob_bp.name,
+            "current_state": "finished",
+            "status": "running",
+            "initial_data": {"document": make_blob_ref(done, 6)},
+        },
+    )
+    await engine.storage.save_job_state(
+        "job-failed",
+        {"id": "job-failed", "current_state": "start", "status": "failed", "initial_data": make_blob_ref(failed, 8)},
+    )
+    retention = BlobRetention(engine)
+
+    async def stop(*args):
+        retention.stop()
+
+    mocker.patch("src.avtomatika.retention.sleep", side_effect=stop)
+    await retention.run()
+
+    # Payloads of jobs that are still running are renewed before the sweep, finished jobs do not keep theirs
+    assert await engine.blob_store.get(waiting) == b'"waiting"'
+    assert await engine.blob_store.get(done) is None
+    assert await engine.blob_store.get(failed) is None
+
+
+@pytest.mark.asyncio
+async def test_redis_blob_touch_renews_ttl(redis_client):
+    blob_store = RedisBlobStore(redis_client, ttl=100)
+    key = await blob_store.put(b'{"a":1}')
+    await redis_client.expire(f"orchestrator:blob:{key}", 10)
+
+    await blob_store.touch([key, "sha256:" + "0" * 64])
+    assert await redis_client.ttl(f"orchestrator:blob:{key}") > 10
+
+
+blob_bp = StateMachineBlueprint(name="blob_test", api_endpoint="/jobs/blob_test", api_version="v1")
+
+
+@blob_bp.handler_for("start", is_start=True)
+async def blob_start(context, actions):
+    document = await context.blobs.resolve(context.initial_data["document"])
+    context.state_history["document_length"] = len(document)
+    actions.transition_to("finished")
+
+
+@blob_bp.handler_for("finished", is_end=True)
+async def blob_finished(context, actions):
+    pass
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("app", [{"extra_blueprints": [blob_bp]}], indirect=True)
+async def test_large_initial_data_is_offloaded(aiohttp_client, app, tmp_path):
+    engine = app[ENGINE_KEY]
+    engine.blob_store = FileSystemBlobStore(str(tmp_path))
+    engine.config.BLOB_STORE_THRESHOLD_BYTES = 1000
+    client = await aiohttp_client(app)
+    storage = app[STORAGE_KEY]
+
+    headers = {"X-Avtomatika-Token": "user_token_vip"}
+    await storage.initialize_client_quota("user_token_vip", 5)
+    resp = await client.post("/api/v1/jobs/blob_test", json={"document": "z" * 5000, "name": "doc"}, headers=headers)
+    assert resp.status == 202
+    job_id = (await resp.json())["job_id"]
+
+    state = await storage.get_job_state(job_id)
+    assert state["initial_data"]["name"] == "doc"
+    reference = state["initial_data"]["document"]
+    assert is_blob_ref(reference)
+
+    # Workers fetch the payload by its key
+    worker_headers = {"X-Worker-Token": engine.config.GLOBAL_WORKER_TOKEN}
+    resp = await client.get(f"/_worker/workers/worker-1/blobs/{reference['$blob']}", headers=worker_headers)
+    assert resp.status == 200
+    assert await resp.json() == "z" * 5000
+
+    # Handlers resolve the reference lazily
+    for _ in range(20):
+        state = await storage.get_job_state(job_id)
+        if state["current_state"] == "finished":
+            break
+        await asyncio.sleep(0.1)
+    assert state["current_state"] == "finished"
+    assert state["state_history"]["document_length"] == 5000
+
+
+@pytest.mark.asyncio
+async def test_blob_route_accepts_individual_worker_token(aiohttp_client, app, tmp_path):
+    engine = app[ENGINE_KEY]
+    engine.blob_store = FileSystemBlobStore(str(tmp_path))
+    client = await aiohttp_client(app)
+    storage = app[STORAGE_KEY]
+
+    worker_id = "worker-with-individual-token"
+    token = "individual-secret-for-blobs"
+    await storage.set_worker_token(worker_id, sha256(token.encode()).hexdigest())
+    key = await engine.blob_store.put(b'"payload"')
+
+    headers = {"X-Worker-Token": token}
+    resp = await client.get(f"/_worker/workers/{worker_id}/blobs/{key}", headers=headers)
+    assert resp.status == 200
+    assert await resp.json() == "payload"
+
+    # The token only authenticates the worker it belongs to
+    resp = await client.get(f"/_worker/workers/other-worker/blobs/{key}", headers=headers)
+    assert resp.status == 401
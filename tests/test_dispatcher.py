@@ -33,6 +33,7 @@ def mock_storage():
     storage.get_available_workers = AsyncMock(return_value=[])
     storage.enqueue_task_for_worker = AsyncMock()
     storage.save_job_state = AsyncMock()
+    storage.get_workers_stats = AsyncMock(return_value={})
     return storage
 
 
@@ -83,6 +84,11 @@ async def test_dispatch_selects_worker_and_queues_task(dispatcher, mock_storage)
     assert payload["job_id"] == job_state["id"]
     assert payload["type"] == task_info["type"]
     assert "task_id" in payload
+    assert "timeout_seconds" not in payload
+
+    # A task timeout is passed on, so that the task counts as in flight for as long as it may run
+    await dispatcher.dispatch(job_state, {**task_info, "timeout_seconds": 600})
+    assert mock_storage.enqueue_task_for_worker.call_args[0][1]["timeout_seconds"] == 600
 
 
 @pytest.mark.asyncio
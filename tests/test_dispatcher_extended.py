@@ -93,3 +93,70 @@ async def test_dispatcher_max_cost_filtering(dispatcher, mock_storage):
 
     args = mock_storage.enqueue_task_for_worker.call_args[0]
     assert args[0] == "just_right"
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_best_value_uses_live_error_rate(dispatcher, mock_storage):
+    """Verifies that 'best_value' lowers the reputation by the recent error rate of the worker."""
+    workers = [
+        {"worker_id": "failing", "status": "idle", "supported_tasks": ["task"], "cost_per_second": 0.1},
+        {"worker_id": "reliable", "status": "idle", "supported_tasks": ["task"], "cost_per_second": 0.15},
+    ]
+    mock_storage.get_available_workers.return_value = workers
+    # score = 0.1 / (1.0 * (1 - 0.5)) = 0.2 vs 0.15 / 1.0
+    mock_storage.get_workers_stats.return_value = {"failing": {"task": {"n": 10, "lat": 100.0, "err": 0.5, "b": {}}}}
+
+    await dispatcher.dispatch({"id": "job-1"}, {"type": "task", "dispatch_strategy": "best_value"})
+
+    mock_storage.get_workers_stats.assert_awaited_once_with(["failing", "reliable"], "task")
+    assert mock_storage.enqueue_task_for_worker.call_args[0][0] == "reliable"
+    # The registry entries are not modified
+    assert "task_stats" not in workers[0]
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_expected_finish_strategy(dispatcher, mock_storage):
+    """Verifies that 'expected_finish' weighs queue depth, in-flight tasks, latency and concurrency."""
+    dispatcher.config.DISPATCH_EXPECTED_FINISH_CHOICES = 0
+    workers = [
+        # (2 + 1 + 1) * 100 / 1 = 400
+        {"worker_id": "slow_queue", "status": "idle", "supported_tasks": ["task"]},
+        # (0 + 1 + 1) * 500 / 1 = 1000
+        {"worker_id": "slow_worker", "status": "idle", "supported_tasks": ["task"]},
+        # (3 + 4 + 1) * 100 / 4 = 200 (Best)
+        {"worker_id": "parallel", "status": "idle", "supported_tasks": ["task"], "max_concurrent_tasks": 4},
+        # No statistics: (5 + 0 + 1) * average latency of the others (~233) = 1400
+        {"worker_id": "new", "status": "idle", "supported_tasks": ["task"]},
+    ]
+    mock_storage.get_available_workers.return_value = workers
+    mock_storage.get_worker_loads.return_value = {
+        "slow_queue": {"queued": 2, "in_flight": 1},
+        "slow_worker": {"queued": 0, "in_flight": 1},
+        "parallel": {"queued": 3, "in_flight": 4},
+        "new": {"queued": 5, "in_flight": 0},
+    }
+    mock_storage.get_workers_stats.return_value = {
+        "slow_queue": {"task": {"lat": 100.0}},
+        "slow_worker": {"task": {"lat": 500.0}},
+        "parallel": {"task": {"lat": 100.0}},
+    }
+
+    await dispatcher.dispatch({"id": "job-1"}, {"type": "task", "dispatch_strategy": "expected_finish"})
+
+    assert mock_storage.enqueue_task_for_worker.call_args[0][0] == "parallel"
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_expected_finish_compares_sampled_workers(dispatcher, mock_storage):
+    """Verifies that 'expected_finish' only looks up DISPATCH_EXPECTED_FINISH_CHOICES random workers."""
+    dispatcher.config.DISPATCH_EXPECTED_FINISH_CHOICES = 2
+    workers = [{"worker_id": f"w{i}", "status": "idle", "supported_tasks": ["task"]} for i in range(10)]
+    mock_storage.get_available_workers.return_value = workers
+    mock_storage.get_worker_loads.return_value = {}
+    mock_storage.get_workers_stats.return_value = {}
+
+    await dispatcher.dispatch({"id": "job-1"}, {"type": "task", "dispatch_strategy": "expected_finish"})
+
+    sampled = mock_storage.get_worker_loads.call_args[0][0]
+    assert len(sampled) == 2
+    assert mock_storage.enqueue_task_for_worker.call_args[0][0] in sampled
@@ -1,3 +1,4 @@
+import json
 from unittest.mock import AsyncMock, MagicMock
 
 import fakeredis.aioredis as redis
@@ -173,3 +174,146 @@ async def test_invalid_input_error_fails_immediately(monkeypatch, redis_storage:
     assert final_state.get("retry_count", 0) == 0
     assert "Task failed due to invalid input" in final_state.get("error_message", "")
     mock_dispatch.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_result_is_not_committed_when_applying_it_fails(monkeypatch, redis_storage: RedisStorage):
+    """
+    Tests that the job changes of a result are dropped when applying the result raises.
+    """
+    config = Config()
+    storage = redis_storage
+    engine = OrchestratorEngine(storage, config)
+    engine.register_blueprint(error_flow_bp)
+    engine.dispatcher = Dispatcher(storage, config)
+    monkeypatch.setattr(engine.dispatcher, "dispatch", AsyncMock(side_effect=RuntimeError("queue unavailable")))
+
+    job_id = "job-rollback-123"
+    initial_job_state = {
+        "id": job_id,
+        "status": "waiting_for_worker",
+        "blueprint_name": "error_flow",
+        "current_task_info": {"type": "fail_task"},
+        "current_task_transitions": {"success": "finished", "failure": "failed"},
+    }
+    await storage.save_job_state(job_id, initial_job_state)
+
+    # The retry of a transient failure is buffered, then its dispatch fails
+    payload_data = {
+        "job_id": job_id,
+        "task_id": "some_task",
+        "result": {"status": "failure", "error": {"code": "TRANSIENT_ERROR", "message": "worker failed"}},
+    }
+    req = make_mocked_request("POST", "/_worker/tasks/result", headers={"content-type": "application/json"})
+    req.json = AsyncMock(return_value=payload_data)
+    req["worker_id"] = "test-worker"
+    with pytest.raises(RuntimeError):
+        await engine._task_result_handler(req)
+
+    assert await storage.get_job_state(job_id) == initial_job_state
+    assert await storage.get_timed_out_jobs() == []
+
+
+@pytest.mark.asyncio
+async def test_batch_results_are_applied_one_by_one(monkeypatch, redis_storage: RedisStorage):
+    """
+    Tests that a result of a batch that fails to apply is reported on its own and leaves no changes,
+    while the other results are committed, and that a repeated result is ignored.
+    """
+    config = Config()
+    storage = redis_storage
+    engine = OrchestratorEngine(storage, config)
+    engine.register_blueprint(error_flow_bp)
+    engine.dispatcher = Dispatcher(storage, config)
+    monkeypatch.setattr(engine.dispatcher, "dispatch", AsyncMock(side_effect=RuntimeError("queue unavailable")))
+
+    for job_id in ("job-fails", "job-succeeds"):
+        await storage.save_job_state(
+            job_id,
+            {
+                "id": job_id,
+                "status": "waiting_for_worker",
+                "blueprint_name": "error_flow",
+                "current_task_id": f"task-{job_id}",
+                "current_task_info": {"type": "fail_task"},
+                "current_task_transitions": {"success": "finished", "failure": "failed"},
+            },
+        )
+    failed_state = await storage.get_job_state("job-fails")
+
+    success = {"job_id": "job-succeeds", "task_id": "task-job-succeeds", "result": {"status": "success"}}
+    payload_data = {
+        "results": [
+            {
+                "job_id": "job-fails",
+                "task_id": "task-job-fails",
+                "result": {"status": "failure", "error": {"code": "TRANSIENT_ERROR", "message": "worker failed"}},
+            },
+            success,
+            success,
+        ]
+    }
+    req = make_mocked_request("POST", "/_worker/tasks/results", headers={"content-type": "application/json"})
+    req.json = AsyncMock(return_value=payload_data)
+    req["worker_id"] = "test-worker"
+    response = await engine._task_results_handler(req)
+
+    results = json.loads(response.body)["results"]
+    assert "queue unavailable" in results[0]["error"]
+    assert [result.get("status") for result in results[1:]] == ["result_accepted_success", "result_ignored"]
+    assert await storage.get_job_state("job-fails") == failed_state
+    assert (await storage.get_job_state("job-succeeds"))["current_state"] == "finished"
+
+
+@pytest.mark.asyncio
+async def test_batch_retried_after_a_failed_commit(monkeypatch, redis_storage: RedisStorage):
+    """
+    Tests that a batch whose commit fails leaves the parallel branch counters and in-flight
+    entries untouched, so that retrying it completes the parallel step.
+    """
+    config = Config()
+    storage = redis_storage
+    engine = OrchestratorEngine(storage, config)
+    engine.register_blueprint(error_flow_bp)
+
+    await storage.save_job_state(
+        "job-parallel",
+        {
+            "id": "job-parallel",
+            "status": "waiting_for_parallel_tasks",
+            "blueprint_name": "error_flow",
+            "active_branches": ["b1", "b2"],
+            "aggregation_target": "finished",
+        },
+    )
+    for task_id in ("b1", "b2"):
+        await storage.mark_task_in_flight("test-worker", task_id, 60)
+
+    payload_data = {
+        "results": [
+            {"job_id": "job-parallel", "task_id": "b1", "result": {"status": "success"}},
+            {"job_id": "job-parallel", "task_id": "b2", "result": {"status": "success"}},
+        ]
+    }
+    req = make_mocked_request("POST", "/_worker/tasks/results", headers={"content-type": "application/json"})
+    req.json = AsyncMock(return_value=payload_data)
+    req["worker_id"] = "test-worker"
+
+    commit_job_writes = storage.commit_job_writes
+    monkeypatch.setattr(storage, "commit_job_writes", AsyncMock(side_effect=RuntimeError("storage unavailable")))
+    with pytest.raises(RuntimeError):
+        await engine._task_results_handler(req)
+
+    assert (await storage.get_worker_loads(["test-worker"]))["test-worker"]["in_flight"] == 2
+    assert (await storage.get_job_state("job-parallel"))["status"] == "waiting_for_parallel_tasks"
+
+    # The worker sends the batch again once storage is back
+    monkeypatch.setattr(storage, "commit_job_writes", commit_job_writes)
+    response = await engine._task_results_handler(req)
+
+    results = json.loads(response.body)["results"]
+    assert [result["status"] for result in results] == ["parallel_branch_result_accepted"] * 2
+    job_state = await storage.get_job_state("job-parallel")
+    assert job_state["current_state"] == "finished"
+    assert job_state["aggregation_results"].keys() == {"b1", "b2"}
+    assert (await storage.get_worker_loads(["test-worker"]))["test-worker"]["in_flight"] == 0
@@ -1,20 +1,27 @@
+from functools import partial
 from unittest.mock import ANY, AsyncMock, MagicMock
 
 import pytest
 from src.avtomatika.blueprint import StateMachineBlueprint
+from src.avtomatika.config import Config
 from src.avtomatika.context import ActionFactory
 from src.avtomatika.executor import JobExecutor
+from src.avtomatika.job_partitions import JobPartitions
+from src.avtomatika.storage.base import StorageBackend
 
 
 @pytest.fixture
 def mock_engine():
     engine = MagicMock()
     engine.storage = AsyncMock()
+    # Apply committed job writes through the individual storage methods so tests can assert on them
+    engine.storage.commit_job_writes.side_effect = partial(StorageBackend.commit_job_writes, engine.storage)
     engine.history_storage = AsyncMock()
     engine.dispatcher = AsyncMock()
     engine.blueprints = {}
     engine.config = MagicMock()
     engine.config.JOB_MAX_RETRIES = 3  # Default max retries for tests
+    engine.job_partitions = JobPartitions(Config(), engine.blueprints)
     return engine
 
 
@@ -165,7 +172,7 @@ async def test_process_job_handler_dependency_injection(job_executor, mocker):
         },
     )
     # 3. Check that the job was re-enqueued for the next state
-    job_executor.storage.enqueue_job.assert_called_with(job_id)
+    job_executor.storage.enqueue_job.assert_called_with(job_id, "")
     job_executor.storage.ack_job.assert_called_with("msg-123")
 
 
@@ -226,7 +233,7 @@ async def test_process_job_handler_backward_compatibility(job_executor):
             "tracing_context": ANY,
         },
     )
-    job_executor.storage.enqueue_job.assert_called_with(job_id)
+    job_executor.storage.enqueue_job.assert_called_with(job_id, "")
     job_executor.storage.ack_job.assert_called_with("msg-123")
 
 
@@ -354,5 +361,90 @@ async def test_di_missing_argument_fails_job(job_executor, caplog):
         in job_executor.storage.save_job_state.call_args[0][1]["error_message"]
     )
     assert f"Error executing handler for job {job_id}. Attempt 1/1." in caplog.text
-    job_executor.storage.enqueue_job.assert_called_with(job_id)  # Job is re-enqueued for retry
+    job_executor.storage.enqueue_job.assert_called_with(job_id, "")  # Job is re-enqueued for retry
     job_executor.storage.ack_job.assert_called_with("msg-123")
+
+
+@pytest.mark.asyncio
+async def test_run_dequeues_in_batches_and_acks_in_bulk(job_executor):
+    """Tests that the main loop fills free slots with one dequeue call and acks processed jobs together."""
+    import asyncio
+
+    job_executor.engine.config.EXECUTOR_MAX_CONCURRENT_JOBS = 5
+    job_executor.engine.config.EXECUTOR_DEQUEUE_BATCH_SIZE = 3
+    job_executor.engine.config.EXECUTOR_DEQUEUE_BLOCK_MS = 100
+    job_executor.storage.get_job_state.return_value = None
+    calls = []
+
+    async def dequeue_jobs(count, block_ms):
+        calls.append((count, block_ms))
+        if len(calls) == 1:
+            return [("job-1", "msg-1"), ("job-2", "msg-2")]
+        # Let the spawned jobs finish, then stop the loop
+        await asyncio.sleep(0.01)
+        job_executor.stop()
+        return []
+
+    job_executor.storage.dequeue_jobs = dequeue_jobs
+    await job_executor.run()
+
+    assert calls[0] == (3, 100)
+    job_executor.storage.ack_jobs.assert_called_once_with(["msg-1", "msg-2"])
+    job_executor.storage.ack_job.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_process_job_commits_writes_once(job_executor):
+    """Tests that all writes made while handling a message are committed in a single batch."""
+    bp = StateMachineBlueprint(name="uow-bp")
+
+    @bp.handler_for("start", is_start=True)
+    async def start(actions):
+        actions.dispatch_task(task_type="work", params={}, transitions={"success": "end"})
+
+    job_executor.engine.blueprints["uow-bp"] = bp
+    job_executor.engine.config.WORKER_TIMEOUT_SECONDS = 60
+    job_executor.storage.get_job_state.return_value = {
+        "id": "job-uow",
+        "blueprint_name": "uow-bp",
+        "current_state": "start",
+        "initial_data": {},
+        "client_config": {},
+    }
+    job_executor.storage.ack_job = AsyncMock()
+
+    await job_executor._process_job("job-uow", "msg-123")
+
+    job_executor.storage.commit_job_writes.assert_called_once()
+    writes = job_executor.storage.commit_job_writes.call_args.kwargs
+    assert list(writes["job_states"]) == ["job-uow"]
+    assert writes["job_states"]["job-uow"]["status"] == "waiting_for_worker"
+    assert list(writes["watched_jobs"]) == ["job-uow"]
+    # The dispatcher writes into the same unit of work
+    assert job_executor.dispatcher.dispatch.call_args.kwargs["storage"] is not job_executor.storage
+    job_executor.storage.ack_job.assert_called_once_with("msg-123")
+
+
+@pytest.mark.asyncio
+async def test_process_job_not_acked_when_commit_fails(job_executor):
+    """Tests that a message is left for redelivery if its job changes could not be saved."""
+    bp = StateMachineBlueprint(name="uow-fail-bp")
+
+    @bp.handler_for("start", is_start=True)
+    async def start(actions):
+        actions.transition_to("end")
+
+    job_executor.engine.blueprints["uow-fail-bp"] = bp
+    job_executor.storage.get_job_state.return_value = {
+        "id": "job-uow",
+        "blueprint_name": "uow-fail-bp",
+        "current_state": "start",
+        "initial_data": {},
+        "client_config": {},
+    }
+    job_executor.storage.commit_job_writes.side_effect = ConnectionError("storage is down")
+    job_executor.storage.ack_job = AsyncMock()
+
+    await job_executor._process_job("job-uow", "msg-123")
+
+    job_executor.storage.ack_job.assert_not_called()
@@ -1,6 +1,6 @@
 import asyncio
 import contextlib
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 from src.avtomatika.health_checker import HealthChecker
@@ -10,13 +10,15 @@ from src.avtomatika.health_checker import HealthChecker
 def mock_engine():
     """Mocks the orchestrator engine and its dependencies."""
     engine = MagicMock()
+    engine.storage.prune_expired_workers = AsyncMock(return_value=0)
+    engine.config.WORKER_HEALTH_CHECK_INTERVAL_SECONDS = 60
     return engine
 
 
 @pytest.mark.asyncio
-async def test_passive_health_checker_does_not_error(mock_engine):
-    """Tests that the new passive HealthChecker can be instantiated and run
-    without causing errors. Its run loop is expected to do nothing but sleep.
+async def test_health_checker_does_not_error(mock_engine):
+    """Tests that the HealthChecker can be instantiated, started and cancelled
+    without causing errors.
     """
     health_checker = HealthChecker(mock_engine)
 
@@ -30,3 +32,20 @@ async def test_passive_health_checker_does_not_error(mock_engine):
 
     # The stop method should also be callable without error
     health_checker.stop()
+
+
+@pytest.mark.asyncio
+async def test_health_checker_prunes_expired_workers(mock_engine):
+    """Tests that the HealthChecker periodically prunes the worker registry."""
+    mock_engine.storage.prune_expired_workers.return_value = 2
+    health_checker = HealthChecker(mock_engine)
+    health_checker.interval_seconds = 0.01
+
+    run_task = asyncio.create_task(health_checker.run())
+    await asyncio.sleep(0.05)
+    health_checker.stop()
+    run_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await run_task
+
+    mock_engine.storage.prune_expired_workers.assert_called()
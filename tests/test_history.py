@@ -1,3 +1,5 @@
+import asyncio
+import time
 import uuid
 from unittest.mock import AsyncMock, MagicMock
 
@@ -8,7 +10,9 @@ from fakeredis.aioredis import FakeRedis
 from src.avtomatika.blueprint import StateMachineBlueprint
 from src.avtomatika.config import Config
 from src.avtomatika.executor import JobExecutor
+from src.avtomatika.history.buffered import BufferedHistoryStorage
 from src.avtomatika.history.sqlite import SQLiteHistoryStorage
+from src.avtomatika.job_partitions import JobPartitions
 from src.avtomatika.storage.redis import RedisStorage
 
 # Mark all tests in this file as asyncio
@@ -171,6 +175,283 @@ async def test_get_job_summary_empty(sqlite_storage: SQLiteHistoryStorage):
     assert summary == {}
 
 
+async def test_sqlite_log_job_events_batch(sqlite_storage: SQLiteHistoryStorage, mocker):
+    """Tests that a batch of events is written with a single commit."""
+    commit_spy = mocker.spy(sqlite_storage._conn, "commit")
+    events = [{"job_id": "job-1", "event_type": "state_started", "state": f"s{i}"} for i in range(5)]
+
+    await sqlite_storage.log_job_events(events)
+
+    assert commit_spy.call_count == 1
+    history = await sqlite_storage.get_job_history("job-1")
+    assert [e["state"] for e in history] == ["s0", "s1", "s2", "s3", "s4"]
+
+
+async def test_sqlite_log_job_events_rolls_back_on_error(sqlite_storage: SQLiteHistoryStorage, mocker):
+    mocker.patch.object(sqlite_storage._conn, "executemany", side_effect=aiosqlite.Error("Mock DB Error"))
+    with pytest.raises(aiosqlite.Error):
+        await sqlite_storage.log_job_events(
+            [{"job_id": "job-1", "event_type": "a"}, {"job_id": "job-1", "event_type": "b"}],
+        )
+
+
+async def test_sqlite_reconstructs_snapshot_diffs(sqlite_storage: SQLiteHistoryStorage):
+    job_state = {"initial_data": {"document": "x" * 1000}, "status": "running", "state_history": {}}
+    for i in range(12):
+        job_state["state_history"][f"step_{i}"] = i
+        await sqlite_storage.log_job_event(
+            {"job_id": "job-1", "event_type": "state_started", "state": f"s{i}", "context_snapshot": job_state}
+        )
+    job_state["status"] = "finished"
+    await sqlite_storage.log_job_event(
+        {"job_id": "job-1", "event_type": "state_finished", "context_snapshot": job_state},
+    )
+
+    async with sqlite_storage._conn.execute(
+        "SELECT COUNT(*) FROM job_history WHERE snapshot_base IS NULL AND job_id = 'job-1'"
+    ) as cursor:
+        (full_snapshots,) = await cursor.fetchone()
+    assert full_snapshots == 2
+
+    history = await sqlite_storage.get_job_history("job-1")
+    assert len(history) == 13
+    for i, event in enumerate(history[:12]):
+        assert event["context_snapshot"]["state_history"] == {f"step_{n}": n for n in range(i + 1)}
+        assert "snapshot_base" not in event
+    assert history[-1]["context_snapshot"]["status"] == "finished"
+
+    # The latest event of the job is a diff, its base is loaded separately
+    jobs = await sqlite_storage.get_jobs()
+    assert jobs[0]["context_snapshot"]["status"] == "finished"
+    assert await sqlite_storage.get_job_summary() == {"finished": 1}
+
+
+async def test_sqlite_get_task_outcomes(sqlite_storage: SQLiteHistoryStorage):
+    now = time.time()
+    for status, timestamp in (("success", now), ("failure", now), ("success", now - 2 * 86400)):
+        await sqlite_storage.log_job_event(
+            {
+                "job_id": "job-1",
+                "event_type": "task_finished",
+                "worker_id": "worker-1",
+                "result_status": status,
+                "timestamp": timestamp,
+            }
+        )
+    # Events logged before result_status was stored are read from the snapshot
+    await sqlite_storage.log_job_event(
+        {
+            "job_id": "job-2",
+            "event_type": "task_finished",
+            "worker_id": "worker-2",
+            "timestamp": now,
+            "context_snapshot": {"result": {"status": "success"}},
+        }
+    )
+    await sqlite_storage.log_job_event({"job_id": "job-3", "event_type": "task_finished", "worker_id": "worker-3"})
+    await sqlite_storage.log_job_event({"job_id": "job-1", "event_type": "state_started", "worker_id": "worker-1"})
+    await sqlite_storage.log_job_event(
+        {"job_id": "job-1", "event_type": "task_finished", "worker_id": "worker-1", "timestamp": now - 40 * 86400}
+    )
+
+    outcomes = await sqlite_storage.get_task_outcomes(since_days=30)
+    assert sorted(outcomes, key=lambda row: (row["worker_id"], row["age_days"])) == [
+        {"worker_id": "worker-1", "age_days": 0, "total": 2, "successes": 1},
+        {"worker_id": "worker-1", "age_days": 2, "total": 1, "successes": 1},
+        {"worker_id": "worker-2", "age_days": 0, "total": 1, "successes": 1},
+        {"worker_id": "worker-3", "age_days": 0, "total": 1, "successes": 0},
+    ]
+
+
+async def test_sqlite_adds_missing_columns(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    async with aiosqlite.connect(db_path) as conn:
+        await conn.execute(
+            "CREATE TABLE job_history (event_id TEXT PRIMARY KEY, job_id TEXT NOT NULL, timestamp REAL NOT NULL, "
+            "state TEXT, event_type TEXT NOT NULL, duration_ms INTEGER, previous_state TEXT, next_state TEXT, "
+            "worker_id TEXT, attempt_number INTEGER, context_snapshot TEXT)"
+        )
+        await conn.commit()
+
+    storage = SQLiteHistoryStorage(db_path)
+    await storage.initialize()
+    try:
+        await storage.log_job_event({"job_id": "job-1", "event_type": "a", "context_snapshot": {"status": "running"}})
+        assert await storage.get_job_summary() == {"running": 1}
+    finally:
+        await storage.close()
+
+
+async def test_sqlite_get_jobs_keyset_pagination(sqlite_storage: SQLiteHistoryStorage):
+    for i in range(5):
+        await sqlite_storage.log_job_event(
+            {
+                "job_id": f"job-{i}",
+                "event_type": "state_started",
+                "timestamp": 1000.0 + i,
+                "context_snapshot": {"status": "running", "blueprint_name": "flow", "current_state": "start"},
+            }
+        )
+    await sqlite_storage.log_job_event(
+        {
+            "job_id": "job-0",
+            "event_type": "state_finished",
+            "timestamp": 2000.0,
+            "context_snapshot": {"status": "finished"},
+        }
+    )
+
+    first_page = await sqlite_storage.get_jobs(limit=2)
+    assert [job["job_id"] for job in first_page] == ["job-0", "job-4"]
+    assert first_page[0]["status"] == "finished"
+    assert first_page[0]["event_type"] == "state_finished"
+    assert first_page[0]["blueprint_name"] == "flow"
+
+    second_page = await sqlite_storage.get_jobs(limit=10, cursor=first_page[-1]["cursor"])
+    assert [job["job_id"] for job in second_page] == ["job-3", "job-2", "job-1"]
+    assert await sqlite_storage.get_job_summary() == {"finished": 1, "running": 4}
+
+    with pytest.raises(ValueError):
+        await sqlite_storage.get_jobs(cursor="not-a-cursor")
+
+
+async def test_sqlite_job_latest_ignores_older_events(sqlite_storage: SQLiteHistoryStorage):
+    await sqlite_storage.log_job_events(
+        [
+            {"job_id": "job-1", "event_type": "b", "timestamp": 20.0, "context_snapshot": {"status": "finished"}},
+            {"job_id": "job-1", "event_type": "a", "timestamp": 10.0, "context_snapshot": {"status": "running"}},
+        ]
+    )
+    jobs = await sqlite_storage.get_jobs()
+    assert len(jobs) == 1
+    assert jobs[0]["event_type"] == "b"
+    assert await sqlite_storage.get_job_summary() == {"finished": 1}
+
+
+async def test_sqlite_backfills_job_latest(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    storage = SQLiteHistoryStorage(db_path)
+    await storage.initialize()
+    await storage.log_job_event({"job_id": "job-1", "event_type": "a", "context_snapshot": {"status": "running"}})
+    await storage._conn.execute("DROP TABLE job_latest")
+    await storage._conn.commit()
+    await storage.close()
+
+    storage = SQLiteHistoryStorage(db_path)
+    await storage.initialize()
+    try:
+        assert await storage.get_job_summary() == {"running": 1}
+        assert [job["job_id"] for job in await storage.get_jobs()] == ["job-1"]
+    finally:
+        await storage.close()
+
+
+# --- Buffered history writer ---
+
+
+async def test_buffered_writes_events_in_batches(sqlite_storage: SQLiteHistoryStorage, mocker):
+    buffered = BufferedHistoryStorage(sqlite_storage, batch_size=100, flush_interval=60)
+    write_spy = mocker.spy(sqlite_storage, "log_job_events")
+
+    for i in range(10):
+        await buffered.log_job_event({"job_id": "job-1", "event_type": "state_started", "state": f"s{i}"})
+    await buffered.log_worker_event({"worker_id": "worker-1", "event_type": "registered"})
+    write_spy.assert_not_called()
+
+    # Reads flush the buffer first
+    history = await buffered.get_job_history("job-1")
+
+    assert len(history) == 10
+    write_spy.assert_called_once()
+    assert len(write_spy.call_args.args[0]) == 10
+
+
+async def test_buffered_background_flush(sqlite_storage: SQLiteHistoryStorage):
+    sqlite_storage.initialize = AsyncMock()
+    buffered = BufferedHistoryStorage(sqlite_storage, batch_size=2, flush_interval=60)
+    await buffered.initialize()
+    try:
+        await buffered.log_job_event({"job_id": "job-1", "event_type": "a"})
+        await buffered.log_job_event({"job_id": "job-1", "event_type": "b"})
+        # The batch size is reached, the background task is woken up without waiting for the interval
+        for _ in range(50):
+            if buffered._queue.empty():
+                break
+            await asyncio.sleep(0.01)
+        assert len(await sqlite_storage.get_job_history("job-1")) == 2
+    finally:
+        buffered._running = False
+        buffered._flusher.cancel()
+
+
+async def test_buffered_snapshot_is_taken_when_logged(sqlite_storage: SQLiteHistoryStorage):
+    buffered = BufferedHistoryStorage(sqlite_storage)
+    job_state = {"status": "running"}
+
+    await buffered.log_job_event({"job_id": "job-1", "event_type": "a", "context_snapshot": job_state})
+    job_state["status"] = "finished"
+
+    history = await buffered.get_job_history("job-1")
+    assert history[0]["context_snapshot"] == {"status": "running"}
+
+
+async def test_buffered_close_flushes_events(sqlite_storage: SQLiteHistoryStorage, mocker):
+    buffered = BufferedHistoryStorage(sqlite_storage, flush_interval=60)
+    write_spy = mocker.spy(sqlite_storage, "log_job_events")
+    close_mock = mocker.patch.object(sqlite_storage, "close", AsyncMock())
+
+    await buffered.log_job_event({"job_id": "job-1", "event_type": "a"})
+    await buffered.close()
+
+    write_spy.assert_called_once()
+    close_mock.assert_awaited_once()
+
+
+async def test_buffered_drop_policy(sqlite_storage: SQLiteHistoryStorage):
+    buffered = BufferedHistoryStorage(sqlite_storage, max_size=2, overflow_policy="drop")
+
+    for i in range(5):
+        await buffered.log_job_event({"job_id": "job-1", "event_type": f"e{i}"})
+
+    history = await buffered.get_job_history("job-1")
+    assert [e["event_type"] for e in history] == ["e0", "e1"]
+
+
+async def test_buffered_spill_policy(sqlite_storage: SQLiteHistoryStorage, tmp_path):
+    spill_path = str(tmp_path / "history.spill")
+    buffered = BufferedHistoryStorage(sqlite_storage, max_size=2, overflow_policy="spill", spill_path=spill_path)
+
+    for i in range(5):
+        await buffered.log_job_event({"job_id": "job-1", "event_type": f"e{i}"})
+
+    assert len((tmp_path / "history.spill").read_text().splitlines()) == 3
+
+    await buffered.flush()
+    await buffered._replay_spill()
+
+    history = await sqlite_storage.get_job_history("job-1")
+    assert sorted(e["event_type"] for e in history) == ["e0", "e1", "e2", "e3", "e4"]
+    assert not (tmp_path / "history.spill").exists()
+
+
+async def test_buffered_spills_failed_batch(sqlite_storage: SQLiteHistoryStorage, mocker, tmp_path):
+    spill_path = str(tmp_path / "history.spill")
+    buffered = BufferedHistoryStorage(sqlite_storage, overflow_policy="spill", spill_path=spill_path)
+    mocker.patch.object(sqlite_storage, "log_job_events", side_effect=aiosqlite.Error("Mock DB Error"))
+
+    await buffered.log_job_event({"job_id": "job-1", "event_type": "a"})
+    await buffered.flush()
+
+    assert len((tmp_path / "history.spill").read_text().splitlines()) == 1
+
+
+async def test_buffered_invalid_overflow_policy(sqlite_storage: SQLiteHistoryStorage):
+    with pytest.raises(ValueError):
+        BufferedHistoryStorage(sqlite_storage, overflow_policy="unknown")
+    with pytest.raises(ValueError):
+        BufferedHistoryStorage(sqlite_storage, overflow_policy="spill")
+
+
 @pytest_asyncio.fixture
 async def redis_client():
     client = FakeRedis()
@@ -210,6 +491,7 @@ async def test_executor_logs_history_integration(sqlite_storage: SQLiteHistorySt
     mock_engine = MagicMock()
     mock_engine.config = Config()
     mock_engine.blueprints = {"test_bp": test_bp}
+    mock_engine.job_partitions = JobPartitions(mock_engine.config, mock_engine.blueprints)
 
     # The dispatcher needs to be an async mock to be awaitable
     mock_dispatcher = AsyncMock()
@@ -0,0 +1,240 @@
+from datetime import datetime, timezone
+from time import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytest_asyncio
+from src.avtomatika.history.partitions import (
+    parse_partition_start,
+    partition_end,
+    partition_name,
+    partition_start,
+    validate_partition_interval,
+)
+from src.avtomatika.history.sqlite import SQLiteHistoryStorage
+from src.avtomatika.retention import HistoryRetention
+
+DAY = 86400
+# 2024-01-03 12:00 UTC, a Wednesday
+NOON = datetime(2024, 1, 3, 12, tzinfo=timezone.utc).timestamp()
+
+
+def test_partition_periods():
+    assert partition_start(NOON, "day") == datetime(2024, 1, 3, tzinfo=timezone.utc).timestamp()
+    # Weeks start on Monday
+    monday = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+    assert partition_start(NOON, "week") == monday
+    assert partition_end(monday, "week") == monday + 7 * DAY
+    assert partition_name("job_history", monday) == "job_history_p20240101"
+    assert parse_partition_start("job_history", "job_history_p20240101") == monday
+    assert parse_partition_start("job_history", "job_history_legacy") is None
+    assert parse_partition_start("job_history", "worker_history_p20240101") is None
+
+
+def test_invalid_partition_interval():
+    validate_partition_interval("")
+    with pytest.raises(ValueError):
+        validate_partition_interval("month")
+    with pytest.raises(ValueError):
+        SQLiteHistoryStorage(":memory:", partition_interval="hour")
+
+
+@pytest_asyncio.fixture
+async def partitioned_storage():
+    storage = SQLiteHistoryStorage(":memory:", partition_interval="day")
+    await storage.initialize()
+    yield storage
+    await storage.close()
+
+
+async def _table_names(storage: SQLiteHistoryStorage) -> set[str]:
+    async with storage._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'") as cursor:
+        return {row[0] for row in await cursor.fetchall()}
+
+
+@pytest.mark.asyncio
+async def test_partitioned_writes_and_reads(partitioned_storage: SQLiteHistoryStorage):
+    storage = partitioned_storage
+    for day in range(3):
+        await storage.log_job_event(
+            {
+                "job_id": "job-1",
+                "event_type": "state_started",
+                "timestamp": NOON + day * DAY,
+                "worker_id": "worker-1",
+                "context_snapshot": {"status": "running", "step": day, "data": "x" * 200},
+            }
+        )
+        await storage.log_worker_event(
+            {"worker_id": "worker-1", "event_type": "heartbeat", "timestamp": NOON + day * DAY},
+        )
+
+    tables = await _table_names(storage)
+    assert {"job_history_p20240103", "job_history_p20240104", "job_history_p20240105"} <= tables
+    assert {"worker_history_p20240103", "worker_history_p20240105"} <= tables
+
+    history = await storage.get_job_history("job-1")
+    assert [event["context_snapshot"]["step"] for event in history] == [0, 1, 2]
+    # Every partition starts with a full snapshot
+    async with storage._conn.execute("SELECT COUNT(*) FROM job_history WHERE snapshot_base IS NULL") as cursor:
+        (full_snapshots,) = await cursor.fetchone()
+    assert full_snapshots == 3
+
+    jobs = await storage.get_jobs()
+    assert jobs[0]["context_snapshot"]["step"] == 2
+
+
+@pytest.mark.asyncio
+async def test_partitioned_retention_drops_partitions(partitioned_storage: SQLiteHistoryStorage, mocker):
+    storage = partitioned_storage
+    await storage.log_job_event({"job_id": "old", "event_type": "a", "timestamp": NOON - 2 * DAY})
+    await storage.log_job_event({"job_id": "kept", "event_type": "a", "timestamp": NOON - DAY / 2})
+    await storage.log_worker_event(
+        {"worker_id": "worker-1", "event_type": "heartbeat", "timestamp": NOON - 2 * DAY},
+    )
+    write_archive = mocker.patch("src.avtomatika.history.sqlite.write_archive", return_value="archive.parquet")
+
+    await storage.drop_expired_events(NOON, archive_path="/archive")
+
+    tables = await _table_names(storage)
+    assert "job_history_p20240101" not in tables
+    assert "worker_history_p20240101" not in tables
+    assert "job_history_p20240103" in tables
+    archived = {call.args[1]: call.args[2] for call in write_archive.call_args_list}
+    assert set(archived) == {"job_history_p20240101", "worker_history_p20240101"}
+    assert archived["job_history_p20240101"][0]["job_id"] == "old"
+    assert [job["job_id"] for job in await storage.get_jobs()] == ["kept"]
+    assert await storage.get_job_history("old") == []
+
+
+@pytest.mark.asyncio
+async def test_unpartitioned_retention_deletes_rows():
+    storage = SQLiteHistoryStorage(":memory:")
+    await storage.initialize()
+    try:
+        await storage.log_job_event({"job_id": "old", "event_type": "a", "timestamp": NOON - DAY})
+        await storage.log_job_event({"job_id": "new", "event_type": "a", "timestamp": NOON + 1})
+        await storage.drop_expired_events(NOON)
+        assert await storage.get_job_history("old") == []
+        assert [job["job_id"] for job in await storage.get_jobs()] == ["new"]
+    finally:
+        await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_retention_keeps_diffs_whose_base_expires():
+    storage = SQLiteHistoryStorage(":memory:")
+    await storage.initialize()
+    try:
+        snapshot = {"initial_data": "x" * 1000, "status": "running", "step": 0}
+        for step, timestamp in enumerate((NOON - DAY, NOON - 1, NOON + 1, NOON + 2)):
+            await storage.log_job_event(
+                {
+                    "job_id": "job-1",
+                    "event_type": "a",
+                    "timestamp": timestamp,
+                    "context_snapshot": {**snapshot, "step": step},
+                }
+            )
+        # Only the first event stores a full snapshot, the events after the cutoff are diffs against it
+        async with storage._conn.execute("SELECT COUNT(*) FROM job_history WHERE snapshot_base IS NULL") as cursor:
+            assert (await cursor.fetchone())[0] == 1
+
+        await storage.drop_expired_events(NOON)
+        history = await storage.get_job_history("job-1")
+        assert [event["context_snapshot"] for event in history] == [
+            {**snapshot, "step": 2},
+            {**snapshot, "step": 3},
+        ]
+    finally:
+        await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_partitioning_keeps_existing_history_as_legacy(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    storage = SQLiteHistoryStorage(db_path)
+    await storage.initialize()
+    await storage.log_job_event({"job_id": "job-1", "event_type": "a", "timestamp": NOON})
+    await storage.close()
+
+    storage = SQLiteHistoryStorage(db_path, partition_interval="week")
+    await storage.initialize()
+    try:
+        assert "job_history_legacy" in await _table_names(storage)
+        await storage.log_job_event({"job_id": "job-2", "event_type": "a"})
+        assert [job["job_id"] for job in await storage.get_jobs()] == ["job-2", "job-1"]
+
+        # The legacy table is dropped once all of its events have expired
+        await storage.drop_expired_events(NOON + 30 * DAY)
+        assert "job_history_legacy" not in await _table_names(storage)
+        assert [job["job_id"] for job in await storage.get_jobs()] == ["job-2"]
+    finally:
+        await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_partitioned_database_requires_partition_interval(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    storage = SQLiteHistoryStorage(db_path, partition_interval="day")
+    await storage.initialize()
+    await storage.close()
+
+    with pytest.raises(RuntimeError):
+        await SQLiteHistoryStorage(db_path).initialize()
+
+
+@pytest.mark.asyncio
+async def test_history_retention_run(mocker):
+    engine = MagicMock()
+    engine.config.HISTORY_RETENTION_DAYS = 7
+    engine.config.HISTORY_RETENTION_INTERVAL_SECONDS = 3600
+    engine.config.HISTORY_ARCHIVE_PATH = "/archive"
+    engine.storage.acquire_lock = AsyncMock(return_value=True)
+    engine.storage.release_lock = AsyncMock()
+    engine.history_storage.drop_expired_events = AsyncMock()
+    retention = HistoryRetention(engine)
+
+    async def stop(*args):
+        retention.stop()
+
+    mocker.patch("src.avtomatika.retention.sleep", side_effect=stop)
+    await retention.run()
+
+    engine.history_storage.drop_expired_events.assert_awaited_once()
+    before = engine.history_storage.drop_expired_events.call_args.args[0]
+    assert before == pytest.approx(time() - 7 * DAY, abs=5)
+    assert engine.history_storage.drop_expired_events.call_args.kwargs["archive_path"] == "/archive"
+    engine.storage.release_lock.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_history_retention_skips_when_locked(mocker):
+    engine = MagicMock()
+    engine.config.HISTORY_RETENTION_DAYS = 7
+    engine.storage.acquire_lock = AsyncMock(return_value=False)
+    engine.history_storage.drop_expired_events = AsyncMock()
+    retention = HistoryRetention(engine)
+
+    async def stop(*args):
+        retention.stop()
+
+    mocker.patch("src.avtomatika.retention.sleep", side_effect=stop)
+    await retention.run()
+    engine.history_storage.drop_expired_events.assert_not_awaited()
+
+
+def test_write_archive_requires_pyarrow(mocker, tmp_path):
+    from src.avtomatika.history import archive
+
+    mocker.patch.object(archive, "Table", None)
+    with pytest.raises(ImportError):
+        archive.write_archive(str(tmp_path), "job_history_p20240101", [{"event_id": "1"}])
+
+
+def test_write_archive(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    from src.avtomatika.history.archive import write_archive
+
+    file_path = write_archive(str(tmp_path), "job_history_p20240101", [{"event_id": "1", "timestamp": NOON}])
+    assert parquet.read_table(file_path).to_pylist() == [{"event_id": "1", "timestamp": NOON}]
@@ -0,0 +1,90 @@
+import pytest
+from src.avtomatika.history.snapshots import SnapshotCompactor, apply_patch, diff_snapshots
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ({"a": 1}, {"a": 1}),
+        ({"a": 1}, {"a": 2}),
+        ({"a": 1}, {"a": 1, "b": {"c": [1, 2]}}),
+        ({"a": 1, "b": 2}, {"a": 1}),
+        ({"a": {"b": {"c": 1, "d": 2}}}, {"a": {"b": {"c": 3}}}),
+        ({"a": [1, 2]}, {"a": [1, 2, 3]}),
+        ({"a": {"b": 1}}, {"a": "flat"}),
+        ({"a": 1}, {"a": 1.0}),
+        ({"a": None}, {"a": 0}),
+        ({"a/b": 1, "c~d": 2}, {"a/b": 2, "c~d": 3}),
+        ({"a": 1}, ["not", "an", "object"]),
+    ],
+)
+def test_diff_and_apply_roundtrip(old, new):
+    patch = diff_snapshots(old, new)
+    assert apply_patch(old, patch) == new
+    assert type(apply_patch(old, patch)) is type(new)
+
+
+def test_diff_of_equal_snapshots_is_empty():
+    assert diff_snapshots({"a": {"b": [1]}}, {"a": {"b": [1]}}) == []
+
+
+def test_apply_patch_does_not_modify_base():
+    base = {"a": {"b": 1}, "c": 2}
+    apply_patch(base, diff_snapshots(base, {"a": {"b": 2}}))
+    assert base == {"a": {"b": 1}, "c": 2}
+
+
+def test_compactor_stores_full_snapshots_at_interval():
+    compactor = SnapshotCompactor(full_snapshot_interval=3)
+    snapshot = {"initial_data": "x" * 1000, "status": "running", "step": 0}
+
+    bases = []
+    for i in range(7):
+        snapshot = {**snapshot, "step": i}
+        _, base = compactor.compact("job-1", f"event-{i}", snapshot)
+        bases.append(base)
+
+    assert bases == [None, "event-0", "event-0", None, "event-3", "event-3", None]
+
+
+def test_compactor_keeps_a_copy_of_the_base():
+    compactor = SnapshotCompactor()
+    job_state = {"initial_data": "x" * 1000, "status": "running"}
+    compactor.compact("job-1", "event-0", job_state)
+
+    job_state["status"] = "finished"
+    data, base = compactor.compact("job-1", "event-1", job_state)
+
+    assert base == "event-0"
+    assert '"finished"' in data
+
+
+def test_compactor_stores_full_snapshot_when_diff_is_larger():
+    compactor = SnapshotCompactor()
+    compactor.compact("job-1", "event-0", {"a": 1})
+    _, base = compactor.compact("job-1", "event-1", {"b": 2})
+    assert base is None
+
+
+def test_compactor_disabled_and_forget():
+    compactor = SnapshotCompactor(full_snapshot_interval=1)
+    snapshot = {"initial_data": "x" * 1000}
+    compactor.compact("job-1", "event-0", snapshot)
+    assert compactor.compact("job-1", "event-1", snapshot)[1] is None
+
+    compactor = SnapshotCompactor()
+    compactor.compact("job-1", "event-0", snapshot)
+    compactor.forget(["job-1"])
+    assert compactor.compact("job-1", "event-1", snapshot)[1] is None
+
+
+def test_compactor_starts_full_snapshot_in_new_period():
+    compactor = SnapshotCompactor()
+    job_state = {"data": "x" * 100, "step": 0}
+    compactor.compact("job-1", "event-0", job_state, period=0.0)
+    job_state["step"] = 1
+    _, base = compactor.compact("job-1", "event-1", job_state, period=0.0)
+    assert base == "event-0"
+    job_state["step"] = 2
+    _, base = compactor.compact("job-1", "event-2", job_state, period=86400.0)
+    assert base is None
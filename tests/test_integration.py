@@ -2,13 +2,15 @@ import asyncio
 import hashlib
 import json
 import os
-from unittest.mock import AsyncMock
+import time
+from unittest.mock import AsyncMock, patch
 
 import pytest
 import zstandard
 from aiohttp import web
 from src.avtomatika.blueprint import StateMachineBlueprint
 from src.avtomatika.client_config_loader import load_client_configs_to_redis
+from src.avtomatika.config import Config
 from src.avtomatika.engine import ENGINE_KEY, OrchestratorEngine
 from src.avtomatika.storage.redis import RedisStorage
 
@@ -120,7 +122,7 @@ async def test_sub_blueprint_flow(aiohttp_client, app):
 
     headers = {"X-Avtomatika-Token": "user_token_vip"}
     await storage.initialize_client_quota("user_token_vip", 5)
-    resp = await client.post("/api/v1/jobs/parent_flow", json={}, headers=headers)
+    resp = await client.post("/api/v1/jobs/parent_flow", json={}, headers=headers, params={"priority": "7"})
     assert resp.status == 202
     parent_job_id = (await resp.json())["job_id"]
 
@@ -143,6 +145,18 @@ async def test_sub_blueprint_flow(aiohttp_client, app):
     assert final_child_state is not None
     assert final_child_state["current_state"] == "finished"
     assert final_child_state["parent_job_id"] == parent_job_id
+    # The sub-job inherits the priority of its parent
+    assert final_child_state["priority"] == final_parent_state["priority"] == 7
+
+
+@pytest.mark.parametrize("app", [{"extra_blueprints": [child_bp, parent_bp]}], indirect=True)
+@pytest.mark.asyncio
+async def test_create_job_with_invalid_priority(aiohttp_client, app):
+    client = await aiohttp_client(app)
+    headers = {"X-Avtomatika-Token": "user_token_vip"}
+    await app[STORAGE_KEY].initialize_client_quota("user_token_vip", 5)
+    resp = await client.post("/api/v1/jobs/parent_flow", json={}, headers=headers, params={"priority": "urgent"})
+    assert resp.status == 400
 
 
 @pytest.mark.parametrize("app", [{"extra_blueprints": [data_store_bp]}], indirect=True)
@@ -342,6 +356,246 @@ async def test_worker_registration_with_full_data(aiohttp_client, app):
     assert stored_data["multi_orchestrator_info"]["mode"] == "FAILOVER"
 
 
+@pytest.mark.parametrize("app", [{"extra_blueprints": [child_bp, parent_bp]}], indirect=True)
+@pytest.mark.asyncio
+async def test_task_result_updates_worker_stats(aiohttp_client, app):
+    client = await aiohttp_client(app)
+    storage: RedisStorage = app[STORAGE_KEY]
+    worker_id = "stats-worker"
+    headers = {"X-Worker-Token": app[ENGINE_KEY].config.GLOBAL_WORKER_TOKEN}
+    await storage.register_worker(worker_id, {"worker_id": worker_id, "supported_tasks": ["render"]}, 60)
+    await storage.save_job_state(
+        "job-stats",
+        {
+            "id": "job-stats",
+            "status": "waiting_for_worker",
+            "current_state": "rendering",
+            "current_task_info": {"type": "render"},
+            "current_task_transitions": {"success": "finished"},
+            "task_dispatched_at": time.time() - 0.25,
+        },
+    )
+
+    resp = await client.post(
+        "/_worker/tasks/result",
+        json={"job_id": "job-stats", "task_id": "task-1", "worker_id": worker_id, "result": {"status": "success"}},
+        headers=headers,
+    )
+    assert resp.status == 200
+
+    await storage.initialize_client_quota("user_token_vip", 5)
+    resp = await client.get("/api/v1/workers", headers={"X-Avtomatika-Token": "user_token_vip"})
+    assert resp.status == 200
+    stats = next(w for w in await resp.json() if w["worker_id"] == worker_id)["stats"]["render"]
+    assert stats["count"] == 1
+    assert stats["error_rate"] == 0.0
+    assert 250 <= stats["ewma_latency_ms"] < 1000
+    assert stats["p50_latency_ms"] == pytest.approx(stats["ewma_latency_ms"], rel=0.02)
+
+
+@pytest.mark.asyncio
+async def test_get_next_tasks_batch(aiohttp_client, app):
+    client = await aiohttp_client(app)
+    storage: RedisStorage = app[STORAGE_KEY]
+    worker_id = "batch-worker"
+    headers = {"X-Worker-Token": app[ENGINE_KEY].config.GLOBAL_WORKER_TOKEN}
+    for priority in range(3):
+        await storage.enqueue_task_for_worker(
+            worker_id, {"job_id": f"job-{priority}", "task_id": f"task-{priority}"}, priority
+        )
+
+    resp = await client.get(f"/_worker/workers/{worker_id}/tasks/next?max=2", headers=headers)
+    assert resp.status == 200
+    assert [task["task_id"] for task in await resp.json()] == ["task-2", "task-1"]
+    assert (await storage.get_worker_loads([worker_id]))[worker_id] == {"queued": 1, "in_flight": 2}
+
+    # Without `max` a single task object is returned
+    resp = await client.get(f"/_worker/workers/{worker_id}/tasks/next", headers=headers)
+    assert (await resp.json())["task_id"] == "task-0"
+
+    resp = await client.get(f"/_worker/workers/{worker_id}/tasks/next?max=0", headers=headers)
+    assert resp.status == 400
+
+
+@pytest.mark.asyncio
+async def test_taken_task_is_in_flight_for_its_timeout(aiohttp_client, app):
+    client = await aiohttp_client(app)
+    storage: RedisStorage = app[STORAGE_KEY]
+    worker_id = "timeout-worker"
+    headers = {"X-Worker-Token": app[ENGINE_KEY].config.GLOBAL_WORKER_TOKEN}
+    await storage.enqueue_task_for_worker(
+        worker_id, {"job_id": "job-1", "task_id": "task-1", "timeout_seconds": 3600}, 0
+    )
+
+    resp = await client.get(f"/_worker/workers/{worker_id}/tasks/next", headers=headers)
+    assert resp.status == 200
+    deadline = await storage._redis.zscore(f"orchestrator:worker:in_flight:{worker_id}", "task-1")
+    assert deadline == pytest.approx(time.time() + 3600, abs=60)
+
+
+@pytest.mark.asyncio
+async def test_long_poll_is_woken_by_task_notifications(aiohttp_client, app):
+    client = await aiohttp_client(app)
+    storage: RedisStorage = app[STORAGE_KEY]
+    worker_id = "waiting-worker"
+    headers = {"X-Worker-Token": app[ENGINE_KEY].config.GLOBAL_WORKER_TOKEN}
+
+    with patch.object(storage, "dequeue_task_for_worker", side_effect=AssertionError("blocking pop")):
+        poll = asyncio.create_task(client.get(f"/_worker/workers/{worker_id}/tasks/next", headers=headers))
+        await asyncio.sleep(0.1)
+        assert not poll.done()
+        await storage.enqueue_task_for_worker(worker_id, {"job_id": "job-1", "task_id": "task-1"}, 0)
+        resp = await asyncio.wait_for(poll, timeout=5)
+
+    assert resp.status == 200
+    assert (await resp.json())["task_id"] == "task-1"
+    assert app[ENGINE_KEY].task_notifier._waiters == {}
+
+
+@pytest.mark.asyncio
+async def test_long_polls_over_the_blocking_limit_do_not_block(app):
+    storage: RedisStorage = app[STORAGE_KEY]
+    config = Config()
+    config.TASK_NOTIFICATIONS_ENABLED = False
+    config.WORKER_BLOCKING_POLLS_MAX = 0
+    config.WORKER_POLL_FALLBACK_INTERVAL_SECONDS = 0.05
+    engine = OrchestratorEngine(storage, config)
+    worker_id = "polling-worker"
+
+    with patch.object(storage, "dequeue_task_from_queues", side_effect=AssertionError("blocking pop")):
+        poll = asyncio.create_task(engine._take_tasks(worker_id, 1, 5))
+        await asyncio.sleep(0.1)
+        assert not poll.done()
+        await storage.enqueue_task_for_worker(worker_id, {"job_id": "job-1", "task_id": "task-1"}, 0)
+        taken = await asyncio.wait_for(poll, timeout=1)
+
+    assert taken == [(worker_id, {"job_id": "job-1", "task_id": "task-1"}, 0)]
+
+
+@pytest.mark.asyncio
+async def test_task_results_batch(aiohttp_client, app):
+    client = await aiohttp_client(app)
+    storage: RedisStorage = app[STORAGE_KEY]
+    worker_id = "results-worker"
+    headers = {"X-Worker-Token": app[ENGINE_KEY].config.GLOBAL_WORKER_TOKEN}
+    await storage.save_job_state(
+        "job-parallel",
+        {
+            "id": "job-parallel",
+            "status": "waiting_for_parallel_tasks",
+            "active_branches": ["b1", "b2"],
+            "aggregation_target": "aggregate",
+        },
+    )
+    await storage.save_job_state(
+        "job-single",
+        {"id": "job-single", "status": "waiting_for_worker", "current_task_transitions": {"success": "done"}},
+    )
+
+    resp = await client.post(
+        "/_worker/tasks/results",
+        json={
+            "worker_id": worker_id,
+            "results": [
+                {"job_id": "job-parallel", "task_id": "b1", "result": {"status": "success"}},
+                {"job_id": "job-parallel", "task_id": "b2", "result": {"status": "success"}},
+                {"job_id": "job-single", "task_id": "t1", "result": {"status": "success"}},
+                {"job_id": "missing", "task_id": "t2", "result": {"status": "success"}},
+            ],
+        },
+        headers=headers,
+    )
+    assert resp.status == 200
+    assert [r.get("status", r.get("error")) for r in (await resp.json())["results"]] == [
+        "parallel_branch_result_accepted",
+        "parallel_branch_result_accepted",
+        "result_accepted_success",
+        "Job not found",
+    ]
+    # Both branches of the same job were applied on top of each other
+    parallel_state = await storage.get_job_state("job-parallel")
+    assert parallel_state["active_branches"] == []
+    assert parallel_state["current_state"] == "aggregate"
+    assert parallel_state["aggregation_results"].keys() == {"b1", "b2"}
+    assert (await storage.get_job_state("job-single"))["current_state"] == "done"
+
+    resp = await client.post(
+        "/_worker/tasks/results", json={"worker_id": worker_id, "results": "not-a-list"}, headers=headers
+    )
+    assert resp.status == 400
+
+
+@pytest.mark.asyncio
+async def test_tasks_pushed_over_websocket(aiohttp_client, app):
+    engine = app[ENGINE_KEY]
+    engine.config.WORKER_PUSH_ENABLED = True
+    client = await aiohttp_client(app)
+    storage: RedisStorage = app[STORAGE_KEY]
+    worker_id = "push-worker"
+    headers = {"X-Worker-Token": engine.config.GLOBAL_WORKER_TOKEN}
+    await storage.register_worker(worker_id, {"worker_id": worker_id, "supported_tasks": ["render"]}, 60)
+    await storage.save_job_state(
+        "job-push",
+        {"id": "job-push", "status": "waiting_for_worker", "current_task_transitions": {"success": "done"}},
+    )
+    await storage.enqueue_task_for_worker(worker_id, {"job_id": "job-push", "task_id": "t1"}, 0)
+    await storage.enqueue_task_for_worker(worker_id, {"job_id": "job-other", "task_id": "t2"}, 0)
+
+    async with client.ws_connect(f"/_worker/ws/{worker_id}", headers=headers) as ws:
+        await ws.send_json({"event": "push_start", "credits": 1})
+        assert await ws.receive_json(timeout=5) == {"command": "push_accepted"}
+        # One free slot, so only one of the queued tasks is pushed
+        first = await ws.receive_json(timeout=5)
+        assert first["command"] == "run_task"
+        assert (await storage.get_worker_loads([worker_id]))[worker_id] == {"queued": 1, "in_flight": 1}
+
+        await ws.send_json(
+            {
+                "event": "task_result",
+                "payload": {"job_id": "job-push", "task_id": "t1", "result": {"status": "success"}},
+            }
+        )
+        ack = await ws.receive_json(timeout=5)
+        assert ack == {"command": "result_ack", "task_id": "t1", "status": "result_accepted_success"}
+
+        # Returning the slot lets the next task through
+        await ws.send_json({"event": "credit", "amount": 1})
+        second = await ws.receive_json(timeout=5)
+        assert {first["task"]["task_id"], second["task"]["task_id"]} == {"t1", "t2"}
+
+        # Tasks enqueued later are pushed as soon as a slot is free
+        await ws.send_json({"event": "credit", "amount": 1})
+        await storage.enqueue_task_for_worker(worker_id, {"job_id": "job-late", "task_id": "t3"}, 0)
+        assert (await ws.receive_json(timeout=5))["task"]["task_id"] == "t3"
+
+    assert (await storage.get_job_state("job-push"))["current_state"] == "done"
+
+
+@pytest.mark.asyncio
+async def test_unsent_pushed_tasks_are_requeued_where_they_came_from(app):
+    engine = app[ENGINE_KEY]
+    storage: RedisStorage = app[STORAGE_KEY]
+    worker_id = "push-worker"
+    await storage.enqueue_task_for_worker(worker_id, {"job_id": "job-1", "task_id": "t1"}, 7)
+    await storage.enqueue_task_for_worker(worker_id, {"job_id": "job-2", "task_id": "t2"}, 5)
+
+    # The connection is lost after the first task was sent
+    wakeup = asyncio.Event()
+    wakeup.set()
+    with (
+        patch.object(engine.ws_manager, "is_pushing", side_effect=[True, False]),
+        patch.object(engine.ws_manager, "get_credits", return_value=2),
+        patch.object(engine.ws_manager, "use_credits"),
+        patch.object(engine.ws_manager, "send_json", AsyncMock(side_effect=[True, False])),
+    ):
+        await engine._push_tasks(worker_id, wakeup)
+
+    assert await storage.dequeue_tasks_from_queues([worker_id], 5) == [
+        (worker_id, {"job_id": "job-2", "task_id": "t2"}, 5)
+    ]
+    assert (await storage.get_worker_loads([worker_id]))[worker_id] == {"queued": 0, "in_flight": 1}
+
+
 @pytest.mark.asyncio
 async def test_empty_heartbeat_refreshes_ttl(aiohttp_client, app):
     client = await aiohttp_client(app)
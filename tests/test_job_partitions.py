@@ -0,0 +1,212 @@
+import time
+from collections import Counter
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from src.avtomatika.config import Config
+from src.avtomatika.executor import JobExecutor
+from src.avtomatika.job_partitions import JobPartitions, WeightedFairScheduler, parse_blueprint_values
+from src.avtomatika.storage.memory import MemoryStorage
+
+BLUEPRINTS = {"bp_a": MagicMock(), "bp_b": MagicMock()}
+
+
+def make_partitions(mode: str, **settings) -> JobPartitions:
+    config = Config()
+    config.JOB_PARTITIONING = mode
+    for name, value in settings.items():
+        setattr(config, name, value)
+    return JobPartitions(config, BLUEPRINTS)
+
+
+def test_parse_blueprint_values():
+    assert parse_blueprint_values("bp_a:3, bp_b:0.5,") == {"bp_a": 3.0, "bp_b": 0.5}
+    assert parse_blueprint_values("") == {}
+    with pytest.raises(ValueError):
+        parse_blueprint_values("bp_a")
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        make_partitions("by_tenant")
+
+
+def test_partition_of_job():
+    job = {"id": "job-1", "blueprint_name": "bp_a"}
+    unknown = {"id": "job-2", "blueprint_name": "bp_unknown"}
+
+    assert make_partitions("none").of(job) == ""
+    assert make_partitions("blueprint").of(job) == "bp_a"
+    assert make_partitions("blueprint").of(unknown) == ""
+
+    hashed = make_partitions("hash", JOB_PARTITION_COUNT=4)
+    assert hashed.of(job) in hashed.all()
+    assert hashed.of(job) == hashed.of(dict(job))
+    assert hashed.of(unknown) != ""
+
+    both = make_partitions("blueprint_hash", JOB_PARTITION_COUNT=2)
+    assert both.of(job).startswith("bp_a:")
+    assert both.of(unknown) == ""
+    assert both.all() == ["", "bp_a:0", "bp_a:1", "bp_b:0", "bp_b:1"]
+    assert both.blueprint_of("bp_b:1") == "bp_b"
+
+
+def test_partitions_of_earlier_settings_are_kept():
+    partitions = make_partitions("none", JOB_PRIORITY_LANES="urgent:10")
+    partitions.set_stored(["", "@urgent", "bp_a", "3", "@high"])
+
+    assert partitions.all() == ["", "@urgent", "bp_a", "3", "@high"]
+    assert partitions.rank_of("@high") == 0
+    partitions.set_stored([""])
+    assert partitions.all() == ["", "@urgent"]
+
+    # Without partitioning, leftover partitions still need the partitioned read
+    plain = make_partitions("none")
+    assert not plain.enabled
+    plain.set_stored(["", "bp_a"])
+    assert plain.enabled
+
+
+def test_weights_are_split_between_hash_partitions():
+    partitions = make_partitions("blueprint_hash", JOB_PARTITION_COUNT=2, JOB_PARTITION_WEIGHTS="bp_a:3")
+    assert partitions.weight("bp_a:0") == 1.5
+    assert partitions.weight("bp_b:1") == 0.5
+    assert partitions.weight("") == 1.0
+
+
+def test_scheduler_shares_slots_by_weight():
+    scheduler = WeightedFairScheduler(make_partitions("blueprint", JOB_PARTITION_WEIGHTS="bp_a:3"))
+    shares = Counter()
+    for _ in range(10):
+        shares.update(scheduler.plan(5, ["", "bp_a", "bp_b"]))
+    assert shares == {"": 10, "bp_a": 30, "bp_b": 10}
+
+
+def test_scheduler_rotates_single_slots():
+    scheduler = WeightedFairScheduler(make_partitions("blueprint"))
+    picked = [
+        partition for _ in range(6) for partition, count in scheduler.plan(1, ["", "bp_a", "bp_b"]).items() if count
+    ]
+    assert Counter(picked) == {"": 2, "bp_a": 2, "bp_b": 2}
+
+
+def make_executor(partitions: JobPartitions) -> JobExecutor:
+    engine = MagicMock()
+    engine.storage = MemoryStorage()
+    engine.job_partitions = partitions
+    return JobExecutor(engine, MagicMock())
+
+
+@pytest.mark.asyncio
+async def test_executor_respects_blueprint_cap():
+    executor = make_executor(make_partitions("blueprint", JOB_PARTITION_MAX_CONCURRENT_JOBS="bp_a:2"))
+    for i in range(5):
+        await executor.storage.enqueue_job(f"a-{i}", "bp_a")
+        await executor.storage.enqueue_job(f"b-{i}", "bp_b")
+
+    jobs = await executor._dequeue_jobs(8, block_ms=50)
+    job_ids = [job_id for job_id, _ in jobs]
+    assert sum(job_id.startswith("a-") for job_id in job_ids) == 2
+    assert executor._running_by_blueprint == {"bp_a": 2}
+    assert await executor.storage.get_job_queue_lengths(["bp_a"]) == {"bp_a": 3}
+
+    # Over its cap, the blueprint is not read until one of its jobs finishes
+    more = await executor._dequeue_jobs(4, block_ms=50)
+    assert all(job_id.startswith("b-") for job_id, _ in more)
+    executor._track_blueprint("bp_a", -1)
+    assert [job_id for job_id, _ in await executor._dequeue_jobs(1, block_ms=50)] == ["a-2"]
+
+
+@pytest.mark.asyncio
+async def test_executor_requeues_jobs_over_its_slots():
+    executor = make_executor(make_partitions("blueprint"))
+    for i in range(3):
+        await executor.storage.enqueue_job(f"a-{i}", "bp_a")
+    # A wake read may return a job more than asked for
+    dequeued = await executor.storage.dequeue_jobs(3, partitions={"bp_a": 3})
+    executor.storage.dequeue_jobs = AsyncMock(return_value=dequeued)
+
+    jobs = await executor._dequeue_jobs(2, block_ms=50)
+    assert [job_id for job_id, _ in jobs] == ["a-0", "a-1"]
+    assert await executor.storage.get_job_queue_lengths(["bp_a"]) == {"bp_a": 1}
+
+
+def test_priority_lanes():
+    partitions = make_partitions("blueprint", JOB_PRIORITY_LANES="high:1,urgent:10", JOB_DEADLINE_BOOST_SECONDS=60)
+    job = {"id": "job-1", "blueprint_name": "bp_a"}
+
+    assert partitions.of(job) == "bp_a"
+    assert partitions.of({**job, "priority": 5}) == "bp_a@high"
+    assert partitions.of({**job, "priority": 10}) == "bp_a@urgent"
+    assert partitions.of({"id": "job-2", "priority": 10}) == "@urgent"
+    # A job close to its deadline goes to the highest lane, whatever its priority
+    assert partitions.of({**job, "deadline": time.time() + 30}) == "bp_a@urgent"
+    assert partitions.of({**job, "deadline": time.time() + 600}) == "bp_a"
+
+    assert partitions.all() == [
+        "",
+        "bp_a",
+        "bp_b",
+        "@urgent",
+        "bp_a@urgent",
+        "bp_b@urgent",
+        "@high",
+        "bp_a@high",
+        "bp_b@high",
+    ]
+    assert partitions.blueprint_of("bp_b@high") == "bp_b"
+    assert [partitions.rank_of(partition) for partition in ("bp_a", "bp_a@high", "bp_a@urgent")] == [0, 1, 2]
+
+
+def test_lane_weights_multiply_blueprint_weights():
+    partitions = make_partitions(
+        "blueprint",
+        JOB_PARTITION_WEIGHTS="bp_a:2",
+        JOB_PRIORITY_LANES="urgent:10",
+        JOB_PRIORITY_LANE_WEIGHTS="urgent:4",
+    )
+    assert partitions.weight("bp_a@urgent") == 8.0
+    assert partitions.weight("@urgent") == 4.0
+    assert partitions.weight("bp_b") == 1.0
+
+
+def test_unknown_priority_draining_is_rejected():
+    with pytest.raises(ValueError):
+        make_partitions("none", JOB_PRIORITY_DRAINING="random")
+
+
+@pytest.mark.asyncio
+async def test_lanes_are_drained_by_weight():
+    executor = make_executor(
+        make_partitions("none", JOB_PRIORITY_LANES="urgent:10", JOB_PRIORITY_LANE_WEIGHTS="urgent:3")
+    )
+    assert executor.partitions.enabled
+    for i in range(8):
+        await executor.storage.enqueue_job(f"bulk-{i}")
+        await executor.storage.enqueue_job(f"urgent-{i}", "@urgent")
+
+    job_ids = [job_id for job_id, _ in await executor._dequeue_jobs(4, block_ms=50)]
+    assert sorted(job_ids) == ["bulk-0", "urgent-0", "urgent-1", "urgent-2"]
+
+
+@pytest.mark.asyncio
+async def test_lanes_are_drained_strictly():
+    executor = make_executor(make_partitions("none", JOB_PRIORITY_LANES="urgent:10", JOB_PRIORITY_DRAINING="strict"))
+    for i in range(3):
+        await executor.storage.enqueue_job(f"bulk-{i}")
+    await executor.storage.enqueue_job("urgent-0", "@urgent")
+
+    assert [job_id for job_id, _ in await executor._dequeue_jobs(4, block_ms=50)] == ["urgent-0"]
+    # The lower lane is read once the higher one is found empty
+    assert [job_id for job_id, _ in await executor._dequeue_jobs(4, block_ms=50)] == ["bulk-0", "bulk-1", "bulk-2"]
+
+
+@pytest.mark.asyncio
+async def test_executor_drains_partitions_of_earlier_settings():
+    executor = make_executor(make_partitions("none"))
+    await executor.storage.enqueue_job("old-job", "bp_a")
+    await executor.storage.enqueue_job("new-job")
+
+    executor.partitions.set_stored(await executor.storage.get_job_partitions())
+    job_ids = [job_id for job_id, _ in await executor._dequeue_jobs(4, block_ms=50)]
+    assert sorted(job_ids) == ["new-job", "old-job"]
@@ -0,0 +1,53 @@
+import pytest
+from src.avtomatika import metrics
+from src.avtomatika.config import Config
+from src.avtomatika.engine import OrchestratorEngine
+from src.avtomatika.job_queue_maintenance import JobQueueMaintenance
+from src.avtomatika.storage.redis import RedisStorage
+
+pytestmark = pytest.mark.asyncio
+
+
+def make_maintenance(redis_client) -> JobQueueMaintenance:
+    config = Config()
+    config.INSTANCE_ID = "instance-1"
+    config.JOB_QUEUE_CONSUMER_IDLE_SECONDS = 0
+    engine = OrchestratorEngine(RedisStorage(redis_client, consumer_name=config.INSTANCE_ID), config)
+    return JobQueueMaintenance(engine)
+
+
+async def test_reports_metrics_and_cleans_owned_partitions(redis_client):
+    maintenance = make_maintenance(redis_client)
+    await redis_client.config_set("stream-node-max-entries", 2)
+    storage = maintenance.storage
+    for i in range(5):
+        await storage.enqueue_job(f"job-{i}")
+    gone = RedisStorage(redis_client, consumer_name="instance-gone")
+    await gone.ack_jobs([message_id for _, message_id in await gone.dequeue_jobs(4, block_ms=100)])
+
+    # Without shards only the metrics are reported
+    await maintenance.maintain()
+    labels = {metrics.LABEL_PARTITION: "default"}
+    assert metrics.task_queue_length.get(labels) == 5
+    assert metrics.job_queue_lag.get(labels) == 1
+    assert await redis_client.xlen("orchestrator:job_stream") == 5
+
+    # The only instance, it owns all shards
+    await maintenance.engine.shard_leases.rebalance()
+    await maintenance.maintain()
+    assert await redis_client.xlen("orchestrator:job_stream") < 5
+    consumers = await redis_client.xinfo_consumers("orchestrator:job_stream", "orchestrator_group")
+    assert [consumer["name"] for consumer in consumers] == []
+    assert [job_id for job_id, _ in await storage.dequeue_jobs(5, block_ms=100)] == ["job-4"]
+
+
+async def test_partitions_of_earlier_settings_are_maintained(redis_client):
+    maintenance = make_maintenance(redis_client)
+    storage = maintenance.storage
+    # Enqueued while jobs were partitioned by blueprint, the engine no longer partitions them
+    await storage.enqueue_job("old-job", "bp_old")
+    await storage.enqueue_job("new-job")
+
+    await maintenance.maintain()
+    assert maintenance.engine.job_partitions.all() == ["", "bp_old"]
+    assert metrics.task_queue_length.get({metrics.LABEL_PARTITION: "bp_old"}) == 1
@@ -14,6 +14,13 @@ def test_init_metrics():
     assert "orchestrator_job_duration_seconds" in REGISTRY.collectors
     assert "orchestrator_task_queue_length" in REGISTRY.collectors
     assert "orchestrator_active_workers" in REGISTRY.collectors
+    assert "orchestrator_worker_cache_hits_total" in REGISTRY.collectors
+    assert "orchestrator_worker_cache_misses_total" in REGISTRY.collectors
+    assert "orchestrator_worker_cache_staleness_seconds" in REGISTRY.collectors
+    assert "orchestrator_history_queue_depth" in REGISTRY.collectors
+    assert "orchestrator_history_flush_latency_seconds" in REGISTRY.collectors
+    assert "orchestrator_history_events_dropped_total" in REGISTRY.collectors
+    assert "orchestrator_history_events_spilled_total" in REGISTRY.collectors
 
 
 def test_init_metrics_idempotent():
@@ -15,3 +15,4 @@ async def test_noop_history_storage():
     assert await storage.get_jobs() == []
     assert await storage.get_job_summary() == {}
     assert await storage.get_worker_history("worker-1", 1) == []
+    assert await storage.get_task_outcomes(30) == []
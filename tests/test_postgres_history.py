@@ -1,4 +1,5 @@
 import os
+from datetime import datetime, timezone
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
@@ -24,6 +25,7 @@ def postgres_storage(dsn):
     storage = PostgresHistoryStorageImpl(dsn=dsn)
 
     mock_conn = AsyncMock()
+    mock_conn.transaction = MagicMock(return_value=AsyncMock())
     mock_pool = MagicMock()
     mock_acquire = AsyncMock()
     mock_acquire.__aenter__.return_value = mock_conn
@@ -51,6 +53,8 @@ async def test_log_job_event(postgres_storage):
     mock_conn.reset_mock()
     await storage.log_job_event({"job_id": "test-job"})
     mock_conn.execute.assert_called_once()
+    mock_conn.executemany.assert_awaited_once()
+    assert mock_conn.executemany.call_args.args[1][0][0] == "test-job"
 
 
 @pytest.mark.asyncio
@@ -62,6 +66,17 @@ async def test_log_worker_event(postgres_storage):
     mock_conn.execute.assert_called_once()
 
 
+@pytest.mark.asyncio
+async def test_log_job_events_uses_copy(postgres_storage):
+    storage, mock_conn, _, _ = postgres_storage
+    await storage.initialize()
+    mock_conn.reset_mock()
+    await storage.log_job_events([{"job_id": "job-1"}, {"job_id": "job-2"}])
+    mock_conn.execute.assert_not_called()
+    mock_conn.copy_records_to_table.assert_awaited_once()
+    assert len(mock_conn.copy_records_to_table.call_args.kwargs["records"]) == 2
+
+
 @pytest.mark.asyncio
 async def test_get_job_history(postgres_storage):
     storage, mock_conn, _, _ = postgres_storage
@@ -82,6 +97,24 @@ async def test_get_jobs(postgres_storage):
     assert jobs == [{"job_id": "123"}]
 
 
+@pytest.mark.asyncio
+async def test_get_jobs_with_cursor(postgres_storage):
+    storage, mock_conn, _, _ = postgres_storage
+    await storage.initialize()
+    updated_at = datetime(2024, 1, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+    mock_conn.fetch.return_value = [{"job_id": "123", "updated_at": updated_at}]
+    jobs = await storage.get_jobs(10)
+    assert jobs[0]["cursor"] == f"{updated_at.isoformat()}|123"
+
+    await storage.get_jobs(10, cursor=jobs[0]["cursor"])
+    query, *params = mock_conn.fetch.call_args.args
+    assert "job_latest" in query
+    assert params == [10, 0, updated_at, "123"]
+
+    with pytest.raises(ValueError):
+        await storage.get_jobs(cursor="not-a-cursor")
+
+
 @pytest.mark.asyncio
 async def test_get_job_summary(postgres_storage):
     storage, mock_conn, _, _ = postgres_storage
@@ -92,6 +125,79 @@ async def test_get_job_summary(postgres_storage):
     assert summary == {"running": 1}
 
 
+@pytest.mark.asyncio
+async def test_partitioned_log_creates_partition(dsn):
+    storage = PostgresHistoryStorageImpl(dsn=dsn, partition_interval="day")
+    mock_conn = AsyncMock()
+    mock_conn.transaction = MagicMock(return_value=AsyncMock())
+    mock_conn.fetchval.return_value = "p"
+    mock_conn.fetch.return_value = [{"relname": "job_history_p20240101"}]
+    mock_pool = MagicMock()
+    mock_pool.acquire.return_value.__aenter__.return_value = mock_conn
+    with patch("src.avtomatika.history.postgres.create_pool", new=AsyncMock(return_value=mock_pool)):
+        await storage.initialize()
+    mock_conn.reset_mock()
+
+    timestamp = datetime(2024, 1, 2, 12, tzinfo=timezone.utc).timestamp()
+    await storage.log_job_events(
+        [{"job_id": "job-1", "timestamp": timestamp}, {"job_id": "job-2", "timestamp": timestamp}],
+    )
+    queries = [call.args[0] for call in mock_conn.execute.call_args_list]
+    assert queries == [
+        "CREATE TABLE IF NOT EXISTS job_history_p20240102 PARTITION OF job_history "
+        "FOR VALUES FROM ('2024-01-02T00:00:00+00:00') TO ('2024-01-03T00:00:00+00:00')"
+    ]
+
+    # The partition is only created once
+    mock_conn.reset_mock()
+    await storage.log_job_events(
+        [{"job_id": "job-3", "timestamp": timestamp}, {"job_id": "job-4", "timestamp": timestamp}],
+    )
+    mock_conn.execute.assert_not_called()
+
+    # Expired partitions are dropped, the partition list is reloaded from the catalog first
+    partitions = [{"relname": "job_history_p20240101"}, {"relname": "job_history_p20240102"}]
+    mock_conn.fetch.side_effect = lambda query, *args: [] if query.startswith("SELECT d.event_id") else partitions
+    await storage.drop_expired_events(timestamp)
+    queries = [call.args[0] for call in mock_conn.execute.call_args_list]
+    assert "DROP TABLE IF EXISTS job_history_p20240101" in queries
+    assert "DROP TABLE IF EXISTS job_history_p20240102" not in queries
+    assert queries[-1] == "DELETE FROM job_latest WHERE updated_at < $1"
+    assert mock_conn.execute.call_args.args[1] == datetime(2024, 1, 2, tzinfo=timezone.utc)
+
+
+@pytest.mark.asyncio
+async def test_unpartitioned_drop_expired_events_deletes_rows(postgres_storage):
+    storage, mock_conn, _, _ = postgres_storage
+    await storage.initialize()
+    mock_conn.reset_mock()
+    # A kept diff whose full snapshot is deleted is rewritten as a full snapshot first
+    mock_conn.fetch.return_value = [
+        {"event_id": "event-2", "diff": '[{"op":"replace","path":"/step","value":2}]', "base": '{"step":1,"a":"x"}'}
+    ]
+    await storage.drop_expired_events(1000.0)
+    mock_conn.executemany.assert_awaited_once_with(
+        "UPDATE job_history SET context_snapshot = $1, snapshot_base = NULL WHERE event_id = $2",
+        [('{"step":2,"a":"x"}', "event-2")],
+    )
+    queries = [call.args[0] for call in mock_conn.execute.call_args_list]
+    assert queries == [
+        "DELETE FROM job_history WHERE timestamp < $1",
+        "DELETE FROM worker_history WHERE timestamp < $1",
+        "DELETE FROM job_latest WHERE updated_at < $1",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_get_task_outcomes(postgres_storage):
+    storage, mock_conn, _, _ = postgres_storage
+    await storage.initialize()
+    mock_conn.fetch.return_value = [{"worker_id": "worker-1", "age_days": 0, "total": 2, "successes": 1}]
+    outcomes = await storage.get_task_outcomes(30)
+    assert mock_conn.fetch.call_args.args[1] == 30
+    assert outcomes == [{"worker_id": "worker-1", "age_days": 0, "total": 2, "successes": 1}]
+
+
 @pytest.mark.asyncio
 async def test_close(postgres_storage):
     storage, _, _, mock_pool = postgres_storage
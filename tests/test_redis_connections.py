@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from src.avtomatika.config import Config
+from src.avtomatika.storage.redis import RedisStorage
+from src.avtomatika.storage.redis_connections import TrackedKeyCache, create_redis_storage
+
+pytestmark = pytest.mark.asyncio
+
+
+def active_cache(redis_client, **options) -> TrackedKeyCache:
+    """A cache that behaves as if Redis tracking was enabled, which fakeredis does not support."""
+    cache = TrackedKeyCache(redis_client, **options)
+    cache._task = asyncio.get_running_loop().create_future()
+    cache._active = True
+    return cache
+
+
+def counting_loader(value):
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return value
+
+    return load, calls
+
+
+async def test_cache_is_bypassed_without_tracking(redis_client):
+    cache = TrackedKeyCache(redis_client)
+    load, calls = counting_loader("token")
+    assert await cache.get("orchestrator:worker:token:w1", load) == "token"
+    # The listener gives up once Redis rejects CLIENT TRACKING
+    await asyncio.wait_for(cache._task, timeout=1)
+    assert await cache.get("orchestrator:worker:token:w1", load) == "token"
+    assert len(calls) == 2
+    await cache.close()
+
+
+async def test_cached_until_invalidated(redis_client):
+    cache = active_cache(redis_client)
+    load, calls = counting_loader("token")
+    key = "orchestrator:worker:token:w1"
+    await cache.get(key, load)
+    await cache.get(key, load)
+    assert len(calls) == 1
+
+    cache.invalidate([key])
+    await cache.get(key, load)
+    assert len(calls) == 2
+
+
+async def test_read_overlapping_an_invalidation_is_not_cached(redis_client):
+    cache = active_cache(redis_client)
+    key = "orchestrator:client_config:t1"
+
+    async def load_and_invalidate():
+        cache.invalidate([key])
+        return "stale"
+
+    assert await cache.get(key, load_and_invalidate) == "stale"
+    assert key not in cache._entries
+
+
+async def test_entries_expire_and_are_bounded(redis_client):
+    cache = active_cache(redis_client, max_size=2, ttl_seconds=0.05)
+    load, calls = counting_loader("v")
+    for key in ("k1", "k2", "k3"):
+        await cache.get(key, load)
+    assert list(cache._entries) == ["k2", "k3"]
+
+    await asyncio.sleep(0.06)
+    await cache.get("k3", load)
+    assert len(calls) == 4
+
+
+async def test_storage_reads_tokens_through_the_cache(redis_client):
+    cache = active_cache(redis_client)
+    storage = RedisStorage(redis_client, key_cache=cache)
+    await storage.set_worker_token("w1", "first")
+    assert await storage.get_worker_token("w1") == "first"
+
+    # Writes through the storage drop the cached value right away
+    await storage.set_worker_token("w1", "second")
+    assert await storage.get_worker_token("w1") == "second"
+
+    await storage.save_client_config("t1", {"plan": "free"})
+    assert await storage.get_client_config("t1") == {"plan": "free"}
+    await redis_client.hset("orchestrator:client_config:t1", "plan", storage._pack("pro"))
+    assert await storage.get_client_config("t1") == {"plan": "free"}
+
+
+async def test_create_redis_storage_uses_separate_pools():
+    config = Config()
+    config.REDIS_HOST = "localhost"
+    config.REDIS_MAX_CONNECTIONS = 7
+    config.REDIS_BLOCKING_MAX_CONNECTIONS = 3
+    config.REDIS_CLIENT_CACHE_ENABLED = True
+    config.REDIS_JOB_STATE_LAYOUT = "hash"
+    storage = create_redis_storage(config)
+
+    assert storage._redis.connection_pool.max_connections == 7
+    assert storage._blocking_redis.connection_pool.max_connections == 3
+    assert storage._key_cache is not None
+    assert storage._job_state_layout == "hash"
+    await storage.close()
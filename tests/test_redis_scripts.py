@@ -0,0 +1,38 @@
+from hashlib import sha1
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from redis.exceptions import NoScriptError
+from src.avtomatika.storage.redis_scripts import SCRIPTS, ScriptRegistry
+
+pytestmark = pytest.mark.asyncio
+
+
+def mock_redis() -> MagicMock:
+    redis = MagicMock()
+    redis.evalsha = AsyncMock(return_value=1)
+    pipe = MagicMock()
+    pipe.execute = AsyncMock()
+    redis.pipeline.return_value.__aenter__.return_value = pipe
+    return redis
+
+
+async def test_scripts_run_by_local_sha():
+    redis = mock_redis()
+    registry = ScriptRegistry(redis)
+    assert await registry.run("release_lock", ["orchestrator:lock:a"], ["holder"]) == 1
+
+    sha = sha1(SCRIPTS["release_lock"].encode("utf-8")).hexdigest()
+    redis.evalsha.assert_awaited_once_with(sha, 1, "orchestrator:lock:a", "holder")
+    redis.pipeline.assert_not_called()
+
+
+async def test_lost_scripts_are_reloaded():
+    redis = mock_redis()
+    redis.evalsha.side_effect = [NoScriptError("NOSCRIPT"), 0]
+    registry = ScriptRegistry(redis)
+    assert await registry.run("decrement_quota", ["orchestrator:quota:t"], []) == 0
+
+    pipe = redis.pipeline.return_value.__aenter__.return_value
+    assert pipe.script_load.call_count == len(SCRIPTS)
+    assert redis.evalsha.await_count == 2
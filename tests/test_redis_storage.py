@@ -1,6 +1,14 @@
+import asyncio
+import time
+
 import pytest
+import pytest_asyncio
+from fakeredis.aioredis import FakeRedis
 
 try:
+    from src.avtomatika.storage.base import shard_of
+    from src.avtomatika.storage.redis import RedisStorage
+
     from .storage_test_suite import StorageTestSuite
 
     redis_installed = True
@@ -28,3 +36,168 @@ class TestRedisStorage(StorageTestSuite):
     """
 
     pass
+
+
+class TestRedisStorageHashLayout(StorageTestSuite):
+    """
+    Runs the common storage test suite for RedisStorage with jobs stored as hashes.
+    """
+
+    @pytest.fixture
+    def storage(self, redis_client, config):
+        return RedisStorage(
+            redis_client,
+            consumer_name=config.INSTANCE_ID,
+            min_idle_time_ms=100,
+            job_state_layout="hash",
+        )
+
+    async def test_only_changed_fields_are_written(self, storage, redis_client):
+        key = "orchestrator:job:hash-job"
+        state = {"id": "hash-job", "status": "pending", "initial_data": {"blob": "x" * 1000}}
+        await storage.save_job_state("hash-job", state)
+        assert await redis_client.type(key) == b"hash"
+
+        # Overwrite a field behind the storage's back: it must survive because it was not changed
+        await redis_client.hset(key, "initial_data", storage._pack({"blob": "changed elsewhere"}))
+        state["status"] = "running"
+        del state["id"]
+        await storage.save_job_state("hash-job", state)
+
+        assert await storage.get_job_state("hash-job") == {
+            "status": "running",
+            "initial_data": {"blob": "changed elsewhere"},
+        }
+
+    async def test_get_job_fields(self, storage):
+        assert await storage.get_job_fields("missing-job", ["status"]) is None
+        await storage.save_job_state("proj-job", {"status": "running", "current_state": "start", "big": [1] * 100})
+        assert await storage.get_job_fields("proj-job", ["status", "current_state", "other"]) == {
+            "status": "running",
+            "current_state": "start",
+            "other": None,
+        }
+
+    async def test_update_job_state(self, storage):
+        await storage.save_job_state("upd-job", {"status": "waiting_for_worker", "current_state": "start"})
+        updated = await storage.update_job_state("upd-job", {"status": "failed"})
+        assert updated == {"status": "failed", "current_state": "start"}
+
+    async def test_reads_jobs_stored_as_blob(self, storage, redis_client, config):
+        blob_storage = RedisStorage(redis_client, consumer_name=config.INSTANCE_ID)
+        await blob_storage.save_job_state("old-job", {"status": "running", "current_state": "start"})
+
+        assert await storage.get_job_state("old-job") == {"status": "running", "current_state": "start"}
+        assert await storage.get_job_fields("old-job", ["status"]) == {"status": "running"}
+        assert await storage.update_job_state("old-job", {"status": "failed"}) == {
+            "status": "failed",
+            "current_state": "start",
+        }
+        # The next full save migrates the job to the hash layout
+        await storage.save_job_state("old-job", {"status": "finished"})
+        assert await redis_client.type("orchestrator:job:old-job") == b"hash"
+        assert await blob_storage.get_job_state("old-job") == {"status": "finished"}
+
+
+class TestRedisStorageResp3(StorageTestSuite):
+    """
+    Runs the common storage test suite for RedisStorage over RESP3 connections.
+    """
+
+    @pytest_asyncio.fixture
+    async def storage(self, config):
+        client = FakeRedis(protocol=3)
+        yield RedisStorage(client, consumer_name=config.INSTANCE_ID, min_idle_time_ms=100)
+        await client.aclose()
+
+
+async def test_unknown_job_state_layout(redis_client):
+    with pytest.raises(ValueError):
+        RedisStorage(redis_client, job_state_layout="json")
+
+
+async def test_initialize_moves_watched_jobs_into_shards(redis_storage, redis_client):
+    # Watched before the timeout tracking list was sharded, the last one on the monotonic clock
+    now = time.time()
+    await redis_client.zadd(
+        "orchestrator:watched_jobs",
+        {"old-job": now - 20, "old-job:branch": now - 10, "monotonic-job": time.monotonic() + 60},
+    )
+    await redis_storage.initialize()
+
+    assert not await redis_client.exists("orchestrator:watched_jobs")
+    deadline = await redis_client.zscore(f"orchestrator:watched_jobs:{shard_of('monotonic-job')}", "monotonic-job")
+    assert deadline == pytest.approx(now + 60, abs=5)
+    assert await redis_storage.get_timed_out_jobs() == ["old-job", "old-job:branch"]
+
+
+async def test_concurrent_registrations_keep_indexes_consistent(redis_storage, redis_client):
+    await redis_storage.register_worker("worker-a", {"worker_id": "worker-a", "supported_tasks": ["render"]}, 60)
+    await asyncio.gather(
+        *(
+            redis_storage.register_worker("worker-a", {"worker_id": "worker-a", "supported_tasks": [task]}, 60)
+            for task in ("encode", "upload", "resize")
+        ),
+        redis_storage.deregister_worker("worker-a"),
+    )
+
+    # Whichever write won, the worker is indexed exactly under the task types of its membership set
+    members = {m.decode() for m in await redis_client.smembers("orchestrator:worker:indexes:worker-a")}
+    for task in ("render", "encode", "upload", "resize"):
+        key = f"orchestrator:worker:index:task:{task}"
+        assert await redis_client.sismember(key, "worker-a") == (key in members)
+    assert len([key for key in members if ":task:" in key]) <= 1
+
+
+async def test_trim_keeps_unacknowledged_jobs(redis_storage, redis_client):
+    # Two entries per stream node, so that the approximate trim has whole nodes to drop
+    await redis_client.config_set("stream-node-max-entries", 2)
+    for i in range(6):
+        await redis_storage.enqueue_job(f"job-{i}")
+    jobs = await redis_storage.dequeue_jobs(4, block_ms=100)
+    await redis_storage.ack_jobs([message_id for _, message_id in jobs[:3]])
+
+    # Only the node of job-0 and job-1 lies entirely before the pending job-3
+    assert await redis_storage.trim_job_queues([""]) == 2
+    assert await redis_storage.get_job_queue_stats([""]) == {"": {"length": 4, "pending": 1, "lag": 2}}
+    assert [job_id for job_id, _ in await redis_storage.dequeue_jobs(5, block_ms=100)] == ["job-4", "job-5"]
+
+
+async def test_remove_dead_job_consumers(redis_storage, redis_client):
+    for i in range(3):
+        await redis_storage.enqueue_job(f"job-{i}")
+    consumers = {name: RedisStorage(redis_client, consumer_name=name) for name in ("gone", "busy", "alive")}
+    for name, consumer in consumers.items():
+        jobs = await consumer.dequeue_jobs(1, block_ms=100)
+        if name != "busy":
+            await consumer.ack_jobs([message_id for _, message_id in jobs])
+
+    # A consumer with pending jobs is kept until they are reclaimed
+    assert await redis_storage.remove_dead_job_consumers([""], ["alive"], 0) == ["gone"]
+    remaining = await redis_client.xinfo_consumers("orchestrator:job_stream", "orchestrator_group")
+    assert sorted(consumer["name"] for consumer in remaining) == [b"alive", b"busy"]
+
+
+async def test_reclaim_continues_from_cursor(redis_client):
+    crashed = RedisStorage(redis_client, consumer_name="crashed")
+    for i in range(3):
+        await crashed.enqueue_job(f"job-{i}")
+    await crashed.dequeue_jobs(3, block_ms=100)
+
+    storage = RedisStorage(redis_client, consumer_name="survivor", min_idle_time_ms=0)
+    reclaimed = [job_id for _ in range(3) for job_id, _ in await storage.dequeue_jobs(1, block_ms=100)]
+    assert reclaimed == ["job-0", "job-1", "job-2"]
+    # The scan reached the end of the pending entries and starts over next time
+    assert storage._reclaim_cursors[""] == "0-0"
+
+
+async def test_reclaim_skips_partitions_planned_no_slots(redis_client):
+    crashed = RedisStorage(redis_client, consumer_name="crashed")
+    await crashed.enqueue_job("job-busy", "busy")
+    await crashed.enqueue_job("job-quiet", "quiet")
+    await crashed.dequeue_jobs(2, block_ms=100, partitions={"busy": 1, "quiet": 1})
+
+    storage = RedisStorage(redis_client, consumer_name="survivor", min_idle_time_ms=0)
+    reclaimed = await storage.dequeue_jobs(1, block_ms=100, partitions={"busy": 0, "quiet": 1})
+    assert [job_id for job_id, _ in reclaimed] == ["job-quiet"]
+    assert "busy" not in storage._reclaim_cursors
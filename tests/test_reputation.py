@@ -1,7 +1,7 @@
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
-from src.avtomatika.reputation import ReputationCalculator
+from src.avtomatika.reputation import ReputationCalculator, decayed_success_rates
 
 
 @pytest.fixture
@@ -18,40 +18,23 @@ async def test_reputation_calculation_logic(mock_engine):
     calculator = ReputationCalculator(mock_engine)
 
     # 1. Configure mocks
-    mock_workers = [{"worker_id": "worker-1"}]
+    mock_workers = [{"worker_id": "worker-1"}, {"worker_id": "worker-2", "reputation": 1.0}]
     mock_engine.storage.get_available_workers.return_value = mock_workers
 
-    # History: 3 successful tasks, 1 failed
-    mock_history = [
-        {
-            "event_type": "task_finished",
-            "context_snapshot": {"result": {"status": "success"}},
-        },
-        {
-            "event_type": "task_finished",
-            "context_snapshot": {"result": {"status": "success"}},
-        },
-        {
-            "event_type": "task_finished",
-            "context_snapshot": {"result": {"status": "failure"}},
-        },
-        {
-            "event_type": "task_finished",
-            "context_snapshot": {"result": {"status": "success"}},
-        },
-        {"event_type": "state_started"},  # This event should be ignored
+    # Today: 3 successful tasks, 1 failed; worker-2 did not fail
+    mock_engine.history_storage.get_task_outcomes.return_value = [
+        {"worker_id": "worker-1", "age_days": 0, "total": 4, "successes": 3},
+        {"worker_id": "worker-2", "age_days": 0, "total": 2, "successes": 2},
+        {"worker_id": "inactive-worker", "age_days": 0, "total": 1, "successes": 0},
     ]
-    mock_engine.history_storage.get_worker_history.return_value = mock_history
 
     # 2. Perform calculation
     await calculator.calculate_all_reputations()
 
     # 3. Check the result
-    # Expected reputation = 3 / 4 = 0.75
-    mock_engine.storage.update_worker_data.assert_called_once_with(
-        "worker-1",
-        {"reputation": 0.75},
-    )
+    # Expected reputation = 3 / 4 = 0.75, worker-2 keeps its reputation, inactive workers are skipped
+    mock_engine.history_storage.get_task_outcomes.assert_awaited_once_with(since_days=30)
+    mock_engine.storage.update_workers_data.assert_awaited_once_with({"worker-1": {"reputation": 0.75}})
 
 
 @pytest.mark.asyncio
@@ -62,27 +45,24 @@ async def test_reputation_no_history(mock_engine):
     calculator = ReputationCalculator(mock_engine)
     mock_workers = [{"worker_id": "worker-1", "reputation": 1.0}]
     mock_engine.storage.get_available_workers.return_value = mock_workers
-    mock_engine.history_storage.get_worker_history.return_value = []
+    mock_engine.history_storage.get_task_outcomes.return_value = []
 
     await calculator.calculate_all_reputations()
 
     # The update method should not be called
-    mock_engine.storage.update_worker_data.assert_not_called()
+    mock_engine.storage.update_workers_data.assert_not_called()
 
 
-@pytest.mark.asyncio
-async def test_reputation_division_by_zero(mock_engine):
-    """Tests the case where a worker has a history, but no task completion events
-    (to avoid division by zero).
-    """
-    calculator = ReputationCalculator(mock_engine)
-    mock_workers = [{"worker_id": "worker-1", "reputation": 1.0}]
-    mock_engine.storage.get_available_workers.return_value = mock_workers
-    mock_engine.history_storage.get_worker_history.return_value = [
-        {"event_type": "state_started"},
+def test_decayed_success_rates():
+    outcomes = [
+        # A week-old failure counts half as much as a success today
+        {"worker_id": "worker-1", "age_days": 0, "total": 1, "successes": 1},
+        {"worker_id": "worker-1", "age_days": 7, "total": 1, "successes": 0},
+        {"worker_id": "worker-2", "age_days": 3, "total": 2, "successes": None},
+        {"worker_id": "worker-3", "age_days": 0, "total": 0, "successes": 0},
     ]
-
-    await calculator.calculate_all_reputations()
-
-    # The update method should not be called
-    mock_engine.storage.update_worker_data.assert_not_called()
+    rates = decayed_success_rates(outcomes)
+    assert rates["worker-1"] == pytest.approx(1 / 1.5)
+    assert rates["worker-2"] == 0.0
+    # Workers without finished tasks have no rate
+    assert "worker-3" not in rates
@@ -0,0 +1,43 @@
+import pytest
+from src.avtomatika.shard_leases import ShardLeases, preferred_shards
+from src.avtomatika.storage.base import SHARD_COUNT
+from src.avtomatika.storage.memory import MemoryStorage
+
+ALL_SHARDS = frozenset(range(SHARD_COUNT))
+
+
+def test_preferred_shards_split_all_shards():
+    instances = ["instance-1", "instance-2", "instance-3"]
+    owned = [preferred_shards(instance, instances) for instance in instances]
+    assert frozenset().union(*owned) == ALL_SHARDS
+    assert sum(len(shards) for shards in owned) == SHARD_COUNT
+    assert all(shards for shards in owned)
+
+
+def test_joining_instance_only_takes_shards_over():
+    before = {instance: preferred_shards(instance, ["a", "b"]) for instance in ("a", "b")}
+    after = {instance: preferred_shards(instance, ["a", "b", "c"]) for instance in ("a", "b", "c")}
+    assert after["a"] <= before["a"]
+    assert after["b"] <= before["b"]
+
+
+@pytest.mark.asyncio
+async def test_instances_share_and_hand_over_shards():
+    storage = MemoryStorage()
+    first = ShardLeases(storage, "instance-1", lease_ttl_seconds=30)
+    second = ShardLeases(storage, "instance-2", lease_ttl_seconds=30)
+    changes = []
+    first.add_listener(changes.append)
+
+    assert await first.rebalance() == ALL_SHARDS
+    # The second instance waits until the first one hands its shards over
+    assert await second.rebalance() == frozenset()
+    await first.rebalance()
+    await second.rebalance()
+    assert first.owned_shards | second.owned_shards == ALL_SHARDS
+    assert not first.owned_shards & second.owned_shards
+    assert changes == [ALL_SHARDS, first.owned_shards]
+
+    await first.release()
+    assert first.owned_shards == frozenset()
+    assert await second.rebalance() == ALL_SHARDS
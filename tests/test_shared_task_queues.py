@@ -0,0 +1,145 @@
+from unittest.mock import MagicMock
+
+import pytest
+from src.avtomatika.dispatcher import Dispatcher, resource_class_id, shared_queue_name
+from src.avtomatika.storage.memory import MemoryStorage
+from src.avtomatika.storage.unit_of_work import JobUnitOfWork
+
+GPU_REQUIREMENTS = {"gpu_info": {"model": "NVIDIA T4", "vram_gb": 16}}
+
+
+@pytest.fixture
+def storage():
+    return MemoryStorage()
+
+
+@pytest.fixture
+def dispatcher(storage):
+    config = MagicMock()
+    config.TASK_QUEUE_MODE = "shared"
+    config.TASK_STEAL_MIN_QUEUE = 2
+    return Dispatcher(storage, config)
+
+
+async def register(storage: MemoryStorage, worker_id: str, **info):
+    await storage.register_worker(worker_id, {"worker_id": worker_id, "supported_tasks": ["render"], **info}, 60)
+
+
+async def dispatch(dispatcher: Dispatcher, job_id: str, **task_info) -> dict:
+    job_state = {"id": job_id}
+    await dispatcher.dispatch(job_state, {"type": "render", "task_id": f"task-{job_id}", **task_info})
+    return job_state
+
+
+@pytest.mark.asyncio
+async def test_tasks_go_to_the_task_type_queue(dispatcher, storage):
+    await register(storage, "worker-a", status="busy")
+
+    job_state = await dispatch(dispatcher, "job-1")
+
+    # Busy workers count as capable, the task waits in the shared queue until one is free
+    assert job_state["task_worker_id"] is None
+    assert (await storage.dequeue_task_from_queues([shared_queue_name("render")], None))[1]["job_id"] == "job-1"
+
+
+@pytest.mark.asyncio
+async def test_constrained_tasks_go_to_resource_class_queues(dispatcher, storage):
+    await register(storage, "gpu-worker", resources={"gpu_info": {"model": "NVIDIA T4", "vram_gb": 16}})
+    await register(storage, "cpu-worker")
+
+    await dispatch(dispatcher, "job-1", resource_requirements=GPU_REQUIREMENTS)
+
+    class_id = resource_class_id({"resource_requirements": GPU_REQUIREMENTS})
+    assert await storage.get_resource_classes(["render"]) == {
+        "render": {class_id: {"resource_requirements": GPU_REQUIREMENTS}}
+    }
+    # Only the compliant worker can claim the task
+    assert await dispatcher.claim_task("cpu-worker", 1) is None
+    task = await dispatcher.claim_task("gpu-worker", 1)
+    assert task["job_id"] == "job-1"
+
+
+@pytest.mark.asyncio
+async def test_warm_workers_keep_affinity(dispatcher, storage):
+    await register(storage, "cold-worker")
+    await register(storage, "warm-worker", hot_cache=["render"])
+
+    job_state = await dispatch(dispatcher, "job-1")
+
+    assert job_state["task_worker_id"] == "warm-worker"
+    assert await storage.get_worker_loads(["warm-worker"]) == {"warm-worker": {"queued": 1, "in_flight": 0}}
+
+
+@pytest.mark.asyncio
+async def test_claim_records_the_worker(dispatcher, storage):
+    await register(storage, "worker-a")
+    await storage.save_job_state("job-1", {"id": "job-1"})
+    await dispatch(dispatcher, "job-1", priority=1)
+    await dispatch(dispatcher, "job-2", priority=5)
+
+    task = await dispatcher.claim_task("worker-a", 1)
+
+    assert task["job_id"] == "job-2"
+    assert await storage.get_task_worker("job-2", "task-job-2") == "worker-a"
+
+
+@pytest.mark.asyncio
+async def test_idle_worker_steals_from_overloaded_peer(dispatcher, storage):
+    await register(storage, "busy-worker", supported_tasks=["render", "encode"])
+    await register(storage, "idle-worker")
+    await storage.save_job_state("job-1", {"id": "job-1"})
+    await storage.enqueue_task_for_worker("busy-worker", {"job_id": "job-1", "task_id": "t1", "type": "render"}, 1)
+
+    # A single queued task is left to its worker
+    assert await dispatcher.claim_task("idle-worker", 0) is None
+
+    await storage.enqueue_task_for_worker("busy-worker", {"job_id": "job-2", "task_id": "t2", "type": "encode"}, 0)
+    task = await dispatcher.claim_task("idle-worker", 0)
+    assert task["task_id"] == "t1"
+    assert await storage.get_task_worker("job-1", "t1") == "idle-worker"
+
+    # Tasks the thief cannot run are left in the queue
+    await storage.enqueue_task_for_worker("busy-worker", {"job_id": "job-3", "task_id": "t3", "type": "encode"}, 5)
+    assert await dispatcher.claim_task("idle-worker", 0) is None
+    assert await storage.get_worker_loads(["busy-worker"]) == {"busy-worker": {"queued": 2, "in_flight": 0}}
+
+
+@pytest.mark.asyncio
+async def test_claim_tasks_takes_a_batch(dispatcher, storage):
+    await register(storage, "worker-a", hot_cache=["render"])
+    for i in range(3):
+        await storage.save_job_state(f"job-{i}", {"id": f"job-{i}"})
+    # The first task is routed to the warm worker, the others wait in the shared queue
+    await dispatch(dispatcher, "job-0")
+    await register(storage, "worker-a")
+    await dispatch(dispatcher, "job-1")
+    await dispatch(dispatcher, "job-2")
+
+    tasks = await dispatcher.claim_tasks("worker-a", 1, 5)
+
+    assert [task["job_id"] for task in tasks] == ["job-0", "job-1", "job-2"]
+    assert await storage.get_task_worker("job-1", "task-job-1") == "worker-a"
+    assert await dispatcher.claim_tasks("worker-a", 0, 5) == []
+
+
+@pytest.mark.asyncio
+async def test_parallel_branches_keep_their_claiming_workers(dispatcher, storage):
+    await register(storage, "worker-a", status="busy")
+    await register(storage, "worker-b", status="busy")
+    job_state = {"id": "job-1", "status": "waiting_for_parallel_tasks", "active_branches": ["b1", "b2"]}
+    await dispatcher.dispatch(job_state, {"type": "render", "task_id": "b1", "priority": 5})
+    await dispatcher.dispatch(job_state, {"type": "render", "task_id": "b2", "priority": 1})
+
+    # Claims are written with the caller's unit of work, nothing is recorded before it is committed
+    job_writes = JobUnitOfWork(storage)
+    claimed = await dispatcher.claim_queued_tasks("worker-a", None, 1, storage=job_writes)
+    assert [task["task_id"] for _, task, _ in claimed] == ["b1"]
+    assert await storage.get_task_worker("job-1", "b1") is None
+    await job_writes.commit()
+
+    job_writes = JobUnitOfWork(storage)
+    await dispatcher.claim_queued_tasks("worker-b", None, 1, storage=job_writes)
+    await job_writes.commit()
+
+    assert await storage.get_task_worker("job-1", "b1") == "worker-a"
+    assert await storage.get_task_worker("job-1", "b2") == "worker-b"
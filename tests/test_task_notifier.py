@@ -0,0 +1,53 @@
+import asyncio
+import contextlib
+
+import pytest
+from src.avtomatika.storage.memory import MemoryStorage
+from src.avtomatika.task_notifier import TaskNotifier
+
+pytestmark = pytest.mark.asyncio
+
+
+@contextlib.asynccontextmanager
+async def running(notifier: TaskNotifier):
+    task = asyncio.create_task(notifier.run())
+    # Let the subscription start before tasks are enqueued
+    await asyncio.sleep(0.05)
+    try:
+        yield
+    finally:
+        notifier.stop()
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+async def test_wakes_only_waiters_of_the_queue():
+    storage = MemoryStorage()
+    notifier = TaskNotifier(storage)
+    async with running(notifier):
+        with notifier.watch(["worker-1", "type:render"]) as first, notifier.watch(["worker-2"]) as second:
+            await storage.enqueue_task_for_worker("type:render", {"task_id": "t1"}, 0)
+            await asyncio.wait_for(first.wait(), timeout=1)
+            assert not second.is_set()
+
+
+async def test_watch_unregisters_waiters():
+    notifier = TaskNotifier(MemoryStorage())
+    with notifier.watch(["worker-1"]):
+        pass
+    assert notifier._waiters == {}
+
+
+async def test_listeners_get_every_event():
+    storage = MemoryStorage()
+    notifier = TaskNotifier(storage)
+    events = []
+    notifier.add_listener(events.append)
+    async with running(notifier):
+        await storage.enqueue_task_for_worker("worker-1", {"task_id": "t1"}, 0)
+        await asyncio.sleep(0.05)
+    assert events == ["worker-1"]
+
+    notifier.notify_all()
+    assert events == ["worker-1", None]
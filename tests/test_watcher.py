@@ -1,43 +1,102 @@
 import asyncio
-from unittest.mock import AsyncMock, MagicMock
+import time
 
 import pytest
+import pytest_asyncio
+from src.avtomatika.config import Config
+from src.avtomatika.engine import OrchestratorEngine
+from src.avtomatika.storage.memory import MemoryStorage
 from src.avtomatika.watcher import Watcher
 
+pytestmark = pytest.mark.asyncio
 
-@pytest.mark.asyncio
-async def test_watcher_run():
-    """Tests that the watcher correctly identifies and handles timed out jobs."""
-    engine = MagicMock()
-    engine.storage.get_timed_out_jobs = AsyncMock(return_value=["job-1"])
-    engine.storage.get_job_state = AsyncMock(
-        return_value={
-            "id": "job-1",
-            "status": "waiting_for_worker",
-            "blueprint_name": "test_bp",
-        }
-    )
-    engine.storage.acquire_lock = AsyncMock(return_value=True)
-    engine.storage.release_lock = AsyncMock(return_value=True)
-    engine.storage.save_job_state = AsyncMock()  # Mock save_job_state too
 
+@pytest_asyncio.fixture
+async def watcher():
+    engine = OrchestratorEngine(MemoryStorage(), Config())
     watcher = Watcher(engine)
-    watcher.watch_interval_seconds = 0.1
+    # Far longer than the tests wait, deadlines must wake the watcher up on their own
+    watcher.watch_interval_seconds = 30
+    # The only instance, it owns all shards
+    await engine.shard_leases.rebalance()
+    return watcher
+
+
+async def wait_for_status(storage, job_id: str, status: str) -> dict:
+    for _ in range(100):
+        job_state = await storage.get_job_state(job_id)
+        if job_state["status"] == status:
+            return job_state
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not reach status {status}")
 
-    # Run the watcher for a short period
+
+async def test_job_fails_on_its_deadline(watcher):
+    storage = watcher.storage
+    await storage.save_job_state("job-1", {"id": "job-1", "status": "waiting_for_worker", "blueprint_name": "bp"})
     task = asyncio.create_task(watcher.run())
-    await asyncio.sleep(0.2)
+    await asyncio.sleep(0.05)
+
+    # Added while the watcher sleeps, the sooner deadline wakes it up
+    deadline = time.time() + 0.1
+    await storage.add_job_to_watch("job-1", deadline)
+    job_state = await wait_for_status(storage, "job-1", "failed")
+    assert time.time() - deadline < 0.5
+    assert job_state["error_message"] == "Worker task timed out."
+
     watcher.stop()
+    task.cancel()
     await task
 
-    engine.storage.get_timed_out_jobs.assert_called()
-    engine.storage.get_job_state.assert_called_with("job-1")
-    engine.storage.save_job_state.assert_called_with(
-        "job-1",
+
+async def test_finished_jobs_are_not_failed(watcher):
+    storage = watcher.storage
+    await storage.save_job_state("job-done", {"id": "job-done", "status": "finished"})
+    await watcher.handle_timeouts(["job-done", "job-missing"])
+    assert (await storage.get_job_state("job-done"))["status"] == "finished"
+
+
+async def test_branch_timeout_moves_job_to_aggregator(watcher):
+    storage = watcher.storage
+    await storage.save_job_state(
+        "job-par",
         {
-            "id": "job-1",
-            "status": "failed",
-            "blueprint_name": "test_bp",
-            "error_message": "Worker task timed out.",
+            "id": "job-par",
+            "status": "waiting_for_parallel_tasks",
+            "current_state": "fan_out",
+            "active_branches": ["b1", "b2"],
+            "aggregation_target": "aggregate",
         },
     )
+    await storage.start_parallel_branches("job-par", ["b1", "b2"])
+    await storage.record_branch_result("job-par", "b1", {"status": "success"}, ["b1", "b2"])
+
+    await storage.add_job_to_watch("job-par:b2", time.time() - 1)
+    await watcher.handle_timeouts(await storage.get_timed_out_jobs())
+
+    job_state = await storage.get_job_state("job-par")
+    assert job_state["status"] == "running"
+    assert job_state["current_state"] == "aggregate"
+    assert job_state["aggregation_results"] == {
+        "b1": {"status": "success"},
+        "b2": {"status": "failure", "error": "Worker task timed out."},
+    }
+    assert await storage.get_job_queue_length() == 1
+
+
+async def test_only_owned_shards_are_handled(watcher):
+    storage = watcher.storage
+    await storage.save_job_state("job-1", {"id": "job-1", "status": "waiting_for_worker"})
+    await storage.add_job_to_watch("job-1", time.time() - 1)
+    await watcher.leases.release()
+    task = asyncio.create_task(watcher.run())
+    await asyncio.sleep(0.05)
+    assert (await storage.get_job_state("job-1"))["status"] == "waiting_for_worker"
+
+    # Taking over the shards wakes the watcher up
+    await watcher.leases.rebalance()
+    await wait_for_status(storage, "job-1", "failed")
+
+    watcher.stop()
+    task.cancel()
+    await task
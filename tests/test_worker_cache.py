@@ -0,0 +1,81 @@
+import asyncio
+import contextlib
+
+import pytest
+from src.avtomatika import metrics
+from src.avtomatika.storage.memory import MemoryStorage
+from src.avtomatika.worker_cache import WorkerCache
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture(autouse=True)
+def init_metrics():
+    metrics.init_metrics()
+
+
+@contextlib.asynccontextmanager
+async def running(cache: WorkerCache):
+    task = asyncio.create_task(cache.run())
+    # Let the subscription start before the storage is modified
+    await asyncio.sleep(0.05)
+    try:
+        yield
+    finally:
+        cache.stop()
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+async def wait_for_workers(cache: WorkerCache, expected: list[str], **filters):
+    for _ in range(50):
+        workers = await cache.get_available_workers(**filters)
+        if sorted(w["worker_id"] for w in workers) == expected:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Cache did not converge to {expected}")
+
+
+async def test_reads_are_served_from_snapshot():
+    storage = MemoryStorage()
+    await storage.register_worker("w1", {"worker_id": "w1", "supported_tasks": ["t"]}, 60)
+    cache = WorkerCache(storage, max_staleness_seconds=60)
+
+    # The first read loads the snapshot, later reads do not touch storage
+    assert [w["worker_id"] for w in await cache.get_available_workers(task_type="t", status="idle")] == ["w1"]
+    await storage.register_worker("w2", {"worker_id": "w2", "supported_tasks": ["t"]}, 60)
+    assert [w["worker_id"] for w in await cache.get_available_workers(task_type="t")] == ["w1"]
+
+    # Invalidation forces a reload
+    cache.invalidate()
+    assert sorted(w["worker_id"] for w in await cache.get_available_workers(task_type="t")) == ["w1", "w2"]
+
+
+async def test_snapshot_is_reloaded_when_stale():
+    storage = MemoryStorage()
+    cache = WorkerCache(storage, max_staleness_seconds=0.05)
+    assert await cache.get_available_workers() == []
+
+    await storage.register_worker("w1", {"worker_id": "w1"}, 60)
+    await asyncio.sleep(0.1)
+    assert [w["worker_id"] for w in await cache.get_available_workers()] == ["w1"]
+
+
+@pytest.mark.parametrize("backend", ["memory", "redis"])
+async def test_events_patch_snapshot(backend, redis_storage):
+    storage = MemoryStorage() if backend == "memory" else redis_storage
+    await storage.register_worker("w1", {"worker_id": "w1", "supported_tasks": ["t"]}, 60)
+    cache = WorkerCache(storage, max_staleness_seconds=60)
+    await cache.get_available_workers()
+
+    async with running(cache):
+        await storage.register_worker("w2", {"worker_id": "w2", "supported_tasks": ["t"]}, 60)
+        await wait_for_workers(cache, ["w1", "w2"], task_type="t", status="idle")
+
+        await storage.update_worker_status("w1", {"status": "busy"}, 60)
+        await wait_for_workers(cache, ["w2"], task_type="t", status="idle")
+
+        await storage.deregister_worker("w2")
+        await wait_for_workers(cache, [], task_type="t", status="idle")
+        await wait_for_workers(cache, ["w1"])
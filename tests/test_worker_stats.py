@@ -0,0 +1,66 @@
+import pytest
+from src.avtomatika.worker_stats import (
+    SKETCH_MAX_BUCKETS,
+    SKETCH_RELATIVE_ACCURACY,
+    latency_quantile,
+    record_task_outcome,
+    summarize_task_stats,
+)
+
+
+def test_percentiles_within_relative_accuracy():
+    stats = None
+    for duration_ms in range(1, 101):
+        stats = record_task_outcome(stats, duration_ms * 10, success=True, window=10**6)
+
+    assert latency_quantile(stats, 0.5) == pytest.approx(500, rel=SKETCH_RELATIVE_ACCURACY + 0.01)
+    assert latency_quantile(stats, 0.95) == pytest.approx(950, rel=SKETCH_RELATIVE_ACCURACY + 0.01)
+
+
+def test_percentiles_follow_recent_tasks():
+    stats = None
+    for _ in range(200):
+        stats = record_task_outcome(stats, 1000, success=True, window=20)
+    for _ in range(200):
+        stats = record_task_outcome(stats, 100, success=True, window=20)
+
+    # The slow tasks have decayed out of the window
+    assert latency_quantile(stats, 0.95) == pytest.approx(100, rel=SKETCH_RELATIVE_ACCURACY)
+    assert len(stats["b"]) == 1
+
+
+def test_sketch_size_is_bounded():
+    stats = None
+    for duration_ms in range(1, 10000, 7):
+        stats = record_task_outcome(stats, duration_ms, success=True, window=10**6)
+
+    assert len(stats["b"]) <= SKETCH_MAX_BUCKETS
+    # Only the lowest buckets are merged, high percentiles stay accurate
+    assert latency_quantile(stats, 0.95) == pytest.approx(9500, rel=0.05)
+
+
+def test_failures_only_move_the_error_rate():
+    stats = record_task_outcome(None, 200, success=True, ewma_alpha=0.5)
+    stats = record_task_outcome(stats, 5, success=False, ewma_alpha=0.5)
+
+    assert stats["n"] == 2
+    assert stats["lat"] == 200
+    assert stats["err"] == 0.5
+    assert summarize_task_stats(stats) == {
+        "count": 2,
+        "ewma_latency_ms": 200.0,
+        "p50_latency_ms": pytest.approx(200, rel=SKETCH_RELATIVE_ACCURACY),
+        "p95_latency_ms": pytest.approx(200, rel=SKETCH_RELATIVE_ACCURACY),
+        "error_rate": 0.5,
+    }
+
+
+def test_summary_without_successful_tasks():
+    stats = record_task_outcome(None, 0, success=False)
+    assert summarize_task_stats(stats) == {
+        "count": 1,
+        "ewma_latency_ms": None,
+        "p50_latency_ms": None,
+        "p95_latency_ms": None,
+        "error_rate": 0.2,
+    }
@@ -76,3 +76,32 @@ async def test_ws_manager_close_all():
     ws1.close.assert_called_with(code=1001, message=b"Server shutdown")
     ws2.close.assert_called_with(code=1001, message=b"Server shutdown")
     assert not manager._connections
+
+
+@pytest.mark.asyncio
+async def test_ws_manager_push_credits_and_wakeups():
+    """Tests the credit accounting and wakeups of push workers."""
+    manager = WebSocketManager()
+    await manager.register("worker-1", AsyncMock(spec=web.WebSocketResponse))
+    await manager.register("worker-2", AsyncMock(spec=web.WebSocketResponse))
+
+    wakeup_1 = manager.start_push("worker-1", 2)
+    wakeup_2 = manager.start_push("worker-2", 0)
+    wakeup_1.clear()
+    wakeup_2.clear()
+    assert manager.is_pushing("worker-1")
+
+    manager.use_credits("worker-1", 2)
+    manager.add_credits("worker-1", 1)
+    assert manager.get_credits("worker-1") == 1
+    assert wakeup_1.is_set() and not wakeup_2.is_set()
+
+    wakeup_1.clear()
+    manager.notify_tasks("worker-2")
+    assert wakeup_2.is_set() and not wakeup_1.is_set()
+    manager.notify_tasks("type:render", shared=True)
+    assert wakeup_1.is_set()
+
+    await manager.unregister("worker-1")
+    assert not manager.is_pushing("worker-1")
+    assert manager.get_credits("worker-1") == 0